@@ -1,7 +1,15 @@
+from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Author, Publisher, Book, BookLoan, BookReservation, Review, LibrarySettings, LateFee
+from .models import (
+    Author, Publisher, Book, BookLoan, BookReservation, Review, LibrarySettings, LateFee, ImageGenerationJob, EmailOutbox
+)
+from .ratings import recompute_rating_summaries
+from .image_jobs import retry_job
+from .outbox import retry_email
+from .inventory import apply_copy_edit
+from .forms import CopyCountsFormMixin
 
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
@@ -13,12 +21,25 @@ class PublisherAdmin(admin.ModelAdmin):
     list_display = ('name', 'website', 'founded_date')
     search_fields = ('name',)
 
+class BookAdminForm(CopyCountsFormMixin, forms.ModelForm):
+    class Meta:
+        model = Book
+        fields = '__all__'
+
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
+    form = BookAdminForm
     list_display = ('title', 'isbn', 'publication_date', 'available_copies', 'total_copies')
     list_filter = ('publication_date', 'language')
     search_fields = ('title', 'isbn')
     filter_horizontal = ('authors',)
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            # Book.save() does not write available_copies, see library.inventory
+            initial_total, initial_available = form.get_rendered_counts()
+            apply_copy_edit(obj.pk, initial_total, obj.total_copies, initial_available, obj.available_copies)
 
 @admin.register(BookLoan)
 class BookLoanAdmin(admin.ModelAdmin):
@@ -85,7 +106,7 @@ class LibrarySettingsAdmin(admin.ModelAdmin):
             'fields': ('max_loan_days', 'max_renewals', 'max_books_per_user')
         }),
         ('Reservation Settings', {
-            'fields': ('reservation_expiry_days',)
+            'fields': ('reservation_expiry_days', 'hold_lifetime_days')
         }),
     )
     
@@ -152,11 +173,55 @@ class ReviewAdmin(admin.ModelAdmin):
     actions = ['approve_reviews', 'reject_reviews']
     
     def approve_reviews(self, request, queryset):
+        book_ids = set(queryset.values_list('book_id', flat=True))
         updated = queryset.update(status='approved')
+        # queryset.update() bypasses the Review signals
+        recompute_rating_summaries(Book.objects.filter(pk__in=book_ids))
         self.message_user(request, f'{updated} reviews have been approved.')
     approve_reviews.short_description = "Approve selected reviews"
     
     def reject_reviews(self, request, queryset):
+        book_ids = set(queryset.values_list('book_id', flat=True))
         updated = queryset.update(status='rejected')
+        recompute_rating_summaries(Book.objects.filter(pk__in=book_ids))
         self.message_user(request, f'{updated} reviews have been rejected.')
     reject_reviews.short_description = "Reject selected reviews"
+
+
+@admin.register(ImageGenerationJob)
+class ImageGenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('entity_type', 'entity_id', 'kind', 'status', 'attempts', 'run_after', 'worker', 'finished_at')
+    list_filter = ('status', 'kind', 'entity_type')
+    search_fields = ('entity_id', 'last_error', 'output_path')
+    readonly_fields = (
+        'entity_type', 'entity_id', 'kind', 'status', 'attempts', 'worker', 'output_path',
+        'last_error', 'created_at', 'started_at', 'finished_at'
+    )
+    actions = ['retry_jobs', 'cancel_jobs']
+    
+    def retry_jobs(self, request, queryset):
+        retried = sum(retry_job(job) for job in queryset)
+        self.message_user(request, f'{retried} jobs have been queued again.')
+    retry_jobs.short_description = "Retry selected jobs"
+    
+    def cancel_jobs(self, request, queryset):
+        updated = queryset.filter(status='pending').update(status='cancelled')
+        self.message_user(request, f'{updated} pending jobs have been cancelled.')
+    cancel_jobs.short_description = "Cancel selected pending jobs"
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'recipient', 'status', 'attempts', 'run_after', 'worker', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('recipient', 'idempotency_key', 'last_error')
+    readonly_fields = (
+        'kind', 'object_id', 'recipient', 'idempotency_key', 'status', 'attempts', 'worker',
+        'last_error', 'created_at', 'started_at', 'sent_at'
+    )
+    actions = ['retry_emails']
+    
+    def retry_emails(self, request, queryset):
+        retried = sum(retry_email(entry) for entry in queryset)
+        self.message_user(request, f'{retried} emails have been queued again.')
+    retry_emails.short_description = "Retry selected emails"
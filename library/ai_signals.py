@@ -1,12 +1,13 @@
 """
 AI Image Generation Signal Handlers
 
-This module contains signal handlers that automatically trigger AI image generation
-when new books, authors, or publishers are added to the database.
+This module contains signal handlers that automatically queue AI image generation
+when new books, authors, or publishers are added to the database. The images are
+generated by the process_image_jobs management command (see library.image_jobs).
 """
 import os
 import logging
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
 from django.core.files.base import ContentFile
@@ -14,6 +15,8 @@ from pathlib import Path
 import subprocess
 
 from .models import Book, Author, Publisher
+from .image_jobs import enqueue_image_job
+from .ai_utils import flux_client
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -23,7 +26,21 @@ FLUX_WRAPPER_PATH = os.path.join(settings.BASE_DIR, 'library', 'ai_utils', 'flux
 FLUX_AVAILABLE = os.path.exists(FLUX_WRAPPER_PATH)
 
 def generate_with_flux(prompt, output_path, seed=None):
-    """Generate an image using Flux AI through the flux_wrapper.py script."""
+    """
+    Generate an image using Flux AI.
+
+    When settings.FLUX_SERVER_URL is set the image is generated by the warm Flux
+    server (library/ai_utils/flux_server.py), falling back to the basic image if the
+    server is down. Otherwise a flux_wrapper.py process is started for the image.
+    """
+    server_url = getattr(settings, 'FLUX_SERVER_URL', None)
+    if server_url:
+        return flux_client.generate_image(
+            prompt, output_path, seed,
+            address=server_url,
+            timeout=getattr(settings, 'FLUX_SERVER_TIMEOUT', flux_client.DEFAULT_TIMEOUT)
+        )
+
     if not FLUX_AVAILABLE:
         logger.warning("Flux AI wrapper not found. Skipping AI image generation.")
         return False
@@ -56,133 +73,65 @@ def generate_with_flux(prompt, output_path, seed=None):
         logger.exception(f"Exception while generating with Flux: {e}")
         return False
 
+def generate_batch_with_flux(items):
+    """
+    Generate several images at once.
+
+    With a warm Flux server (settings.FLUX_SERVER_URL) the items are sent as one
+    batch and generated in batched forward passes; otherwise they are generated
+    one by one with generate_with_flux.
+
+    Args:
+        items (list): Dicts with prompt, output_path and an optional seed
+
+    Returns:
+        list: One bool per item, True if its image was generated
+    """
+    server_url = getattr(settings, 'FLUX_SERVER_URL', None)
+    if server_url:
+        for item in items:
+            os.makedirs(os.path.dirname(item['output_path']), exist_ok=True)
+        return flux_client.generate_images(
+            items,
+            address=server_url,
+            timeout=getattr(settings, 'FLUX_SERVER_TIMEOUT', flux_client.DEFAULT_TIMEOUT) * max(1, len(items))
+        )
+    return [generate_with_flux(item['prompt'], item['output_path'], item.get('seed')) for item in items]
+
 @receiver(post_save, sender=Book)
-def generate_book_cover(sender, instance, created, **kwargs):
+def generate_book_cover(sender, instance, created, raw=False, **kwargs):
     """
-    Generate a book cover using AI when a new book is created or 
-    when a book is updated and doesn't have a cover.
+    Queue a book cover when a book is saved without a cover.
+    Books without authors are queued once their authors are added.
     """
-    # Skip if the book already has a cover
-    if instance.cover and instance.cover.name:
-        return
-    
-    # Only generate for books with authors
-    if not instance.authors.exists():
+    if not raw:
+        enqueue_image_job(instance)
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def generate_book_cover_for_authors(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Queue a cover for books that just got their authors.
+    """
+    if action != 'post_add':
         return
-    
-    try:
-        # Create a filename for the cover
-        filename = f"{instance.id}_{instance.title.replace(' ', '_')[:30]}.jpg"
-        
-        # Define the media path
-        media_root = settings.MEDIA_ROOT
-        covers_dir = os.path.join(media_root, 'covers')
-        os.makedirs(covers_dir, exist_ok=True)
-        
-        # Full path to save the image
-        output_path = os.path.join(covers_dir, filename)
-        
-        # Generate the prompt
-        authors = ", ".join([author.name for author in instance.authors.all()])
-        prompt = f"A professional book cover for '{instance.title}' by {authors}. High quality, detailed, publishing industry standard."
-        
-        # Generate the image
-        success = generate_with_flux(prompt, output_path)
-        
-        if success and os.path.exists(output_path):
-            # Update the book model with the new cover
-            relative_path = os.path.join('covers', filename)
-            
-            # Update the model without triggering the post_save signal again
-            Book.objects.filter(pk=instance.pk).update(cover=relative_path)
-            
-            logger.info(f"Successfully generated and saved AI cover for book: {instance.title}")
-        else:
-            logger.warning(f"Failed to generate AI cover for book: {instance.title}")
-    
-    except Exception as e:
-        logger.exception(f"Error in generate_book_cover signal: {e}")
+    if reverse:
+        for book in Book.objects.filter(pk__in=pk_set):
+            enqueue_image_job(book)
+    else:
+        enqueue_image_job(instance)
 
 @receiver(post_save, sender=Author)
-def generate_author_portrait(sender, instance, created, **kwargs):
+def generate_author_portrait(sender, instance, created, raw=False, **kwargs):
     """
-    Generate an author portrait using AI when a new author is created or
-    when an author is updated and doesn't have a photo.
+    Queue an author portrait when an author is saved without a photo.
     """
-    # Skip if the author already has a photo
-    if instance.photo and instance.photo.name:
-        return
-    
-    try:
-        # Create a filename for the portrait
-        filename = f"{instance.id}_{instance.name.replace(' ', '_')[:30]}.jpg"
-        
-        # Define the media path
-        media_root = settings.MEDIA_ROOT
-        authors_dir = os.path.join(media_root, 'authors')
-        os.makedirs(authors_dir, exist_ok=True)
-        
-        # Full path to save the image
-        output_path = os.path.join(authors_dir, filename)
-        
-        # Generate the prompt
-        prompt = f"A professional portrait photograph of author {instance.name}. High quality, detailed, professional headshot."
-        
-        # Generate the image
-        success = generate_with_flux(prompt, output_path)
-        
-        if success and os.path.exists(output_path):
-            # Update the author model with the new photo
-            relative_path = os.path.join('authors', filename)
-            
-            # Update the model without triggering the post_save signal again
-            Author.objects.filter(pk=instance.pk).update(photo=relative_path)
-            
-            logger.info(f"Successfully generated and saved AI portrait for author: {instance.name}")
-        else:
-            logger.warning(f"Failed to generate AI portrait for author: {instance.name}")
-    
-    except Exception as e:
-        logger.exception(f"Error in generate_author_portrait signal: {e}")
+    if not raw:
+        enqueue_image_job(instance)
 
 @receiver(post_save, sender=Publisher)
-def generate_publisher_logo(sender, instance, created, **kwargs):
+def generate_publisher_logo(sender, instance, created, raw=False, **kwargs):
     """
-    Generate a publisher logo using AI when a new publisher is created or
-    when a publisher is updated and doesn't have a logo.
+    Queue a publisher logo when a publisher is saved without a logo.
     """
-    # Skip if the publisher already has a logo
-    if instance.logo and instance.logo.name:
-        return
-    
-    try:
-        # Create a filename for the logo
-        filename = f"{instance.id}_{instance.name.replace(' ', '_')[:30]}.jpg"
-        
-        # Define the media path
-        media_root = settings.MEDIA_ROOT
-        publishers_dir = os.path.join(media_root, 'publishers')
-        os.makedirs(publishers_dir, exist_ok=True)
-        
-        # Full path to save the image
-        output_path = os.path.join(publishers_dir, filename)
-        
-        # Generate the prompt
-        prompt = f"A professional logo for publishing company '{instance.name}'. Clean, corporate design, minimalist, high quality."
-        
-        # Generate the image
-        success = generate_with_flux(prompt, output_path)
-        
-        if success and os.path.exists(output_path):
-            # Update the publisher model with the new logo
-            relative_path = os.path.join('publishers', filename)
-            
-            # Update the model without triggering the post_save signal again
-            Publisher.objects.filter(pk=instance.pk).update(logo=relative_path)
-            
-            logger.info(f"Successfully generated and saved AI logo for publisher: {instance.name}")
-        else:
-            logger.warning(f"Failed to generate AI logo for publisher: {instance.name}")
-    
-    except Exception as e:
-        logger.exception(f"Error in generate_publisher_logo signal: {e}")
+    if not raw:
+        enqueue_image_job(instance)
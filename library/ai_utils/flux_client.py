@@ -0,0 +1,217 @@
+"""
+Flux AI Generation Client
+
+Client for the warm Flux AI generation server (see flux_server.py). Addresses are
+either "unix:///path/to/socket" or "http://host:port". When the server cannot be
+reached or fails, generate_image falls back to the basic placeholder image, and
+run_generation starts the given generator process instead.
+"""
+
+import http.client
+import json
+import logging
+import os
+import socket
+import subprocess
+from urllib.parse import urlsplit
+
+try:
+    from library.ai_utils.flux_wrapper import generate_basic_image
+except ImportError:  # Run as a script from the ai_utils directory
+    from flux_wrapper import generate_basic_image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+HEALTH_TIMEOUT = 2
+
+
+class FluxServerError(Exception):
+    """Raised when the generation server is unreachable or cannot generate an image."""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class FluxClient:
+    """Client for a running generation server."""
+
+    def __init__(self, address, timeout=DEFAULT_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+
+    def get_connection(self, timeout):
+        if self.address.startswith('unix://'):
+            return UnixHTTPConnection(self.address[len('unix://'):], timeout=timeout)
+        url = urlsplit(self.address)
+        return http.client.HTTPConnection(url.hostname or 'localhost', url.port, timeout=timeout)
+
+    def request(self, method, path, payload=None, timeout=None):
+        """
+        Send a JSON request to the server.
+
+        Returns:
+            dict: The decoded JSON response
+
+        Raises:
+            FluxServerError: If the server is unreachable or responds with an error
+        """
+        connection = self.get_connection(timeout or self.timeout)
+        try:
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = json.loads(response.read() or b'{}')
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            raise FluxServerError(f"Flux server at {self.address} is unavailable: {e}") from e
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            raise FluxServerError(data.get('error') or f"Flux server responded with status {response.status}")
+        return data
+
+    def health(self):
+        """Return the server status, or None if the server is not running."""
+        try:
+            return self.request('GET', '/health', timeout=HEALTH_TIMEOUT)
+        except FluxServerError:
+            return None
+
+    def is_available(self):
+        return self.health() is not None
+
+    def generate(self, prompt, output_path, seed=None, **params):
+        """
+        Generate an image on the server.
+
+        Args:
+            prompt (str): Text prompt for image generation
+            output_path (str): Path to save the generated image; the server must be able to write it
+            seed (int, optional): Random seed for reproducibility
+            **params: Optional height, width and num_inference_steps
+
+        Returns:
+            dict: The server response with the output path, seed and duration
+        """
+        payload = {'prompt': prompt, 'output_path': os.path.abspath(output_path), 'seed': seed}
+        payload.update(params)
+        return self.request('POST', '/generate', payload)
+
+    def generate_batch(self, items, **params):
+        """
+        Generate several images on the server in batched forward passes.
+
+        Args:
+            items (list): Dicts with prompt, output_path and an optional seed
+            **params: Optional height, width and num_inference_steps
+
+        Returns:
+            dict: The server response with one result per item, in order
+        """
+        payload = {
+            'items': [
+                {'prompt': item['prompt'], 'output_path': os.path.abspath(item['output_path']), 'seed': item.get('seed')}
+                for item in items
+            ]
+        }
+        payload.update(params)
+        return self.request('POST', '/generate_batch', payload)
+
+
+def generate_image(prompt, output_path, seed=None, address=None, timeout=DEFAULT_TIMEOUT, fallback=True):
+    """
+    Generate an image on the warm server, falling back to the basic placeholder image.
+
+    Args:
+        prompt (str): Text prompt for image generation
+        output_path (str): Path to save the generated image
+        seed (int, optional): Random seed for reproducibility
+        address (str, optional): Server address; defaults to the FLUX_SERVER_URL environment variable
+        timeout (int): Seconds to wait for the generated image
+        fallback (bool): Draw the basic image when the server fails
+
+    Returns:
+        bool: True if an image was written to output_path
+    """
+    address = address or os.environ.get('FLUX_SERVER_URL')
+    if address:
+        try:
+            result = FluxClient(address, timeout=timeout).generate(prompt, output_path, seed)
+            logger.info(f"Generated image at {output_path} in {result.get('duration')}s")
+            return True
+        except FluxServerError as e:
+            logger.warning(str(e))
+
+    if not fallback:
+        return False
+    logger.info(f"Falling back to basic image generation for {output_path}")
+    return generate_basic_image(prompt, output_path, seed)
+
+
+def generate_images(items, address=None, timeout=DEFAULT_TIMEOUT, fallback=True):
+    """
+    Generate a batch of images on the warm server, falling back per failed item.
+
+    Args:
+        items (list): Dicts with prompt, output_path and an optional seed
+        address (str, optional): Server address; defaults to the FLUX_SERVER_URL environment variable
+        timeout (int): Seconds to wait for the whole batch
+        fallback (bool): Draw the basic image for items the server did not generate
+
+    Returns:
+        list: One bool per item, True if an image was written to its output_path
+    """
+    address = address or os.environ.get('FLUX_SERVER_URL')
+    generated = [False] * len(items)
+    if address and items:
+        try:
+            response = FluxClient(address, timeout=timeout).generate_batch(items)
+            generated = [result['ok'] for result in response['results']]
+            logger.info(
+                f"Generated {sum(generated)}/{len(items)} images in {response.get('duration')}s"
+            )
+        except FluxServerError as e:
+            logger.warning(str(e))
+
+    if fallback:
+        for index, item in enumerate(items):
+            if not generated[index]:
+                logger.info(f"Falling back to basic image generation for {item['output_path']}")
+                generated[index] = generate_basic_image(item['prompt'], item['output_path'], item.get('seed'))
+    return generated
+
+
+def run_generation(command, prompt, output_path, seed=None, address=None, server_timeout=DEFAULT_TIMEOUT, **run_kwargs):
+    """
+    Generate an image on the warm server when one is configured, and only start the
+    generator process (flux_wrapper.py or direct_flux_generator.py) without a server
+    or when the server fails.
+
+    Args:
+        command (list): Generator command line, run with subprocess.run(command, **run_kwargs)
+        prompt (str): Text prompt for image generation
+        output_path (str): Path to save the generated image
+        seed (int, optional): Random seed for reproducibility
+        address (str, optional): Server address; defaults to the FLUX_SERVER_URL environment variable
+        server_timeout (int): Seconds to wait for the server to generate the image
+
+    Returns:
+        subprocess.CompletedProcess: The generator process, or a successful stand-in for a server image
+    """
+    address = address or os.environ.get('FLUX_SERVER_URL')
+    if address and generate_image(prompt, output_path, seed, address=address, timeout=server_timeout, fallback=False):
+        return subprocess.CompletedProcess(command, 0, stdout='', stderr='')
+    return subprocess.run(command, **run_kwargs)
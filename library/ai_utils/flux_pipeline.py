@@ -50,10 +50,11 @@ import gc
 import inspect
 import json
 import os
+import time
 import torch
 import transformers
 from pathlib import Path
-from typing import Optional, Any, Dict, Union
+from typing import Optional, Any, Dict, List, Union
 from datetime import datetime
 
 from core.memory_manager import MemoryManager
@@ -67,6 +68,10 @@ from utils.system_utils import (
 from config.logging_config import logger
 from config.env_config import DEFAULT_MODEL_CONFIG, GENERATION_DEFAULTS
 
+# Estimated activation memory of one 1024x1024 image in a batch, used to size batches
+BATCH_MEMORY_PER_MEGAPIXEL = 3 * 1024**3
+MAX_BATCH_SIZE = 8
+
 
 class FluxPipeline:
     """Advanced AI image generation pipeline with integrated management systems.
@@ -149,6 +154,7 @@ class FluxPipeline:
         self.pipe = None
         self.model_capabilities = {}
         self.generation_config = self._initialize_generation_config()
+        self.batch_size_limit = None
 
     def _initialize_generation_config(self) -> Dict[str, Any]:
         """Initialize default generation configuration.
@@ -163,6 +169,7 @@ class FluxPipeline:
             "min_width": 512,
             "max_height": 1024,
             "max_width": 1024,
+            "max_batch_size": MAX_BATCH_SIZE,
             "supported_features": set(),
         }
 
@@ -517,6 +524,247 @@ class FluxPipeline:
         finally:
             self.memory_manager.cleanup()
 
+    def _get_free_memory(self) -> int:
+        """Return the free memory in bytes on the generation device.
+        
+        Returns:
+            int: Free GPU memory, or available system memory on CPU; 0 if unknown
+        """
+        try:
+            memory_info = self.memory_manager.get_system_memory_info()
+            if memory_info.get("status") == "critical":
+                return 0
+            if torch.cuda.is_available():
+                free_memory, _ = torch.cuda.mem_get_info(self.memory_manager.device)
+                return free_memory
+            return int(memory_info.get("available", 0))
+        except Exception as e:
+            logger.warning(f"Error reading free memory: {str(e)}")
+            return 0
+
+    def get_batch_size(
+        self, height: int = 1024, width: int = 1024, max_batch_size: Optional[int] = None
+    ) -> int:
+        """Pick how many images to generate in one forward pass.
+        
+        The batch size is derived from the free memory reported by the memory
+        manager and, within a generate_batch() call, capped by the largest batch
+        that fitted since its last out of memory error.
+        
+        Args:
+            height (int, optional): Image height. Defaults to 1024.
+            width (int, optional): Image width. Defaults to 1024.
+            max_batch_size (Optional[int], optional): Upper bound. Defaults to config value.
+            
+        Returns:
+            int: Batch size of at least 1
+        """
+        limit = max_batch_size or self.generation_config["max_batch_size"]
+        if self.batch_size_limit:
+            limit = min(limit, self.batch_size_limit)
+
+        per_image = BATCH_MEMORY_PER_MEGAPIXEL * (height * width) / (1024 * 1024)
+        return max(1, min(limit, int(self._get_free_memory() // per_image)))
+
+    def generate_batch(
+        self,
+        prompts: List[str],
+        seeds: Optional[List[Optional[int]]] = None,
+        output_paths: Optional[List[Optional[str]]] = None,
+        num_inference_steps: int = 4,
+        guidance_scale: float = 0.0,
+        height: int = 1024,
+        width: int = 1024,
+        negative_prompt: Optional[str] = None,
+        seed_profile: Optional[SeedProfile] = None,
+        max_batch_size: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Generate images for several prompts with batched forward passes.
+        
+        Prompts are split into batches sized by get_batch_size(). A batch that
+        runs out of memory is split in half (down to single images, which are
+        retried like generate_image), and later batches of the same call stay at
+        the smaller size. The next call sizes its batches from free memory again.
+        Every saved image gets a JSON metadata file next to it.
+        
+        Args:
+            prompts (List[str]): Generation prompts
+            seeds (Optional[List[Optional[int]]], optional): Seed per prompt. Defaults to None.
+            output_paths (Optional[List[Optional[str]]], optional): Save path per prompt. Defaults to None.
+            num_inference_steps (int, optional): Number of generation steps. Defaults to 4.
+            guidance_scale (float, optional): Guidance scale. Defaults to 0.0.
+            height (int, optional): Image height. Defaults to 1024.
+            width (int, optional): Image width. Defaults to 1024.
+            negative_prompt (Optional[str], optional): Negative prompt for all items. Defaults to None.
+            seed_profile (Optional[SeedProfile], optional): Seed profile. Defaults to None.
+            max_batch_size (Optional[int], optional): Upper bound of the batch size. Defaults to None.
+            
+        Returns:
+            List[Dict[str, Any]]: One result per prompt, in order, with the keys
+            index, prompt, seed, output_path, image, success, error, batch_size
+            and duration
+        
+        Example:
+            ```python
+            results = pipeline.generate_batch(
+                prompts=["A red cover", "A blue cover"],
+                output_paths=["covers/1.jpg", "covers/2.jpg"],
+                height=512,
+                width=512,
+            )
+            failed = [r["index"] for r in results if not r["success"]]
+            ```
+        """
+        seeds = list(seeds) if seeds is not None else [None] * len(prompts)
+        output_paths = list(output_paths) if output_paths is not None else [None] * len(prompts)
+        if not len(prompts) == len(seeds) == len(output_paths):
+            raise ValueError("prompts, seeds and output_paths must have the same length")
+
+        results = []
+        pending = []
+        # An out of memory error only limits the batches of this call, since a
+        # long-running server sees memory freed again between calls
+        self.batch_size_limit = None
+        try:
+            if seed_profile:
+                self.seed_manager.set_profile(seed_profile)
+
+            for index, (prompt, seed, output_path) in enumerate(zip(prompts, seeds, output_paths)):
+                result = {
+                    "index": index,
+                    "prompt": prompt,
+                    "seed": None,
+                    "output_path": str(output_path) if output_path else None,
+                    "image": None,
+                    "success": False,
+                    "error": None,
+                    "batch_size": 0,
+                    "duration": 0.0,
+                }
+                results.append(result)
+                if self.pipe is None:
+                    result["error"] = "Model not loaded"
+                    continue
+
+                if seed is not None:
+                    result["seed"] = self.seed_manager._validate_seed(seed)
+                else:
+                    result["seed"] = self.seed_manager.generate_seed()
+
+                processed_prompt = self.prompt_manager.process_prompt(prompt)
+                if not processed_prompt:
+                    result["error"] = "Invalid or empty prompt after processing"
+                    continue
+                pending.append((result, processed_prompt))
+
+            if self.pipe is None:
+                logger.error("Model not loaded. Please call load_model() first.")
+                return results
+
+            generation_params = {
+                "num_inference_steps": num_inference_steps,
+                "guidance_scale": guidance_scale,
+                "height": height,
+                "width": width,
+            }
+            if negative_prompt:
+                processed_negative = self.prompt_manager.process_negative_prompt(
+                    negative_prompt
+                )
+                if processed_negative:
+                    generation_params["negative_prompt"] = processed_negative
+
+            self.memory_manager.optimize_memory_allocation()
+            batch_size = self.get_batch_size(height, width, max_batch_size)
+            logger.info(f"Generating {len(pending)} images in batches of {batch_size}")
+
+            position = 0
+            while position < len(pending):
+                batch = pending[position:position + batch_size]
+                self._generate_batch_items(batch, generation_params)
+                position += len(batch)
+                if self.batch_size_limit:
+                    batch_size = min(batch_size, self.batch_size_limit)
+
+        except Exception as e:
+            logger.error(f"Error generating batch: {str(e)}")
+            for result in results:
+                if not result["success"] and not result["error"]:
+                    result["error"] = str(e)
+        finally:
+            self.memory_manager.cleanup()
+
+        return results
+
+    def _generate_batch_items(self, batch: List[tuple], params: Dict[str, Any], attempt: int = 0):
+        """Run one forward pass for a batch, splitting it in half on out of memory errors.
+        
+        Args:
+            batch (List[tuple]): (result, processed prompt) pairs; results are updated in place
+            params (Dict[str, Any]): Generation parameters shared by the batch
+            attempt (int, optional): Retry number of a single image batch. Defaults to 0.
+        """
+        results = [result for result, _ in batch]
+        generation_params = dict(params, prompt=[prompt for _, prompt in batch])
+        if all(result["seed"] is not None for result in results):
+            generation_params["generator"] = [
+                torch.Generator(device=self.memory_manager.device).manual_seed(result["seed"])
+                for result in results
+            ]
+
+        start = time.perf_counter()
+        try:
+            with torch.inference_mode():
+                with torch.amp.autocast(
+                    "cuda" if torch.cuda.is_available() else "cpu"
+                ):
+                    images = self.pipe(**generation_params).images
+        except RuntimeError as e:
+            if "out of memory" not in str(e):
+                logger.error(f"Error generating batch of {len(batch)}: {str(e)}")
+                for result in results:
+                    result["error"] = str(e)
+                return
+
+            self._handle_oom_error()
+            if len(batch) > 1:
+                half = len(batch) // 2
+                self.batch_size_limit = min(self.batch_size_limit or half, half)
+                logger.warning(
+                    f"Out of memory with a batch of {len(batch)}, splitting into {half} + {len(batch) - half}"
+                )
+                self._generate_batch_items(batch[:half], params)
+                self._generate_batch_items(batch[half:], params)
+            elif attempt < self.max_retries - 1:
+                self._generate_batch_items(batch, params, attempt + 1)
+            else:
+                logger.error(f"\nFailed after {self.max_retries} attempts: {str(e)}")
+                results[0]["error"] = str(e)
+            return
+
+        duration = time.perf_counter() - start
+        for batch_index, (result, image) in enumerate(zip(results, images)):
+            result.update({
+                "image": image,
+                "batch_size": len(batch),
+                "duration": duration / len(batch),
+                "success": True,
+            })
+            if result["output_path"]:
+                metadata = dict(
+                    params,
+                    prompt=result["prompt"],
+                    seed=result["seed"],
+                )
+                extra = {
+                    "batch_size": len(batch),
+                    "batch_index": batch_index,
+                    "duration": round(result["duration"], 3),
+                }
+                if not self._save_generation_output(image, result["output_path"], metadata, extra):
+                    result["success"] = False
+                    result["error"] = "Failed to save image"
+
     def _handle_oom_error(self):
         """Handle out of memory errors during generation."""
         logger.warning("Handling out of memory error...")
@@ -537,14 +785,22 @@ class FluxPipeline:
             self.pipe.enable_attention_slicing("max")
 
     def _save_generation_output(
-        self, image: Any, output_path: Path, params: Dict[str, Any]
-    ):
+        self,
+        image: Any,
+        output_path: Path,
+        params: Dict[str, Any],
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> bool:
         """Save generated image and metadata.
         
         Args:
             image (Any): Generated image
             output_path (Path): Save location
             params (Dict[str, Any]): Generation parameters
+            extra (Optional[Dict[str, Any]], optional): Additional metadata. Defaults to None.
+            
+        Returns:
+            bool: True if the image was saved
         """
         try:
             # Create output directory
@@ -568,15 +824,18 @@ class FluxPipeline:
                 "model_id": self.model_id,
                 "device": str(self.memory_manager.device),
             }
+            generation_info.update(extra or {})
 
             with open(metadata_path, "w") as f:
                 json.dump(generation_info, f, indent=2)
 
             logger.info(f"Image saved to: {output_path}")
             logger.info(f"Metadata saved to: {metadata_path}")
+            return True
 
         except Exception as e:
             logger.error(f"Error saving generation output: {str(e)}")
+            return False
 
     def _cleanup_after_error(self):
         """Perform cleanup after error occurs."""
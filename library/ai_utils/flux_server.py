@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+"""
+Flux AI Generation Server
+
+A long-lived local daemon that loads the Flux AI model once and keeps it warm,
+instead of starting a new conda process and reloading the model for every image.
+Requests are served as JSON over a Unix socket or a local HTTP port:
+
+    GET  /health          -> {"status": "ok", "backend": "flux", "generated": 12, ...}
+    POST /generate        -> {"prompt": "...", "output_path": "...", "seed": 42}
+    POST /generate_batch  -> {"items": [{"prompt": "...", "output_path": "...", "seed": 42}, ...]}
+
+Batches run through FluxPipeline.generate_batch, which sizes the forward passes
+by free GPU memory.
+
+Generation is serialized (one model, one GPU), while health checks are answered
+concurrently. Run it in the flux conda environment, for example:
+
+    conda run -n flux python library/ai_utils/flux_server.py --socket /tmp/flux.sock
+
+The "mock" backend draws placeholder images on the CPU and needs neither torch
+nor the Flux project, which makes it suitable for development and tests.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from pathlib import Path
+
+try:
+    from library.ai_utils.flux_wrapper import generate_basic_image
+except ImportError:  # Run as a script from the ai_utils directory
+    from flux_wrapper import generate_basic_image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_FLUX_PROJECT_PATH = r"K:\Self Projects\Flux_Ai\flux_pipeline"
+MAX_SEED = 2 ** 32 - 1
+
+
+class MockBackend:
+    """CPU-only backend that draws the basic fallback image; used for development and tests."""
+
+    name = 'mock'
+
+    def load(self):
+        return True
+
+    def generate(self, prompt, output_path, seed=None, **params):
+        """
+        Draw a placeholder image for the prompt.
+
+        Returns:
+            int: The seed used for the image
+        """
+        if seed is None:
+            seed = random.randint(0, MAX_SEED)
+        if not generate_basic_image(prompt, output_path, seed):
+            raise RuntimeError("Failed to generate image")
+        return seed
+
+    def generate_batch(self, items, **params):
+        """
+        Draw a placeholder image for every item.
+
+        Returns:
+            list: One {"ok", "seed", "error"} result per item
+        """
+        results = []
+        for item in items:
+            try:
+                results.append({'ok': True, 'seed': self.generate(item['prompt'], item['output_path'], item.get('seed'))})
+            except Exception as e:
+                results.append({'ok': False, 'seed': item.get('seed'), 'error': str(e)})
+        return results
+
+
+class FluxBackend:
+    """Backend that keeps a single FluxPipeline loaded for the lifetime of the server."""
+
+    name = 'flux'
+
+    def __init__(self, project_path=None, model_id="black-forest-labs/FLUX.1-schnell",
+                 height=512, width=512, num_inference_steps=4):
+        self.project_path = project_path or os.environ.get('FLUX_PROJECT_PATH', DEFAULT_FLUX_PROJECT_PATH)
+        self.model_id = model_id
+        self.defaults = {
+            'height': height,
+            'width': width,
+            'num_inference_steps': num_inference_steps,
+        }
+        self.pipeline = None
+        self.seed_profile = None
+
+    def load(self):
+        """
+        Import the Flux AI components and load the model once.
+
+        Returns:
+            bool: True if the model is ready
+        """
+        if not os.path.exists(self.project_path):
+            logger.error(f"Flux AI project path not found at {self.project_path}")
+            return False
+        if self.project_path not in sys.path:
+            sys.path.append(self.project_path)
+
+        # The pipeline in this directory depends on the core, utils and config packages of the project
+        try:
+            from library.ai_utils.flux_pipeline import FluxPipeline
+        except ImportError:
+            from flux_pipeline import FluxPipeline
+        from core.seed_manager import SeedProfile
+
+        self.seed_profile = SeedProfile.BALANCED
+        self.pipeline = FluxPipeline(
+            model_id=self.model_id,
+            memory_threshold=0.90,
+            max_retries=3,
+            enable_xformers=False,
+            use_fast_tokenizer=True,
+            workspace=Path(os.path.dirname(os.path.abspath(__file__))),
+        )
+        return bool(self.pipeline.load_model())
+
+    def generate(self, prompt, output_path, seed=None, **params):
+        """
+        Generate an image with the warm pipeline.
+
+        Returns:
+            int: The seed used for the image
+        """
+        options = dict(self.defaults)
+        options.update({key: value for key, value in params.items() if key in self.defaults and value})
+        generation = {
+            'prompt': prompt,
+            'guidance_scale': 0.0,
+            'seed_profile': self.seed_profile,
+            'output_path': output_path,
+            **options,
+        }
+        if seed is not None:
+            generation['seed'] = seed
+
+        try:
+            image, used_seed = self.pipeline.generate_image(**generation)
+        finally:
+            self.release_memory()
+        if not image:
+            raise RuntimeError("Flux AI returned no image")
+        return used_seed
+
+    def generate_batch(self, items, **params):
+        """
+        Generate all items with batched forward passes of the warm pipeline.
+
+        Returns:
+            list: One {"ok", "seed", "error", "batch_size"} result per item
+        """
+        options = dict(self.defaults)
+        options.update({key: value for key, value in params.items() if key in self.defaults and value})
+        try:
+            results = self.pipeline.generate_batch(
+                prompts=[item['prompt'] for item in items],
+                seeds=[item.get('seed') for item in items],
+                output_paths=[item['output_path'] for item in items],
+                guidance_scale=0.0,
+                seed_profile=self.seed_profile,
+                **options
+            )
+        finally:
+            self.release_memory()
+        return [
+            {'ok': result['success'], 'seed': result['seed'], 'error': result['error'], 'batch_size': result['batch_size']}
+            for result in results
+        ]
+
+    @staticmethod
+    def release_memory():
+        """Free per-request allocations while keeping the model weights loaded."""
+        gc.collect()
+        try:
+            import torch
+        except ImportError:
+            return
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+BACKENDS = {
+    'mock': MockBackend,
+    'flux': FluxBackend,
+}
+
+
+class GenerationHandler(BaseHTTPRequestHandler):
+    """JSON request handler for the /health, /generate and /generate_batch endpoints."""
+
+    server_version = 'FluxServer/1.0'
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'ok': False, 'error': f"Unknown endpoint {self.path}"})
+            return
+        self.send_json(200, self.server.health())
+
+    def do_POST(self):
+        if self.path not in ('/generate', '/generate_batch'):
+            self.send_json(404, {'ok': False, 'error': f"Unknown endpoint {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if self.path == '/generate':
+                items = [{'prompt': payload['prompt'], 'output_path': payload['output_path']}]
+            else:
+                items = [
+                    {'prompt': item['prompt'], 'output_path': item['output_path'], 'seed': item.get('seed')}
+                    for item in payload['items']
+                ]
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'ok': False, 'error': f"Invalid request: {e}"})
+            return
+
+        params = {key: payload.get(key) for key in ('height', 'width', 'num_inference_steps')}
+        try:
+            if self.path == '/generate':
+                result = self.server.generate(items[0]['prompt'], items[0]['output_path'], payload.get('seed'), **params)
+            else:
+                result = self.server.generate_batch(items, **params)
+        except Exception as e:
+            logger.exception(f"Error handling {self.path} for {len(items)} items: {e}")
+            self.send_json(500, {'ok': False, 'error': str(e)})
+            return
+        self.send_json(200, result)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+class GenerationServerMixin:
+    """Holds the loaded backend and serializes access to it across request threads."""
+
+    daemon_threads = True
+
+    def setup_backend(self, backend):
+        self.backend = backend
+        self.generation_lock = threading.Lock()
+        self.started_at = time.time()
+        self.generated = 0
+        self.failed = 0
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'backend': self.backend.name,
+            'generated': self.generated,
+            'failed': self.failed,
+            'busy': self.generation_lock.locked(),
+            'uptime': round(time.time() - self.started_at, 1),
+        }
+
+    def generate(self, prompt, output_path, seed=None, **params):
+        """
+        Generate one image with the loaded backend.
+
+        Returns:
+            dict: The response payload with the output path, seed and duration
+        """
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        with self.generation_lock:
+            start = time.perf_counter()
+            try:
+                used_seed = self.backend.generate(prompt, output_path, seed, **params)
+            except Exception:
+                self.failed += 1
+                raise
+            duration = time.perf_counter() - start
+            self.generated += 1
+
+        if not os.path.exists(output_path):
+            raise RuntimeError(f"Output file not created at {output_path}")
+        return {'ok': True, 'output_path': output_path, 'seed': used_seed, 'duration': round(duration, 3)}
+
+    def generate_batch(self, items, **params):
+        """
+        Generate several images with one backend call.
+
+        Returns:
+            dict: The response payload with one result per item, in order
+        """
+        for item in items:
+            output_dir = os.path.dirname(item['output_path'])
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+        with self.generation_lock:
+            start = time.perf_counter()
+            results = self.backend.generate_batch(items, **params)
+            duration = time.perf_counter() - start
+
+        for item, result in zip(items, results):
+            result['output_path'] = item['output_path']
+            if result['ok'] and not os.path.exists(item['output_path']):
+                result.update(ok=False, error=f"Output file not created at {item['output_path']}")
+            if result['ok']:
+                self.generated += 1
+            else:
+                self.failed += 1
+        return {
+            'ok': all(result['ok'] for result in results),
+            'results': results,
+            'duration': round(duration, 3),
+        }
+
+
+class TCPGenerationServer(GenerationServerMixin, ThreadingHTTPServer):
+    """Generation server listening on a local TCP port."""
+
+
+class UnixGenerationServer(GenerationServerMixin, socketserver.ThreadingMixIn, HTTPServer):
+    """Generation server listening on a Unix domain socket."""
+
+    address_family = getattr(socket, 'AF_UNIX', None)
+
+    def server_bind(self):
+        # Remove a socket file left behind by a previous server
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def create_server(backend, socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Create a generation server for an already loaded backend.
+
+    Args:
+        backend: A loaded MockBackend or FluxBackend
+        socket_path (str, optional): Listen on this Unix socket instead of a TCP port
+        host (str): TCP host, local only by default
+        port (int): TCP port, 0 picks a free port
+
+    Returns:
+        The server; call serve_forever() to start handling requests
+    """
+    if socket_path:
+        if UnixGenerationServer.address_family is None:
+            raise RuntimeError("Unix sockets are not supported on this platform, use --port instead")
+        server = UnixGenerationServer(socket_path, GenerationHandler)
+    else:
+        server = TCPGenerationServer((host, port), GenerationHandler)
+    server.setup_backend(backend)
+    return server
+
+
+def get_server_address(server):
+    """Return the client address (unix:///path or http://host:port) of a server."""
+    if isinstance(server, UnixGenerationServer):
+        return f"unix://{server.server_address}"
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Flux AI image generation from a warm model')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='flux', help='Generation backend')
+    parser.add_argument('--socket', help='Listen on this Unix socket path')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='TCP host (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port (default: 8765)')
+    parser.add_argument('--project-path', help='Path of the Flux AI project (default: FLUX_PROJECT_PATH)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    backend = FluxBackend(project_path=args.project_path) if args.backend == 'flux' else MockBackend()
+    start = time.perf_counter()
+    if not backend.load():
+        logger.error("Failed to load the generation backend")
+        return False
+    logger.info(f"Loaded {backend.name} backend in {time.perf_counter() - start:.1f}s")
+
+    server = create_server(backend, socket_path=args.socket, host=args.host, port=args.port)
+    logger.info(f"Serving image generation at {get_server_address(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,186 @@
+"""
+Bulk catalog import for the library app.
+Imports books in chunks with bulk_create instead of one save() per row. Authors
+and publishers are resolved against existing rows through in-memory name maps,
+and the Book.authors through rows are inserted in bulk as well. Because
+bulk_create does not send model signals, the denormalized book counts, the genre
+index and the search index are refreshed once per chunk.
+"""
+import time
+from collections import namedtuple
+
+from django.db import transaction
+
+from .counters import refresh_author_book_counts, refresh_publisher_book_counts
+from .genres import sync_genres_for_books
+from .models import Author, Book, Publisher
+from .search import update_search_index
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DEFAULT_CHUNK_SIZE = 1000
+
+ChunkStats = namedtuple('ChunkStats', [
+    'number', 'rows', 'books', 'authors', 'publishers', 'seconds', 'peak_memory_mb'
+])
+
+
+def get_peak_memory_mb():
+    """Return the peak resident memory of the process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return peak / 1024 / 1024 if peak > 1024 ** 3 else peak / 1024
+
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items from an iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BookImporter:
+    """
+    Import book records in chunks.
+
+    Each record is a dict with:
+        book: Book field values (without publisher and authors)
+        authors: List of author names
+        publisher: Publisher name or None
+
+    Args:
+        chunk_size (int): Number of records inserted per transaction
+        author_defaults: Optional callable(name, record) returning extra fields for new authors
+        publisher_defaults: Optional callable(name, record) returning extra fields for new publishers
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, author_defaults=None, publisher_defaults=None):
+        self.chunk_size = max(1, chunk_size)
+        self.author_defaults = author_defaults or (lambda name, record: {})
+        self.publisher_defaults = publisher_defaults or (lambda name, record: {})
+        self.author_ids = None
+        self.publisher_ids = None
+        self.chunks = 0
+
+    def load_lookup_maps(self):
+        """Map the names of existing authors and publishers to their ids (the oldest row wins)."""
+        self.author_ids = self.build_name_map(Author)
+        self.publisher_ids = self.build_name_map(Publisher)
+
+    @staticmethod
+    def build_name_map(model):
+        names = {}
+        for name, pk in model.objects.order_by('-pk').values_list('name', 'pk').iterator(chunk_size=5000):
+            names[name] = pk
+        return names
+
+    def import_records(self, records):
+        """
+        Import an iterable of records, one chunk at a time.
+
+        Yields:
+            ChunkStats: Statistics of every imported chunk
+        """
+        for chunk in chunked(records, self.chunk_size):
+            yield self.import_chunk(chunk)
+
+    def import_chunk(self, records):
+        """
+        Insert one chunk of records in a single transaction.
+
+        Returns:
+            ChunkStats: Rows, created objects, duration and peak memory of the chunk
+        """
+        if self.author_ids is None:
+            self.load_lookup_maps()
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            authors_created = self.create_missing(
+                Author, self.author_ids,
+                [(name, record) for record in records for name in record['authors']],
+                self.author_defaults
+            )
+            publishers_created = self.create_missing(
+                Publisher, self.publisher_ids,
+                [(record['publisher'], record) for record in records if record['publisher']],
+                self.publisher_defaults
+            )
+
+            books = Book.objects.bulk_create([
+                Book(publisher_id=self.publisher_ids.get(record['publisher']), **record['book'])
+                for record in records
+            ], batch_size=self.chunk_size)
+            book_ids = self.get_book_ids(books)
+
+            through_rows = []
+            for book_id, record in zip(book_ids, records):
+                for author_id in dict.fromkeys(self.author_ids[name] for name in record['authors']):
+                    through_rows.append(Book.authors.through(book_id=book_id, author_id=author_id))
+            Book.authors.through.objects.bulk_create(through_rows, batch_size=self.chunk_size)
+
+            self.refresh_derived_data(book_ids, records)
+
+        self.chunks += 1
+        return ChunkStats(
+            number=self.chunks,
+            rows=len(records),
+            books=len(books),
+            authors=authors_created,
+            publishers=publishers_created,
+            seconds=time.perf_counter() - start,
+            peak_memory_mb=get_peak_memory_mb(),
+        )
+
+    def create_missing(self, model, name_ids, names, get_defaults):
+        """
+        Bulk create the named rows that are not in the lookup map yet and add them to it.
+
+        Args:
+            model: Author or Publisher
+            name_ids (dict): Lookup map of names to ids, updated in place
+            names (list): (name, record) pairs; the first record of a name provides its defaults
+            get_defaults: Callable(name, record) returning extra fields for a new row
+
+        Returns:
+            int: Number of created rows
+        """
+        new = {}
+        for name, record in names:
+            if name not in name_ids and name not in new:
+                new[name] = model(name=name, **get_defaults(name, record))
+        if not new:
+            return 0
+
+        created = model.objects.bulk_create(new.values(), batch_size=self.chunk_size)
+        if all(obj.pk for obj in created):
+            name_ids.update((obj.name, obj.pk) for obj in created)
+        else:
+            # Databases that cannot return ids from a bulk insert: look the new rows up
+            for name, pk in model.objects.filter(name__in=list(new)).order_by('-pk').values_list('name', 'pk'):
+                name_ids[name] = pk
+        return len(created)
+
+    @staticmethod
+    def get_book_ids(books):
+        if all(book.pk for book in books):
+            return [book.pk for book in books]
+        # Without returned ids, the new books are the last ones in insertion order
+        return list(reversed(Book.objects.order_by('-pk').values_list('pk', flat=True)[:len(books)]))
+
+    def refresh_derived_data(self, book_ids, records):
+        """Update what the model signals would have updated for the inserted books."""
+        refresh_author_book_counts({self.author_ids[name] for record in records for name in record['authors']})
+        refresh_publisher_book_counts({self.publisher_ids.get(record['publisher']) for record in records})
+        sync_genres_for_books(Book.objects.filter(pk__in=book_ids))
+        update_search_index(book_ids=book_ids)
@@ -0,0 +1,90 @@
+"""
+Denormalized book counters for the library app.
+Keeps Author.book_count and Publisher.book_count in sync with Book.authors and
+Book.publisher so that listings can sort by the number of books with an
+indexed column instead of counting books per row.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Author, Book, Publisher
+
+
+def get_book_count_source(model):
+    """
+    Return the table holding the relation counted for a model.
+
+    Returns:
+        tuple: (model of the relation rows, name of the foreign key to the counted model)
+    """
+    if model is Author:
+        return Book.authors.through, 'author'
+    if model is Publisher:
+        return Book, 'publisher'
+    raise ValueError(f"{model.__name__} has no book counter")
+
+
+def actual_book_count(model):
+    """
+    Return an expression computing the real number of books for each row of a model.
+    """
+    source, field = get_book_count_source(model)
+    counts = (
+        source.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def refresh_book_counts(model, pks=None):
+    """
+    Recompute the stored book count of some or all rows of a model.
+
+    Counts are recomputed from the relation rather than incremented, so a refresh
+    is idempotent and also repairs counters that drifted through bulk updates.
+
+    Args:
+        model: Author or Publisher
+        pks: Primary keys to refresh, or None for every row
+
+    Returns:
+        int: Number of rows updated
+    """
+    queryset = model.objects.all()
+    if pks is not None:
+        pks = {pk for pk in pks if pk is not None}
+        if not pks:
+            return 0
+        queryset = queryset.filter(pk__in=pks)
+
+    with transaction.atomic():
+        return queryset.update(book_count=actual_book_count(model))
+
+
+def refresh_author_book_counts(author_ids=None):
+    """Recompute Author.book_count for the given authors (all authors if None)."""
+    return refresh_book_counts(Author, author_ids)
+
+
+def refresh_publisher_book_counts(publisher_ids=None):
+    """Recompute Publisher.book_count for the given publishers (all publishers if None)."""
+    return refresh_book_counts(Publisher, publisher_ids)
+
+
+def find_book_count_drift(model):
+    """
+    Find rows whose stored book count differs from the real one.
+
+    Returns:
+        list: (pk, stored count, actual count) tuples ordered by primary key
+    """
+    return list(
+        model.objects.annotate(actual=actual_book_count(model))
+        .exclude(book_count=F('actual'))
+        .order_by('pk')
+        .values_list('pk', 'book_count', 'actual')
+    )
@@ -0,0 +1,364 @@
+"""
+Fuzzy duplicate detection and merging for the library catalog.
+Books are normalized into blocking keys (ISBN, title prefix, author surname plus
+title word) and only books sharing a key are compared, so the number of scored
+pairs grows with the size of the blocks rather than with the square of the
+catalog. Pairs scoring above a threshold are joined into clusters, and each
+cluster is merged into one book with set-based updates in a single transaction.
+Merging removes the duplicates, so running it again finds nothing new.
+"""
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .counters import refresh_author_book_counts, refresh_publisher_book_counts
+from .genres import sync_genres_for_books
+from .holds import renumber_queues
+from .models import Book, BookLoan, BookReservation, ImageGenerationJob, Review
+from .ratings import recompute_rating_summaries
+from .search import update_search_index
+
+DEFAULT_THRESHOLD = 0.9
+# Blocks larger than this come from very common keys and are not compared pairwise
+DEFAULT_MAX_BLOCK_SIZE = 200
+TITLE_PREFIX_LENGTH = 12
+TITLE_WEIGHT = 0.75
+
+# Fields copied from a duplicate when the kept book has no value
+FILL_FIELDS = ('cover', 'description', 'publication_date', 'isbn', 'pages', 'language', 'genres', 'publisher_id')
+
+STOP_WORDS = {'the', 'a', 'an', 'and', 'of', 'i', 'w', 'z', 'na', 'o'}
+
+CandidateBook = namedtuple('CandidateBook', ['pk', 'title', 'raw_title', 'isbn', 'surnames'])
+
+
+def normalize_text(value):
+    """Lowercase, strip accents, bracketed parts and punctuation, and collapse spaces."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char)).lower()
+    value = value.replace('ł', 'l')
+    value = re.sub(r'[(\[][^)\]]*[)\]]', ' ', value)
+    value = re.sub(r'[^\w\s]', ' ', value)
+    return ' '.join(value.split())
+
+
+def normalize_isbn(value):
+    """
+    Return the ISBN-13 form of an ISBN, or None if it is not a valid length.
+    ISBN-10 and ISBN-13 of the same edition normalize to the same value.
+    """
+    digits = re.sub(r'[^0-9Xx]', '', value or '').upper()
+    # X is only valid as the ISBN-10 check digit
+    if len(digits) == 10 and digits[:9].isdigit():
+        body = '978' + digits[:9]
+        check = (10 - sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(body)) % 10) % 10
+        return body + str(check)
+    if len(digits) == 13 and digits.isdigit():
+        return digits
+    return None
+
+
+def get_surname(name):
+    words = normalize_text(name).split()
+    return words[-1] if words else ''
+
+
+def get_blocking_keys(book):
+    """
+    Return the blocks a book is compared in.
+
+    Args:
+        book (CandidateBook): Normalized book
+
+    Returns:
+        set: (kind, key) pairs
+    """
+    keys = set()
+    if book.isbn:
+        keys.add(('isbn', book.isbn))
+    words = [word for word in book.title.split() if word not in STOP_WORDS]
+    compact = ''.join(words)
+    if compact:
+        keys.add(('title', compact[:TITLE_PREFIX_LENGTH]))
+    if words:
+        for surname in book.surnames:
+            keys.add(('author', f"{surname}:{words[0]}"))
+    return keys
+
+
+def score_pair(first, second, threshold=0.0):
+    """
+    Return the similarity of two books between 0 and 1.
+
+    The same ISBN is a match and two different ISBNs are different editions.
+    Otherwise the title similarity is combined with the overlap of author surnames.
+    Pairs that cannot reach the threshold score 0 without computing the full ratio.
+    """
+    if first.isbn and second.isbn:
+        return 1.0 if first.isbn == second.isbn else 0.0
+
+    if first.surnames and second.surnames:
+        title_weight = TITLE_WEIGHT
+        # Overlap rather than Jaccard, so an extra co-author or translator is not a mismatch
+        author_score = len(first.surnames & second.surnames) / min(len(first.surnames), len(second.surnames))
+    else:
+        title_weight, author_score = 1.0, 0.0
+
+    matcher = SequenceMatcher(None, first.title, second.title)
+    for upper_bound in (matcher.real_quick_ratio, matcher.quick_ratio):
+        if title_weight * upper_bound() + (1 - title_weight) * author_score < threshold:
+            return 0.0
+    return title_weight * matcher.ratio() + (1 - title_weight) * author_score
+
+
+def load_candidates(books=None):
+    """
+    Load normalized titles, ISBNs and author surnames with two streamed queries.
+
+    Args:
+        books (QuerySet): Books to consider, all books if None
+
+    Returns:
+        dict: CandidateBook per book id
+    """
+    books = Book.objects.all() if books is None else books
+    surnames = defaultdict(set)
+    through = Book.authors.through.objects.filter(book__in=books.values('pk'))
+    for book_id, name in through.values_list('book_id', 'author__name').iterator(chunk_size=5000):
+        surname = get_surname(name)
+        if surname:
+            surnames[book_id].add(surname)
+
+    candidates = {}
+    for pk, title, isbn in books.order_by().values_list('pk', 'title', 'isbn').iterator(chunk_size=5000):
+        candidates[pk] = CandidateBook(pk, normalize_text(title), title, normalize_isbn(isbn),
+                                       frozenset(surnames.get(pk, ())))
+    return candidates
+
+
+class DuplicateReport:
+    """Clusters found by find_duplicate_clusters and totals of the search."""
+
+    def __init__(self):
+        self.books = self.blocks = self.skipped_blocks = self.comparisons = 0
+        self.clusters = []
+        self.titles = {}
+
+
+def find_duplicate_clusters(books=None, threshold=DEFAULT_THRESHOLD, max_block_size=DEFAULT_MAX_BLOCK_SIZE):
+    """
+    Find clusters of books that are probably the same book.
+
+    Args:
+        books (QuerySet): Books to consider, all books if None
+        threshold (float): Minimum score of a duplicate pair
+        max_block_size (int): Blocks with more books are skipped
+
+    Returns:
+        DuplicateReport: Clusters as sorted lists of book ids, largest first
+    """
+    report = DuplicateReport()
+    candidates = load_candidates(books)
+    report.books = len(candidates)
+
+    blocks = defaultdict(list)
+    for book in candidates.values():
+        for key in get_blocking_keys(book):
+            blocks[key].append(book.pk)
+
+    parents = {}
+
+    def find(pk):
+        parents.setdefault(pk, pk)
+        while parents[pk] != pk:
+            parents[pk] = parents[parents[pk]]
+            pk = parents[pk]
+        return pk
+
+    compared = set()
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+        if len(block) > max_block_size:
+            report.skipped_blocks += 1
+            continue
+        report.blocks += 1
+        for first, second in combinations(sorted(block), 2):
+            if (first, second) in compared or find(first) == find(second):
+                continue
+            compared.add((first, second))
+            report.comparisons += 1
+            if score_pair(candidates[first], candidates[second], threshold) >= threshold:
+                parents[find(second)] = find(first)
+
+    clusters = defaultdict(list)
+    for pk in parents:
+        clusters[find(pk)].append(pk)
+    report.clusters = sorted(
+        (sorted(cluster) for cluster in clusters.values() if len(cluster) > 1),
+        key=lambda cluster: (-len(cluster), cluster[0])
+    )
+    report.titles = {pk: candidates[pk].raw_title for cluster in report.clusters for pk in cluster}
+    return report
+
+
+def get_related_counts(book_ids):
+    """
+    Count the loans, reservations and reviews of books with one grouped query per table.
+
+    Returns:
+        dict: {book id: {'loans': n, 'reservations': n, 'reviews': n}}
+    """
+    counts = defaultdict(lambda: {'loans': 0, 'reservations': 0, 'reviews': 0})
+    for key, model in (('loans', BookLoan), ('reservations', BookReservation), ('reviews', Review)):
+        rows = model.objects.filter(book_id__in=book_ids).order_by().values('book_id').annotate(total=Count('pk'))
+        for row in rows:
+            counts[row['book_id']][key] = row['total']
+    return counts
+
+
+def close_double_holdings(keep_id, duplicate_ids):
+    """
+    Close the loans and holds that would give a patron two of them on the merged book.
+
+    A patron keeps one open loan and one active hold across the cluster: the loan
+    on the kept book if there is one, otherwise the oldest, and a hold already set
+    aside for pickup before a pending one, then the same way as loans. The other
+    loans are returned and the other holds cancelled.
+
+    Returns:
+        int: Copies freed by the closed loans and the cancelled ready holds
+    """
+    cluster = [keep_id, *duplicate_ids]
+    today = timezone.now().date()
+
+    loans = BookLoan.objects.filter(
+        book_id__in=cluster, status__in=['borrowed', 'overdue'], return_date__isnull=True
+    ).values_list('pk', 'user_id', 'book_id', 'loan_date')
+    extra_loans = []
+    seen = set()
+    for pk, user_id, book_id, loan_date in sorted(loans, key=lambda row: (row[2] != keep_id, row[3], row[0])):
+        if user_id in seen:
+            extra_loans.append(pk)
+        seen.add(user_id)
+    freed = BookLoan.objects.filter(pk__in=extra_loans).update(status='returned', return_date=today)
+
+    holds = BookReservation.objects.filter(
+        book_id__in=cluster, status__in=['pending', 'fulfilled']
+    ).values_list('pk', 'user_id', 'book_id', 'status', 'reservation_date')
+    extra_holds = []
+    seen = set()
+    for pk, user_id, book_id, status, reservation_date in sorted(
+        holds, key=lambda row: (row[3] != 'fulfilled', row[2] != keep_id, row[4], row[0])
+    ):
+        if user_id in seen:
+            extra_holds.append(pk)
+        seen.add(user_id)
+    extra_holds = BookReservation.objects.filter(pk__in=extra_holds)
+    # A ready hold had a copy set aside
+    freed += extra_holds.filter(status='fulfilled').count()
+    extra_holds.update(status='cancelled', queue_position=None)
+    return freed
+
+
+@transaction.atomic
+def merge_cluster(cluster, keep_newest=False, sum_copies=False):
+    """
+    Merge a cluster of duplicate books into one of them.
+
+    Loans, reservations and reviews are moved with queryset updates, so no model
+    signals fire for them. A patron left with two open loans or two active holds
+    keeps one of each (see close_double_holdings), and a user with reviews of
+    several books in the cluster keeps the highest rated one. Authors and
+    categories are combined and empty fields of the kept book are filled from the
+    duplicates. The kept book keeps its copies, since duplicates usually describe
+    the same shelf, unless sum_copies adds up the copies of the whole cluster.
+    Without it, the open loans and ready holds moved from the duplicates take
+    copies of the kept book, so they are subtracted from its available copies.
+
+    Args:
+        cluster (list): Ids of the books in the cluster
+        keep_newest (bool): Keep the book with the highest id instead of the lowest
+        sum_copies (bool): Add the copies of the duplicates to the kept book
+
+    Returns:
+        int: Id of the kept book
+    """
+    cluster = sorted(cluster)
+    keep_id = cluster[-1] if keep_newest else cluster[0]
+    duplicate_ids = [pk for pk in cluster if pk != keep_id]
+    books = {book.pk: book for book in Book.objects.select_for_update().filter(pk__in=cluster)}
+    if keep_id not in books:
+        return None
+    keep = books[keep_id]
+    duplicates = [books[pk] for pk in duplicate_ids if pk in books]
+    duplicate_ids = [book.pk for book in duplicates]
+    if not duplicate_ids:
+        return keep_id
+
+    # One review per user: keep the highest rating, preferring the kept book's review
+    best_reviews = {}
+    reviews = Review.objects.filter(book_id__in=cluster).values_list('pk', 'user_id', 'rating', 'book_id')
+    for pk, user_id, rating, book_id in reviews:
+        rank = (rating, book_id == keep_id, -pk)
+        if user_id not in best_reviews or rank > best_reviews[user_id][0]:
+            best_reviews[user_id] = (rank, pk)
+    kept_reviews = [pk for _, pk in best_reviews.values()]
+    Review.objects.filter(book_id__in=cluster).exclude(pk__in=kept_reviews).delete()
+    Review.objects.filter(book_id__in=duplicate_ids).update(book_id=keep_id)
+
+    freed = close_double_holdings(keep_id, duplicate_ids)
+    moved_out = (
+        BookLoan.objects.filter(
+            book_id__in=duplicate_ids, status__in=['borrowed', 'overdue'], return_date__isnull=True
+        ).count()
+        + BookReservation.objects.filter(book_id__in=duplicate_ids, status='fulfilled').count()
+    )
+    BookLoan.objects.filter(book_id__in=duplicate_ids).update(book_id=keep_id)
+    BookReservation.objects.filter(book_id__in=duplicate_ids).update(book_id=keep_id)
+    # The moved holds keep their positions from the duplicate's queue
+    renumber_queues([keep_id])
+    ImageGenerationJob.objects.filter(
+        entity_type='book', entity_id__in=duplicate_ids, status__in=ImageGenerationJob.ACTIVE_STATUSES
+    ).update(status='cancelled')
+
+    for relation, field in ((Book.authors.through, 'author_id'), (Book.categories.through, 'category_id')):
+        existing = set(relation.objects.filter(book_id=keep_id).values_list(field, flat=True))
+        missing = set(relation.objects.filter(book_id__in=duplicate_ids).values_list(field, flat=True)) - existing
+        relation.objects.bulk_create([relation(book_id=keep_id, **{field: pk}) for pk in missing],
+                                     ignore_conflicts=True)
+
+    updates = {}
+    if sum_copies:
+        total_copies = keep.total_copies + sum(book.total_copies for book in duplicates)
+        updates['total_copies'] = total_copies
+        updates['available_copies'] = min(
+            keep.available_copies + sum(book.available_copies for book in duplicates) + freed, total_copies
+        )
+    elif moved_out:
+        # The copies freed on duplicates went with them
+        updates['available_copies'] = max(keep.available_copies - moved_out, 0)
+    for field in FILL_FIELDS:
+        if not getattr(keep, field):
+            value = next((getattr(book, field) for book in duplicates if getattr(book, field)), None)
+            if value:
+                updates[field] = value
+    if updates:
+        Book.objects.filter(pk=keep_id).update(**updates)
+
+    # Deleting sends the Book delete signals, which remove the duplicates from the search index
+    Book.objects.filter(pk__in=duplicate_ids).delete()
+
+    kept = Book.objects.filter(pk=keep_id)
+    refresh_author_book_counts(set(Book.authors.through.objects.filter(book_id=keep_id).values_list('author_id', flat=True)))
+    refresh_publisher_book_counts({book.publisher_id for book in books.values()})
+    sync_genres_for_books(kept)
+    recompute_rating_summaries(kept)
+    update_search_index(book_ids=[keep_id])
+    return keep_id
@@ -95,7 +95,34 @@ class PublisherForm(forms.ModelForm):
         }
 
 
-class BookForm(forms.ModelForm):
+class CopyCountsFormMixin(forms.Form):
+    """
+    Send a book's copy counts as they were when the form was rendered, so
+    library.inventory.apply_copy_edit can apply the edit as a delta from them.
+    """
+    rendered_total_copies = forms.IntegerField(widget=forms.HiddenInput, required=False)
+    rendered_available_copies = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The counts when the form was submitted, for forms sent without the hidden fields
+        self.current_counts = (self.instance.total_copies, self.instance.available_copies)
+        if self.instance.pk and not self.is_bound:
+            self.initial['rendered_total_copies'], self.initial['rendered_available_copies'] = self.current_counts
+
+    def get_rendered_counts(self):
+        """
+        Returns:
+            tuple: total_copies and available_copies of the book as the form showed them
+        """
+        total = self.cleaned_data.get('rendered_total_copies')
+        available = self.cleaned_data.get('rendered_available_copies')
+        if total is None or available is None:
+            return self.current_counts
+        return total, available
+
+
+class BookForm(CopyCountsFormMixin, forms.ModelForm):
     """Form for creating and editing books."""
     
     class Meta:
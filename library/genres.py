@@ -0,0 +1,154 @@
+"""
+Genre index for the library app.
+Keeps BookGenre rows in sync with Book.genres and Book.categories so that
+genre filters are resolved in SQL instead of scanning every book in Python.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import Book, BookGenre
+
+
+GENRE_NAME_MAX_LENGTH = BookGenre._meta.get_field('name').max_length
+
+
+def extract_genres(genres):
+    """
+    Normalize the value of Book.genres into a list of genre names.
+
+    The JSON field has been populated as a list, a comma separated string
+    or a dictionary keyed by genre over time, so all three shapes are accepted.
+
+    Args:
+        genres: Value of the Book.genres field
+
+    Returns:
+        list: Genre names in their original order, without blanks
+    """
+    if not genres:
+        return []
+
+    if isinstance(genres, dict):
+        values = genres.keys()
+    elif isinstance(genres, str):
+        values = genres.split(',')
+    elif isinstance(genres, (list, tuple)):
+        values = genres
+    else:
+        return []
+
+    names = []
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        value = value.strip()[:GENRE_NAME_MAX_LENGTH]
+        if value and value not in names:
+            names.append(value)
+    return names
+
+
+def get_genre_keys(book, category_slugs=None):
+    """
+    Return the set of (name, source) pairs that should be indexed for a book.
+
+    Args:
+        book (Book): The book to index
+        category_slugs (list): Slugs of the book's categories, looked up if not given
+    """
+    if category_slugs is None:
+        category_slugs = book.categories.values_list('slug', flat=True)
+
+    keys = {(name, 'genre') for name in extract_genres(book.genres)}
+    keys.update((slug[:GENRE_NAME_MAX_LENGTH], 'category') for slug in category_slugs if slug)
+    return keys
+
+
+def _apply_genre_keys(book_keys):
+    """
+    Bring BookGenre rows in line with the desired keys for several books.
+
+    Args:
+        book_keys (dict): Mapping of book id to a set of (name, source) pairs
+
+    Returns:
+        tuple: Number of rows created and deleted
+    """
+    existing = {book_id: set() for book_id in book_keys}
+    stale_ids = []
+    for entry_id, book_id, name, source in BookGenre.objects.filter(
+        book_id__in=list(book_keys)
+    ).values_list('id', 'book_id', 'name', 'source'):
+        if (name, source) in book_keys[book_id]:
+            existing[book_id].add((name, source))
+        else:
+            stale_ids.append(entry_id)
+
+    new_entries = [
+        BookGenre(book_id=book_id, name=name, source=source)
+        for book_id, keys in book_keys.items()
+        for name, source in keys - existing[book_id]
+    ]
+
+    with transaction.atomic():
+        if stale_ids:
+            BookGenre.objects.filter(id__in=stale_ids).delete()
+        if new_entries:
+            BookGenre.objects.bulk_create(new_entries, ignore_conflicts=True)
+
+    return len(new_entries), len(stale_ids)
+
+
+def sync_book_genres(book):
+    """
+    Update the genre index for a single book.
+
+    Args:
+        book (Book): A saved book instance
+    """
+    if book.pk is None:
+        return 0, 0
+    return _apply_genre_keys({book.pk: get_genre_keys(book)})
+
+
+def sync_genres_for_books(books, batch_size=1000):
+    """
+    Update the genre index for every book in a queryset, in batches.
+
+    Args:
+        books (QuerySet): Books to (re)index
+        batch_size (int): Number of books processed per batch
+
+    Returns:
+        tuple: Total number of rows created and deleted
+    """
+    created = deleted = 0
+    book_ids = list(books.order_by('pk').values_list('pk', flat=True))
+
+    for start in range(0, len(book_ids), batch_size):
+        batch = (
+            Book.objects.filter(pk__in=book_ids[start:start + batch_size])
+            .only('id', 'genres')
+            .prefetch_related('categories')
+        )
+        book_keys = {
+            book.pk: get_genre_keys(book, [category.slug for category in book.categories.all()])
+            for book in batch
+        }
+        batch_created, batch_deleted = _apply_genre_keys(book_keys)
+        created += batch_created
+        deleted += batch_deleted
+
+    return created, deleted
+
+
+def filter_books_by_genre(queryset, genre):
+    """
+    Restrict a Book queryset to books tagged with the given genre.
+
+    Matches both entries from Book.genres and category slugs. The lookup is
+    an EXISTS subquery on the (name, book) index, so it composes with other
+    filters without introducing duplicate rows.
+    """
+    return queryset.filter(
+        Exists(BookGenre.objects.filter(book=OuterRef('pk'), name=genre))
+    )
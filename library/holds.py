@@ -0,0 +1,201 @@
+"""
+FIFO hold queue of book reservations.
+Every pending reservation has an explicit, dense queue_position within its book
+(1 is next in line), so the next hold is a single index lookup on
+(book, status, queue_position) and a patron's position is read from the row
+instead of counted. Promoting the head of the queue, or leaving the queue,
+shifts the holds behind it with one UPDATE. Copies are moved by
+library.inventory, which calls these functions in the same transaction.
+
+While a reservation waits in the queue its expiry_date is the end of its hold
+lifetime (LibrarySettings.hold_lifetime_days); the shorter pickup window of
+reservation_expiry_days only starts when a copy is set aside for it.
+"""
+from datetime import timedelta
+
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import BookReservation, LibrarySettings
+from .outbox import enqueue_email
+
+
+def get_next_hold(book_id):
+    """Return the pending reservation next in line for a book, or None."""
+    return BookReservation.objects.filter(
+        book_id=book_id, status='pending'
+    ).order_by('queue_position', 'pk').first()
+
+
+def has_queue(book_id):
+    """Check whether anybody is already waiting in a book's queue."""
+    return BookReservation.objects.filter(book_id=book_id, status='pending', queue_position__isnull=False).exists()
+
+
+def add_to_queue(reservation):
+    """
+    Put a pending reservation at the end of its book's queue.
+
+    Returns:
+        int: The queue position of the reservation
+    """
+    last = BookReservation.objects.filter(
+        book_id=reservation.book_id, status='pending'
+    ).exclude(pk=reservation.pk).aggregate(last=Max('queue_position'))['last']
+    reservation.queue_position = (last or 0) + 1
+    BookReservation.objects.filter(pk=reservation.pk).update(queue_position=reservation.queue_position)
+    return reservation.queue_position
+
+
+def close_gap(book_id, position):
+    """Move every hold behind a position that left the queue one place forward."""
+    if position is None:
+        return 0
+    return BookReservation.objects.filter(
+        book_id=book_id, status='pending', queue_position__gt=position
+    ).update(queue_position=F('queue_position') - 1)
+
+
+def get_hold_expiry(today=None):
+    """Return the date until which a new reservation may wait in the queue."""
+    today = today or timezone.now().date()
+    return today + timedelta(days=LibrarySettings.get_settings().hold_lifetime_days)
+
+
+def get_pickup_deadline(today=None):
+    """Return the date until which a ready reservation is held for the patron."""
+    today = today or timezone.now().date()
+    return today + timedelta(days=LibrarySettings.get_settings().reservation_expiry_days)
+
+
+def fulfill_hold(reservation):
+    """
+    Mark a pending reservation ready for pickup, with a pickup deadline, and
+    queue the notification. The caller has already set a copy aside for it.
+
+    Returns:
+        bool: False if the reservation was no longer pending
+    """
+    deadline = get_pickup_deadline()
+    claimed = BookReservation.objects.filter(pk=reservation.pk, status='pending').update(
+        status='fulfilled', expiry_date=deadline, queue_position=None
+    )
+    if not claimed:
+        return False
+    close_gap(reservation.book_id, reservation.queue_position)
+    reservation.status = 'fulfilled'
+    reservation.expiry_date = deadline
+    reservation.queue_position = None
+    enqueue_email('reservation_available', reservation)
+    return True
+
+
+def promote_next_hold(book_id):
+    """
+    Give a copy that came back to the patron next in line.
+
+    Returns:
+        BookReservation: The promoted reservation, or None if nobody is waiting
+    """
+    # A concurrent promotion may claim the same head first, so try the next one
+    while True:
+        reservation = get_next_hold(book_id)
+        if reservation is None:
+            return None
+        if fulfill_hold(reservation):
+            return reservation
+
+
+def promote_holds(book_id, count, expired_before=None):
+    """
+    Give several copies that became free to the holds at the head of a book's
+    queue at once, with one UPDATE for the promoted holds and one for the rest
+    of the queue.
+
+    Args:
+        book_id (int): The book whose copies became free
+        count (int): The number of free copies
+        expired_before (date): Skip holds that expire before this date
+
+    Returns:
+        list: The promoted reservations, fewer than count if the queue ran out
+    """
+    heads = BookReservation.objects.select_related('user').filter(book_id=book_id, status='pending')
+    if expired_before is not None:
+        heads = heads.exclude(expiry_date__lt=expired_before)
+    heads = list(heads.select_for_update().order_by('queue_position', 'pk')[:count])
+    if not heads:
+        return []
+    deadline = get_pickup_deadline()
+    head_ids = [reservation.pk for reservation in heads]
+    claimed = BookReservation.objects.filter(pk__in=head_ids, status='pending').update(
+        status='fulfilled', expiry_date=deadline, queue_position=None
+    )
+    if claimed < len(heads):
+        # Without row locks a concurrent fulfill_hold or cancellation took some of the heads
+        heads = list(BookReservation.objects.select_related('user').filter(
+            pk__in=head_ids, status='fulfilled', expiry_date=deadline
+        ).order_by('pk')[:claimed])
+    renumber_queues([book_id])
+    for reservation in heads:
+        reservation.status = 'fulfilled'
+        reservation.expiry_date = deadline
+        reservation.queue_position = None
+        enqueue_email('reservation_available', reservation)
+    return heads
+
+
+def renumber_queues(book_ids):
+    """
+    Make the queue positions of some books dense again (1, 2, 3, ...) after
+    several holds left them at once, keeping the order of the holds.
+
+    Returns:
+        int: The number of holds that moved
+    """
+    pending = BookReservation.objects.filter(
+        book_id__in=book_ids, status='pending'
+    ).order_by('book_id', 'queue_position', 'pk').only('pk', 'book_id', 'queue_position')
+    moved = []
+    book_id = position = None
+    for reservation in pending.iterator(chunk_size=2000):
+        if reservation.book_id != book_id:
+            book_id, position = reservation.book_id, 0
+        position += 1
+        if reservation.queue_position != position:
+            reservation.queue_position = position
+            moved.append(reservation)
+    BookReservation.objects.bulk_update(moved, ['queue_position'], batch_size=500)
+    return len(moved)
+
+
+def leave_queue(reservation, status):
+    """
+    Cancel or expire a pending reservation and close the gap it leaves.
+
+    Returns:
+        bool: False if the reservation was no longer pending
+    """
+    claimed = BookReservation.objects.filter(pk=reservation.pk, status='pending').update(
+        status=status, queue_position=None
+    )
+    if claimed:
+        close_gap(reservation.book_id, reservation.queue_position)
+        reservation.status = status
+        reservation.queue_position = None
+    return bool(claimed)
+
+
+def collect_hold(book_id, user_id):
+    """
+    Mark a patron's ready reservation of a book as collected when they borrow it.
+
+    Returns:
+        bool: True if the patron had a copy set aside
+    """
+    reservation_id = BookReservation.objects.filter(
+        book_id=book_id, user_id=user_id, status='fulfilled'
+    ).values_list('pk', flat=True).first()
+    if reservation_id is None:
+        return False
+    return bool(BookReservation.objects.filter(pk=reservation_id, status='fulfilled').update(status='collected'))
@@ -0,0 +1,198 @@
+"""
+Responsive image derivatives for the library app.
+Book covers, author photos, publisher logos and profile pictures are served in
+several widths and modern formats (AVIF, WebP) instead of at full size. Each
+derivative is cached on disk under a deterministic name derived from the source
+file, its modification time, the width and the format, so a replaced source
+gets new derivatives and stale ones are never served.
+
+Derivatives are created lazily by the image_derivative view the first time a
+variant is requested, unless settings.IMAGE_DERIVATIVES_EAGER is enabled, in
+which case they are generated when the image is saved.
+"""
+import hashlib
+import logging
+import os
+import posixpath
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils._os import safe_join
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_VERSION = 1
+DERIVATIVE_DIRECTORY = 'derivatives'
+DERIVATIVE_WIDTHS = (80, 160, 320, 640)
+# Preferred format first; formats missing from the Pillow build are skipped
+DERIVATIVE_FORMATS = ('avif', 'webp', 'jpeg')
+# Only images in these media directories have derivatives
+SOURCE_DIRECTORIES = ('covers', 'authors', 'publishers', 'profile_pics')
+
+FORMAT_OPTIONS = {
+    'avif': {'extension': 'avif', 'mime_type': 'image/avif', 'pil_format': 'AVIF', 'quality': 50},
+    'webp': {'extension': 'webp', 'mime_type': 'image/webp', 'pil_format': 'WEBP', 'quality': 75},
+    'jpeg': {'extension': 'jpg', 'mime_type': 'image/jpeg', 'pil_format': 'JPEG', 'quality': 80},
+}
+
+
+def get_widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DERIVATIVE_WIDTHS))
+
+
+def is_format_supported(fmt):
+    if fmt == 'jpeg':
+        return True
+    try:
+        return bool(features.check(fmt))
+    except ValueError:
+        return False
+
+
+def get_formats():
+    """Return the configured derivative formats that this Pillow build can encode."""
+    formats = getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', DERIVATIVE_FORMATS)
+    return tuple(fmt for fmt in formats if fmt in FORMAT_OPTIONS and is_format_supported(fmt))
+
+
+def get_source_path(name):
+    """
+    Return the absolute path of a source image.
+
+    Raises:
+        ValueError: If the name is outside the directories that have derivatives
+    """
+    name = name.replace('\\', '/')
+    if name.split('/', 1)[0] not in SOURCE_DIRECTORIES:
+        raise ValueError(f"{name} is not a library image")
+    return safe_join(settings.MEDIA_ROOT, name)
+
+
+def get_derivative_name(name, width, fmt, source_mtime_ns):
+    """
+    Return the deterministic media-relative name of a derivative.
+
+    Args:
+        name (str): Media-relative name of the source image
+        width (int): Target width in pixels
+        fmt (str): Key of FORMAT_OPTIONS
+        source_mtime_ns (int): Modification time of the source, so a replaced source gets a new name
+    """
+    options = FORMAT_OPTIONS[fmt]
+    key = f"{DERIVATIVE_VERSION}:{name}:{source_mtime_ns}:{width}:{fmt}:{options['quality']}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    stem = os.path.splitext(posixpath.basename(name.replace('\\', '/')))[0][:40]
+    return posixpath.join(DERIVATIVE_DIRECTORY, digest[:2], f"{stem}-{digest[:12]}-{width}w.{options['extension']}")
+
+
+def render_derivative(source_path, output_path, width, fmt):
+    """Resize the source to the width (never upscaling) and encode it in the format."""
+    options = FORMAT_OPTIONS[fmt]
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        if fmt == 'jpeg' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA')
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # Write to a temporary file first, so concurrent requests never see a partial image
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        img.save(temp_path, format=options['pil_format'], quality=options['quality'])
+    os.replace(temp_path, output_path)
+
+
+def get_derivative(name, width, fmt, create=True):
+    """
+    Return the media-relative name of a derivative, generating it if needed.
+
+    Returns:
+        str: The derivative name, or None if the source is missing or it does not exist yet
+
+    Raises:
+        ValueError: If the name is not a library image
+    """
+    source_path = get_source_path(name)
+    try:
+        source_mtime_ns = os.stat(source_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    derivative_name = get_derivative_name(name, width, fmt, source_mtime_ns)
+    output_path = os.path.join(settings.MEDIA_ROOT, derivative_name)
+    if os.path.exists(output_path):
+        return derivative_name
+    if not create:
+        return None
+    render_derivative(source_path, output_path, width, fmt)
+    return derivative_name
+
+
+def get_derivative_url(name, width, fmt):
+    """
+    Return the URL of a derivative: the media URL once it exists, otherwise the
+    image_derivative view, which generates it on the first request.
+    """
+    derivative_name = get_derivative(name, width, fmt, create=False)
+    if derivative_name:
+        return settings.MEDIA_URL + derivative_name
+    return reverse('image_derivative', kwargs={'width': width, 'fmt': fmt, 'name': name.replace('\\', '/')})
+
+
+def get_candidate_widths(display_width=None):
+    """
+    Return the derivative widths worth offering for an image shown at display_width
+    CSS pixels: every width up to the first one that covers a 2x screen.
+    """
+    widths = sorted(get_widths())
+    if not display_width:
+        return widths
+    candidates = []
+    for width in widths:
+        candidates.append(width)
+        if width >= display_width * 2:
+            break
+    return candidates
+
+
+def get_srcset(name, fmt, display_width=None):
+    """Return the srcset attribute value for an image in one format."""
+    return ', '.join(
+        f"{get_derivative_url(name, width, fmt)} {width}w"
+        for width in get_candidate_widths(display_width)
+    )
+
+
+def generate_derivatives(name, widths=None, formats=None):
+    """
+    Generate all derivatives of an image up front, skipping existing ones.
+
+    Used when settings.IMAGE_DERIVATIVES_EAGER is enabled and for finished AI
+    image jobs; otherwise the image_derivative view creates them on request.
+
+    Returns:
+        int: Number of derivatives that exist after the call
+    """
+    if not name:
+        return 0
+    count = 0
+    try:
+        for width in widths or get_widths():
+            for fmt in formats or get_formats():
+                if get_derivative(name, width, fmt):
+                    count += 1
+    except Exception as e:
+        logger.warning(f"Could not generate image derivatives for {name}: {e}")
+    return count
+
+
+def has_derivatives(name):
+    """Check cheaply whether an image already has its derivatives, using the smallest one."""
+    try:
+        return get_derivative(name, min(get_widths()), 'jpeg', create=False) is not None
+    except ValueError:
+        return True
@@ -0,0 +1,274 @@
+"""
+Queue of AI image generation jobs for the library app.
+Model signals only enqueue an ImageGenerationJob row; the process_image_jobs
+management command claims due jobs and runs the slow Flux generation outside
+of the request/response cycle, with retries and exponential backoff.
+"""
+import logging
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Author, Book, ImageGenerationJob, Publisher
+from .image_derivatives import generate_derivatives
+from .job_queue import claim, requeue_stale, schedule_retry
+from .media_store import get_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 3
+# Base delay before a failed job is retried, doubled after every failed attempt
+DEFAULT_RETRY_DELAY = 60
+
+ImageTarget = namedtuple('ImageTarget', ['model', 'kind', 'field', 'directory', 'label_field'])
+
+IMAGE_TARGETS = {
+    'book': ImageTarget(Book, 'cover', 'cover', 'covers', 'title'),
+    'author': ImageTarget(Author, 'portrait', 'photo', 'authors', 'name'),
+    'publisher': ImageTarget(Publisher, 'logo', 'logo', 'publishers', 'name'),
+}
+
+ENTITY_TYPES = {target.model: entity_type for entity_type, target in IMAGE_TARGETS.items()}
+
+
+def has_image(instance, target):
+    image = getattr(instance, target.field)
+    return bool(image and image.name)
+
+
+def build_prompt(entity_type, instance):
+    """Return the Flux prompt for an entity's image."""
+    if entity_type == 'book':
+        authors = ", ".join(author.name for author in instance.authors.all())
+        return (
+            f"A professional book cover for '{instance.title}' by {authors}. "
+            "High quality, detailed, publishing industry standard."
+        )
+    if entity_type == 'author':
+        return (
+            f"A professional portrait photograph of author {instance.name}. "
+            "High quality, detailed, professional headshot."
+        )
+    return (
+        f"A professional logo for publishing company '{instance.name}'. "
+        "Clean, corporate design, minimalist, high quality."
+    )
+
+
+def get_relative_path(target, instance):
+    """Return the media-relative path of the generated image for an entity."""
+    label = getattr(instance, target.label_field)
+    filename = f"{instance.id}_{label.replace(' ', '_')[:30]}.jpg"
+    return os.path.join(target.directory, filename)
+
+
+def needs_image(instance):
+    """
+    Check whether an entity should get an AI generated image.
+    Books are only illustrated once they have authors, which the prompt names.
+    """
+    target = IMAGE_TARGETS.get(ENTITY_TYPES.get(type(instance)))
+    if target is None or not instance.pk or has_image(instance, target):
+        return False
+    if target.model is Book and not instance.authors.exists():
+        return False
+    return True
+
+
+def enqueue_image_job(instance):
+    """
+    Queue image generation for an entity unless it has an image or a job is already queued.
+
+    Args:
+        instance: A Book, Author or Publisher
+
+    Returns:
+        ImageGenerationJob: The new or already active job, or None if no image is needed
+    """
+    if not needs_image(instance):
+        return None
+
+    entity_type = ENTITY_TYPES[type(instance)]
+    lookup = {
+        'entity_type': entity_type,
+        'entity_id': instance.pk,
+        'kind': IMAGE_TARGETS[entity_type].kind,
+    }
+    active = ImageGenerationJob.objects.filter(status__in=ImageGenerationJob.ACTIVE_STATUSES, **lookup)
+    job = active.first()
+    if job:
+        return job
+
+    try:
+        # The partial unique constraint rejects a concurrent duplicate
+        with transaction.atomic():
+            return ImageGenerationJob.objects.create(
+                max_attempts=getattr(settings, 'IMAGE_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+                **lookup
+            )
+    except IntegrityError:
+        return active.first()
+
+
+def claim_jobs(limit, worker=None):
+    """
+    Atomically move up to `limit` due pending jobs to running (see library.job_queue).
+
+    Returns:
+        list: The claimed ImageGenerationJob objects
+    """
+    return claim(ImageGenerationJob, limit, 'running', worker)
+
+
+def requeue_stale_jobs(timeout):
+    """
+    Return jobs stuck in running (for example after a worker crash) to the queue.
+
+    Args:
+        timeout (timedelta): How long a job may run before it is considered abandoned
+
+    Returns:
+        int: Number of requeued jobs
+    """
+    return requeue_stale(ImageGenerationJob, 'running', timeout)
+
+
+def finish_job(job, status, error=''):
+    job.status = status
+    job.last_error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'last_error', 'finished_at'])
+
+
+def record_failure(job, error):
+    """Schedule a retry with exponential backoff, or fail the job after its last attempt."""
+    if not schedule_retry(job, error, getattr(settings, 'IMAGE_JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY)):
+        logger.warning(f"Image job {job.pk} failed after {job.attempts} attempts: {error}")
+        finish_job(job, 'failed', error)
+
+
+def prepare_job(job):
+    """
+    Look up the entity of a claimed job and work out what to generate.
+
+    Returns:
+        dict: The target, instance, prompt and paths, or None if the job was skipped
+    """
+    target = IMAGE_TARGETS[job.entity_type]
+    instance = target.model.objects.filter(pk=job.entity_id).first()
+    if instance is None:
+        finish_job(job, 'skipped', f"{job.entity_type} #{job.entity_id} no longer exists")
+        return None
+    if not needs_image(instance):
+        finish_job(job, 'skipped', 'No image needed')
+        return None
+
+    relative_path = get_relative_path(target, instance)
+    return {
+        'target': target,
+        'instance': instance,
+        'prompt': build_prompt(job.entity_type, instance),
+        'relative_path': relative_path,
+        'output_path': os.path.join(settings.MEDIA_ROOT, relative_path),
+    }
+
+
+def store_result(job, item, success):
+    """
+    Store a generated image on the entity, or record the failure of the job.
+
+    Returns:
+        str: The final or retry status of the job
+    """
+    if not success or not os.path.exists(item['output_path']):
+        record_failure(job, 'Image generation failed')
+        return job.status
+
+    target = item['target']
+    relative_path = item['relative_path']
+    storage = get_store()
+    if storage is not None:
+        # Generated fallback images are often identical; the store keeps them once
+        relative_path = storage.ingest(item['output_path'], target.directory)
+
+    # Update the field without triggering post_save (and another job) again
+    target.model.objects.filter(pk=item['instance'].pk).update(**{target.field: relative_path})
+    job.output_path = relative_path
+    job.save(update_fields=['output_path'])
+    generate_derivatives(relative_path)
+    finish_job(job, 'succeeded')
+    logger.info(f"Generated {target.kind} for {job.entity_type} #{job.entity_id} at {relative_path}")
+    return job.status
+
+
+def run_job(job):
+    """
+    Generate the image for a claimed job and store it on the entity.
+
+    Returns:
+        str: The final or retry status of the job
+    """
+    # Imported here because ai_signals enqueues jobs through this module
+    from . import ai_signals
+
+    item = prepare_job(job)
+    if item is None:
+        return job.status
+
+    try:
+        os.makedirs(os.path.dirname(item['output_path']), exist_ok=True)
+        success = ai_signals.generate_with_flux(item['prompt'], item['output_path'])
+    except Exception as e:
+        logger.exception(f"Error running image job {job.pk}: {e}")
+        record_failure(job, str(e))
+        return job.status
+
+    return store_result(job, item, success)
+
+
+def run_jobs(jobs):
+    """
+    Generate the images of several claimed jobs as one batch.
+
+    Returns:
+        list: The final or retry status of every job, in order
+    """
+    from . import ai_signals
+
+    prepared = [(job, prepare_job(job)) for job in jobs]
+    batch = [(job, item) for job, item in prepared if item is not None]
+    try:
+        for job, item in batch:
+            os.makedirs(os.path.dirname(item['output_path']), exist_ok=True)
+        generated = ai_signals.generate_batch_with_flux([
+            {'prompt': item['prompt'], 'output_path': item['output_path']} for job, item in batch
+        ])
+    except Exception as e:
+        logger.exception(f"Error running a batch of {len(batch)} image jobs: {e}")
+        for job, item in batch:
+            record_failure(job, str(e))
+        return [job.status for job in jobs]
+
+    for (job, item), success in zip(batch, generated):
+        store_result(job, item, success)
+    return [job.status for job in jobs]
+
+
+def retry_job(job):
+    """
+    Put a finished job back in the queue with a fresh attempt budget.
+
+    Returns:
+        bool: False if another job for the same entity and kind is already active
+    """
+    try:
+        with transaction.atomic():
+            updated = ImageGenerationJob.objects.filter(
+                pk=job.pk, status__in=['failed', 'cancelled', 'skipped']
+            ).update(status='pending', attempts=0, run_after=timezone.now(), worker='', finished_at=None)
+    except IntegrityError:
+        return False
+    return bool(updated)
@@ -0,0 +1,310 @@
+"""
+Parallel, incremental optimization of library images.
+Resizes and recompresses book covers, author photos and publisher logos in a
+process pool. A manifest of content hashes records the files already optimized
+with the current settings, so unchanged files are skipped on the next run and
+already optimized JPEGs are not re-encoded again and again.
+
+Content-addressed files are never rewritten in place, since their name is the hash
+of their content: the optimized image is stored under its own hash and the rows are
+pointed at it, leaving the original to library.media_store's garbage collection.
+"""
+import hashlib
+import io
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image
+
+from .storage import get_content_name, is_content_name
+
+MANIFEST_VERSION = 1
+JPEG_QUALITY = 85
+
+# Largest dimensions kept for each kind of image
+MAX_IMAGE_SIZES = {
+    'book': (512, 768),  # Portrait orientation for book covers
+    'author': (512, 512),
+    'publisher': (512, 512),
+}
+
+OptimizeTask = namedtuple('OptimizeTask', ['path', 'relative_path', 'max_size', 'resize', 'optimize', 'dry_run'])
+
+
+def get_manifest_path():
+    return getattr(settings, 'IMAGE_OPTIMIZE_MANIFEST', None) or os.path.join(settings.MEDIA_ROOT, '.image_manifest.json')
+
+
+def file_digest(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_settings_key(max_size, resize, optimize):
+    """Identify the optimization settings, so a change of settings reprocesses every file."""
+    return f"v{MANIFEST_VERSION}:{max_size[0]}x{max_size[1]}:q{JPEG_QUALITY}:{int(resize)}{int(optimize)}"
+
+
+class ImageManifest:
+    """
+    Content-hash manifest of optimized images, stored as JSON.
+
+    Entries are keyed by the path relative to MEDIA_ROOT and hold the hash, size,
+    modification time and settings key of the file as it was after optimization.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_manifest_path()
+        self.entries = {}
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.entries = data.get('files', {}) if data.get('version') == MANIFEST_VERSION else {}
+        return self
+
+    def save(self):
+        """Write the manifest atomically, so an interrupted run keeps the previous one."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.entries}, f)
+        os.replace(temp_path, self.path)
+
+    def is_current(self, relative_path, path, settings_key):
+        """
+        Check whether a file is unchanged since it was optimized with these settings.
+        The hash is only computed when the size or modification time changed.
+        """
+        entry = self.entries.get(relative_path)
+        if not entry or entry.get('settings') != settings_key:
+            return False
+        stat = os.stat(path)
+        if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return True
+        if entry['size'] != stat.st_size or file_digest(path) != entry['sha256']:
+            return False
+        entry['mtime'] = stat.st_mtime_ns
+        return True
+
+    def record(self, relative_path, path, settings_key, digest=None):
+        stat = os.stat(path)
+        self.entries[relative_path] = {
+            'sha256': digest or file_digest(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'settings': settings_key,
+        }
+
+
+def encode_image(img, image_format):
+    """Encode an image the way optimized files are saved and return the bytes."""
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(buffer, format='JPEG', optimize=True, quality=JPEG_QUALITY, progressive=True)
+    elif image_format == 'PNG':
+        img.save(buffer, format='PNG', optimize=True)
+    else:
+        img.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def optimize_file(task):
+    """
+    Resize and recompress a single image. Runs in a worker process, so it only
+    touches the file system.
+
+    The image is only rewritten when it was resized or when recompressing it
+    makes it smaller, so optimized files are stable from one run to the next.
+    A content-addressed image is written to the name of its new hash instead.
+
+    Returns:
+        dict: Result with the sizes before and after, the new hash, the new name
+        of a content-addressed image and the worker pid
+    """
+    start = time.perf_counter()
+    result = {
+        'relative_path': task.relative_path,
+        'original_size': 0,
+        'new_size': 0,
+        'resized': False,
+        'written': False,
+        'digest': None,
+        'new_name': None,
+        'error': None,
+        'pid': os.getpid(),
+    }
+    try:
+        result['original_size'] = result['new_size'] = os.path.getsize(task.path)
+        with Image.open(task.path) as img:
+            image_format = img.format or 'JPEG'
+            img.load()
+            if task.resize and (img.width > task.max_size[0] or img.height > task.max_size[1]):
+                img.thumbnail(task.max_size, Image.LANCZOS)
+                result['resized'] = True
+            data = encode_image(img, image_format) if (result['resized'] or task.optimize) else None
+
+        if data is not None and (result['resized'] or len(data) < result['original_size']):
+            result['new_size'] = len(data)
+            result['written'] = True
+            if not task.dry_run:
+                result['digest'] = hashlib.sha256(data).hexdigest()
+                path = task.path
+                if is_content_name(task.relative_path):
+                    directory, _, name = task.relative_path.split('/')
+                    result['new_name'] = get_content_name(directory, result['digest'], os.path.splitext(name)[1])
+                    # Same content-addressed directory, under the prefix of the new hash
+                    path = os.path.join(os.path.dirname(os.path.dirname(task.path)),
+                                        *result['new_name'].split('/')[1:])
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                if not os.path.exists(path) or path == task.path:
+                    temp_path = f"{path}.optimizing"
+                    with open(temp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(temp_path, path)
+        elif not task.dry_run:
+            result['digest'] = file_digest(task.path)
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def collect_tasks(entity_types, resize=True, optimize=True, dry_run=False):
+    """
+    List the image files referenced by the database for the given entity types.
+
+    Yields:
+        tuple: (OptimizeTask, settings key) for every existing file
+    """
+    # Imported here so that worker processes do not need the app registry
+    from .image_jobs import IMAGE_TARGETS
+
+    seen = set()
+    for entity_type in entity_types:
+        target = IMAGE_TARGETS[entity_type]
+        max_size = MAX_IMAGE_SIZES[entity_type]
+        settings_key = get_settings_key(max_size, resize, optimize)
+        relative_paths = (
+            target.model.objects.exclude(**{f'{target.field}__isnull': True})
+            .exclude(**{target.field: ''})
+            .values_list(target.field, flat=True)
+            .distinct()
+            .iterator()
+        )
+        for relative_path in relative_paths:
+            path = os.path.join(settings.MEDIA_ROOT, relative_path)
+            if relative_path in seen or not os.path.isfile(path):
+                continue
+            seen.add(relative_path)
+            yield OptimizeTask(path, relative_path, max_size, resize, optimize, dry_run), settings_key
+
+
+class OptimizationReport:
+    """Totals of an optimization run, overall and per worker process."""
+
+    def __init__(self):
+        self.processed = self.written = self.skipped = self.failed = 0
+        self.bytes_before = self.bytes_after = 0
+        self.workers = {}
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_before - self.bytes_after
+
+    def add(self, result):
+        self.processed += 1
+        worker = self.workers.setdefault(result['pid'], {'files': 0, 'bytes_saved': 0, 'seconds': 0.0})
+        worker['files'] += 1
+        worker['seconds'] += result['seconds']
+        if result['error']:
+            self.failed += 1
+            self.errors.append((result['relative_path'], result['error']))
+            return
+        self.bytes_before += result['original_size']
+        self.bytes_after += result['new_size']
+        worker['bytes_saved'] += result['original_size'] - result['new_size']
+        if result['written']:
+            self.written += 1
+
+
+def optimize_library_images(entity_types=('book', 'author', 'publisher'), resize=True, optimize=True,
+                            dry_run=False, workers=None, force=False, manifest=None, on_result=None):
+    """
+    Optimize the images of the given entity types in parallel.
+
+    Args:
+        entity_types (iterable): Keys of IMAGE_TARGETS to process
+        resize (bool): Shrink images larger than MAX_IMAGE_SIZES
+        optimize (bool): Recompress images when that makes them smaller
+        dry_run (bool): Compute the savings without writing files or the manifest
+        workers (int): Number of worker processes; 1 runs in this process
+        force (bool): Ignore the manifest and process every file
+        manifest (ImageManifest): Manifest to use, loaded from the default path if None
+        on_result: Optional callable receiving every worker result
+
+    Returns:
+        OptimizationReport: Totals of the run
+    """
+    start = time.perf_counter()
+    manifest = manifest or ImageManifest().load()
+    report = OptimizationReport()
+    workers = workers or os.cpu_count() or 1
+
+    settings_keys = {}
+    tasks = []
+    for task, settings_key in collect_tasks(entity_types, resize, optimize, dry_run):
+        if not force and manifest.is_current(task.relative_path, task.path, settings_key):
+            report.skipped += 1
+            continue
+        settings_keys[task.relative_path] = settings_key
+        tasks.append(task)
+
+    if workers == 1 or len(tasks) <= 1:
+        results = map(optimize_file, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(optimize_file, tasks, chunksize=max(1, min(64, len(tasks) // (workers * 4))))
+
+    renames = {}
+    try:
+        for task, result in zip(tasks, results):
+            report.add(result)
+            if on_result:
+                on_result(result)
+            if dry_run or result['error']:
+                continue
+            if result['new_name']:
+                renames[task.relative_path] = result['new_name']
+                manifest.record(result['new_name'], os.path.join(settings.MEDIA_ROOT, result['new_name']),
+                                settings_keys[task.relative_path], result['digest'])
+            else:
+                manifest.record(task.relative_path, task.path, settings_keys[task.relative_path], result['digest'])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if renames:
+            # Imported here so that worker processes do not need the app registry
+            from .media_store import update_references
+            update_references(renames)
+        if not dry_run:
+            manifest.save()
+
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,165 @@
+"""
+SQL query instrumentation for the library app.
+Records the number of queries, duplicate query fingerprints (the usual sign of
+an N+1 pattern) and database time for a block of code. Used by
+QueryCountMiddleware for every request and by tests to enforce query budgets.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.urls import resolve
+
+# Query budgets are looked up by URL name in settings.QUERY_BUDGETS
+DEFAULT_QUERY_BUDGETS = {}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint_sql(sql):
+    """
+    Normalize a SQL statement so that queries differing only in their parameters match.
+
+    Literals and placeholders become '?' and IN lists of any length collapse to
+    '(...)', so "WHERE book_id = 1" and "WHERE book_id = 2" share a fingerprint.
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def get_query_budget(url_name):
+    """Return the query budget configured for a URL name, or None."""
+    budgets = getattr(settings, 'QUERY_BUDGETS', DEFAULT_QUERY_BUDGETS)
+    return budgets.get(url_name) if url_name else None
+
+
+class QueryRecorder:
+    """
+    Record every SQL query run on the given database connections.
+
+    Usage:
+        with QueryRecorder() as recorder:
+            ...
+        recorder.count, recorder.duplicates, recorder.duration
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        aliases = [self.using] if self.using else list(connections)
+        for alias in aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'duration': time.perf_counter() - start,
+                'alias': context['connection'].alias,
+            })
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        """Total time spent in the database, in seconds."""
+        return sum(query['duration'] for query in self.queries)
+
+    @property
+    def duplicates(self):
+        """
+        Fingerprints executed more than once, most repeated first.
+
+        Returns:
+            list: (fingerprint, count) tuples
+        """
+        counts = Counter(fingerprint_sql(query['sql']) for query in self.queries)
+        return [(fingerprint, count) for fingerprint, count in counts.most_common() if count > 1]
+
+    @property
+    def duplicate_count(self):
+        """Number of queries that repeat an earlier fingerprint."""
+        return sum(count - 1 for _, count in self.duplicates)
+
+    def summary(self):
+        """Return the recorded statistics as a JSON-serializable dictionary."""
+        return {
+            'queries': self.count,
+            'duplicate_queries': self.duplicate_count,
+            'db_time_ms': round(self.duration * 1000, 2),
+            'duplicates': [
+                {'fingerprint': fingerprint, 'count': count} for fingerprint, count in self.duplicates[:5]
+            ],
+        }
+
+    def report(self):
+        """Return a human readable list of the recorded queries for assertion messages."""
+        lines = [f"{self.count} queries, {self.duplicate_count} duplicates, {self.duration * 1000:.1f} ms"]
+        for fingerprint, count in self.duplicates:
+            lines.append(f"  {count}x {fingerprint}")
+        lines.append('Queries:')
+        lines.extend(f"  {index}. {query['sql']}" for index, query in enumerate(self.queries, start=1))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def assert_query_budget(max_queries, max_duplicates=None, using=None):
+    """
+    Fail if the block runs more than max_queries queries or repeats too many fingerprints.
+
+    Args:
+        max_queries (int): Maximum number of queries allowed
+        max_duplicates (int): Maximum number of duplicate queries allowed, None to skip the check
+        using (str): Database alias to record, all databases if None
+    """
+    with QueryRecorder(using=using) as recorder:
+        yield recorder
+
+    if recorder.count > max_queries:
+        raise AssertionError(f"Query budget of {max_queries} exceeded: {recorder.report()}")
+    if max_duplicates is not None and recorder.duplicate_count > max_duplicates:
+        raise AssertionError(
+            f"More than {max_duplicates} duplicate queries (possible N+1): {recorder.report()}"
+        )
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin asserting the query budget of a URL.
+
+    The budget defaults to the entry for the URL name in settings.QUERY_BUDGETS.
+    """
+
+    def assertQueryBudget(self, url, max_queries=None, max_duplicates=None, data=None):
+        if max_queries is None:
+            max_queries = get_query_budget(resolve(url.split('?')[0]).url_name)
+            if max_queries is None:
+                self.fail(f"No query budget configured for {url}")
+
+        with assert_query_budget(max_queries, max_duplicates) as recorder:
+            response = self.client.get(url, data)
+        response.query_recorder = recorder
+        return response
@@ -0,0 +1,176 @@
+"""
+Copy inventory of the library app.
+Every change of Book.available_copies goes through a single conditional UPDATE
+(available_copies = available_copies - 1 WHERE available_copies > 0, and the
+reverse up to total_copies), so concurrent checkouts and returns never read,
+modify and write back a stale count. Views, signals and management commands all
+use these functions; Book.save() never writes available_copies (it is one of
+Book.counter_fields), so a command holding an old Book instance cannot put a
+stale count back. A copy set aside for a ready reservation (see
+library.holds) stays off the shelf until the patron borrows it.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import Book, BookLoan, BookReservation
+from .holds import add_to_queue, collect_hold, fulfill_hold, has_queue, leave_queue, promote_next_hold
+from .outbox import enqueue_email
+
+
+def checkout_copy(book_id):
+    """
+    Take one available copy of a book.
+
+    Returns:
+        bool: False if no copy was available
+    """
+    return bool(Book.objects.filter(pk=book_id, available_copies__gt=0).update(
+        available_copies=F('available_copies') - 1
+    ))
+
+
+def release_copy(book_id):
+    """
+    Put one copy of a book back on the shelf, never above its total copies.
+
+    Returns:
+        bool: False if all copies were already available
+    """
+    return bool(Book.objects.filter(pk=book_id, available_copies__lt=F('total_copies')).update(
+        available_copies=F('available_copies') + 1
+    ))
+
+
+def release_copies(book_id, count):
+    """
+    Put several copies of a book back on the shelf with one UPDATE, never above its total copies.
+
+    Returns:
+        bool: False if all copies were already available
+    """
+    return bool(Book.objects.filter(pk=book_id, available_copies__lt=F('total_copies')).update(
+        available_copies=Least(F('available_copies') + count, F('total_copies'))
+    ))
+
+
+def apply_copy_edit(book_id, initial_total, total_copies, initial_available, available_copies):
+    """
+    Apply a librarian's edit of a book's copy counts to available_copies as a
+    delta, so loans and returns made since the edit form was loaded are kept.
+    The initial counts are the ones the form was rendered with (see
+    library.forms.CopyCountsFormMixin), not the ones in the database when it
+    was submitted. An edited available count moves it by the same amount;
+    otherwise added or removed copies are added to or removed from the shelf.
+    Call it after the book, and so its new total_copies, was saved.
+
+    Returns:
+        bool: False if the book does not exist
+    """
+    if available_copies != initial_available:
+        delta = available_copies - initial_available
+    else:
+        delta = total_copies - initial_total
+    return bool(Book.objects.filter(pk=book_id).update(
+        available_copies=Least(Greatest(F('available_copies') + delta, 0), F('total_copies'))
+    ))
+
+
+@transaction.atomic
+def borrow_copy(book, user, due_date):
+    """
+    Lend a copy of a book to a user, if one is available.
+
+    The copy is taken before the loan is created, so two concurrent requests
+    for the last copy cannot both get a loan. A patron with a ready reservation
+    of the book gets the copy set aside for them.
+
+    Returns:
+        BookLoan: The new loan, or None if no copy was available
+    """
+    if not collect_hold(book.pk, user.pk) and not checkout_copy(book.pk):
+        return None
+    loan = BookLoan(book=book, user=user, due_date=due_date, status='borrowed')
+    # Tells the BookLoan post_save signal that the copy was already taken
+    loan._copy_checked_out = True
+    loan.save()
+    return loan
+
+
+@transaction.atomic
+def return_copy(loan, return_date=None):
+    """
+    Return a loan and put its copy back on the shelf.
+
+    The loan is claimed with a conditional UPDATE, so a loan returned twice at
+    the same time releases its copy only once.
+
+    Returns:
+        bool: False if the loan was already returned or lost
+    """
+    return_date = return_date or timezone.now().date()
+    claimed = BookLoan.objects.filter(pk=loan.pk).exclude(status__in=['returned', 'lost']).update(
+        status='returned', return_date=return_date
+    )
+    if not claimed:
+        return False
+
+    loan.status = 'returned'
+    loan.return_date = return_date
+    # Records the late fee of a late return; the signal sees the loan as already returned
+    loan.save()
+    handle_returned_loan(loan)
+    return True
+
+
+def handle_returned_loan(loan):
+    """
+    Give the copy of a newly returned loan to the next reservation in line, or
+    put it back on the shelf, and queue the return confirmation.
+    """
+    enqueue_email('return_confirmation', loan)
+    pass_copy_on(loan.book_id)
+
+
+def pass_copy_on(book_id):
+    """
+    Hand a copy that became free to the next reservation in line, or put it back on the shelf.
+
+    Returns:
+        BookReservation: The promoted reservation, or None if the copy was shelved
+    """
+    reservation = promote_next_hold(book_id)
+    if reservation is None:
+        release_copy(book_id)
+    return reservation
+
+
+def place_hold(reservation):
+    """
+    Set a copy aside for a new pending reservation if one is on the shelf and
+    nobody is waiting for it, otherwise put the reservation at the end of the queue.
+    """
+    if not has_queue(reservation.book_id) and checkout_copy(reservation.book_id):
+        fulfill_hold(reservation)
+    else:
+        add_to_queue(reservation)
+
+
+@transaction.atomic
+def cancel_hold(reservation):
+    """
+    Cancel a pending or ready reservation. The copy of a ready reservation goes
+    to the next reservation in line.
+
+    Returns:
+        bool: False if the reservation was already collected, cancelled or expired
+    """
+    if reservation.status == 'pending':
+        return leave_queue(reservation, 'cancelled')
+    claimed = BookReservation.objects.filter(pk=reservation.pk, status='fulfilled').update(status='cancelled')
+    if not claimed:
+        return False
+    reservation.status = 'cancelled'
+    pass_copy_on(reservation.book_id)
+    return True
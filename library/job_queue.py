@@ -0,0 +1,85 @@
+"""
+Database-backed work queues for the library app.
+The AI image jobs (library.image_jobs) and the email outbox (library.outbox) are
+rows with a status, a run_after time and an attempt budget. Workers claim due
+rows with a conditional UPDATE, so concurrent workers never process the same row
+even on databases without SELECT ... SKIP LOCKED; rows left in progress by a
+crashed worker are requeued, and failures are retried with exponential backoff.
+The worker loop of the management commands is QueueWorkerCommand in
+library.management.queue_worker.
+"""
+import os
+import socket
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+
+def get_worker_name():
+    """Return an identifier of the current worker process for the audit trail of claimed rows."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(model, limit, in_progress_status, worker=None):
+    """
+    Atomically move up to `limit` due pending rows of a queue model to in_progress_status.
+
+    Args:
+        model: Queue model with status, run_after, worker, started_at and attempts fields
+        limit (int): Maximum number of rows to claim
+        in_progress_status (str): Status of a row a worker is processing
+        worker (str): Name recorded on the claimed rows, get_worker_name() if None
+
+    Returns:
+        list: The claimed objects, oldest due first
+    """
+    worker = worker or get_worker_name()
+    now = timezone.now()
+    candidates = model.objects.filter(
+        status='pending', run_after__lte=now
+    ).order_by('run_after', 'id').values_list('pk', flat=True)[:limit * 2]
+
+    claimed = []
+    for pk in candidates:
+        updated = model.objects.filter(pk=pk, status='pending').update(
+            status=in_progress_status, worker=worker, started_at=now, attempts=F('attempts') + 1
+        )
+        if updated:
+            claimed.append(pk)
+        if len(claimed) >= limit:
+            break
+    return list(model.objects.filter(pk__in=claimed).order_by('run_after', 'id'))
+
+
+def requeue_stale(model, in_progress_status, timeout):
+    """
+    Return rows stuck in progress (for example after a worker crash) to the queue.
+
+    Args:
+        timeout (timedelta): How long processing may take before it is considered abandoned
+
+    Returns:
+        int: Number of requeued rows
+    """
+    return model.objects.filter(
+        status=in_progress_status, started_at__lt=timezone.now() - timeout
+    ).update(status='pending', worker='', run_after=timezone.now())
+
+
+def schedule_retry(entry, error, retry_delay):
+    """
+    Put a failed row back in the queue, after retry_delay seconds doubled for
+    every attempt already made.
+
+    Returns:
+        bool: False if the row has no attempts left and the caller should fail it
+    """
+    if entry.attempts >= entry.max_attempts:
+        return False
+    entry.status = 'pending'
+    entry.worker = ''
+    entry.last_error = error
+    entry.run_after = timezone.now() + timedelta(seconds=retry_delay * 2 ** (entry.attempts - 1))
+    entry.save(update_fields=['status', 'worker', 'last_error', 'run_after'])
+    return True
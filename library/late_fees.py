@@ -0,0 +1,129 @@
+"""
+Nightly late-fee accrual for the library app.
+BookLoan.save() only updates the late fee of the loan being saved. The accrual
+engine instead computes the days overdue and fee amounts of every past-due loan
+in SQL and upserts the LateFee rows that changed in bulk, in one transaction.
+The nightly run leaves the loan status alone: send_overdue_notification selects
+the loans still borrowed and has them marked overdue once their notice was sent,
+as does the daily digest. A dry run
+reports the same diff without writing anything.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import DateField, DecimalField, ExpressionWrapper, F, Func, IntegerField, Value
+from django.utils import timezone
+
+from .bulk_import import chunked
+from .models import BookLoan, LateFee, LibrarySettings
+
+DEFAULT_BATCH_SIZE = 500
+
+FeeChange = namedtuple(
+    'FeeChange', ['loan_id', 'title', 'email', 'old_days', 'new_days', 'old_amount', 'new_amount']
+)
+
+
+class DaysBetween(Func):
+    """Whole days from the second date expression to the first, computed by the database."""
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            function='DATEDIFF', template='%(function)s(%(expressions)s)', arg_joiner=', ',
+            **extra_context
+        )
+
+
+class AccrualReport:
+    """Loans marked overdue and late fees created or changed by accrue_late_fees."""
+
+    def __init__(self):
+        self.marked_overdue = self.unchanged = 0
+        self.changes = []
+
+    @property
+    def created(self):
+        return sum(1 for change in self.changes if change.old_amount is None)
+
+    @property
+    def updated(self):
+        return len(self.changes) - self.created
+
+
+def get_accruing_loans(today, loan_ids=None):
+    """
+    Return open past-due loans with an unpaid fee, annotated in SQL with the days
+    overdue, the fee amount and the current LateFee values.
+    """
+    daily_rate = LibrarySettings.get_settings().late_fee_daily_rate
+    loans = BookLoan.objects.filter(
+        status__in=['borrowed', 'overdue'], return_date__isnull=True, due_date__lt=today, late_fee_paid=False
+    )
+    if loan_ids is not None:
+        loans = loans.filter(pk__in=loan_ids)
+    return loans.annotate(
+        accrued_days=DaysBetween(Value(today, output_field=DateField()), F('due_date')),
+        accrued_amount=ExpressionWrapper(
+            F('accrued_days') * Value(daily_rate, output_field=DecimalField(max_digits=5, decimal_places=2)),
+            output_field=DecimalField(max_digits=6, decimal_places=2)
+        ),
+    ).order_by('pk').values_list(
+        'pk', 'book__title', 'user__email', 'late_fee__days_overdue', 'accrued_days',
+        'late_fee__amount', 'accrued_amount'
+    )
+
+
+def accrue_late_fees(today=None, dry_run=False, loan_ids=None, batch_size=DEFAULT_BATCH_SIZE, mark_overdue=False):
+    """
+    Bring the late fee of every past-due loan up to date.
+
+    Args:
+        today (date): Date the fees are computed for, today if None
+        dry_run (bool): Compute the diff without writing anything
+        loan_ids (list): Only accrue these loans, all loans if None
+        batch_size (int): LateFee rows upserted per statement
+        mark_overdue (bool): Also mark the past-due borrowed loans overdue, which
+            only the overdue notification does, after sending their notice
+
+    Returns:
+        AccrualReport: The loans marked overdue and the fee changes
+    """
+    today = today or timezone.now().date()
+    report = AccrualReport()
+    newly_overdue = BookLoan.objects.filter(status='borrowed', return_date__isnull=True, due_date__lt=today)
+    if loan_ids is not None:
+        newly_overdue = newly_overdue.filter(pk__in=loan_ids)
+
+    with transaction.atomic():
+        if mark_overdue and dry_run:
+            report.marked_overdue = newly_overdue.count()
+        elif mark_overdue:
+            report.marked_overdue = newly_overdue.update(status='overdue')
+
+        for row in get_accruing_loans(today, loan_ids).iterator(chunk_size=2000):
+            change = FeeChange(*row)
+            if (change.old_days, change.old_amount) == (change.new_days, change.new_amount):
+                report.unchanged += 1
+            else:
+                report.changes.append(change)
+
+        if not dry_run:
+            for batch in chunked(report.changes, batch_size):
+                LateFee.objects.bulk_create(
+                    [LateFee(loan_id=change.loan_id, days_overdue=change.new_days, amount=change.new_amount)
+                     for change in batch],
+                    update_conflicts=True, unique_fields=['loan'],
+                    update_fields=['amount', 'days_overdue', 'updated_at']
+                )
+    return report
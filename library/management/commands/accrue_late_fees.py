@@ -0,0 +1,58 @@
+"""
+Management command to accrue late fees for all overdue loans.
+Run it nightly from a cron job. Days overdue and fee amounts are computed in SQL
+and the changed LateFee rows are upserted in bulk (see library.late_fees), so the
+run does no per-loan saves. Loans are marked overdue by send_notifications once
+their overdue notice was sent.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.late_fees import accrue_late_fees
+
+
+class Command(BaseCommand):
+    help = 'Bring the late fees of past-due loans up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show the fee changes without saving them'
+        )
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=None,
+            help='Accrue fees as of this date (YYYY-MM-DD) instead of today'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        today = None
+        if options['date']:
+            try:
+                today = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Running in dry-run mode - no changes will be made'))
+
+        report = accrue_late_fees(today, dry_run=dry_run)
+
+        if dry_run or options['verbosity'] >= 2:
+            for change in report.changes:
+                if change.old_amount is None:
+                    diff = f'new fee of {change.new_amount:.2f} PLN for {change.new_days} days'
+                else:
+                    diff = (f'{change.old_days} -> {change.new_days} days, '
+                            f'{change.old_amount:.2f} -> {change.new_amount:.2f} PLN')
+                self.stdout.write(f'  Loan #{change.loan_id} "{change.title}" ({change.email}): {diff}')
+
+        summary = f'{report.created} created, {report.updated} updated, {report.unchanged} unchanged'
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'DRY RUN: Late fees would be {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Late fees: {summary}'))
@@ -0,0 +1,46 @@
+"""
+Management command to (re)build the BookGenre index.
+Run it once after migrating, and again after bulk updates that bypass model signals
+(for example queryset.update() on Book.genres).
+"""
+from django.core.management.base import BaseCommand
+
+from library.models import Book, BookGenre
+from library.genres import sync_genres_for_books
+
+
+class Command(BaseCommand):
+    help = 'Backfill the indexed BookGenre table from Book.genres and Book.categories'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of books processed per batch (default: 1000)'
+        )
+        parser.add_argument(
+            '--book-id',
+            type=int,
+            action='append',
+            dest='book_ids',
+            help='Only re-index the given book id (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        book_ids = options['book_ids']
+
+        books = Book.objects.all()
+        if book_ids:
+            books = books.filter(pk__in=book_ids)
+
+        self.stdout.write(f"Indexing genres for {books.count()} books...")
+        created, deleted = sync_genres_for_books(books, batch_size=batch_size)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} and removed {deleted} genre entries "
+                f"({BookGenre.objects.count()} entries in total)"
+            )
+        )
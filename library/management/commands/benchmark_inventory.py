@@ -0,0 +1,168 @@
+"""
+Management command to load test the copy inventory under concurrent checkouts.
+Several threads borrow and return copies of one hot title through
+library.inventory as fast as they can, and the run fails unless the invariants
+hold: never more loans than copies, every copy back on the shelf at the end and
+a doubled return never releasing a second copy. The benchmark creates its own
+book and users and deletes them afterwards unless --keep is given.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.utils import timezone
+
+from library.inventory import borrow_copy, return_copy
+from library.models import Book, BookLoan, EmailOutbox
+
+User = get_user_model()
+
+BENCHMARK_TITLE = 'Inventory benchmark'
+# Attempts of an operation that keeps hitting a locked database
+MAX_ATTEMPTS = 50
+
+
+class InventoryLoad:
+    """Counters shared by the benchmark threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.borrowed = self.returned = self.rejected = self.double_returns = self.retries = 0
+        self.holders = self.peak_holders = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+            self.peak_holders = max(self.peak_holders, self.holders)
+
+
+class Command(BaseCommand):
+    help = 'Hammer borrow/return of one title from many threads and check the inventory invariants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Number of concurrent borrowers (default: 8)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Borrow attempts per thread (default: 50)'
+        )
+        parser.add_argument(
+            '--copies',
+            type=int,
+            default=3,
+            help='Copies of the hot title (default: 3)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark book, users and loans'
+        )
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        copies = max(1, options['copies'])
+        book = Book.objects.create(title=BENCHMARK_TITLE, total_copies=copies, available_copies=copies)
+        users = [
+            User.objects.create_user(email=f'inventory-benchmark-{book.pk}-{i}@example.invalid', password=None)
+            for i in range(threads)
+        ]
+        load = InventoryLoad()
+
+        try:
+            start = time.perf_counter()
+            if threads == 1:
+                self.run_borrower(book, users[0], options['iterations'], load)
+            else:
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    futures = [
+                        executor.submit(self.run_in_thread, book, user, options['iterations'], load)
+                        for user in users
+                    ]
+                    for future in futures:
+                        future.result()
+            seconds = time.perf_counter() - start
+
+            book.refresh_from_db()
+            open_loans = BookLoan.objects.filter(book=book).exclude(status='returned').count()
+            operations = load.borrowed + load.returned + load.rejected
+            self.stdout.write(
+                f"{threads} threads, {copies} copies: {load.borrowed} borrowed, {load.returned} returned, "
+                f"{load.rejected} rejected, {load.retries} lock retries, peak {load.peak_holders} loans"
+            )
+            self.stdout.write(f"{operations} operations in {seconds:.2f}s ({operations / seconds:.0f} ops/s)")
+
+            failures = []
+            if load.peak_holders > copies:
+                failures.append(f"{load.peak_holders} simultaneous loans of {copies} copies")
+            if load.borrowed != load.returned or open_loans:
+                failures.append(f"{load.borrowed} borrowed but {load.returned} returned, {open_loans} open loans")
+            if book.available_copies != copies:
+                failures.append(f"{book.available_copies} of {copies} copies available at the end")
+            if load.double_returns:
+                failures.append(f"{load.double_returns} doubled returns released a copy")
+            if failures:
+                raise CommandError('Inventory invariants violated: ' + '; '.join(failures))
+            self.stdout.write(self.style.SUCCESS('All inventory invariants hold'))
+        finally:
+            if not options['keep']:
+                self.cleanup(book, users)
+
+    @classmethod
+    def run_in_thread(cls, book, user, iterations, load):
+        """Run a borrower in a pool thread, which uses its own database connection."""
+        close_old_connections()
+        try:
+            cls.run_borrower(book, user, iterations, load)
+        finally:
+            connection.close()
+
+    @classmethod
+    def run_borrower(cls, book, user, iterations, load):
+        rng = random.Random(user.pk)
+        due_date = timezone.now().date() + timedelta(days=14)
+        for _ in range(iterations):
+            loan = cls.retry(load, borrow_copy, book, user, due_date)
+            if loan is None:
+                load.add(rejected=1)
+                continue
+            load.add(borrowed=1, holders=1)
+            time.sleep(rng.random() / 1000)
+            load.add(holders=-1)
+            cls.retry(load, return_copy, loan)
+            load.add(returned=1)
+            # A second click on "return" must not release another copy
+            if cls.retry(load, return_copy, loan):
+                load.add(double_returns=1)
+
+    @staticmethod
+    def retry(load, operation, *args):
+        """Run an operation again while the database is locked by another thread (SQLite)."""
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return operation(*args)
+            except OperationalError:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                load.add(retries=1)
+                time.sleep(0.001 * (attempt + 1))
+
+    @staticmethod
+    def cleanup(book, users):
+        loan_ids = list(BookLoan.objects.filter(book=book).values_list('pk', flat=True))
+        EmailOutbox.objects.filter(
+            kind__in=['loan_confirmation', 'return_confirmation'], object_id__in=loan_ids
+        ).delete()
+        book.delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
@@ -0,0 +1,168 @@
+"""
+Management command to benchmark catalog search.
+Compares the legacy icontains query used by book_list with the SQLite FTS5 index
+on synthetic catalogs of increasing size. The data is generated in a temporary
+SQLite database, so the project database is never touched.
+"""
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.search import SQLiteFTSBackend
+
+WORDS = [
+    'night', 'river', 'shadow', 'garden', 'empire', 'winter', 'secret', 'journey', 'ocean', 'forest',
+    'king', 'queen', 'war', 'peace', 'dream', 'stone', 'fire', 'silver', 'golden', 'storm',
+    'history', 'science', 'love', 'death', 'city', 'island', 'mountain', 'letter', 'house', 'road',
+    'książka', 'miasto', 'wojna', 'morze', 'zamek', 'światło', 'droga', 'czas', 'ogród', 'pamięć',
+]
+FIRST_NAMES = ['Anna', 'Jan', 'Maria', 'Piotr', 'John', 'Emma', 'Stephen', 'Olga', 'Adam', 'Ewa']
+LAST_NAMES = ['Nowak', 'Kowalski', 'King', 'Tokarczuk', 'Smith', 'Mickiewicz', 'Austen', 'Lem', 'Orwell', 'Sapkowski']
+
+QUERIES = ['shadow', 'golden river', 'Sapkowski', 'wojn', '978000001']
+
+LEGACY_SQL = (
+    "SELECT DISTINCT b.id, b.title, b.isbn, b.description, b.publisher_id "
+    "FROM library_book b "
+    "LEFT OUTER JOIN library_book_authors ba ON b.id = ba.book_id "
+    "LEFT OUTER JOIN library_author a ON ba.author_id = a.id "
+    "WHERE (b.title LIKE ? ESCAPE '\\' OR a.name LIKE ? ESCAPE '\\' OR b.isbn LIKE ? ESCAPE '\\')"
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the icontains search path against the FTS5 index on synthetic catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Catalog sizes to benchmark (default: 10000 100000 1000000)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of timed runs per query (default: 5)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic catalog'
+        )
+
+    def handle(self, *args, **options):
+        if not self.fts5_available():
+            self.stderr.write(self.style.ERROR('This SQLite build does not support FTS5'))
+            return
+
+        self.stdout.write(f"{'books':>10} {'query':<14} {'icontains ms':>13} {'fts5 ms':>9} {'speedup':>8} {'hits':>7} {'fts hits':>8}")
+        for size in options['sizes']:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                db = sqlite3.connect(os.path.join(tmp_dir, 'benchmark.sqlite3'))
+                try:
+                    build_start = time.time()
+                    self.populate(db, size, random.Random(options['seed']))
+                    self.stdout.write(f"Built catalog of {size} books in {time.time() - build_start:.1f}s")
+
+                    for query in QUERIES:
+                        legacy_ms, legacy_hits = self.time_query(db, self.run_legacy, query, options['repeat'])
+                        fts_ms, fts_hits = self.time_query(db, self.run_fts, query, options['repeat'])
+                        speedup = legacy_ms / fts_ms if fts_ms else float('inf')
+                        self.stdout.write(
+                            f"{size:>10} {query:<14} {legacy_ms:>13.2f} {fts_ms:>9.2f} {speedup:>7.1f}x "
+                            f"{legacy_hits:>7} {fts_hits:>8}"
+                        )
+                finally:
+                    db.close()
+
+    @staticmethod
+    def fts5_available():
+        try:
+            sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE t USING fts5(a)')
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def populate(self, db, size, rng):
+        """Create the catalog tables and the FTS index with `size` synthetic books."""
+        backend = SQLiteFTSBackend
+        db.executescript(
+            "CREATE TABLE library_author (id INTEGER PRIMARY KEY, name TEXT);"
+            "CREATE TABLE library_publisher (id INTEGER PRIMARY KEY, name TEXT);"
+            "CREATE TABLE library_book (id INTEGER PRIMARY KEY, title TEXT, isbn TEXT, "
+            "description TEXT, publisher_id INTEGER);"
+            "CREATE TABLE library_book_authors (id INTEGER PRIMARY KEY, book_id INTEGER, author_id INTEGER);"
+            "CREATE INDEX library_book_authors_book_id ON library_book_authors (book_id);"
+            f"CREATE VIRTUAL TABLE {backend.table} USING fts5("
+            f"{', '.join(backend.columns)}, tokenize='unicode61 remove_diacritics 2');"
+        )
+
+        author_count = max(size // 10, 1)
+        authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(author_count)]
+        publishers = [f"{rng.choice(WORDS).title()} Press" for _ in range(100)]
+        db.executemany("INSERT INTO library_author VALUES (?, ?)", enumerate(authors, start=1))
+        db.executemany("INSERT INTO library_publisher VALUES (?, ?)", enumerate(publishers, start=1))
+
+        batch_size = 10000
+        for start in range(1, size + 1, batch_size):
+            books, links, documents = [], [], []
+            for book_id in range(start, min(start + batch_size, size + 1)):
+                title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+                description = ' '.join(rng.choice(WORDS) for _ in range(30))
+                isbn = f"978{book_id:010d}"
+                publisher_id = rng.randint(1, len(publishers))
+                author_id = rng.randint(1, author_count)
+                books.append((book_id, title, isbn, description, publisher_id))
+                links.append((book_id, author_id))
+                documents.append(
+                    (book_id, title, authors[author_id - 1], publishers[publisher_id - 1], description, isbn)
+                )
+            db.executemany("INSERT INTO library_book VALUES (?, ?, ?, ?, ?)", books)
+            db.executemany("INSERT INTO library_book_authors (book_id, author_id) VALUES (?, ?)", links)
+            db.executemany(
+                f"INSERT INTO {backend.table} (rowid, {', '.join(backend.columns)}) VALUES (?, ?, ?, ?, ?, ?)",
+                documents
+            )
+        db.commit()
+
+    @staticmethod
+    def run_legacy(db, query):
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return db.execute(LEGACY_SQL, [pattern, pattern, pattern]).fetchall()
+
+    @staticmethod
+    def run_fts(db, query):
+        backend = SQLiteFTSBackend
+        weights = ', '.join(str(weight) for weight in backend.weights)
+        ids = [row[0] for row in db.execute(
+            f"SELECT rowid FROM {backend.table} WHERE {backend.table} MATCH ? "
+            f"ORDER BY bm25({backend.table}, {weights}), rowid",
+            [backend.build_match(query)]
+        )]
+        if not ids:
+            return []
+        placeholders = ', '.join('?' * len(ids))
+        return db.execute(
+            f"SELECT id, title, isbn, description, publisher_id FROM library_book WHERE id IN ({placeholders})",
+            ids
+        ).fetchall()
+
+    @staticmethod
+    def time_query(db, runner, query, repeat):
+        """Return the median runtime in milliseconds and the number of rows returned."""
+        timings = []
+        rows = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = runner(db, query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), len(rows)
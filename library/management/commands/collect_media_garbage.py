@@ -0,0 +1,53 @@
+"""
+Management command to delete content-addressed media files that no row references.
+Files younger than the grace period are kept, so uploads whose rows are not
+committed yet are never collected.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from library.media_store import collect_garbage, get_store
+
+
+class Command(BaseCommand):
+    help = 'Delete unreferenced files from the content-addressed media store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=1,
+            help='Keep unreferenced files younger than this many hours (default: 1)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the files that would be deleted'
+        )
+        parser.add_argument(
+            '--verbose-files',
+            action='store_true',
+            help='List every deleted file'
+        )
+
+    def handle(self, *args, **options):
+        if get_store() is None:
+            self.stdout.write(self.style.WARNING('The default storage is not content-addressed, nothing to collect'))
+            return
+
+        report = collect_garbage(timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+
+        if options['verbose_files'] or options['dry_run']:
+            for name in report.deleted_names:
+                self.stdout.write(f"  {name}")
+
+        freed_mb = report.bytes_freed / (1024 * 1024)
+        summary = (
+            f"{report.deleted} of {report.stored} stored files ({freed_mb:.2f} MB); "
+            f"{report.referenced} referenced, {report.recent} within the grace period"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: would delete {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {summary}"))
@@ -0,0 +1,33 @@
+"""
+Management command to deliver queued transactional emails from the outbox.
+Run it as a long-lived worker process (or with --once from a cron job). Several
+workers may run side by side: every email is claimed atomically before it is sent,
+and each thread sends its batch over one mail server connection.
+"""
+from library.management.queue_worker import QueueWorkerCommand
+from library.outbox import claim_emails, deliver_emails, requeue_stale_emails
+
+
+class Command(QueueWorkerCommand):
+    help = 'Deliver queued loan and reservation emails from the outbox'
+    item_name = 'emails'
+    worker_label = 'Email worker'
+    concurrency_setting = 'EMAIL_OUTBOX_CONCURRENCY'
+    concurrency_help = 'Number of threads sending emails in parallel'
+    batch_size_setting = 'EMAIL_OUTBOX_BATCH_SIZE'
+    default_batch_size = 50
+    batch_size_help = 'Number of emails each thread sends over one connection'
+    default_poll_interval = 2.0
+    default_stale_after = 600
+
+    def claim(self, limit, worker):
+        return claim_emails(limit, worker=worker)
+
+    def requeue_stale(self, timeout):
+        return requeue_stale_emails(timeout)
+
+    def process_batch(self, entries):
+        return deliver_emails(entries)
+
+    def describe(self, entry):
+        return f"{entry.kind} to {entry.recipient}"
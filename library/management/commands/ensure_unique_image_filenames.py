@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.db.models import Q
 from library.models import Book, Author, Publisher
+from library.media_store import get_store
 
 class Command(BaseCommand):
     help = 'Ensure all images have unique and consistent filenames'
@@ -24,6 +25,13 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        if get_store() is not None:
+            # Content-addressed names are unique by construction; renaming them would break the store
+            self.stdout.write(self.style.WARNING(
+                'Media files are content-addressed, filenames cannot collide. Nothing to do.'
+            ))
+            return
+
         image_type = options['type']
         dry_run = options['dry_run']
         
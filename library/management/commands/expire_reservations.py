@@ -0,0 +1,48 @@
+"""
+Management command to expire reservations past their expiry date.
+Run it from a cron job, e.g. hourly. Reservations are expired in batches, and
+the copies set aside for expired ready reservations go to the next holds in the
+queue or back on the shelf (see library.reservation_expiry).
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.reservation_expiry import DEFAULT_BATCH_SIZE, expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Expire overdue reservations and pass their copies on to the next holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would expire without changing anything'
+        )
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=None,
+            help='Expire reservations as of this date (YYYY-MM-DD) instead of today'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Reservations expired per transaction (default: {DEFAULT_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+        dry_run = options['dry_run']
+        report = expire_reservations(today, dry_run=dry_run, batch_size=max(1, options['batch_size']))
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'DRY RUN: Would expire {report.summary()}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Successfully expired {report.summary()}'))
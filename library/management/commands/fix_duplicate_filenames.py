@@ -4,6 +4,7 @@ from django.core.management.base import BaseCommand
 from django.db.models import Q
 from django.conf import settings
 from library.models import Book, Author, Publisher
+from library.media_store import get_store
 
 class Command(BaseCommand):
     help = 'Fix duplicate image filenames by creating unique filenames for each item'
@@ -21,6 +22,13 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        if get_store() is not None:
+            # Content-addressed names are unique by construction; renaming them would break the store
+            self.stdout.write(self.style.WARNING(
+                'Media files are content-addressed, filenames cannot collide. Nothing to do.'
+            ))
+            return
+
         dry_run = options['dry_run']
         fallback = options['fallback']
         
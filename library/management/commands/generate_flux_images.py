@@ -6,6 +6,7 @@ import random
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from library.models import Book, Author, Publisher
+from library.ai_utils import flux_client
 
 class Command(BaseCommand):
     help = 'Generate high-quality images using Flux AI for books, authors, and publishers'
@@ -151,7 +152,11 @@ class Command(BaseCommand):
                 self.stdout.write(f'    Running command: {" ".join(cmd)}')
                 
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=120)
+                    result = flux_client.run_generation(
+                        cmd, prompt, output_path, seed,
+                        address=settings.FLUX_SERVER_URL, server_timeout=settings.FLUX_SERVER_TIMEOUT,
+                        capture_output=True, text=True, env=env, timeout=120
+                    )
                     success = result.returncode == 0 and os.path.exists(output_path)
                     
                     if success and os.path.exists(output_path):
@@ -271,7 +276,11 @@ class Command(BaseCommand):
                 self.stdout.write(f'    Running command: {" ".join(cmd)}')
                 
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=120)
+                    result = flux_client.run_generation(
+                        cmd, prompt, output_path, seed,
+                        address=settings.FLUX_SERVER_URL, server_timeout=settings.FLUX_SERVER_TIMEOUT,
+                        capture_output=True, text=True, env=env, timeout=120
+                    )
                     success = result.returncode == 0 and os.path.exists(output_path)
                     
                     if success and os.path.exists(output_path):
@@ -391,7 +400,11 @@ class Command(BaseCommand):
                 self.stdout.write(f'    Running command: {" ".join(cmd)}')
                 
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=120)
+                    result = flux_client.run_generation(
+                        cmd, prompt, output_path, seed,
+                        address=settings.FLUX_SERVER_URL, server_timeout=settings.FLUX_SERVER_TIMEOUT,
+                        capture_output=True, text=True, env=env, timeout=120
+                    )
                     success = result.returncode == 0 and os.path.exists(output_path)
                     
                     if success and os.path.exists(output_path):
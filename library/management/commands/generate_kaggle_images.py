@@ -6,6 +6,7 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.db import transaction, models
 from library.models import Book, Author, Publisher
+from library.ai_utils import flux_client
 
 class Command(BaseCommand):
     help = 'Generate images for Kaggle-imported books, authors, and publishers using Flux AI'
@@ -253,8 +254,16 @@ class Command(BaseCommand):
                 if force_fallback:
                     cmd.append("--fallback")
                 
-                self.stdout.write(f'    Running command: {" ".join(cmd)}')
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                if force_fallback:
+                    self.stdout.write(f'    Running command: {" ".join(cmd)}')
+                    result = subprocess.run(cmd, capture_output=True, text=True)
+                else:
+                    # The warm Flux server when FLUX_SERVER_URL is set, a flux_wrapper.py process otherwise
+                    result = flux_client.run_generation(
+                        cmd, prompt, output_path,
+                        address=settings.FLUX_SERVER_URL, server_timeout=settings.FLUX_SERVER_TIMEOUT,
+                        capture_output=True, text=True
+                    )
                 success = result.returncode == 0 and os.path.exists(output_path)
                 
                 if success and os.path.exists(output_path):
@@ -345,8 +354,16 @@ class Command(BaseCommand):
                 if force_fallback:
                     cmd.append("--fallback")
                 
-                self.stdout.write(f'    Running command: {" ".join(cmd)}')
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                if force_fallback:
+                    self.stdout.write(f'    Running command: {" ".join(cmd)}')
+                    result = subprocess.run(cmd, capture_output=True, text=True)
+                else:
+                    # The warm Flux server when FLUX_SERVER_URL is set, a flux_wrapper.py process otherwise
+                    result = flux_client.run_generation(
+                        cmd, prompt, output_path,
+                        address=settings.FLUX_SERVER_URL, server_timeout=settings.FLUX_SERVER_TIMEOUT,
+                        capture_output=True, text=True
+                    )
                 success = result.returncode == 0 and os.path.exists(output_path)
                 
                 if success and os.path.exists(output_path):
@@ -437,8 +454,16 @@ class Command(BaseCommand):
                 if force_fallback:
                     cmd.append("--fallback")
                 
-                self.stdout.write(f'    Running command: {" ".join(cmd)}')
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                if force_fallback:
+                    self.stdout.write(f'    Running command: {" ".join(cmd)}')
+                    result = subprocess.run(cmd, capture_output=True, text=True)
+                else:
+                    # The warm Flux server when FLUX_SERVER_URL is set, a flux_wrapper.py process otherwise
+                    result = flux_client.run_generation(
+                        cmd, prompt, output_path,
+                        address=settings.FLUX_SERVER_URL, server_timeout=settings.FLUX_SERVER_TIMEOUT,
+                        capture_output=True, text=True
+                    )
                 success = result.returncode == 0 and os.path.exists(output_path)
                 
                 if success and os.path.exists(output_path):
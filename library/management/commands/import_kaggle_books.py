@@ -1,14 +1,38 @@
+"""
+Management command to import books from the Kaggle books dataset.
+The CSV is streamed in chunks and inserted with bulk_create (see library.bulk_import),
+so large datasets import with bounded memory. Throughput and peak memory are
+reported for every chunk.
+"""
+import codecs
 import os
-import csv
 import random
 import re
+import time
 from datetime import datetime, timedelta
 import pandas as pd
-import kagglehub
 from django.core.management.base import BaseCommand
 from django.utils.text import slugify
-from django.db import transaction
-from library.models import Book, Author, Publisher
+from library.bulk_import import DEFAULT_CHUNK_SIZE, BookImporter
+
+# Expected columns and the names they are matched against in the CSV header
+COLUMN_MAPPING = {
+    'title': 'title',
+    'authors': 'authors',
+    'publisher': 'publisher',
+    'isbn': 'isbn',
+    'isbn13': 'isbn13',
+    'average_rating': 'average_rating',
+    'publication_date': 'publication_date',
+    'publication_year': 'publication_year',  # Fallback
+    'language_code': 'language_code',
+    'num_pages': 'num_pages',
+    'ratings_count': 'ratings_count',
+    'description': 'description',
+}
+
+ENCODINGS = ['utf-8', 'latin1', 'ISO-8859-1', 'cp1252']
+
 
 class Command(BaseCommand):
     help = 'Import books data from Kaggle dataset'
@@ -18,218 +42,162 @@ class Command(BaseCommand):
             '--limit',
             type=int,
             default=100,
-            help='Limit the number of books to import'
+            help='Limit the number of books to import (0 for all)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Number of rows read and inserted per transaction (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--csv',
+            type=str,
+            default=None,
+            help='Import this CSV file instead of downloading the Kaggle dataset'
         )
 
     def handle(self, *args, **options):
         limit = options['limit']
-        self.stdout.write(self.style.SUCCESS(f'Starting import of up to {limit} books from Kaggle dataset'))
+        chunk_size = options['chunk_size']
+        self.stdout.write(self.style.SUCCESS(
+            f'Starting import of {f"up to {limit}" if limit > 0 else "all"} books from Kaggle dataset'
+        ))
         
         try:
-            # Download the dataset
-            self.stdout.write('Downloading Kaggle dataset...')
-            dataset_path = kagglehub.dataset_download("saurabhbagchi/books-dataset")
-            self.stdout.write(self.style.SUCCESS(f'Dataset downloaded to: {dataset_path}'))
-            
-            # Process the dataset
-            books_csv_path = os.path.join(dataset_path, 'books_data', 'books.csv')
+            books_csv_path = options['csv']
+            if not books_csv_path:
+                # Download the dataset
+                self.stdout.write('Downloading Kaggle dataset...')
+                import kagglehub
+                dataset_path = kagglehub.dataset_download("saurabhbagchi/books-dataset")
+                self.stdout.write(self.style.SUCCESS(f'Dataset downloaded to: {dataset_path}'))
+                books_csv_path = os.path.join(dataset_path, 'books_data', 'books.csv')
             
             if not os.path.exists(books_csv_path):
                 self.stdout.write(self.style.ERROR(f'Books CSV file not found at {books_csv_path}'))
                 return
             
-            # Read the CSV file using pandas with error handling for encoding
-            try:
-                # Try different encodings
-                encodings = ['utf-8', 'latin1', 'ISO-8859-1', 'cp1252']
-                
-                for encoding in encodings:
-                    try:
-                        self.stdout.write(f'Trying to read CSV with {encoding} encoding...')
-                        df = pd.read_csv(books_csv_path, encoding=encoding, on_bad_lines='skip')
-                        self.stdout.write(self.style.SUCCESS(f'Successfully read CSV with {encoding} encoding'))
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                else:
-                    raise Exception('Failed to read CSV with any of the attempted encodings')
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error reading CSV: {str(e)}'))
+            # Find an encoding that decodes the whole file, without loading it
+            encoding = self._detect_encoding(books_csv_path)
+            if encoding is None:
+                self.stdout.write(self.style.ERROR('Error reading CSV: Failed to read CSV with any of the attempted encodings'))
                 return
-            self.stdout.write(self.style.SUCCESS(f'Loaded {len(df)} books from CSV'))
-            
-            # Print column names for debugging
-            self.stdout.write(f'Dataset columns: {list(df.columns)}')
-            
-            # Create column mapping for flexibility
-            column_mapping = {
-                'title': 'title',
-                'authors': 'authors',
-                'publisher': 'publisher',
-                'isbn': 'isbn',
-                'isbn13': 'isbn13',
-                'average_rating': 'average_rating',
-                'publication_date': 'publication_date',
-                'publication_year': 'publication_year',  # Fallback
-                'language_code': 'language_code',
-                'num_pages': 'num_pages',
-                'ratings_count': 'ratings_count',
-                'description': 'description',
-                # Add more mappings as needed
-            }
+            self.stdout.write(self.style.SUCCESS(f'Reading CSV with {encoding} encoding'))
             
             # Update mappings based on actual columns
-            for actual_col in df.columns:
+            columns = list(pd.read_csv(books_csv_path, encoding=encoding, nrows=0).columns)
+            self.stdout.write(f'Dataset columns: {columns}')
+            column_mapping = dict(COLUMN_MAPPING)
+            for actual_col in columns:
                 # Check for close matches
-                for expected_col, mapped_col in column_mapping.items():
+                for expected_col in COLUMN_MAPPING:
                     if expected_col.lower() in actual_col.lower() or actual_col.lower() in expected_col.lower():
                         column_mapping[expected_col] = actual_col
-            
             self.stdout.write(f'Column mapping: {column_mapping}')
             
-            # Limit the number of books to import
-            if limit > 0:
-                df = df.head(limit)
-                self.stdout.write(f'Limited to {len(df)} books')
+            # Stream the CSV in chunks so memory stays bounded for large datasets
+            reader = pd.read_csv(
+                books_csv_path,
+                encoding=encoding,
+                on_bad_lines='skip',
+                chunksize=chunk_size,
+                nrows=limit if limit > 0 else None,
+            )
+            records = (
+                self._build_record(row, column_mapping)
+                for chunk in reader
+                for row in chunk.to_dict('records')
+            )
             
-            # Start importing data
-            with transaction.atomic():
-                books_imported = 0
-                authors_created = 0
-                publishers_created = 0
-                
-                # Create a dictionary to track created authors and publishers
-                author_dict = {}
-                publisher_dict = {}
-                
-                for _, row in df.iterrows():
-                    # Get values using column mapping
-                    def get_value(field, default=None):
-                        mapped_col = column_mapping.get(field, field)
-                        if mapped_col in row and not pd.isna(row[mapped_col]):
-                            return row[mapped_col]
-                        return default
-                    
-                    # Process author
-                    author_name = get_value('authors', 'Unknown Author')
-                    if author_name not in author_dict:
-                        # Create a sanitized version of the author name for use in filenames
-                        sanitized_name = self._sanitize_filename(author_name)
-                        
-                        # Disable AI signal processing temporarily to avoid filename issues
-                        with transaction.atomic():
-                            # Temporarily disable signals
-                            from django.db.models.signals import post_save
-                            from library.ai_signals import generate_author_portrait
-                            post_save.disconnect(generate_author_portrait, sender=Author)
-                            
-                            # Create author
-                            author = Author.objects.create(
-                                name=author_name,
-                                bio=f"Author of {get_value('title', 'unknown book')}",
-                                birth_date=self._generate_random_date(1900, 1990)
-                            )
-                            
-                            # Reconnect signals
-                            post_save.connect(generate_author_portrait, sender=Author)
-                        
-                        author_dict[author_name] = author
-                        authors_created += 1
-                    else:
-                        author = author_dict[author_name]
-                    
-                    # Process publisher
-                    publisher_name = get_value('publisher', 'Unknown Publisher')
-                    if publisher_name not in publisher_dict:
-                        # Create a sanitized version of the publisher name for use in URLs and filenames
-                        sanitized_name = self._sanitize_filename(publisher_name)
-                        
-                        # Disable AI signal processing temporarily to avoid filename issues
-                        with transaction.atomic():
-                            # Temporarily disable signals
-                            from django.db.models.signals import post_save
-                            from library.ai_signals import generate_publisher_logo
-                            post_save.disconnect(generate_publisher_logo, sender=Publisher)
-                            
-                            # Create publisher
-                            publisher = Publisher.objects.create(
-                                name=publisher_name,
-                                description=f"Publisher of {get_value('title', 'unknown book')}",
-                                founded_date=self._generate_random_date(1800, 1990),
-                                website=f"https://www.{slugify(sanitized_name)}.com"
-                            )
-                            
-                            # Reconnect signals
-                            post_save.connect(generate_publisher_logo, sender=Publisher)
-                        
-                        publisher_dict[publisher_name] = publisher
-                        publishers_created += 1
-                    else:
-                        publisher = publisher_dict[publisher_name]
-                    
-                    # Process book
-                    # Try both ISBN and ISBN13 fields
-                    isbn = str(get_value('isbn13') or get_value('isbn', ''))[:13]  # Limit to 13 chars
-                    
-                    # Get language code or default to English
-                    language_code = get_value('language_code', 'en')
-                    
-                    # Get publication date
-                    pub_date = get_value('publication_date')
-                    pub_year = get_value('publication_year')
-                    
-                    # Create a sanitized version of the book title for use in filenames
-                    book_title = get_value('title', 'Unknown Title')
-                    sanitized_title = self._sanitize_filename(book_title)
-                    
-                    # Disable AI signal processing temporarily to avoid filename issues
-                    with transaction.atomic():
-                        # Temporarily disable signals
-                        from django.db.models.signals import post_save
-                        from library.ai_signals import generate_book_cover
-                        post_save.disconnect(generate_book_cover, sender=Book)
-                        
-                        # Create the book
-                        book = Book.objects.create(
-                            title=book_title,
-                            publisher=publisher,
-                            description=get_value('description', '') or f"A book titled {book_title}",
-                            publication_date=self._parse_date_or_year(pub_date, pub_year),
-                            isbn=isbn,
-                            pages=get_value('num_pages', random.randint(100, 500)),
-                            language=language_code[:2] if language_code else 'en',  # Extract main language code
-                            genres=self._generate_random_genres(),
-                            total_copies=random.randint(1, 10),
-                            available_copies=random.randint(0, 5)
-                        )
-                        
-                        # Add author to the book
-                        book.authors.add(author)
-                        
-                        # Reconnect signals
-                        post_save.connect(generate_book_cover, sender=Book)
-                    
-                    # Add average rating if available
-                    avg_rating = get_value('average_rating')
-                    if avg_rating:
-                        try:
-                            book.avg_rating = float(avg_rating)
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    books_imported += 1
-                    
-                    if books_imported % 10 == 0:
-                        self.stdout.write(f'Imported {books_imported} books...')
-                
-                self.stdout.write(self.style.SUCCESS(
-                    f'Successfully imported {books_imported} books, '
-                    f'created {authors_created} authors and {publishers_created} publishers'
-                ))
+            importer = BookImporter(
+                chunk_size=chunk_size,
+                author_defaults=lambda name, record: {
+                    'bio': f"Author of {record['book']['title']}",
+                    'birth_date': self._generate_random_date(1900, 1990),
+                },
+                publisher_defaults=lambda name, record: {
+                    'description': f"Publisher of {record['book']['title']}",
+                    'founded_date': self._generate_random_date(1800, 1990),
+                    'website': f"https://www.{slugify(self._sanitize_filename(name))}.com",
+                },
+            )
+            
+            started = time.perf_counter()
+            books_imported = authors_created = publishers_created = 0
+            for stats in importer.import_records(records):
+                books_imported += stats.books
+                authors_created += stats.authors
+                publishers_created += stats.publishers
+                memory = f'{stats.peak_memory_mb:.0f} MB' if stats.peak_memory_mb is not None else 'n/a'
+                self.stdout.write(
+                    f'Chunk {stats.number}: {stats.books} books, {stats.authors} new authors, '
+                    f'{stats.publishers} new publishers in {stats.seconds:.2f}s '
+                    f'({stats.rows / max(stats.seconds, 1e-6):.0f} rows/s, peak memory {memory})'
+                )
+            
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully imported {books_imported} books, '
+                f'created {authors_created} authors and {publishers_created} publishers '
+                f'in {elapsed:.1f}s ({books_imported / max(elapsed, 1e-6):.0f} books/s)'
+            ))
                 
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error importing books: {str(e)}'))
     
+    def _detect_encoding(self, path):
+        """Return the first encoding that decodes the whole file, reading it in blocks"""
+        for encoding in ENCODINGS:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        decoder.decode(block)
+                    decoder.decode(b'', final=True)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return None
+    
+    def _build_record(self, row, column_mapping):
+        """Convert a CSV row into a BookImporter record"""
+        def get_value(field, default=None):
+            mapped_col = column_mapping.get(field, field)
+            value = row.get(mapped_col)
+            if value is None or pd.isna(value):
+                return default
+            return value
+        
+        # Try both ISBN and ISBN13 fields
+        isbn = str(get_value('isbn13') or get_value('isbn', ''))[:13]  # Limit to 13 chars
+        
+        # Get language code or default to English
+        language_code = str(get_value('language_code', 'en'))
+        
+        try:
+            pages = int(get_value('num_pages'))
+        except (TypeError, ValueError):
+            pages = random.randint(100, 500)
+        
+        book_title = str(get_value('title', 'Unknown Title'))[:200]
+        total_copies = random.randint(1, 10)
+        return {
+            'book': {
+                'title': book_title,
+                'description': get_value('description', '') or f"A book titled {book_title}",
+                'publication_date': self._parse_date_or_year(get_value('publication_date'), get_value('publication_year')),
+                'isbn': isbn,
+                'pages': pages,
+                'language': language_code[:2] if language_code else 'en',  # Extract main language code
+                'genres': self._generate_random_genres(),
+                'total_copies': total_copies,
+                'available_copies': min(random.randint(0, 5), total_copies),
+            },
+            'authors': [str(get_value('authors', 'Unknown Author'))[:200]],
+            'publisher': str(get_value('publisher', 'Unknown Publisher'))[:200],
+        }
+    
     def _generate_random_date(self, start_year, end_year):
         """Generate a random date between start_year and end_year"""
         start_date = datetime(start_year, 1, 1).date()
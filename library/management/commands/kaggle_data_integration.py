@@ -6,6 +6,14 @@ from django.core.management.base import BaseCommand
 from django.db.models import Q
 from django.conf import settings
 from library.models import Book, Author, Publisher
+from library.media_scan import clear_references, scan_media
+
+ENTITY_TYPES = {
+    'books': ('book',),
+    'authors': ('author',),
+    'publishers': ('publisher',),
+    'all': ('book', 'author', 'publisher'),
+}
 
 class Command(BaseCommand):
     help = 'Integrate Kaggle-imported data with proper images and data cleanup'
@@ -62,14 +70,7 @@ class Command(BaseCommand):
             self.clean_publisher_names(dry_run)
         
         # Step 2: Reset invalid image paths
-        if data_type in ['books', 'all']:
-            self.reset_invalid_book_covers(dry_run)
-        
-        if data_type in ['authors', 'all']:
-            self.reset_invalid_author_photos(dry_run)
-        
-        if data_type in ['publishers', 'all']:
-            self.reset_invalid_publisher_logos(dry_run)
+        self.reset_invalid_images(ENTITY_TYPES[data_type], dry_run)
         
         # Step 3: Generate missing images
         if not dry_run:
@@ -152,16 +153,6 @@ class Command(BaseCommand):
         
         return sanitized
     
-    def check_image_exists(self, image_field):
-        """Check if an image file actually exists"""
-        if not image_field or not image_field.name:
-            return False
-            
-        # Check if the file exists on disk
-        if hasattr(image_field, 'path'):
-            return os.path.exists(image_field.path)
-        return False
-    
     def clean_book_titles(self, dry_run):
         """Clean up mangled book titles from Kaggle import"""
         self.stdout.write('Checking for mangled book titles...')
@@ -231,62 +222,21 @@ class Command(BaseCommand):
         else:
             self.stdout.write('No mangled publisher names found')
     
-    def reset_invalid_book_covers(self, dry_run):
-        """Reset invalid book cover paths"""
-        self.stdout.write('Checking for books with invalid cover paths...')
-        
-        reset_count = 0
-        for book in Book.objects.all():
-            if book.cover and not self.check_image_exists(book.cover):
-                self.stdout.write(f'  Book has invalid cover path: {book.title} (path: {book.cover})')
-                
-                if not dry_run:
-                    book.cover = None
-                    book.save(update_fields=['cover'])
-                    reset_count += 1
-        
-        if reset_count > 0:
-            self.stdout.write(self.style.SUCCESS(f'Reset {reset_count} invalid book cover paths'))
-        else:
-            self.stdout.write('No invalid book cover paths found')
-    
-    def reset_invalid_author_photos(self, dry_run):
-        """Reset invalid author photo paths"""
-        self.stdout.write('Checking for authors with invalid photo paths...')
-        
-        reset_count = 0
-        for author in Author.objects.all():
-            if author.photo and not self.check_image_exists(author.photo):
-                self.stdout.write(f'  Author has invalid photo path: {author.name} (path: {author.photo})')
-                
-                if not dry_run:
-                    author.photo = None
-                    author.save(update_fields=['photo'])
-                    reset_count += 1
-        
-        if reset_count > 0:
-            self.stdout.write(self.style.SUCCESS(f'Reset {reset_count} invalid author photo paths'))
-        else:
-            self.stdout.write('No invalid author photo paths found')
-    
-    def reset_invalid_publisher_logos(self, dry_run):
-        """Reset invalid publisher logo paths"""
-        self.stdout.write('Checking for publishers with invalid logo paths...')
-        
-        reset_count = 0
-        for publisher in Publisher.objects.all():
-            if publisher.logo and not self.check_image_exists(publisher.logo):
-                self.stdout.write(f'  Publisher has invalid logo path: {publisher.name} (path: {publisher.logo})')
-                
-                if not dry_run:
-                    publisher.logo = None
-                    publisher.save(update_fields=['logo'])
-                    reset_count += 1
-        
-        if reset_count > 0:
-            self.stdout.write(self.style.SUCCESS(f'Reset {reset_count} invalid publisher logo paths'))
-        else:
-            self.stdout.write('No invalid publisher logo paths found')
+    def reset_invalid_images(self, entity_types, dry_run):
+        """Reset image paths whose files are missing or empty, found with one media scan"""
+        self.stdout.write('Checking for invalid image paths...')
+        
+        report = scan_media(entity_types)
+        for reference in report.broken:
+            self.stdout.write(
+                f'  {reference.entity_type.capitalize()} #{reference.entity_id} has invalid image path: {reference.name}'
+            )
+        
+        if not report.broken:
+            self.stdout.write('No invalid image paths found')
+        elif not dry_run:
+            reset_count = clear_references(report.broken)
+            self.stdout.write(self.style.SUCCESS(f'Reset {reset_count} invalid image paths'))
     
     def generate_book_covers(self, batch_size, pause_seconds, fallback):
         """Generate book covers for books without images"""
@@ -0,0 +1,41 @@
+"""
+Management command to convert an existing media tree to the content-addressed store.
+Referenced covers, photos, logos and profile pictures are moved to names derived
+from their content, identical files are kept once and the rows are updated
+without sending model signals.
+"""
+from django.core.management.base import BaseCommand
+
+from library.media_store import migrate_media
+
+
+class Command(BaseCommand):
+    help = 'Move media files to content-addressed names and update the rows referencing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be converted'
+        )
+        parser.add_argument(
+            '--keep-originals',
+            action='store_true',
+            help='Leave the original files in place after the rows are updated'
+        )
+
+    def handle(self, *args, **options):
+        report = migrate_media(dry_run=options['dry_run'], keep_originals=options['keep_originals'])
+
+        for name in report.missing_names:
+            self.stdout.write(self.style.WARNING(f"  Missing file: {name}"))
+
+        saved_mb = report.bytes_saved / (1024 * 1024)
+        summary = (
+            f"{report.converted} files, {report.duplicates} duplicates, {report.missing} missing; "
+            f"{saved_mb:.2f} MB saved by deduplication"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: would convert {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Converted {summary}; updated {report.rows} rows"))
@@ -1,11 +1,11 @@
 import os
 import re
 import subprocess
-from PIL import Image
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.db.models import Q
 from library.models import Book, Author, Publisher
+from library.image_optimizer import optimize_library_images
 
 class Command(BaseCommand):
     help = 'Optimize and manage library images for better performance and quality'
@@ -38,6 +38,17 @@ class Command(BaseCommand):
             action='store_true',
             help='Regenerate missing images'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of worker processes for optimization (default: number of CPUs)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Optimize every image, ignoring the manifest of already optimized files'
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -51,6 +62,7 @@ class Command(BaseCommand):
         verify = options['verify']
         regenerate_missing = options['regenerate_missing']
         dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
         
         if dry_run:
             self.stdout.write(self.style.WARNING('Running in dry-run mode - no changes will be made'))
@@ -63,7 +75,7 @@ class Command(BaseCommand):
             self.verify_image_paths(image_type, dry_run)
         
         if resize or optimize:
-            self.optimize_images(image_type, resize, optimize, dry_run)
+            self.optimize_images(image_type, resize, optimize, dry_run, options['workers'], options['force'])
         
         if regenerate_missing:
             self.regenerate_missing_images(image_type, dry_run)
@@ -141,156 +153,43 @@ class Command(BaseCommand):
         else:
             self.stdout.write('No invalid image paths found')
     
-    def optimize_images(self, image_type, resize, optimize, dry_run):
-        """Optimize images for better performance"""
+    def optimize_images(self, image_type, resize, optimize, dry_run, workers=None, force=False):
+        """Optimize images in parallel, skipping files unchanged since the last run"""
         self.stdout.write('Optimizing images...')
         
-        # Define optimal dimensions
-        book_cover_size = (512, 768)  # Portrait orientation for book covers
-        author_photo_size = (512, 512)  # Square for author photos
-        publisher_logo_size = (512, 512)  # Square for publisher logos
+        entity_types = ['book', 'author', 'publisher'] if image_type == 'all' else [image_type[:-1]]
         
-        optimized_count = 0
+        def report_result(result):
+            if result['error']:
+                self.stdout.write(self.style.ERROR(f'  Error processing {result["relative_path"]}: {result["error"]}'))
+            elif result['written'] and self.verbosity > 1:
+                self.stdout.write(
+                    f'  {result["relative_path"]}: {result["original_size"] / 1024:.1f} KB -> '
+                    f'{result["new_size"] / 1024:.1f} KB{" (resized)" if result["resized"] else ""}'
+                )
         
-        # Optimize book covers
-        if image_type in ['books', 'all']:
-            self.stdout.write('Processing book covers...')
-            books = Book.objects.exclude(Q(cover__isnull=True) | Q(cover=''))
-            
-            for book in books:
-                try:
-                    image_path = os.path.join(settings.MEDIA_ROOT, str(book.cover))
-                    
-                    if not os.path.exists(image_path):
-                        continue
-                    
-                    # Open the image
-                    img = Image.open(image_path)
-                    original_size = os.path.getsize(image_path)
-                    
-                    modified = False
-                    
-                    # Resize if needed
-                    if resize and (img.width > book_cover_size[0] or img.height > book_cover_size[1]):
-                        self.stdout.write(f'  Resizing cover for book ID {book.id}: "{book.title}"')
-                        self.stdout.write(f'    Original size: {img.width}x{img.height}')
-                        
-                        # Resize while maintaining aspect ratio
-                        img.thumbnail(book_cover_size, Image.LANCZOS)
-                        self.stdout.write(f'    New size: {img.width}x{img.height}')
-                        modified = True
-                    
-                    # Optimize file size
-                    if optimize:
-                        self.stdout.write(f'  Optimizing cover for book ID {book.id}: "{book.title}"')
-                        self.stdout.write(f'    Original file size: {original_size / 1024:.1f} KB')
-                        modified = True
-                    
-                    # Save the optimized image
-                    if modified and not dry_run:
-                        img.save(image_path, optimize=True, quality=85)
-                        new_size = os.path.getsize(image_path)
-                        self.stdout.write(f'    New file size: {new_size / 1024:.1f} KB')
-                        self.stdout.write(self.style.SUCCESS(f'    Saved optimized image'))
-                        optimized_count += 1
-                
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'    Error processing image: {str(e)}'))
-        
-        # Optimize author photos
-        if image_type in ['authors', 'all']:
-            self.stdout.write('Processing author photos...')
-            authors = Author.objects.exclude(Q(photo__isnull=True) | Q(photo=''))
-            
-            for author in authors:
-                try:
-                    image_path = os.path.join(settings.MEDIA_ROOT, str(author.photo))
-                    
-                    if not os.path.exists(image_path):
-                        continue
-                    
-                    # Open the image
-                    img = Image.open(image_path)
-                    original_size = os.path.getsize(image_path)
-                    
-                    modified = False
-                    
-                    # Resize if needed
-                    if resize and (img.width > author_photo_size[0] or img.height > author_photo_size[1]):
-                        self.stdout.write(f'  Resizing photo for author ID {author.id}: "{author.name}"')
-                        self.stdout.write(f'    Original size: {img.width}x{img.height}')
-                        
-                        # Resize while maintaining aspect ratio
-                        img.thumbnail(author_photo_size, Image.LANCZOS)
-                        self.stdout.write(f'    New size: {img.width}x{img.height}')
-                        modified = True
-                    
-                    # Optimize file size
-                    if optimize:
-                        self.stdout.write(f'  Optimizing photo for author ID {author.id}: "{author.name}"')
-                        self.stdout.write(f'    Original file size: {original_size / 1024:.1f} KB')
-                        modified = True
-                    
-                    # Save the optimized image
-                    if modified and not dry_run:
-                        img.save(image_path, optimize=True, quality=85)
-                        new_size = os.path.getsize(image_path)
-                        self.stdout.write(f'    New file size: {new_size / 1024:.1f} KB')
-                        self.stdout.write(self.style.SUCCESS(f'    Saved optimized image'))
-                        optimized_count += 1
-                
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'    Error processing image: {str(e)}'))
+        report = optimize_library_images(
+            entity_types, resize=resize, optimize=optimize, dry_run=dry_run,
+            workers=workers, force=force, on_result=report_result
+        )
         
-        # Optimize publisher logos
-        if image_type in ['publishers', 'all']:
-            self.stdout.write('Processing publisher logos...')
-            publishers = Publisher.objects.exclude(Q(logo__isnull=True) | Q(logo=''))
-            
-            for publisher in publishers:
-                try:
-                    image_path = os.path.join(settings.MEDIA_ROOT, str(publisher.logo))
-                    
-                    if not os.path.exists(image_path):
-                        continue
-                    
-                    # Open the image
-                    img = Image.open(image_path)
-                    original_size = os.path.getsize(image_path)
-                    
-                    modified = False
-                    
-                    # Resize if needed
-                    if resize and (img.width > publisher_logo_size[0] or img.height > publisher_logo_size[1]):
-                        self.stdout.write(f'  Resizing logo for publisher ID {publisher.id}: "{publisher.name}"')
-                        self.stdout.write(f'    Original size: {img.width}x{img.height}')
-                        
-                        # Resize while maintaining aspect ratio
-                        img.thumbnail(publisher_logo_size, Image.LANCZOS)
-                        self.stdout.write(f'    New size: {img.width}x{img.height}')
-                        modified = True
-                    
-                    # Optimize file size
-                    if optimize:
-                        self.stdout.write(f'  Optimizing logo for publisher ID {publisher.id}: "{publisher.name}"')
-                        self.stdout.write(f'    Original file size: {original_size / 1024:.1f} KB')
-                        modified = True
-                    
-                    # Save the optimized image
-                    if modified and not dry_run:
-                        img.save(image_path, optimize=True, quality=85)
-                        new_size = os.path.getsize(image_path)
-                        self.stdout.write(f'    New file size: {new_size / 1024:.1f} KB')
-                        self.stdout.write(self.style.SUCCESS(f'    Saved optimized image'))
-                        optimized_count += 1
-                
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'    Error processing image: {str(e)}'))
+        for pid, worker in sorted(report.workers.items()):
+            rate = worker['files'] / worker['seconds'] if worker['seconds'] else 0
+            self.stdout.write(
+                f'  Worker {pid}: {worker["files"]} files, {worker["bytes_saved"] / 1024 / 1024:.2f} MB saved, '
+                f'{rate:.1f} files/s'
+            )
         
-        if optimized_count > 0:
-            self.stdout.write(self.style.SUCCESS(f'Optimized {optimized_count} images'))
+        rate = report.processed / report.seconds if report.seconds else 0
+        summary = (
+            f'{"Would optimize" if dry_run else "Optimized"} {report.written} of {report.processed} images '
+            f'({report.skipped} unchanged skipped, {report.failed} failed), '
+            f'saved {report.bytes_saved / 1024 / 1024:.2f} MB in {report.seconds:.1f}s ({rate:.1f} files/s)'
+        )
+        if report.written > 0:
+            self.stdout.write(self.style.SUCCESS(summary))
         else:
-            self.stdout.write('No images were optimized')
+            self.stdout.write(summary)
     
     def regenerate_missing_images(self, image_type, dry_run):
         """Regenerate missing images using Flux AI"""
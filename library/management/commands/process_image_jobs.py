@@ -0,0 +1,35 @@
+"""
+Management command to run queued AI image generation jobs.
+Run it as a long-lived worker process (or with --once from a cron job). Several
+workers may run side by side: every job is claimed atomically before it runs.
+With --batch-size, each thread submits its jobs to the Flux server as one batch.
+"""
+from library.image_jobs import claim_jobs, requeue_stale_jobs, run_job, run_jobs
+from library.management.queue_worker import QueueWorkerCommand
+
+
+class Command(QueueWorkerCommand):
+    help = 'Process queued AI image generation jobs (book covers, author portraits, publisher logos)'
+    item_name = 'jobs'
+    worker_label = 'Image job worker'
+    concurrency_setting = 'IMAGE_JOB_CONCURRENCY'
+    concurrency_help = 'Number of jobs generated in parallel'
+    batch_size_setting = 'IMAGE_JOB_BATCH_SIZE'
+    default_batch_size = 1
+    batch_size_help = 'Number of jobs generated together in one batch'
+    default_poll_interval = 5.0
+    default_stale_after = 3600
+
+    def claim(self, limit, worker):
+        return claim_jobs(limit, worker=worker)
+
+    def requeue_stale(self, timeout):
+        return requeue_stale_jobs(timeout)
+
+    def process_batch(self, jobs):
+        if len(jobs) == 1:
+            return [run_job(jobs[0])]
+        return run_jobs(jobs)
+
+    def describe(self, job):
+        return f"{job.kind} for {job.entity_type} #{job.entity_id}"
@@ -0,0 +1,46 @@
+"""
+Management command to recompute the materialized book rating summaries.
+Run it after bulk updates that bypass the Review signals (for example
+queryset.update(status=...) or reviews imported with raw SQL).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.models import Book
+from library.ratings import recompute_rating_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating average, count and histogram stored on each book'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of books processed per batch (default: 1000)'
+        )
+        parser.add_argument(
+            '--book-id',
+            type=int,
+            action='append',
+            dest='book_ids',
+            help='Only recompute the given book id (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        books = Book.objects.all()
+        if options['book_ids']:
+            books = books.filter(pk__in=options['book_ids'])
+
+        total = books.count()
+        self.stdout.write(f"Recomputing rating summaries for {total} books...")
+        start_time = time.time()
+        changed = recompute_rating_summaries(books, batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Updated {changed} of {total} books in {time.time() - start_time:.2f}s"
+            )
+        )
@@ -0,0 +1,45 @@
+"""
+Management command to reconcile the denormalized Author/Publisher book counters.
+Run it after bulk updates that bypass model signals (for example queryset.update()
+on Book.publisher or raw inserts into the Book.authors table).
+"""
+from django.core.management.base import BaseCommand
+
+from library.models import Author, Publisher
+from library.counters import find_book_count_drift, refresh_book_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute Author.book_count and Publisher.book_count from the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report counters that are out of date'
+        )
+        parser.add_argument(
+            '--verbose-drift',
+            action='store_true',
+            help='List every out-of-date counter'
+        )
+
+    def handle(self, *args, **options):
+        for model in (Author, Publisher):
+            label = model._meta.verbose_name_plural
+            drift = find_book_count_drift(model)
+
+            if options['verbose_drift']:
+                for pk, stored, actual in drift:
+                    self.stdout.write(f"  {model.__name__} #{pk}: stored {stored}, actual {actual}")
+
+            if not drift:
+                self.stdout.write(self.style.SUCCESS(f"All {label} book counts are up to date"))
+            elif options['dry_run']:
+                self.stdout.write(self.style.WARNING(f"{len(drift)} {label} have out-of-date book counts"))
+            else:
+                # Recount everything in one statement rather than passing a huge id list
+                pks = [pk for pk, _, _ in drift] if len(drift) <= 1000 else None
+                refresh_book_counts(model, pks)
+                updated = len(drift)
+                self.stdout.write(self.style.SUCCESS(f"Fixed book counts of {updated} {label}"))
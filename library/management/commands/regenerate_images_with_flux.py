@@ -5,6 +5,8 @@ import time
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from library.models import Book, Author, Publisher
+from library.ai_signals import generate_batch_with_flux
+from library.ai_utils.flux_client import FluxClient
 
 class Command(BaseCommand):
     help = 'Regenerate images for books, authors, and publishers using Flux AI'
@@ -14,7 +16,7 @@ class Command(BaseCommand):
             '--batch-size',
             type=int,
             default=3,
-            help='Number of images to generate in one batch before pausing'
+            help='Number of images to generate in one batch (sent together to the Flux server) before pausing'
         )
         parser.add_argument(
             '--pause-seconds',
@@ -79,6 +81,14 @@ class Command(BaseCommand):
     
     def check_flux_availability(self):
         """Check if Flux AI is available by running a test command"""
+        server_url = getattr(settings, 'FLUX_SERVER_URL', None)
+        if server_url:
+            health = FluxClient(server_url).health()
+            if health:
+                self.stdout.write(f'Flux server is available at {server_url} ({health["backend"]} backend)')
+                return True
+            self.stdout.write(self.style.WARNING(f'Flux server at {server_url} is not available'))
+
         try:
             # Check if conda is available
             conda_result = subprocess.run(["conda", "--version"], capture_output=True, text=True)
@@ -106,206 +116,129 @@ class Command(BaseCommand):
     
     def regenerate_book_covers(self, batch_size, pause_seconds, limit, force_fallback):
         """Regenerate book covers"""
-        self.stdout.write('Checking for books to regenerate covers...')
-        
-        # Get all books
-        books = Book.objects.all()
-        count = books.count()
-        self.stdout.write(f'Found {count} books')
-        
-        if limit > 0 and limit < count:
-            books = books[:limit]
-            self.stdout.write(f'Limiting to {limit} books')
-        
-        # Generate covers in batches
-        for i, book in enumerate(books):
-            if i > 0 and i % batch_size == 0:
-                self.stdout.write(f'Processed {i}/{count} books, pausing for {pause_seconds} seconds...')
-                time.sleep(pause_seconds)
-            
-            try:
-                # Create a filename for the cover
-                filename = f"{book.id}_{self._sanitize_filename(book.title)[:30]}.jpg"
-                
-                # Define the media path
-                media_root = settings.MEDIA_ROOT
-                covers_dir = os.path.join(media_root, 'covers')
-                os.makedirs(covers_dir, exist_ok=True)
-                
-                # Full path to save the image
-                output_path = os.path.join(covers_dir, filename)
-                
-                # Generate the prompt
-                authors = ", ".join([author.name for author in book.authors.all()])
-                if not authors:
-                    authors = "Unknown Author"
-                
-                prompt = f"A professional book cover for '{book.title}' by {authors}. High quality, detailed, publishing industry standard."
-                
-                self.stdout.write(f'  Regenerating cover for book: {book.title}')
-                
-                # Generate the image using flux_wrapper.py
-                flux_wrapper_path = os.path.join(settings.BASE_DIR, 'library', 'ai_utils', 'flux_wrapper.py')
-                cmd = [
-                    "python", flux_wrapper_path,
-                    "--prompt", prompt,
-                    "--output", output_path
-                ]
-                
-                # Add fallback flag if requested
-                if force_fallback:
-                    cmd.append("--fallback")
-                
-                self.stdout.write(f'    Running command: {" ".join(cmd)}')
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                success = result.returncode == 0 and os.path.exists(output_path)
-                
-                if success and os.path.exists(output_path):
-                    # Update the book model with the new cover
-                    relative_path = os.path.join('covers', filename)
-                    book.cover = relative_path
-                    book.save(update_fields=['cover'])
-                    self.stdout.write(self.style.SUCCESS(f'    Successfully regenerated cover for book: {book.title}'))
-                else:
-                    self.stdout.write(self.style.ERROR(f'    Failed to regenerate cover for book: {book.title}'))
-                    if result.stderr:
-                        self.stdout.write(f'    Error: {result.stderr[:200]}...')
-            
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'    Error regenerating cover for book {book.id}: {str(e)}'))
-    
+        def build_prompt(book):
+            authors = ", ".join([author.name for author in book.authors.all()])
+            if not authors:
+                authors = "Unknown Author"
+            return f"A professional book cover for '{book.title}' by {authors}. High quality, detailed, publishing industry standard."
+
+        self._regenerate_images(
+            Book.objects.prefetch_related('authors'), 'books', 'cover', 'covers', 'title', build_prompt,
+            batch_size, pause_seconds, limit, force_fallback
+        )
+
     def regenerate_author_photos(self, batch_size, pause_seconds, limit, force_fallback):
         """Regenerate author photos"""
-        self.stdout.write('Checking for authors to regenerate photos...')
-        
-        # Get all authors
-        authors = Author.objects.all()
-        count = authors.count()
-        self.stdout.write(f'Found {count} authors')
-        
-        if limit > 0 and limit < count:
-            authors = authors[:limit]
-            self.stdout.write(f'Limiting to {limit} authors')
-        
-        # Generate photos in batches
-        for i, author in enumerate(authors):
-            if i > 0 and i % batch_size == 0:
-                self.stdout.write(f'Processed {i}/{count} authors, pausing for {pause_seconds} seconds...')
-                time.sleep(pause_seconds)
-            
-            try:
-                # Create a filename for the portrait
-                filename = f"{author.id}_{self._sanitize_filename(author.name)[:30]}.jpg"
-                
-                # Define the media path
-                media_root = settings.MEDIA_ROOT
-                authors_dir = os.path.join(media_root, 'authors')
-                os.makedirs(authors_dir, exist_ok=True)
-                
-                # Full path to save the image
-                output_path = os.path.join(authors_dir, filename)
-                
-                # Generate the prompt
-                prompt = f"A professional portrait photograph of author {author.name}. High quality, detailed, professional headshot."
-                
-                self.stdout.write(f'  Regenerating photo for author: {author.name}')
-                
-                # Generate the image using flux_wrapper.py
-                flux_wrapper_path = os.path.join(settings.BASE_DIR, 'library', 'ai_utils', 'flux_wrapper.py')
-                cmd = [
-                    "python", flux_wrapper_path,
-                    "--prompt", prompt,
-                    "--output", output_path
-                ]
-                
-                # Add fallback flag if requested
-                if force_fallback:
-                    cmd.append("--fallback")
-                
-                self.stdout.write(f'    Running command: {" ".join(cmd)}')
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                success = result.returncode == 0 and os.path.exists(output_path)
-                
-                if success and os.path.exists(output_path):
-                    # Update the author model with the new photo
-                    relative_path = os.path.join('authors', filename)
-                    author.photo = relative_path
-                    author.save(update_fields=['photo'])
-                    self.stdout.write(self.style.SUCCESS(f'    Successfully regenerated photo for author: {author.name}'))
-                else:
-                    self.stdout.write(self.style.ERROR(f'    Failed to regenerate photo for author: {author.name}'))
-                    if result.stderr:
-                        self.stdout.write(f'    Error: {result.stderr[:200]}...')
-            
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'    Error regenerating photo for author {author.id}: {str(e)}'))
-    
+        self._regenerate_images(
+            Author.objects.all(), 'authors', 'photo', 'authors', 'name',
+            lambda author: f"A professional portrait photograph of author {author.name}. High quality, detailed, professional headshot.",
+            batch_size, pause_seconds, limit, force_fallback
+        )
+
     def regenerate_publisher_logos(self, batch_size, pause_seconds, limit, force_fallback):
         """Regenerate publisher logos"""
-        self.stdout.write('Checking for publishers to regenerate logos...')
-        
-        # Get all publishers
-        publishers = Publisher.objects.all()
-        count = publishers.count()
-        self.stdout.write(f'Found {count} publishers')
-        
+        self._regenerate_images(
+            Publisher.objects.all(), 'publishers', 'logo', 'publishers', 'name',
+            lambda publisher: f"A professional logo for publishing company '{publisher.name}'. Clean, corporate design, minimalist, high quality.",
+            batch_size, pause_seconds, limit, force_fallback
+        )
+
+    def _regenerate_images(self, queryset, label, field, directory, name_field, build_prompt,
+                           batch_size, pause_seconds, limit, force_fallback):
+        """
+        Regenerate the images of a queryset in batches.
+
+        With a warm Flux server (settings.FLUX_SERVER_URL) every batch is submitted
+        at once; otherwise each image is generated by its own flux_wrapper.py process.
+        """
+        self.stdout.write(f'Checking for {label} to regenerate {field}s...')
+
+        count = queryset.count()
+        self.stdout.write(f'Found {count} {label}')
+
         if limit > 0 and limit < count:
-            publishers = publishers[:limit]
-            self.stdout.write(f'Limiting to {limit} publishers')
-        
-        # Generate logos in batches
-        for i, publisher in enumerate(publishers):
-            if i > 0 and i % batch_size == 0:
-                self.stdout.write(f'Processed {i}/{count} publishers, pausing for {pause_seconds} seconds...')
+            queryset = queryset[:limit]
+            self.stdout.write(f'Limiting to {limit} {label}')
+
+        # Create the media directory
+        output_dir = os.path.join(settings.MEDIA_ROOT, directory)
+        os.makedirs(output_dir, exist_ok=True)
+
+        objects = list(queryset)
+        for start in range(0, len(objects), batch_size):
+            if start > 0:
+                self.stdout.write(f'Processed {start}/{count} {label}, pausing for {pause_seconds} seconds...')
                 time.sleep(pause_seconds)
-            
+
+            items = []
+            for obj in objects[start:start + batch_size]:
+                name = getattr(obj, name_field)
+                filename = f"{obj.id}_{self._sanitize_filename(name)[:30]}.jpg"
+                self.stdout.write(f'  Regenerating {field} for {label[:-1]}: {name}')
+                items.append({
+                    'object': obj,
+                    'name': name,
+                    'filename': filename,
+                    'prompt': build_prompt(obj),
+                    'output_path': os.path.join(output_dir, filename),
+                })
+
+            started = time.time()
+            results = self._generate_batch(items, force_fallback)
+            if len(items) > 1:
+                self.stdout.write(f'    Generated batch of {len(items)} in {time.time() - started:.1f}s')
+
+            for item, (success, error) in zip(items, results):
+                try:
+                    if success and os.path.exists(item['output_path']):
+                        # Update the model with the new image
+                        obj = item['object']
+                        setattr(obj, field, os.path.join(directory, item['filename']))
+                        obj.save(update_fields=[field])
+                        self.stdout.write(self.style.SUCCESS(f'    Successfully regenerated {field} for {label[:-1]}: {item["name"]}'))
+                    else:
+                        self.stdout.write(self.style.ERROR(f'    Failed to regenerate {field} for {label[:-1]}: {item["name"]}'))
+                        if error:
+                            self.stdout.write(f'    Error: {error[:200]}...')
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'    Error regenerating {field} for {label[:-1]} {item["object"].id}: {str(e)}'))
+
+    def _generate_batch(self, items, force_fallback):
+        """
+        Generate the images of a batch.
+
+        Returns:
+            list: One (success, error) pair per item
+        """
+        if getattr(settings, 'FLUX_SERVER_URL', None) and not force_fallback:
+            try:
+                generated = generate_batch_with_flux(items)
+            except Exception as e:
+                return [(False, str(e))] * len(items)
+            return [(success, '' if success else 'Flux server failed to generate the image') for success in generated]
+
+        results = []
+        flux_wrapper_path = os.path.join(settings.BASE_DIR, 'library', 'ai_utils', 'flux_wrapper.py')
+        for item in items:
+            cmd = [
+                "python", flux_wrapper_path,
+                "--prompt", item['prompt'],
+                "--output", item['output_path']
+            ]
+
+            # Add fallback flag if requested
+            if force_fallback:
+                cmd.append("--fallback")
+
+            self.stdout.write(f'    Running command: {" ".join(cmd)}')
             try:
-                # Create a filename for the logo
-                filename = f"{publisher.id}_{self._sanitize_filename(publisher.name)[:30]}.jpg"
-                
-                # Define the media path
-                media_root = settings.MEDIA_ROOT
-                publishers_dir = os.path.join(media_root, 'publishers')
-                os.makedirs(publishers_dir, exist_ok=True)
-                
-                # Full path to save the image
-                output_path = os.path.join(publishers_dir, filename)
-                
-                # Generate the prompt
-                prompt = f"A professional logo for publishing company '{publisher.name}'. Clean, corporate design, minimalist, high quality."
-                
-                self.stdout.write(f'  Regenerating logo for publisher: {publisher.name}')
-                
-                # Generate the image using flux_wrapper.py
-                flux_wrapper_path = os.path.join(settings.BASE_DIR, 'library', 'ai_utils', 'flux_wrapper.py')
-                cmd = [
-                    "python", flux_wrapper_path,
-                    "--prompt", prompt,
-                    "--output", output_path
-                ]
-                
-                # Add fallback flag if requested
-                if force_fallback:
-                    cmd.append("--fallback")
-                
-                self.stdout.write(f'    Running command: {" ".join(cmd)}')
                 result = subprocess.run(cmd, capture_output=True, text=True)
-                success = result.returncode == 0 and os.path.exists(output_path)
-                
-                if success and os.path.exists(output_path):
-                    # Update the publisher model with the new logo
-                    relative_path = os.path.join('publishers', filename)
-                    publisher.logo = relative_path
-                    publisher.save(update_fields=['logo'])
-                    self.stdout.write(self.style.SUCCESS(f'    Successfully regenerated logo for publisher: {publisher.name}'))
-                else:
-                    self.stdout.write(self.style.ERROR(f'    Failed to regenerate logo for publisher: {publisher.name}'))
-                    if result.stderr:
-                        self.stdout.write(f'    Error: {result.stderr[:200]}...')
-            
             except Exception as e:
-                self.stdout.write(self.style.ERROR(f'    Error regenerating logo for publisher {publisher.id}: {str(e)}'))
-    
+                results.append((False, str(e)))
+                continue
+            results.append((result.returncode == 0 and os.path.exists(item['output_path']), result.stderr))
+        return results
+
     def _sanitize_filename(self, filename):
         """Sanitize a string to be safe for filenames"""
         if not filename:
@@ -3,11 +3,9 @@ Management command to send scheduled notifications.
 This command can be run via a cron job or similar scheduler to send notifications on a regular basis.
 """
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from django.db.models import Q
 
-from library.models import BookLoan, BookReservation
-from library.notifications import send_due_date_reminder, send_overdue_notification
+from library.notifications import send_daily_digest, send_due_date_reminder, send_overdue_notification
+from library.reservation_expiry import expire_reservations
 
 
 class Command(BaseCommand):
@@ -26,74 +24,85 @@ class Command(BaseCommand):
             action='store_true',
             help='Perform a dry run without actually sending emails'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Emails sent per batch over one connection (default: settings.NOTIFICATION_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--digest',
+            action='store_true',
+            help='Send every user one daily digest of all their loans, reservations and fees instead of --type'
+        )
 
     def handle(self, *args, **options):
         notification_type = options['type']
         dry_run = options['dry_run']
+        batch_size = options['batch_size']
         
-        if notification_type in ['due', 'all']:
-            self.send_due_date_reminders(dry_run)
-        
-        if notification_type in ['overdue', 'all']:
-            self.send_overdue_notifications(dry_run)
+        if options['digest']:
+            self.send_daily_digests(dry_run, batch_size)
+        else:
+            if notification_type in ['due', 'all']:
+                self.send_due_date_reminders(dry_run, batch_size)
+            
+            if notification_type in ['overdue', 'all']:
+                self.send_overdue_notifications(dry_run, batch_size)
         
         self.check_expired_reservations(dry_run)
 
-    def send_due_date_reminders(self, dry_run=False):
+    def send_due_date_reminders(self, dry_run=False, batch_size=None):
         """Send reminders for books due in the next 3 days."""
-        count = 0
-        
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN: Due date reminders'))
         
-        # Logic moved to the notifications module
-        send_due_date_reminder()
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'Successfully sent {count} due date reminders')
-        )
+        report = send_due_date_reminder(batch_size=batch_size, dry_run=dry_run)
+        self.write_report(report, 'due date reminders', dry_run)
 
-    def send_overdue_notifications(self, dry_run=False):
+    def send_overdue_notifications(self, dry_run=False, batch_size=None):
         """Send notifications for overdue books."""
-        count = 0
-        
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN: Overdue notifications'))
         
-        # Logic moved to the notifications module
-        send_overdue_notification()
+        report = send_overdue_notification(batch_size=batch_size, dry_run=dry_run)
+        self.write_report(report, 'overdue notifications', dry_run)
+
+    def send_daily_digests(self, dry_run=False, batch_size=None):
+        """Send one digest per user with all their due, overdue, ready and late-fee items."""
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN: Daily digests'))
         
-        self.stdout.write(
-            self.style.SUCCESS(f'Successfully sent {count} overdue notifications')
-        )
+        report = send_daily_digest(batch_size=batch_size, dry_run=dry_run)
+        self.write_report(report, 'daily digests', dry_run)
+
+    def write_report(self, report, label, dry_run):
+        """Print the timing of every batch and the totals of a run."""
+        for batch in report.batches:
+            self.stdout.write(
+                f'  Batch {batch.number}: {batch.sent}/{batch.messages} sent, '
+                f'rendered in {batch.render_seconds:.2f}s, sent in {batch.send_seconds:.2f}s'
+            )
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'DRY RUN: Would send {report.messages} {label}'))
+        elif report.failed:
+            self.stdout.write(self.style.ERROR(
+                f'Sent {report.sent} {label}, {report.failed} failed ({report.seconds:.2f}s)'
+            ))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Successfully sent {report.sent} {label} ({report.seconds:.2f}s)')
+            )
 
     def check_expired_reservations(self, dry_run=False):
-        """Check for and handle expired reservations."""
-        today = timezone.now().date()
-        
-        # Find expired reservations
-        expired_reservations = BookReservation.objects.filter(
-            Q(status='pending') | Q(status='fulfilled'),
-            expiry_date__lt=today
-        )
-        
-        count = expired_reservations.count()
+        """Expire reservations past their expiry date and pass their copies on."""
+        report = expire_reservations(dry_run=dry_run)
         
         if dry_run:
             self.stdout.write(
-                self.style.WARNING(f'DRY RUN: Would expire {count} reservations')
+                self.style.WARNING(f'DRY RUN: Would expire {report.summary()}')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Successfully expired {report.summary()}')
             )
-            return
-        
-        # Update status to expired
-        expired_reservations.update(status='expired')
-        
-        # For each expired fulfilled reservation, make the book available again
-        for reservation in expired_reservations.filter(status='fulfilled'):
-            book = reservation.book
-            book.available_copies += 1
-            book.save()
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'Successfully expired {count} reservations')
-        )
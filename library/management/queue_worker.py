@@ -0,0 +1,137 @@
+"""
+Base class of the management commands that drain a library.job_queue queue.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from library.job_queue import get_worker_name
+
+
+class QueueWorkerCommand(BaseCommand):
+    """
+    Long-lived worker process (or a single pass with --once) for a work queue.
+
+    Every pass requeues abandoned rows, claims up to concurrency * batch_size due
+    rows and processes them in batches, one batch per pool thread. Subclasses
+    name their items, set the option defaults and implement claim(),
+    requeue_stale(), process_batch() and describe().
+    """
+    item_name = 'jobs'
+    worker_label = 'Worker'
+    concurrency_setting = None
+    concurrency_help = 'Number of batches processed in parallel'
+    batch_size_setting = None
+    default_batch_size = 1
+    batch_size_help = 'Number of items processed together in one batch'
+    default_poll_interval = 5.0
+    default_stale_after = 3600
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, self.concurrency_setting, 1),
+            help=f'{self.concurrency_help} (default: {self.concurrency_setting} or 1)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, self.batch_size_setting, self.default_batch_size),
+            help=f'{self.batch_size_help} (default: {self.batch_size_setting} or {self.default_batch_size})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help=f'Exit when no due {self.item_name} are left instead of polling for new ones'
+        )
+        parser.add_argument(
+            f'--max-{self.item_name}',
+            dest='max_items',
+            metavar=f'MAX_{self.item_name.upper()}',
+            type=int,
+            default=None,
+            help=f'Exit after processing this many {self.item_name}'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=self.default_poll_interval,
+            help=f'Seconds to wait before polling an empty queue again (default: {self.default_poll_interval:g})'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=self.default_stale_after,
+            help=(f'Seconds after which an item in progress is considered abandoned and requeued '
+                  f'(default: {self.default_stale_after})')
+        )
+
+    def claim(self, limit, worker):
+        raise NotImplementedError
+
+    def requeue_stale(self, timeout):
+        raise NotImplementedError
+
+    def process_batch(self, items):
+        """Process claimed items and return the final or retry status of each."""
+        raise NotImplementedError
+
+    def describe(self, item):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        batch_size = max(1, options['batch_size'])
+        max_items = options['max_items']
+        worker = get_worker_name()
+        processed = 0
+        counts = {}
+
+        self.stdout.write(
+            f"{self.worker_label} {worker} started with concurrency {concurrency} and batch size {batch_size}"
+        )
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while max_items is None or processed < max_items:
+                requeued = self.requeue_stale(timedelta(seconds=options['stale_after']))
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f"Requeued {requeued} abandoned {self.item_name}"))
+
+                limit = concurrency * batch_size
+                if max_items is not None:
+                    limit = min(limit, max_items - processed)
+                items = self.claim(limit, worker)
+                if not items:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+                if concurrency == 1:
+                    statuses = [status for batch in batches for status in self.process_batch(batch)]
+                else:
+                    statuses = [
+                        status for batch_statuses in executor.map(self.process_in_thread, batches)
+                        for status in batch_statuses
+                    ]
+
+                for item, status in zip(items, statuses):
+                    counts[status] = counts.get(status, 0) + 1
+                    self.stdout.write(f"  {self.describe(item)}: {status}")
+                processed += len(items)
+
+        summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items())) or f'no {self.item_name}'
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} {self.item_name} ({summary})"))
+
+    def process_in_thread(self, items):
+        """Process a batch in a pool thread, which uses its own database connection."""
+        close_old_connections()
+        try:
+            return self.process_batch(items)
+        finally:
+            connection.close()
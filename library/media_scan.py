@@ -0,0 +1,182 @@
+"""
+Set-based integrity scan of the library media files.
+Instead of one os.path.exists call per row, the image directories are listed
+once with os.scandir into an in-memory map of file sizes, and the image paths of
+books, authors and publishers are streamed with values_list. Comparing the two
+gives the missing, zero-byte and orphaned files in a single pass, and broken
+rows are handed to the image generation queue in bulk.
+"""
+import os
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .image_jobs import DEFAULT_MAX_ATTEMPTS, IMAGE_TARGETS
+from .models import ImageGenerationJob
+
+UPDATE_BATCH_SIZE = 500
+
+MediaReference = namedtuple('MediaReference', ['entity_type', 'entity_id', 'name'])
+
+
+def normalize_name(name):
+    """Media names written on Windows may use backslashes."""
+    return name.replace('\\', '/')
+
+
+def scan_directory(directory, root=None):
+    """
+    List the files below a media directory.
+
+    Args:
+        directory (str): Directory relative to MEDIA_ROOT, e.g. 'covers'
+        root (str): Media root, MEDIA_ROOT if None
+
+    Returns:
+        dict: File size per media-relative name; hidden files are skipped
+    """
+    root = str(root or settings.MEDIA_ROOT)
+    files = {}
+    pending = [os.path.join(root, directory)]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    name = normalize_name(os.path.relpath(entry.path, root))
+                    files[name] = entry.stat().st_size
+    return files
+
+
+def iter_references(entity_types):
+    """
+    Stream the image paths of the given entity types.
+
+    Yields:
+        MediaReference: One per row with a non-empty image field
+    """
+    for entity_type in entity_types:
+        target = IMAGE_TARGETS[entity_type]
+        rows = (
+            target.model.objects.exclude(**{f'{target.field}__isnull': True})
+            .exclude(**{target.field: ''})
+            .values_list('pk', target.field)
+            .order_by()
+            .iterator(chunk_size=5000)
+        )
+        for pk, name in rows:
+            yield MediaReference(entity_type, pk, normalize_name(name))
+
+
+class MediaScanReport:
+    """Result of a media scan."""
+
+    def __init__(self):
+        self.files = self.references = 0
+        self.missing = []
+        self.empty = []
+        self.orphaned = []
+        self.seconds = 0.0
+
+    @property
+    def broken(self):
+        """References whose image has to be generated again."""
+        return self.missing + self.empty
+
+
+def scan_media(entity_types=tuple(IMAGE_TARGETS), root=None):
+    """
+    Compare the image directories with the image paths stored in the database.
+
+    Args:
+        entity_types (iterable): Keys of IMAGE_TARGETS to scan
+        root (str): Media root, MEDIA_ROOT if None
+
+    Returns:
+        MediaScanReport: Missing and zero-byte references, and files no row references
+    """
+    start = time.perf_counter()
+    report = MediaScanReport()
+
+    files = {}
+    for directory in {IMAGE_TARGETS[entity_type].directory for entity_type in entity_types}:
+        files.update(scan_directory(directory, root))
+    report.files = len(files)
+
+    referenced = set()
+    for reference in iter_references(entity_types):
+        report.references += 1
+        referenced.add(reference.name)
+        size = files.get(reference.name)
+        if size is None:
+            report.missing.append(reference)
+        elif size == 0:
+            report.empty.append(reference)
+
+    report.orphaned = sorted(files.keys() - referenced)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def clear_references(references):
+    """
+    Clear the image fields of broken references with one update per entity type and batch.
+    No signals are sent, so no image jobs are queued.
+
+    Returns:
+        int: Number of cleared rows
+    """
+    ids = defaultdict(list)
+    for reference in references:
+        ids[reference.entity_type].append(reference.entity_id)
+
+    cleared = 0
+    with transaction.atomic():
+        for entity_type, entity_ids in ids.items():
+            target = IMAGE_TARGETS[entity_type]
+            for start in range(0, len(entity_ids), UPDATE_BATCH_SIZE):
+                batch = entity_ids[start:start + UPDATE_BATCH_SIZE]
+                cleared += target.model.objects.filter(pk__in=batch).update(**{target.field: ''})
+    return cleared
+
+
+def queue_regeneration(references):
+    """
+    Clear broken references and queue one image generation job for each of them.
+    Entities that already have an active job are not queued again.
+
+    Returns:
+        int: Number of queued jobs
+    """
+    references = list(references)
+    clear_references(references)
+
+    ids = defaultdict(set)
+    for reference in references:
+        ids[reference.entity_type].add(reference.entity_id)
+
+    max_attempts = getattr(settings, 'IMAGE_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    jobs = []
+    for entity_type, entity_ids in ids.items():
+        kind = IMAGE_TARGETS[entity_type].kind
+        active = set(
+            ImageGenerationJob.objects.filter(
+                entity_type=entity_type, kind=kind, status__in=ImageGenerationJob.ACTIVE_STATUSES
+            ).values_list('entity_id', flat=True)
+        )
+        jobs.extend(
+            ImageGenerationJob(entity_type=entity_type, entity_id=entity_id, kind=kind, max_attempts=max_attempts)
+            for entity_id in sorted(entity_ids - active)
+        )
+    # A job queued concurrently is rejected by the partial unique constraint
+    ImageGenerationJob.objects.bulk_create(jobs, batch_size=UPDATE_BATCH_SIZE, ignore_conflicts=True)
+    return len(jobs)
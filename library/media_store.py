@@ -0,0 +1,230 @@
+"""
+Reference counting, garbage collection and migration for the content-addressed
+media store (library.storage.ContentAddressedStorage).
+
+A stored file is referenced by every row whose image field holds its name.
+References are counted with one grouped query per image field, so the counts
+always match the database; files without references are deleted once they are
+older than a grace period, which protects uploads whose rows are not committed
+yet. migrate_media moves the files of an existing media tree into the store and
+points the rows at them.
+"""
+import os
+import shutil
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import storages
+from django.db import transaction
+from django.db.models import Case, Count, Value, When
+
+from accounts.models import UserProfile
+
+from .models import Author, Book, Publisher
+from .storage import (
+    ContentAddressedStorage, get_content_addressed_directories, get_content_name, hash_path, is_content_name
+)
+
+# Image fields whose files live in the store
+MEDIA_FIELDS = (
+    (Book, 'cover'),
+    (Author, 'photo'),
+    (Publisher, 'logo'),
+    (UserProfile, 'profile_picture'),
+)
+
+DEFAULT_GRACE_PERIOD = timedelta(hours=1)
+UPDATE_BATCH_SIZE = 500
+
+
+def get_store():
+    """Return the default storage if it is content-addressed, else None."""
+    storage = storages['default']
+    return storage if isinstance(storage, ContentAddressedStorage) else None
+
+
+def count_references():
+    """
+    Count the rows referencing each media file.
+
+    Returns:
+        Counter: Number of references per media name
+    """
+    references = Counter()
+    for model, field in MEDIA_FIELDS:
+        rows = (
+            model.objects.exclude(**{f'{field}__isnull': True})
+            .exclude(**{field: ''})
+            .values(field)
+            .annotate(references=Count('pk'))
+            .order_by()
+        )
+        for row in rows.iterator():
+            references[row[field]] += row['references']
+    return references
+
+
+def iter_stored_files(storage):
+    """
+    List the files in the content-addressed directories.
+
+    Yields:
+        tuple: (name, os.DirEntry) of every content-addressed file
+    """
+    for directory in get_content_addressed_directories():
+        try:
+            prefixes = [entry for entry in os.scandir(storage.path(directory)) if entry.is_dir()]
+        except FileNotFoundError:
+            continue
+        for prefix in prefixes:
+            for entry in os.scandir(prefix.path):
+                name = f"{directory}/{prefix.name}/{entry.name}"
+                if entry.is_file() and is_content_name(name):
+                    yield name, entry
+
+
+class GarbageReport:
+    """Totals of a garbage collection run."""
+
+    def __init__(self):
+        self.stored = self.referenced = self.recent = self.deleted = 0
+        self.bytes_freed = 0
+        self.deleted_names = []
+
+
+def collect_garbage(grace_period=DEFAULT_GRACE_PERIOD, dry_run=False, storage=None):
+    """
+    Delete stored files that no row references.
+
+    Args:
+        grace_period (timedelta): Unreferenced files younger than this are kept
+        dry_run (bool): Only report what would be deleted
+        storage (ContentAddressedStorage): Store to clean, the default storage if None
+
+    Returns:
+        GarbageReport: Totals of the run
+    """
+    storage = storage or get_store()
+    report = GarbageReport()
+    if storage is None:
+        return report
+
+    references = count_references()
+    cutoff = time.time() - grace_period.total_seconds()
+    for name, entry in iter_stored_files(storage):
+        report.stored += 1
+        if references[name]:
+            report.referenced += 1
+            continue
+        stat = entry.stat()
+        if stat.st_mtime > cutoff:
+            report.recent += 1
+            continue
+        if not dry_run:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+        report.deleted += 1
+        report.bytes_freed += stat.st_size
+        report.deleted_names.append(name)
+    return report
+
+
+class MigrationReport:
+    """Totals of a media migration."""
+
+    def __init__(self):
+        self.converted = self.duplicates = self.missing = self.rows = 0
+        self.bytes_before = self.bytes_after = 0
+        self.missing_names = []
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_before - self.bytes_after
+
+
+def migrate_media(dry_run=False, keep_originals=False, storage=None):
+    """
+    Move the referenced files of a name-based media tree into the store.
+
+    Files are copied to their content-addressed names first, the rows are then
+    updated in one transaction with set-based updates, and the originals are
+    removed last, so an interrupted run leaves every row pointing at a file.
+
+    Args:
+        dry_run (bool): Only report what would be converted
+        keep_originals (bool): Leave the original files in place
+        storage (ContentAddressedStorage): Target store, the default storage if None
+
+    Returns:
+        MigrationReport: Totals of the migration
+    """
+    storage = storage or get_store() or ContentAddressedStorage()
+    directories = get_content_addressed_directories()
+    report = MigrationReport()
+    renames = {}
+    stored = set()
+
+    for name in count_references():
+        if is_content_name(name) or name.split('/', 1)[0] not in directories:
+            continue
+        try:
+            path = storage.path(name)
+        except SuspiciousFileOperation:
+            path = None
+        if not path or not os.path.isfile(path):
+            report.missing += 1
+            report.missing_names.append(name)
+            continue
+
+        content_name = get_content_name(name.split('/', 1)[0], hash_path(path), os.path.splitext(name)[1])
+        size = os.path.getsize(path)
+        report.bytes_before += size
+        if content_name in stored or storage.exists(content_name):
+            report.duplicates += 1
+        else:
+            report.bytes_after += size
+            if not dry_run:
+                content_path = storage.path(content_name)
+                os.makedirs(os.path.dirname(content_path), exist_ok=True)
+                temp_path = f"{content_path}.migrating"
+                shutil.copy2(path, temp_path)
+                os.replace(temp_path, content_path)
+        stored.add(content_name)
+        renames[name] = content_name
+        report.converted += 1
+
+    if dry_run or not renames:
+        return report
+
+    with transaction.atomic():
+        report.rows = update_references(renames)
+
+    if not keep_originals:
+        for name in renames:
+            try:
+                os.remove(storage.path(name))
+            except FileNotFoundError:
+                pass
+    return report
+
+
+def update_references(renames):
+    """
+    Point every row referencing an old name at its new name, without sending signals.
+
+    Returns:
+        int: Number of updated rows
+    """
+    updated = 0
+    old_names = list(renames)
+    for model, field in MEDIA_FIELDS:
+        for start in range(0, len(old_names), UPDATE_BATCH_SIZE):
+            batch = old_names[start:start + UPDATE_BATCH_SIZE]
+            updated += model.objects.filter(**{f'{field}__in': batch}).update(**{
+                field: Case(*(When(**{field: old}, then=Value(renames[old])) for old in batch))
+            })
+    return updated
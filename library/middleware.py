@@ -0,0 +1,56 @@
+"""
+Middleware for the library app.
+"""
+import json
+import logging
+
+from django.conf import settings
+
+from .instrumentation import QueryRecorder, get_query_budget
+
+logger = logging.getLogger('library.queries')
+
+
+class QueryCountMiddleware:
+    """
+    Record SQL statistics for every request.
+
+    The statistics are logged as a JSON line on the 'library.queries' logger
+    (at WARNING level when the view exceeds its budget in settings.QUERY_BUDGETS)
+    and, when settings.QUERY_INSTRUMENTATION_HEADERS is enabled, returned in the
+    X-Query-Count, X-Query-Duplicates and X-Query-Time-Ms response headers.
+    Recording is switched by settings.QUERY_INSTRUMENTATION, which defaults to DEBUG.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_INSTRUMENTATION', settings.DEBUG)
+        self.headers = getattr(settings, 'QUERY_INSTRUMENTATION_HEADERS', settings.DEBUG)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = get_query_budget(url_name)
+        stats = recorder.summary()
+        stats.update({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'budget': budget,
+        })
+
+        over_budget = budget is not None and recorder.count > budget
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(stats), extra={'query_stats': stats})
+
+        if self.headers:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Duplicates'] = str(recorder.duplicate_count)
+            response['X-Query-Time-Ms'] = f"{recorder.duration * 1000:.2f}"
+        return response
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0004_category_book_categories"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookGenre",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("genre", "Genre"), ("category", "Category")],
+                        default="genre",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="genre_entries",
+                        to="library.book",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["name", "book"], name="library_bookgenre_name_idx"
+                    )
+                ],
+                "unique_together": {("book", "name", "source")},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS library_book_fts USING fts5("
+            "title, authors, publisher, description, isbn, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS library_book_search ("
+            "book_id bigint PRIMARY KEY REFERENCES library_book (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS library_book_search_document_idx "
+            "ON library_book_search USING GIN (document)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS library_book_fts")
+    elif connection.vendor == "postgresql":
+        schema_editor.execute("DROP TABLE IF EXISTS library_book_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0005_bookgenre"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_book_counts(apps, schema_editor):
+    Author = apps.get_model("library", "Author")
+    Publisher = apps.get_model("library", "Publisher")
+    Book = apps.get_model("library", "Book")
+    BookAuthor = Book.authors.through
+
+    def count_of(source, field):
+        counts = (
+            source.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        return Coalesce(Subquery(counts), Value(0))
+
+    Author.objects.update(book_count=count_of(BookAuthor, "author"))
+    Publisher.objects.update(book_count=count_of(Book, "publisher"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0007_listing_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="author",
+            name="book_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="publisher",
+            name="book_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="author",
+            index=models.Index(
+                fields=["book_count", "id"], name="library_author_count_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="publisher",
+            index=models.Index(
+                fields=["book_count", "id"], name="library_publisher_count_idx"
+            ),
+        ),
+        migrations.RunPython(populate_book_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:48
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_rating_summaries(apps, schema_editor):
+    Book = apps.get_model("library", "Book")
+    Review = apps.get_model("library", "Review")
+
+    histogram = {
+        f"rating_{rating}_count": Count("pk", filter=Q(rating=rating))
+        for rating in range(1, 6)
+    }
+    rows = (
+        Review.objects.filter(status="approved")
+        .order_by()
+        .values("book_id")
+        .annotate(rating_count=Count("pk"), rating_sum=Sum("rating"), **histogram)
+    )
+    books = []
+    for row in rows:
+        book = Book(pk=row.pop("book_id"), **row)
+        book.rating_average = book.rating_sum / book.rating_count
+        books.append(book)
+    Book.objects.bulk_update(
+        books,
+        ["rating_count", "rating_sum", "rating_average"] + list(histogram),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0008_book_counts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="rating_1_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_2_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_3_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_4_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_5_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_average",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_rating_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:57
+
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def number_pending_reservations(apps, schema_editor):
+    BookReservation = apps.get_model("library", "BookReservation")
+    pending = BookReservation.objects.filter(status="pending").annotate(
+        position=Window(
+            expression=RowNumber(),
+            partition_by=[F("book_id")],
+            order_by=[F("reservation_date").asc(), F("pk").asc()],
+        )
+    )
+    reservations = []
+    for reservation in pending:
+        reservation.queue_position = reservation.position
+        reservations.append(reservation)
+    BookReservation.objects.bulk_update(
+        reservations, ["queue_position"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0011_email_outbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookreservation",
+            name="queue_position",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="bookreservation",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("fulfilled", "Fulfilled"),
+                    ("collected", "Collected"),
+                    ("cancelled", "Cancelled"),
+                    ("expired", "Expired"),
+                ],
+                default="pending",
+                max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookreservation",
+            index=models.Index(
+                fields=["book", "status", "queue_position"],
+                name="library_hold_queue_idx",
+            ),
+        ),
+        migrations.RunPython(number_pending_reservations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-17 13:43
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def extend_queued_holds(apps, schema_editor):
+    """Give holds waiting in the queue the hold lifetime instead of the pickup window."""
+    BookReservation = apps.get_model("library", "BookReservation")
+    LibrarySettings = apps.get_model("library", "LibrarySettings")
+    library_settings = LibrarySettings.objects.filter(pk=1).first()
+    lifetime = timedelta(
+        days=library_settings.hold_lifetime_days if library_settings else 90
+    )
+    queued = []
+    for reservation in BookReservation.objects.filter(status="pending").only(
+        "pk", "reservation_date", "expiry_date"
+    ):
+        if reservation.expiry_date < reservation.reservation_date + lifetime:
+            reservation.expiry_date = reservation.reservation_date + lifetime
+            queued.append(reservation)
+    BookReservation.objects.bulk_update(queued, ["expiry_date"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0012_reservation_hold_queue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="librarysettings",
+            name="hold_lifetime_days",
+            field=models.PositiveIntegerField(
+                default=90,
+                help_text="Number of days a reservation may wait in the queue before it expires",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="librarysettings",
+            name="reservation_expiry_days",
+            field=models.PositiveIntegerField(
+                default=3,
+                help_text="Number of days a ready reservation is held for pickup",
+            ),
+        ),
+        migrations.RunPython(extend_queued_holds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+def fill_search_index(apps, schema_editor):
+    """Index the books that existed before the search index was created."""
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        schema_editor.execute("DELETE FROM library_book_fts")
+        schema_editor.execute(
+            "INSERT INTO library_book_fts "
+            "(rowid, title, authors, publisher, description, isbn) "
+            "SELECT b.id, COALESCE(b.title, ''), "
+            "COALESCE((SELECT group_concat(a.name, ' ') FROM library_book_authors ba "
+            "JOIN library_author a ON a.id = ba.author_id WHERE ba.book_id = b.id), ''), "
+            "COALESCE(p.name, ''), COALESCE(b.description, ''), COALESCE(b.isbn, '') "
+            "FROM library_book b LEFT JOIN library_publisher p ON p.id = b.publisher_id"
+        )
+    elif connection.vendor == "postgresql":
+        schema_editor.execute("TRUNCATE library_book_search")
+        schema_editor.execute(
+            "INSERT INTO library_book_search (book_id, document) "
+            "SELECT b.id, "
+            "setweight(to_tsvector('simple', COALESCE(b.title, '')), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE(b.isbn, '')), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE((SELECT string_agg(a.name, ' ') "
+            "FROM library_book_authors ba JOIN library_author a ON a.id = ba.author_id "
+            "WHERE ba.book_id = b.id), '')), 'B') || "
+            "setweight(to_tsvector('simple', COALESCE(p.name, '')), 'C') || "
+            "setweight(to_tsvector('simple', COALESCE(b.description, '')), 'D') "
+            "FROM library_book b LEFT JOIN library_publisher p ON p.id = b.publisher_id"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0013_hold_lifetime"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -8,13 +8,41 @@ from decimal import Decimal
 from django.utils.text import slugify
 from accounts.models import CustomUser
 
-class Author(models.Model):
+class CounterFieldsMixin:
+    """
+    Keep save() from overwriting denormalized counters with stale in-memory values.
+    The fields listed in counter_fields are maintained with UPDATE queries
+    (see library.counters and library.ratings).
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not args and not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Author(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=200)
     bio = models.TextField(blank=True)
     photo = models.ImageField(upload_to='authors/', blank=True, null=True)
     birth_date = models.DateField(blank=True, null=True)
     website = models.URLField(blank=True, null=True)
     social_media = models.JSONField(blank=True, null=True)
+    # Maintained by library.counters; see the reconcile_book_counts command
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_fields = ('book_count',)
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination of author_list by name and by number of books
+            models.Index(fields=['name', 'id'], name='library_author_name_idx'),
+            models.Index(fields=['book_count', 'id'], name='library_author_count_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -22,13 +50,23 @@ class Author(models.Model):
     def get_absolute_url(self):
         return reverse('library:author_detail', args=[str(self.id)])
 
-class Publisher(models.Model):
+class Publisher(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     logo = models.ImageField(upload_to='publishers/', blank=True, null=True)
     website = models.URLField(blank=True, null=True)
     founded_date = models.DateField(blank=True, null=True)
     contact_info = models.JSONField(blank=True, null=True)
+    # Maintained by library.counters; see the reconcile_book_counts command
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_fields = ('book_count',)
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination of publisher_list by name and by number of books
+            models.Index(fields=['name', 'id'], name='library_publisher_name_idx'),
+            models.Index(fields=['book_count', 'id'], name='library_publisher_count_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -53,7 +91,7 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = 'Categories'
 
-class Book(models.Model):
+class Book(CounterFieldsMixin, models.Model):
     title = models.CharField(max_length=200)
     authors = models.ManyToManyField(Author, related_name='books')
     publisher = models.ForeignKey(Publisher, on_delete=models.SET_NULL, null=True, related_name='books')
@@ -67,6 +105,28 @@ class Book(models.Model):
     categories = models.ManyToManyField(Category, related_name='books', blank=True)
     available_copies = models.PositiveIntegerField(default=0)
     total_copies = models.PositiveIntegerField(default=0)
+    # Summary of approved reviews, maintained by library.ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    # available_copies is changed only by library.inventory, with conditional UPDATEs
+    counter_fields = (
+        'available_copies',
+        'rating_count', 'rating_sum', 'rating_average',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination of book_list by title and publication date
+            models.Index(fields=['title', 'id'], name='library_book_title_idx'),
+            models.Index(fields=['publication_date', 'id'], name='library_book_pubdate_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -80,28 +140,42 @@ class Book(models.Model):
     
     @property
     def average_rating(self):
-        """Calculate the average rating for approved reviews."""
-        approved_reviews = self.reviews.filter(status='approved')
-        if not approved_reviews.exists():
-            return 0
-        total_rating = sum(review.rating for review in approved_reviews)
-        return round(total_rating / approved_reviews.count(), 1)
+        """Return the average rating of approved reviews."""
+        return round(self.rating_average, 1) if self.rating_count else 0
     
     @property
     def review_count(self):
         """Return the count of approved reviews."""
-        return self.reviews.filter(status='approved').count()
+        return self.rating_count
     
     @property
     def rating_distribution(self):
         """Return the distribution of ratings as a dictionary."""
-        distribution = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        approved_reviews = self.reviews.filter(status='approved')
-        
-        for review in approved_reviews:
-            distribution[review.rating] += 1
-            
-        return distribution
+        return {rating: getattr(self, f'rating_{rating}_count') for rating in range(1, 6)}
+
+
+class BookGenre(models.Model):
+    """
+    Normalized genre membership for a book.
+    Mirrors Book.genres and Book.categories so genre filters can use an index.
+    """
+    SOURCE_CHOICES = [
+        ('genre', 'Genre'),
+        ('category', 'Category'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='genre_entries')
+    name = models.CharField(max_length=100)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='genre')
+
+    class Meta:
+        unique_together = ['book', 'name', 'source']
+        indexes = [
+            models.Index(fields=['name', 'book'], name='library_bookgenre_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} - {self.name}"
 
 class BookLoan(models.Model):
     STATUS_CHOICES = [
@@ -172,6 +246,7 @@ class BookReservation(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('fulfilled', 'Fulfilled'),
+        ('collected', 'Collected'),
         ('cancelled', 'Cancelled'),
         ('expired', 'Expired'),
     ]
@@ -179,8 +254,17 @@ class BookReservation(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='book_reservations')
     reservation_date = models.DateField(auto_now_add=True)
+    # End of the hold lifetime while pending, pickup deadline once fulfilled
     expiry_date = models.DateField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Place in the book's hold queue while pending, 1 is next in line (see library.holds)
+    queue_position = models.PositiveIntegerField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            # Next hold in line for a book
+            models.Index(fields=['book', 'status', 'queue_position'], name='library_hold_queue_idx'),
+        ]
     
     def __str__(self):
         return f"{self.book.title} - {self.user.username}"
@@ -208,7 +292,11 @@ class LibrarySettings(models.Model):
     )
     reservation_expiry_days = models.PositiveIntegerField(
         default=3,
-        help_text=_('Number of days until a reservation expires')
+        help_text=_('Number of days a ready reservation is held for pickup')
+    )
+    hold_lifetime_days = models.PositiveIntegerField(
+        default=90,
+        help_text=_('Number of days a reservation may wait in the queue before it expires')
     )
     
     class Meta:
@@ -217,9 +305,12 @@ class LibrarySettings(models.Model):
     
     @classmethod
     def get_settings(cls):
-        """Get the library settings, creating default settings if none exist."""
-        settings, created = cls.objects.get_or_create(pk=1)
-        return settings
+        """
+        Get the library settings, creating default settings if none exist.
+        The instance is cached per process (see library.settings_cache) and must not be modified.
+        """
+        from library.settings_cache import get_library_settings
+        return get_library_settings()
 
 
 class LateFee(models.Model):
@@ -312,3 +403,107 @@ class Review(models.Model):
     @property
     def is_approved(self):
         return self.status == 'approved'
+
+
+class ImageGenerationJob(models.Model):
+    """Queued AI image generation for a book cover, author portrait or publisher logo."""
+    ENTITY_CHOICES = [
+        ('book', _('Book')),
+        ('author', _('Author')),
+        ('publisher', _('Publisher')),
+    ]
+    KIND_CHOICES = [
+        ('cover', _('Cover')),
+        ('portrait', _('Portrait')),
+        ('logo', _('Logo')),
+    ]
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('succeeded', _('Succeeded')),
+        ('skipped', _('Skipped')),
+        ('failed', _('Failed')),
+        ('cancelled', _('Cancelled')),
+    ]
+    ACTIVE_STATUSES = ('pending', 'running')
+    
+    entity_type = models.CharField(max_length=10, choices=ENTITY_CHOICES)
+    entity_id = models.PositiveIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    output_path = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _('Image Generation Job')
+        verbose_name_plural = _('Image Generation Jobs')
+        constraints = [
+            # At most one queued or running job per entity and image kind
+            models.UniqueConstraint(
+                fields=['entity_type', 'entity_id', 'kind'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='library_imagejob_active_unique',
+            ),
+        ]
+        indexes = [
+            # Workers claim the oldest due pending jobs
+            models.Index(fields=['status', 'run_after', 'id'], name='library_imagejob_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.entity_type} #{self.entity_id} ({self.status})"
+
+
+class EmailOutbox(models.Model):
+    """
+    Transactional email written in the same transaction as the change it reports.
+    The deliver_emails management command sends it outside of the request.
+    """
+    KIND_CHOICES = [
+        ('loan_confirmation', _('Loan confirmation')),
+        ('return_confirmation', _('Return confirmation')),
+        ('reservation_confirmation', _('Reservation confirmation')),
+        ('reservation_available', _('Reservation available')),
+    ]
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('sending', _('Sending')),
+        ('sent', _('Sent')),
+        ('skipped', _('Skipped')),
+        ('failed', _('Failed')),
+    ]
+    
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    recipient = models.EmailField()
+    # One email per event, even if the event is saved or queued more than once
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _('Outgoing Email')
+        verbose_name_plural = _('Outgoing Emails')
+        indexes = [
+            # Workers claim the oldest due pending emails
+            models.Index(fields=['status', 'run_after', 'id'], name='library_outbox_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.recipient} ({self.status})"
@@ -2,14 +2,28 @@
 Notification system for the library application.
 Handles email notifications and in-app notifications for various events.
 """
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.db.models import CharField, DecimalField, F, Value
+from django.template.loader import get_template, render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
 from datetime import timedelta
+from collections import namedtuple
+from itertools import groupby
+import logging
+import time
 
-from .models import BookLoan, BookReservation
+from .bulk_import import chunked
+from .late_fees import accrue_late_fees
+from .models import BookLoan, BookReservation, LateFee
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NOTIFICATION_BATCH_SIZE = 100
+DUE_DATE_REMINDER_DAYS = 3
+
+NotificationBatch = namedtuple('NotificationBatch', ['number', 'messages', 'sent', 'render_seconds', 'send_seconds'])
 
 
 def send_email_notification(subject, template_name, context, recipient_list):
@@ -38,94 +52,318 @@ def send_email_notification(subject, template_name, context, recipient_list):
     )
 
 
-def send_due_date_reminder():
+def build_email_message(subject, template, context, recipient_list):
+    """
+    Render an email from an already loaded template.
+
+    Args:
+        subject (str): Email subject
+        template: Template returned by get_template, shared by all messages of a run
+        context (dict): Context data for the template
+        recipient_list (list): List of recipient email addresses
+
+    Returns:
+        EmailMultiAlternatives: Message with a plain text body and an HTML alternative
+    """
+    html_message = template.render(context)
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=strip_tags(html_message),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=recipient_list,
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+class DispatchReport:
+    """Totals of a bulk notification run, with the timing of every batch."""
+
+    def __init__(self):
+        self.messages = self.sent = self.failed = 0
+        self.batches = []
+
+    @property
+    def seconds(self):
+        return sum(batch.render_seconds + batch.send_seconds for batch in self.batches)
+
+    def add(self, batch):
+        self.batches.append(batch)
+        self.messages += batch.messages
+        self.sent += batch.sent
+
+
+def send_bulk_notifications(messages, batch_size=None, dry_run=False, on_sent=None):
+    """
+    Send messages in batches over a single email backend connection.
+
+    Messages are rendered lazily, one batch at a time, and every batch is handed
+    to the backend with send_messages instead of opening a connection per email.
+    A failing batch is logged and counted, and the run continues with the next one.
+
+    Args:
+        messages (iterable): EmailMessage objects
+        batch_size (int): Messages per batch, settings.NOTIFICATION_BATCH_SIZE if None
+        dry_run (bool): Render the messages without sending them
+        on_sent: Optional callable receiving the messages of every batch that was sent
+
+    Returns:
+        DispatchReport: Totals and per-batch timing
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', DEFAULT_NOTIFICATION_BATCH_SIZE)
+    report = DispatchReport()
+    connection = None if dry_run else get_connection(fail_silently=False)
+
+    try:
+        if connection is not None:
+            connection.open()
+        start = time.perf_counter()
+        for number, batch in enumerate(chunked(messages, batch_size), 1):
+            rendered = time.perf_counter()
+            if dry_run:
+                sent = 0
+            else:
+                try:
+                    sent = connection.send_messages(batch) or 0
+                except Exception as e:
+                    logger.error(f"Notification batch {number} of {len(batch)} messages failed: {e}")
+                    sent = 0
+                    report.failed += len(batch)
+                else:
+                    if on_sent:
+                        on_sent(batch)
+            finished = time.perf_counter()
+            report.add(NotificationBatch(number, len(batch), sent, rendered - start, finished - rendered))
+            start = finished
+    finally:
+        if connection is not None:
+            connection.close()
+    return report
+
+
+def get_open_loans():
+    """
+    Return open loans with the user and book loaded in the same query and the
+    book authors prefetched, so rendering a message does not query per loan.
+    """
+    return (
+        BookLoan.objects.filter(status='borrowed', return_date__isnull=True)
+        .select_related('user', 'book')
+        .prefetch_related('book__authors')
+        .order_by('pk')
+    )
+
+
+def send_due_date_reminder(batch_size=None, dry_run=False):
     """
     Send reminder emails for books due in the next 3 days.
     This function is intended to be run daily via a scheduled task.
+
+    Returns:
+        DispatchReport: Totals and per-batch timing
     """
     # Find loans due in the next 3 days
-    today = timezone.now().date()
-    reminder_date = today + timedelta(days=3)
-    
-    upcoming_due_loans = BookLoan.objects.filter(
-        status='borrowed',
-        due_date=reminder_date,
-        return_date__isnull=True
-    )
-    
-    for loan in upcoming_due_loans:
-        context = {
-            'user': loan.user,
-            'book': loan.book,
-            'due_date': loan.due_date,
-        }
-        
-        send_email_notification(
+    reminder_date = timezone.now().date() + timedelta(days=DUE_DATE_REMINDER_DAYS)
+    loans = get_open_loans().filter(due_date=reminder_date)
+    template = get_template('emails/due_date_reminder.html')
+
+    messages = (
+        build_email_message(
             subject='Reminder: Book Due Soon',
-            template_name='due_date_reminder',
-            context=context,
-            recipient_list=[loan.user.email]
+            template=template,
+            context={'user': loan.user, 'book': loan.book, 'due_date': loan.due_date},
+            recipient_list=[loan.user.email],
         )
+        for loan in loans.iterator(chunk_size=1000)
+    )
+    return send_bulk_notifications(messages, batch_size, dry_run)
 
 
-def send_overdue_notification():
+def send_overdue_notification(batch_size=None, dry_run=False):
     """
-    Send notifications for overdue books.
+    Send notifications for overdue books and mark the loans as overdue.
+    Only the loans of batches that were sent are marked, so the others are
+    notified again on the next run.
     This function is intended to be run daily via a scheduled task.
+
+    Returns:
+        DispatchReport: Totals and per-batch timing
     """
     today = timezone.now().date()
-    
-    overdue_loans = BookLoan.objects.filter(
-        status='borrowed',
-        due_date__lt=today,
-        return_date__isnull=True
+    loans = get_open_loans().filter(due_date__lt=today)
+    template = get_template('emails/overdue_notification.html')
+
+    # Loan of every message not sent yet, by message identity
+    pending = {}
+    notified = []
+
+    def build_messages():
+        for loan in loans.iterator(chunk_size=1000):
+            message = build_email_message(
+                subject='Book Overdue Notice',
+                template=template,
+                context={
+                    'user': loan.user,
+                    'book': loan.book,
+                    'due_date': loan.due_date,
+                    'days_overdue': (today - loan.due_date).days,
+                },
+                recipient_list=[loan.user.email],
+            )
+            pending[id(message)] = loan.pk
+            yield message
+
+    def record_sent(batch):
+        notified.extend(pending.pop(id(message)) for message in batch)
+
+    report = send_bulk_notifications(build_messages(), batch_size, dry_run, on_sent=record_sent)
+    if notified:
+        accrue_late_fees(today, loan_ids=notified, mark_overdue=True)
+    return report
+
+
+# Sections of the daily digest template
+DIGEST_KINDS = ('overdue', 'due_soon', 'reservation_ready', 'late_fee')
+DIGEST_COLUMNS = (
+    'recipient_id', 'recipient_email', 'recipient_name', 'item_kind', 'item_title', 'item_date', 'item_amount'
+)
+
+DigestItem = namedtuple('DigestItem', ['title', 'date', 'amount'])
+
+
+def select_digest_items(queryset, kind, date, prefix=''):
+    """Select the common digest columns of one kind of item, for a UNION with the others."""
+    amount = F('amount') if kind == 'late_fee' else Value(
+        None, output_field=DecimalField(max_digits=6, decimal_places=2)
     )
-    
-    for loan in overdue_loans:
-        # Update status to overdue if not already
-        if loan.status != 'overdue':
-            loan.status = 'overdue'
-            loan.save()
-        
-        days_overdue = (today - loan.due_date).days
-        
-        context = {
-            'user': loan.user,
-            'book': loan.book,
-            'due_date': loan.due_date,
-            'days_overdue': days_overdue,
-        }
-        
-        send_email_notification(
-            subject='Book Overdue Notice',
-            template_name='overdue_notification',
-            context=context,
-            recipient_list=[loan.user.email]
-        )
+    return queryset.order_by().annotate(
+        recipient_id=F(f'{prefix}user_id'),
+        recipient_email=F(f'{prefix}user__email'),
+        recipient_name=F(f'{prefix}user__first_name'),
+        item_kind=Value(kind, output_field=CharField()),
+        item_title=F(f'{prefix}book__title'),
+        item_date=F(date),
+        item_amount=amount,
+    ).values_list(*DIGEST_COLUMNS)
 
 
-def send_reservation_confirmation(reservation):
+def get_digest_items(today=None):
     """
-    Send a confirmation email when a book is reserved.
-    
-    Args:
-        reservation (BookReservation): The reservation object
+    Return every digest item of every patron with a single UNION query.
+
+    Items are loans due in DUE_DATE_REMINDER_DAYS days, open overdue loans,
+    reservations ready for pickup and unpaid late fees, ordered by patron so
+    they can be grouped while streaming.
+    """
+    today = today or timezone.now().date()
+    open_loans = BookLoan.objects.filter(status__in=['borrowed', 'overdue'], return_date__isnull=True)
+    due_soon = open_loans.filter(due_date=today + timedelta(days=DUE_DATE_REMINDER_DAYS))
+    overdue = open_loans.filter(due_date__lt=today)
+    ready = BookReservation.objects.filter(status='fulfilled', expiry_date__gte=today)
+    fees = LateFee.objects.filter(payment_status='pending', loan__late_fee_paid=False)
+
+    return select_digest_items(due_soon, 'due_soon', 'due_date').union(
+        select_digest_items(overdue, 'overdue', 'due_date'),
+        select_digest_items(ready, 'reservation_ready', 'expiry_date'),
+        select_digest_items(fees, 'late_fee', 'loan__due_date', prefix='loan__'),
+        all=True,
+    ).order_by('recipient_id', 'item_date', 'item_title')
+
+
+def send_daily_digest(batch_size=None, dry_run=False):
+    """
+    Send every patron one email listing all their due-soon, overdue, ready and
+    late-fee items, instead of one email per loan.
+    Late fees are accrued first, so the digest lists the current amounts, and
+    past-due loans are marked overdue, since the digest is their overdue notice.
+    This function is intended to be run daily via a scheduled task.
+
+    Returns:
+        DispatchReport: Totals and per-batch timing, one message per patron
     """
-    context = {
+    today = timezone.now().date()
+    if not dry_run:
+        accrue_late_fees(today, mark_overdue=True)
+
+    template = get_template('emails/daily_digest.html')
+
+    def build_messages():
+        rows = get_digest_items(today).iterator(chunk_size=1000)
+        for (_, email, first_name), items in groupby(rows, key=lambda row: row[:3]):
+            context = {kind: [] for kind in DIGEST_KINDS}
+            for *_, kind, title, date, amount in items:
+                context[kind].append(DigestItem(title, date, amount))
+            context['user'] = {'first_name': first_name}
+            context['total_fees'] = sum(item.amount for item in context['late_fee'])
+            yield build_email_message(
+                subject='Your Library Summary',
+                template=template,
+                context=context,
+                recipient_list=[email],
+            )
+
+    return send_bulk_notifications(build_messages(), batch_size, dry_run)
+
+
+def get_loan_context(loan):
+    return {
+        'user': loan.user,
+        'book': loan.book,
+        'loan_date': loan.loan_date,
+        'due_date': loan.due_date,
+        'return_date': loan.return_date,
+    }
+
+
+def get_reservation_context(reservation):
+    return {
         'user': reservation.user,
         'book': reservation.book,
         'reservation_date': reservation.reservation_date,
         'expiry_date': reservation.expiry_date,
     }
-    
-    send_email_notification(
-        subject='Book Reservation Confirmation',
-        template_name='reservation_confirmation',
-        context=context,
-        recipient_list=[reservation.user.email]
+
+
+TransactionalEmail = namedtuple('TransactionalEmail', ['model', 'subject', 'template_name', 'get_context'])
+
+# Emails sent for a single loan or reservation, by EmailOutbox kind
+TRANSACTIONAL_EMAILS = {
+    'loan_confirmation': TransactionalEmail(
+        BookLoan, 'Book Loan Confirmation', 'loan_confirmation', get_loan_context
+    ),
+    'return_confirmation': TransactionalEmail(
+        BookLoan, 'Book Return Confirmation', 'return_confirmation', get_loan_context
+    ),
+    'reservation_confirmation': TransactionalEmail(
+        BookReservation, 'Book Reservation Confirmation', 'reservation_confirmation', get_reservation_context
+    ),
+    'reservation_available': TransactionalEmail(
+        BookReservation, 'Your Reserved Book is Now Available', 'reservation_available', get_reservation_context
+    ),
+}
+
+
+def send_transactional_email(kind, instance):
+    """Send one of the TRANSACTIONAL_EMAILS immediately, bypassing the outbox."""
+    email = TRANSACTIONAL_EMAILS[kind]
+    return send_email_notification(
+        subject=email.subject,
+        template_name=email.template_name,
+        context=email.get_context(instance),
+        recipient_list=[instance.user.email]
     )
 
 
+def send_reservation_confirmation(reservation):
+    """
+    Send a confirmation email when a book is reserved.
+    
+    Args:
+        reservation (BookReservation): The reservation object
+    """
+    send_transactional_email('reservation_confirmation', reservation)
+
+
 def send_reservation_available_notification(reservation):
     """
     Send a notification when a reserved book becomes available.
@@ -133,19 +371,7 @@ def send_reservation_available_notification(reservation):
     Args:
         reservation (BookReservation): The reservation object
     """
-    context = {
-        'user': reservation.user,
-        'book': reservation.book,
-        'reservation_date': reservation.reservation_date,
-        'expiry_date': reservation.expiry_date,
-    }
-    
-    send_email_notification(
-        subject='Your Reserved Book is Now Available',
-        template_name='reservation_available',
-        context=context,
-        recipient_list=[reservation.user.email]
-    )
+    send_transactional_email('reservation_available', reservation)
 
 
 def send_loan_confirmation(loan):
@@ -155,19 +381,7 @@ def send_loan_confirmation(loan):
     Args:
         loan (BookLoan): The loan object
     """
-    context = {
-        'user': loan.user,
-        'book': loan.book,
-        'loan_date': loan.loan_date,
-        'due_date': loan.due_date,
-    }
-    
-    send_email_notification(
-        subject='Book Loan Confirmation',
-        template_name='loan_confirmation',
-        context=context,
-        recipient_list=[loan.user.email]
-    )
+    send_transactional_email('loan_confirmation', loan)
 
 
 def send_return_confirmation(loan):
@@ -177,16 +391,4 @@ def send_return_confirmation(loan):
     Args:
         loan (BookLoan): The loan object
     """
-    context = {
-        'user': loan.user,
-        'book': loan.book,
-        'loan_date': loan.loan_date,
-        'return_date': loan.return_date,
-    }
-    
-    send_email_notification(
-        subject='Book Return Confirmation',
-        template_name='return_confirmation',
-        context=context,
-        recipient_list=[loan.user.email]
-    )
+    send_transactional_email('return_confirmation', loan)
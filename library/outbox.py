@@ -0,0 +1,186 @@
+"""
+Transactional email outbox for the library app.
+Loan and reservation signals only write an EmailOutbox row, inside the same
+database transaction as the change it reports, so requests never wait on the
+mail server. The deliver_emails management command claims due rows and sends
+them, with retries and exponential backoff. Every row has an idempotency key,
+so saving the same event twice queues one email, and a stable Message-ID, so a
+message resent after a worker crash can be recognised as the same message.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.utils import DNS_NAME
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .job_queue import claim, requeue_stale, schedule_retry
+from .models import EmailOutbox
+from .notifications import TRANSACTIONAL_EMAILS, build_email_message
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+# Base delay before a failed email is retried, doubled after every failed attempt
+DEFAULT_RETRY_DELAY = 30
+
+
+def get_idempotency_key(kind, instance):
+    return f"{kind}:{instance.pk}"
+
+
+def enqueue_email(kind, instance, key=None):
+    """
+    Queue one of the TRANSACTIONAL_EMAILS for a loan or reservation.
+
+    The row is inserted on the caller's connection, so it is committed or rolled
+    back together with the loan or reservation change. A row with the same
+    idempotency key is left as it is.
+
+    Args:
+        kind (str): Key of TRANSACTIONAL_EMAILS
+        instance: The BookLoan or BookReservation the email is about
+        key (str): Idempotency key, one email per kind and object if None
+
+    Returns:
+        bool: True if a new email was queued
+    """
+    key = key or get_idempotency_key(kind, instance)
+    if EmailOutbox.objects.filter(idempotency_key=key).exists():
+        return False
+    created = EmailOutbox.objects.bulk_create([
+        EmailOutbox(
+            kind=kind,
+            object_id=instance.pk,
+            recipient=instance.user.email,
+            idempotency_key=key,
+            max_attempts=getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        )
+    ], ignore_conflicts=True)
+    return bool(created)
+
+
+def claim_emails(limit, worker=None):
+    """
+    Atomically move up to `limit` due pending emails to sending (see library.job_queue).
+
+    Returns:
+        list: The claimed EmailOutbox objects
+    """
+    return claim(EmailOutbox, limit, 'sending', worker)
+
+
+def requeue_stale_emails(timeout):
+    """
+    Return emails stuck in sending (for example after a worker crash) to the queue.
+
+    Args:
+        timeout (timedelta): How long sending may take before it is considered abandoned
+
+    Returns:
+        int: Number of requeued emails
+    """
+    return requeue_stale(EmailOutbox, 'sending', timeout)
+
+
+def finish_email(entry, status, error=''):
+    entry.status = status
+    entry.last_error = error
+    update_fields = ['status', 'last_error']
+    if status == 'sent':
+        entry.sent_at = timezone.now()
+        update_fields.append('sent_at')
+    entry.save(update_fields=update_fields)
+
+
+def record_failure(entry, error):
+    """Schedule a retry with exponential backoff, or fail the email after its last attempt."""
+    if not schedule_retry(entry, error, getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', DEFAULT_RETRY_DELAY)):
+        logger.warning(f"Email {entry.pk} ({entry.kind}) failed after {entry.attempts} attempts: {error}")
+        finish_email(entry, 'failed', error)
+
+
+def load_instances(entries):
+    """
+    Load the loans and reservations of claimed emails with one joined query per model.
+
+    Returns:
+        dict: {(model, pk): instance}
+    """
+    ids = {}
+    for entry in entries:
+        model = TRANSACTIONAL_EMAILS[entry.kind].model
+        ids.setdefault(model, set()).add(entry.object_id)
+
+    instances = {}
+    for model, pks in ids.items():
+        for instance in model.objects.select_related('user', 'book').filter(pk__in=pks):
+            instances[(model, instance.pk)] = instance
+    return instances
+
+
+def deliver_emails(entries):
+    """
+    Render and send claimed emails over one mail backend connection.
+
+    Each email is sent on its own, so one rejected recipient does not fail the
+    others. Emails whose loan or reservation was deleted are skipped.
+
+    Args:
+        entries (list): Claimed EmailOutbox objects
+
+    Returns:
+        list: The final or retry status of each email
+    """
+    instances = load_instances(entries)
+    templates = {}
+    statuses = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.exception(f"Could not connect to the mail server: {e}")
+        for entry in entries:
+            record_failure(entry, str(e))
+        return [entry.status for entry in entries]
+
+    try:
+        for entry in entries:
+            email = TRANSACTIONAL_EMAILS[entry.kind]
+            instance = instances.get((email.model, entry.object_id))
+            if instance is None:
+                finish_email(entry, 'skipped', f"{email.model.__name__} #{entry.object_id} no longer exists")
+                statuses.append(entry.status)
+                continue
+
+            try:
+                if email.template_name not in templates:
+                    templates[email.template_name] = get_template(f'emails/{email.template_name}.html')
+                message = build_email_message(
+                    email.subject, templates[email.template_name], email.get_context(instance), [entry.recipient]
+                )
+                message.extra_headers['Message-ID'] = f"<outbox.{entry.pk}@{DNS_NAME}>"
+                message.connection = connection
+                message.send()
+            except Exception as e:
+                logger.exception(f"Error sending email {entry.pk} ({entry.kind}): {e}")
+                record_failure(entry, str(e))
+            else:
+                finish_email(entry, 'sent')
+            statuses.append(entry.status)
+    finally:
+        connection.close()
+    return statuses
+
+
+def retry_email(entry):
+    """
+    Put a failed or skipped email back in the queue with a fresh attempt budget.
+
+    Returns:
+        bool: True if the email was queued again
+    """
+    return bool(EmailOutbox.objects.filter(pk=entry.pk, status__in=['failed', 'skipped']).update(
+        status='pending', attempts=0, run_after=timezone.now(), worker='', last_error=''
+    ))
@@ -0,0 +1,254 @@
+"""
+Pagination for the catalog listings (books, authors and publishers).
+
+Shallow pages use classic OFFSET pagination with page numbers. Deep pages switch
+to keyset (cursor) pagination: the cursor stores the (sort_key, id) of the last
+row shown, and the next page is fetched with an indexed range condition instead
+of an OFFSET, so page N costs the same as page 1.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.paginator import Paginator, InvalidPage
+from django.db.models import F, Q
+
+# Page numbers above this are served through cursors instead of OFFSET
+MAX_OFFSET_PAGES = 10
+
+PER_PAGE_CHOICES = (12, 24, 48, 96)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded."""
+
+
+def get_per_page(request, default=PER_PAGE_CHOICES[0]):
+    """Read the per_page parameter, falling back to the default for unknown values."""
+    try:
+        per_page = int(request.GET.get('per_page', default))
+    except (TypeError, ValueError):
+        return default
+    return per_page if per_page in PER_PAGE_CHOICES else default
+
+
+def encode_cursor(value, pk, direction):
+    """Encode a (sort value, id) position into an opaque URL-safe cursor."""
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    payload = json.dumps({'v': value, 'pk': pk, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Returns:
+        tuple: (sort value, id, direction)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        pk = int(payload['pk'])
+        direction = payload['d']
+    except (ValueError, KeyError, TypeError, UnicodeError) as e:
+        raise InvalidCursor(str(e))
+    if direction not in ('next', 'prev'):
+        raise InvalidCursor(f"Unknown cursor direction: {direction}")
+    return payload.get('v'), pk, direction
+
+
+def keyset_condition(field, value, pk, descending):
+    """
+    Build the WHERE condition selecting rows after (value, pk) in the given order.
+
+    NULL sort values are treated as the smallest values (first in ascending order,
+    last in descending order), matching the ordering used by CursorPaginator.
+    """
+    if field is None:
+        return Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+
+    if descending:
+        if value is None:
+            return Q(**{f'{field}__isnull': True, 'pk__lt': pk})
+        return (
+            Q(**{f'{field}__lt': value}) |
+            Q(**{field: value, 'pk__lt': pk}) |
+            Q(**{f'{field}__isnull': True})
+        )
+
+    if value is None:
+        return Q(**{f'{field}__isnull': True, 'pk__gt': pk}) | Q(**{f'{field}__isnull': False})
+    return Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+
+
+class ListingPage:
+    """
+    A page of a listing, usable in templates like django.core.paginator.Page.
+
+    In offset mode the page knows its number and the total count; in keyset mode
+    only the neighbouring cursors are known, which keeps deep pages cheap.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous, number=None, page=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.number = number
+        self._page = page
+
+    @property
+    def is_keyset(self):
+        return self._page is None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def start_index(self):
+        return self._page.start_index() if self._page else None
+
+    def end_index(self):
+        return self._page.end_index() if self._page else None
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(self.paginator.sort_value(last), last.pk, 'next')
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(self.paginator.sort_value(first), first.pk, 'prev')
+
+    @property
+    def next_uses_cursor(self):
+        """Whether the link to the next page should use a cursor rather than a page number."""
+        return self.is_keyset or self.number >= MAX_OFFSET_PAGES
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset ordered by a single sort key with the primary key as tie-breaker.
+
+    Args:
+        queryset (QuerySet): Rows to paginate; any existing ordering is replaced
+        sort_field (str): Field or annotation to sort by, prefixed with '-' for
+            descending order, or None to sort by primary key only
+        per_page (int): Number of rows per page
+    """
+
+    def __init__(self, queryset, sort_field=None, per_page=PER_PAGE_CHOICES[0]):
+        self.descending = bool(sort_field) and sort_field.startswith('-')
+        self.field = sort_field.lstrip('-') if sort_field else None
+        if sort_field is None and queryset.query.order_by and isinstance(queryset.query.order_by[0], str):
+            # Keep an explicit ordering (such as search relevance) as the sort key
+            ordering = queryset.query.order_by[0]
+            self.descending = ordering.startswith('-')
+            self.field = ordering.lstrip('-')
+        self.per_page = per_page
+        self.queryset = queryset.order_by(*self.get_ordering())
+        self._offset_paginator = None
+
+    def get_ordering(self, reverse=False):
+        descending = self.descending != reverse
+        ordering = []
+        if self.field:
+            expression = F(self.field)
+            ordering.append(
+                expression.desc(nulls_last=True) if descending else expression.asc(nulls_first=True)
+            )
+        ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    def sort_value(self, obj):
+        return getattr(obj, self.field) if self.field else obj.pk
+
+    @property
+    def offset_paginator(self):
+        if self._offset_paginator is None:
+            self._offset_paginator = Paginator(self.queryset, self.per_page)
+        return self._offset_paginator
+
+    @property
+    def count(self):
+        return self.offset_paginator.count
+
+    @property
+    def num_pages(self):
+        return self.offset_paginator.num_pages
+
+    @property
+    def page_range(self):
+        return range(1, min(self.num_pages, MAX_OFFSET_PAGES) + 1)
+
+    def get_page(self, page=None, cursor=None):
+        """
+        Return a page, by cursor if one is given and by page number otherwise.
+        Invalid cursors and page numbers fall back to the first page.
+        """
+        if cursor:
+            try:
+                return self.get_keyset_page(cursor)
+            except InvalidCursor:
+                pass
+
+        try:
+            number = int(page or 1)
+        except (TypeError, ValueError):
+            number = 1
+        number = max(1, min(number, MAX_OFFSET_PAGES))
+
+        try:
+            offset_page = self.offset_paginator.page(number)
+        except InvalidPage:
+            offset_page = self.offset_paginator.page(self.num_pages)
+        return ListingPage(
+            list(offset_page.object_list),
+            self,
+            has_next=offset_page.has_next(),
+            has_previous=offset_page.has_previous(),
+            number=offset_page.number,
+            page=offset_page,
+        )
+
+    def get_keyset_page(self, cursor):
+        value, pk, direction = decode_cursor(cursor)
+        backwards = direction == 'prev'
+        condition = keyset_condition(self.field, value, pk, self.descending != backwards)
+        rows = list(
+            self.queryset.filter(condition).order_by(*self.get_ordering(reverse=backwards))[:self.per_page + 1]
+        )
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            return ListingPage(rows, self, has_next=True, has_previous=has_more)
+        return ListingPage(rows, self, has_next=has_more, has_previous=True)
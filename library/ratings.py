@@ -0,0 +1,141 @@
+"""
+Materialized rating summaries for the library app.
+Keeps the rating_* columns of Book in sync with its approved reviews so that
+average ratings, review counts and star histograms are read from the book row
+instead of being recomputed from the reviews on every page render.
+"""
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Book, Review
+
+RATING_VALUES = range(1, 6)
+
+RATING_FIELDS = ('rating_count', 'rating_sum', 'rating_average') + tuple(
+    f'rating_{rating}_count' for rating in RATING_VALUES
+)
+
+
+def get_review_contribution(book_id, rating, status):
+    """
+    Return what a review adds to its book's summary.
+
+    Returns:
+        tuple: (book id, rating) for approved reviews, None otherwise
+    """
+    if status != 'approved' or book_id is None or rating not in RATING_VALUES:
+        return None
+    return book_id, rating
+
+
+def apply_rating_changes(removed=(), added=()):
+    """
+    Incrementally update book summaries for reviews leaving and entering the approved set.
+
+    Args:
+        removed: (book id, rating) pairs no longer counted
+        added: (book id, rating) pairs newly counted
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for sign, contributions in ((-1, removed), (1, added)):
+        for book_id, rating in contributions:
+            deltas[book_id][rating] += sign
+
+    with transaction.atomic():
+        for book_id, ratings in deltas.items():
+            count_delta = sum(ratings.values())
+            sum_delta = sum(rating * delta for rating, delta in ratings.items())
+            updates = {
+                f'rating_{rating}_count': F(f'rating_{rating}_count') + delta
+                for rating, delta in ratings.items() if delta
+            }
+            if not updates:
+                continue
+
+            new_count = F('rating_count') + count_delta
+            new_sum = F('rating_sum') + sum_delta
+            updates['rating_count'] = new_count
+            updates['rating_sum'] = new_sum
+            # SET expressions see the old values, so the average is computed from the new totals
+            updates['rating_average'] = Coalesce(
+                Cast(new_sum, FloatField()) / NullIf(new_count, 0), 0.0, output_field=FloatField()
+            )
+            Book.objects.filter(pk=book_id).update(**updates)
+
+
+def get_rating_summaries(book_ids=None):
+    """
+    Aggregate approved reviews per book in a single grouped query.
+
+    Returns:
+        dict: Book id mapped to a dictionary of RATING_FIELDS values
+    """
+    reviews = Review.objects.filter(status='approved')
+    if book_ids is not None:
+        reviews = reviews.filter(book_id__in=book_ids)
+
+    histogram = {
+        f'rating_{rating}_count': Count('pk', filter=Q(rating=rating)) for rating in RATING_VALUES
+    }
+    rows = reviews.order_by().values('book_id').annotate(
+        rating_count=Count('pk'), rating_sum=Sum('rating'), **histogram
+    )
+
+    summaries = {}
+    for row in rows:
+        book_id = row.pop('book_id')
+        row['rating_average'] = row['rating_sum'] / row['rating_count']
+        summaries[book_id] = row
+    return summaries
+
+
+def recompute_rating_summaries(books=None, batch_size=1000):
+    """
+    Recompute the stored rating summaries from the reviews.
+
+    Used to backfill the columns and to repair them after bulk updates that
+    bypass the Review signals (for example queryset.update(status=...)).
+
+    Args:
+        books (QuerySet): Books to recompute, all books if None
+        batch_size (int): Number of books loaded and updated per batch
+
+    Returns:
+        int: Number of books whose summary changed
+    """
+    if books is None:
+        books = Book.objects.all()
+    empty = dict.fromkeys(RATING_FIELDS, 0)
+
+    changed = 0
+    book_ids = list(books.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(book_ids), batch_size):
+        batch_ids = book_ids[start:start + batch_size]
+        summaries = get_rating_summaries(batch_ids)
+
+        stale = []
+        for book in Book.objects.filter(pk__in=batch_ids).only(*RATING_FIELDS):
+            summary = summaries.get(book.pk, empty)
+            if not all(math.isclose(getattr(book, field), value) for field, value in summary.items()):
+                for field, value in summary.items():
+                    setattr(book, field, value)
+                stale.append(book)
+
+        with transaction.atomic():
+            Book.objects.bulk_update(stale, RATING_FIELDS)
+        changed += len(stale)
+    return changed
+
+
+def refresh_cached_book(review):
+    """
+    Reload the rating summary of the book object cached on a review, if any,
+    so that callers holding that object see the updated values.
+    """
+    book = review._state.fields_cache.get('book')
+    if book is not None and book.pk:
+        book.refresh_from_db(fields=RATING_FIELDS)
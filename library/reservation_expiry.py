@@ -0,0 +1,127 @@
+"""
+Reservation expiry sweeper for the library app.
+Reservations past their expiry date are expired in batches. Each batch selects
+the affected reservation ids once, expires them with one UPDATE, and hands the
+copies that were set aside for expired ready reservations to the next holds in
+each book's queue. Copies nobody is waiting for go back on the shelf with one
+grouped available_copies increment per book. The whole batch runs in one
+transaction, so a failed batch leaves no copy released twice or lost. Run it
+from a cron job (see the expire_reservations command); every run only touches
+reservations that expired since the previous one.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .holds import promote_holds, renumber_queues
+from .inventory import release_copies
+from .models import BookReservation
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class ExpiryReport:
+    """Reservations expired and copies passed on or released by expire_reservations."""
+
+    def __init__(self):
+        self.expired_pending = self.expired_ready = 0
+        self.promoted = self.released = 0
+        self.batches = 0
+
+    @property
+    def expired(self):
+        return self.expired_pending + self.expired_ready
+
+    def summary(self):
+        return (f'{self.expired} reservations ({self.expired_ready} ready, {self.expired_pending} queued); '
+                f'{self.promoted} copies passed to the next hold, {self.released} returned to the shelf')
+
+
+def get_expired_reservations(today):
+    """
+    Return reservations whose expiry date has passed, oldest first: queued holds
+    past their hold lifetime and ready reservations past their pickup deadline.
+    """
+    return BookReservation.objects.filter(
+        status__in=['pending', 'fulfilled'], expiry_date__lt=today
+    ).order_by('expiry_date', 'pk')
+
+
+def count_waiting_holds(book_ids, today):
+    """Return the number of holds in each book's queue that have not expired."""
+    return dict(
+        BookReservation.objects.filter(book_id__in=book_ids, status='pending')
+        .exclude(expiry_date__lt=today)
+        .values('book_id').annotate(waiting=Count('pk')).values_list('book_id', 'waiting')
+    )
+
+
+def expire_batch(today, report, dry_run=False, limit=None):
+    """
+    Expire one batch of reservations. Must run inside a transaction.
+
+    Returns:
+        int: The number of reservations in the batch
+    """
+    expired = get_expired_reservations(today).values_list('pk', 'book_id', 'status')
+    if not dry_run:
+        expired = expired.select_for_update()
+    if limit is not None:
+        expired = expired[:limit]
+    rows = list(expired)
+    if not rows:
+        return 0
+
+    ids = [pk for pk, book_id, status in rows]
+    freed = Counter(book_id for pk, book_id, status in rows if status == 'fulfilled')
+    queued_books = {book_id for pk, book_id, status in rows if status == 'pending'}
+    report.batches += 1
+    report.expired_ready += sum(freed.values())
+    report.expired_pending += len(rows) - sum(freed.values())
+
+    if dry_run:
+        waiting = count_waiting_holds(freed, today)
+        for book_id, copies in freed.items():
+            promoted = min(copies, waiting.get(book_id, 0))
+            report.promoted += promoted
+            report.released += copies - promoted
+        return len(rows)
+
+    BookReservation.objects.filter(pk__in=ids).update(status='expired', queue_position=None)
+    for book_id, copies in freed.items():
+        promoted = len(promote_holds(book_id, copies, expired_before=today))
+        if copies > promoted:
+            release_copies(book_id, copies - promoted)
+        report.promoted += promoted
+        report.released += copies - promoted
+    # promote_holds already renumbered the queues of the books that had a copy freed
+    renumber_queues(queued_books - set(freed))
+    return len(rows)
+
+
+def expire_reservations(today=None, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Expire every reservation past its expiry date and pass the freed copies on.
+
+    Args:
+        today (date): Reservations with an earlier expiry date expire, today if None
+        dry_run (bool): Report what would change without writing anything
+        batch_size (int): Reservations expired per transaction
+
+    Returns:
+        ExpiryReport: The expired reservations and where their copies went
+    """
+    today = today or timezone.now().date()
+    report = ExpiryReport()
+    if dry_run:
+        with transaction.atomic():
+            expire_batch(today, report, dry_run=True)
+        return report
+
+    while True:
+        with transaction.atomic():
+            expired = expire_batch(today, report, limit=batch_size)
+        if expired < batch_size:
+            return report
@@ -0,0 +1,397 @@
+"""
+Full-text search for the library catalog.
+
+The catalog is indexed over title, author names, publisher, description and ISBN.
+A backend is chosen from the database vendor (SQLite FTS5 or PostgreSQL tsvector),
+or explicitly via settings.LIBRARY_SEARCH_BACKEND. Backends return Book ids
+ordered by relevance, and the native ones also filter and rank a Book queryset
+inside the database, so search_books() returns every match for the caller to
+paginate instead of a capped list of ids.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize_query(query):
+    """Split a user query into plain word tokens, dropping search syntax."""
+    return TOKEN_RE.findall(query or '')
+
+
+def get_book_document(book):
+    """
+    Collect the searchable text of a book.
+
+    Returns:
+        dict: Values for the title, authors, publisher, description and isbn columns
+    """
+    return {
+        'title': book.title or '',
+        'authors': ' '.join(author.name for author in book.authors.all()),
+        'publisher': book.publisher.name if book.publisher_id and book.publisher else '',
+        'description': book.description or '',
+        'isbn': book.isbn or '',
+    }
+
+
+class BaseSearchBackend:
+    """Interface shared by all search backends."""
+
+    name = 'base'
+
+    def ensure_schema(self):
+        """Create the index structures if they do not exist yet."""
+
+    def index_books(self, books):
+        """Add or replace the index entries of the given books."""
+        raise NotImplementedError
+
+    def remove_books(self, book_ids):
+        """Remove the index entries of the given book ids."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every index entry."""
+        raise NotImplementedError
+
+    def search(self, query, limit=None):
+        """Return Book ids matching the query, best match first, all of them if limit is None."""
+        raise NotImplementedError
+
+    def rank_books(self, queryset, query):
+        """
+        Filter a Book queryset to the matches of a query and annotate search_rank,
+        lower being better, without loading the ids.
+
+        Returns:
+            QuerySet: The ranked queryset, or None if the backend only returns ids
+        """
+        return None
+
+    def index_book(self, book):
+        self.index_books([book])
+
+    def rebuild(self, books=None, batch_size=1000):
+        """
+        Rebuild the whole index from the database.
+
+        Returns:
+            int: Number of indexed books
+        """
+        self.ensure_schema()
+        self.clear()
+        if books is None:
+            books = Book.objects.all()
+        books = books.select_related('publisher').prefetch_related('authors').order_by('pk')
+
+        indexed = 0
+        batch = []
+        for book in books.iterator(chunk_size=batch_size):
+            batch.append(book)
+            if len(batch) >= batch_size:
+                self.index_books(batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            self.index_books(batch)
+            indexed += len(batch)
+        return indexed
+
+
+class IcontainsSearchBackend(BaseSearchBackend):
+    """
+    Unindexed fallback using icontains lookups.
+    Used for databases without a native full-text engine and as the benchmark baseline.
+    """
+
+    name = 'icontains'
+
+    def index_books(self, books):
+        pass
+
+    def remove_books(self, book_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit=None):
+        books = Book.objects.filter(
+            Q(title__icontains=query) |
+            Q(authors__name__icontains=query) |
+            Q(isbn__icontains=query)
+        ).distinct().order_by('title', 'pk')
+        return list(books.values_list('pk', flat=True)[:limit])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Search backend using an SQLite FTS5 virtual table keyed by Book id."""
+
+    name = 'sqlite_fts5'
+    table = 'library_book_fts'
+    columns = ('title', 'authors', 'publisher', 'description', 'isbn')
+    # bm25 weights, in column order
+    weights = (10.0, 5.0, 2.0, 1.0, 10.0)
+
+    def ensure_schema(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"{', '.join(self.columns)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    @staticmethod
+    def build_match(query):
+        """Turn a user query into an FTS5 expression of prefix terms."""
+        tokens = tokenize_query(query)
+        return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+    def index_books(self, books):
+        rows = []
+        for book in books:
+            document = get_book_document(book)
+            rows.append([book.pk] + [document[column] for column in self.columns])
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[row[0]] for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(self.columns)}) "
+                f"VALUES (%s, {', '.join(['%s'] * len(self.columns))})",
+                rows
+            )
+
+    def remove_books(self, book_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[pk] for pk in book_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def get_rank_sql(self):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return f"bm25({self.table}, {weights})"
+
+    def search(self, query, limit=None):
+        match = self.build_match(query)
+        if not match:
+            return []
+        # LIMIT -1 is no limit in SQLite
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY {self.get_rank_sql()}, rowid LIMIT %s",
+                [match, -1 if limit is None else limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rank_books(self, queryset, query):
+        match = self.build_match(query)
+        book_table = Book._meta.db_table
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        ).annotate(search_rank=RawSQL(
+            f"SELECT {self.get_rank_sql()} FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND rowid = {book_table}.id",
+            [match]
+        ))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Search backend using a weighted tsvector side table with a GIN index."""
+
+    name = 'postgres_tsvector'
+    table = 'library_book_search'
+    config = 'simple'
+
+    def ensure_schema(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "book_id bigint PRIMARY KEY REFERENCES library_book (id) ON DELETE CASCADE, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_document_idx "
+                f"ON {self.table} USING GIN (document)"
+            )
+
+    @staticmethod
+    def build_tsquery(query):
+        """Turn a user query into a to_tsquery expression of prefix terms."""
+        return ' & '.join(f'{token}:*' for token in tokenize_query(query))
+
+    def index_books(self, books):
+        rows = []
+        for book in books:
+            document = get_book_document(book)
+            rows.append([
+                book.pk, document['title'], document['isbn'], document['authors'],
+                document['publisher'], document['description'],
+            ])
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (book_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'C') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'D')) "
+                "ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document",
+                rows
+            )
+
+    def remove_books(self, book_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE book_id = ANY(%s)", [list(book_ids)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+
+    def search(self, query, limit=None):
+        tsquery = self.build_tsquery(query)
+        if not tsquery:
+            return []
+        # LIMIT NULL is no limit in PostgreSQL
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT book_id FROM {self.table}, to_tsquery('{self.config}', %s) query "
+                "WHERE document @@ query "
+                "ORDER BY ts_rank(document, query) DESC, book_id LIMIT %s",
+                [tsquery, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rank_books(self, queryset, query):
+        tsquery = self.build_tsquery(query)
+        book_table = Book._meta.db_table
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT book_id FROM {self.table} WHERE document @@ to_tsquery('{self.config}', %s)", [tsquery]
+        )).annotate(search_rank=RawSQL(
+            f"SELECT -ts_rank(document, to_tsquery('{self.config}', %s)) FROM {self.table} "
+            f"WHERE book_id = {book_table}.id",
+            [tsquery]
+        ))
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Return the configured search backend instance.
+
+    settings.LIBRARY_SEARCH_BACKEND may hold a dotted path to a backend class;
+    otherwise the backend is picked from the database vendor.
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'LIBRARY_SEARCH_BACKEND', None)
+        if backend_path:
+            backend_class = import_string(backend_path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connection.vendor, IcontainsSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+def update_search_index(books=None, book_ids=None):
+    """
+    Re-index books after a change, without failing the caller if the index is broken.
+
+    Args:
+        books (list): Book instances to index
+        book_ids (iterable): Ids of books to load and index
+    """
+    if book_ids is not None:
+        books = list(
+            Book.objects.filter(pk__in=list(book_ids))
+            .select_related('publisher')
+            .prefetch_related('authors')
+        )
+    if not books:
+        return
+    backend = get_search_backend()
+    try:
+        with transaction.atomic():
+            backend.index_books(books)
+    except DatabaseError as e:
+        logger.warning(f"Could not update search index ({backend.name}): {e}")
+
+
+def remove_from_search_index(book_ids):
+    """Drop deleted books from the index, logging any index errors."""
+    backend = get_search_backend()
+    try:
+        with transaction.atomic():
+            backend.remove_books(list(book_ids))
+    except DatabaseError as e:
+        logger.warning(f"Could not update search index ({backend.name}): {e}")
+
+
+def search_book_ids(query, limit=None):
+    """
+    Return relevance-ranked Book ids for a query, all of them if limit is None.
+    Falls back to icontains matching if the index is unavailable.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+    backend = get_search_backend()
+    if tokenize_query(query):
+        try:
+            return backend.search(query, limit=limit)
+        except DatabaseError as e:
+            logger.warning(f"Search backend {backend.name} failed, using icontains: {e}")
+    return IcontainsSearchBackend().search(query, limit=limit)
+
+
+def search_books(queryset, query):
+    """
+    Restrict a Book queryset to every search result, ordered by relevance.
+
+    Backends that rank inside the database do so without loading the ids; the
+    others rank the list from search_book_ids.
+    """
+    query = (query or '').strip()
+    backend = get_search_backend()
+    ranked = backend.rank_books(queryset, query) if tokenize_query(query) else None
+    if ranked is not None:
+        try:
+            # Reading one row finds a broken index now rather than when the page renders
+            backend.search(query, limit=1)
+        except DatabaseError as e:
+            logger.warning(f"Search backend {backend.name} failed, using icontains: {e}")
+            book_ids = IcontainsSearchBackend().search(query)
+        else:
+            return ranked.order_by('search_rank', 'pk')
+    else:
+        book_ids = search_book_ids(query)
+
+    if not book_ids:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(book_ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(pk__in=book_ids).annotate(search_rank=rank).order_by('search_rank')
@@ -0,0 +1,99 @@
+"""
+Process-local cache of the LibrarySettings row.
+LibrarySettings.get_settings() is reached once per loan when late fees are
+computed, so the row is kept in memory and only read again when its version
+stamp changes. Saving or deleting the settings (see signals.py) publishes a new
+version stamp in the Django cache once the transaction commits, which the other
+worker processes notice within LIBRARY_SETTINGS_VERSION_CHECK_INTERVAL seconds.
+With a per-process cache backend such as the default LocMemCache, other
+processes still reload the row after LIBRARY_SETTINGS_CACHE_TIMEOUT seconds.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+VERSION_CACHE_KEY = 'library:settings:version'
+DEFAULT_CACHE_TIMEOUT = 300
+DEFAULT_VERSION_CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_state = {
+    'settings': None,
+    'version': None,
+    'checked_at': 0.0,
+    'expires_at': 0.0,
+    # Set while a transaction that changed the settings is still open
+    'dirty': False,
+}
+
+
+def load_settings():
+    """Read the settings row from the database, creating the defaults if it does not exist."""
+    from .models import LibrarySettings
+
+    library_settings, created = LibrarySettings.objects.get_or_create(pk=1)
+    return library_settings
+
+
+def get_library_settings():
+    """
+    Return the library settings, from memory when the version stamp is unchanged.
+
+    The returned instance is shared by the whole process and must not be modified;
+    load a fresh instance with LibrarySettings.objects.get(pk=1) to edit it.
+
+    Returns:
+        LibrarySettings: The current settings
+    """
+    now = time.monotonic()
+    with _lock:
+        if _state['dirty'] and not connection.in_atomic_block:
+            # The transaction that changed the settings has ended, committed or not
+            _state['dirty'] = False
+        dirty = _state['dirty']
+        if not dirty and _state['settings'] is not None and now < _state['expires_at']:
+            if now < _state['checked_at'] + getattr(
+                settings, 'LIBRARY_SETTINGS_VERSION_CHECK_INTERVAL', DEFAULT_VERSION_CHECK_INTERVAL
+            ):
+                return _state['settings']
+            version = cache.get(VERSION_CACHE_KEY)
+            if version == _state['version']:
+                _state['checked_at'] = now
+                return _state['settings']
+
+    if dirty:
+        # Uncommitted changes must not be cached, the transaction may still roll back
+        return load_settings()
+
+    version = cache.get(VERSION_CACHE_KEY)
+    library_settings = load_settings()
+    with _lock:
+        if not _state['dirty']:
+            _state.update(
+                settings=library_settings,
+                version=version,
+                checked_at=now,
+                expires_at=now + getattr(settings, 'LIBRARY_SETTINGS_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT),
+            )
+    return library_settings
+
+
+def publish_settings_version():
+    """Drop the cached settings and announce a new version stamp to all processes."""
+    with _lock:
+        _state.update(settings=None, version=None, dirty=False)
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_library_settings():
+    """
+    Drop the cached settings after a change, and publish a new version stamp
+    when the change commits.
+    """
+    with _lock:
+        _state.update(settings=None, version=None, dirty=connection.in_atomic_block)
+    transaction.on_commit(publish_settings_version)
@@ -1,37 +1,42 @@
 """
 Signal handlers for the library app.
 These signals automatically trigger notifications when certain events occur.
+Emails are written to the outbox in the same transaction as the loan or
+reservation change and delivered later by the deliver_emails command.
 """
-from django.db.models.signals import post_save, pre_save
+from django.conf import settings
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 
-from .models import BookLoan, BookReservation, Book
-from .notifications import (
-    send_loan_confirmation,
-    send_return_confirmation,
-    send_reservation_confirmation,
-    send_reservation_available_notification
-)
+from accounts.models import UserProfile
+
+from .models import BookLoan, BookReservation, Book, BookGenre, Category, Author, Publisher, Review, LibrarySettings
+from .genres import sync_book_genres, sync_genres_for_books
+from .search import update_search_index, remove_from_search_index
+from .counters import refresh_author_book_counts, refresh_publisher_book_counts
+from .ratings import apply_rating_changes, get_review_contribution, refresh_cached_book
+from .image_derivatives import generate_derivatives, has_derivatives
+from .outbox import enqueue_email
+from .inventory import checkout_copy, handle_returned_loan, place_hold
+from .settings_cache import invalidate_library_settings
 
 
 @receiver(post_save, sender=BookLoan)
 def handle_book_loan_signals(sender, instance, created, **kwargs):
     """
     Handle signals for BookLoan model.
-    Sends notifications when a book is borrowed or returned.
-    Updates book availability when loan status changes.
+    Queues notifications when a book is borrowed or returned.
+    Updates book availability through the inventory service when loan status changes.
     """
-    # If this is a new loan, send confirmation and update book availability
+    # If this is a new loan, queue the confirmation and take a copy
     if created:
-        # Send loan confirmation email
-        send_loan_confirmation(instance)
+        # Queue loan confirmation email
+        enqueue_email('loan_confirmation', instance)
         
-        # Update book availability
-        book = instance.book
-        if book.available_copies > 0:
-            book.available_copies -= 1
-            book.save()
+        # borrow_copy takes the copy before creating the loan
+        if not getattr(instance, '_copy_checked_out', False):
+            checkout_copy(instance.book_id)
     
     # If a book is returned (status changed to 'returned' and return_date is set)
     elif instance.status == 'returned' and instance.return_date:
@@ -43,28 +48,8 @@ def handle_book_loan_signals(sender, instance, created, **kwargs):
         )
         
         if is_newly_returned:
-            # Send return confirmation email
-            send_return_confirmation(instance)
-            
-            # Update book availability
-            book = instance.book
-            book.available_copies += 1
-            book.save()
-            
-            # Check if there are pending reservations for this book
-            pending_reservations = BookReservation.objects.filter(
-                book=book,
-                status='pending'
-            ).order_by('reservation_date')
-            
-            if pending_reservations.exists():
-                # Get the oldest reservation
-                oldest_reservation = pending_reservations.first()
-                oldest_reservation.status = 'fulfilled'
-                oldest_reservation.save()
-                
-                # Notify the user that their reserved book is available
-                send_reservation_available_notification(oldest_reservation)
+            # Release the copy, queue the confirmation and fulfill the next reservation
+            handle_returned_loan(instance)
 
 
 @receiver(pre_save, sender=BookLoan)
@@ -84,17 +69,267 @@ def store_pre_save_book_loan(sender, instance, **kwargs):
 def handle_book_reservation_signals(sender, instance, created, **kwargs):
     """
     Handle signals for BookReservation model.
-    Sends notifications when a book is reserved.
+    Queues notifications when a book is reserved and places the hold.
     """
     if created:
-        # Send reservation confirmation email
-        send_reservation_confirmation(instance)
+        # Queue reservation confirmation email
+        enqueue_email('reservation_confirmation', instance)
         
-        # If the book is available, immediately fulfill the reservation
-        book = instance.book
-        if book.available_copies > 0 and instance.status == 'pending':
-            instance.status = 'fulfilled'
-            instance.save()
-            
-            # Notify the user that their reserved book is available
-            send_reservation_available_notification(instance)
+        # Set a copy aside if one is free and nobody is waiting, otherwise join the queue
+        if instance.status == 'pending':
+            place_hold(instance)
+
+
+@receiver(post_save, sender=Book)
+def update_book_genre_index(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the BookGenre index in sync with Book.genres.
+    """
+    if update_fields is not None and 'genres' not in update_fields:
+        return
+    sync_book_genres(instance)
+
+
+@receiver(m2m_changed, sender=Book.categories.through)
+def update_book_category_genre_index(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep the BookGenre index in sync with Book.categories.
+    Handles both book.categories.add(...) and category.books.add(...).
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            sync_book_genres(instance)
+        return
+
+    if action == 'pre_clear':
+        instance._genre_index_book_ids = list(instance.books.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        sync_genres_for_books(Book.objects.filter(pk__in=pk_set))
+    elif action == 'post_clear':
+        book_ids = getattr(instance, '_genre_index_book_ids', [])
+        sync_genres_for_books(Book.objects.filter(pk__in=book_ids))
+
+
+@receiver(post_save, sender=Category)
+def update_category_genre_index(sender, instance, created, **kwargs):
+    """
+    Re-index the books of a category when its slug may have changed.
+    """
+    if not created:
+        sync_genres_for_books(instance.books.all())
+
+
+@receiver(pre_delete, sender=Category)
+def remove_category_genre_index(sender, instance, **kwargs):
+    """
+    Drop index entries for a category that is being deleted.
+    The through rows are removed by cascade, which does not fire m2m_changed.
+    """
+    BookGenre.objects.filter(
+        source='category',
+        name=instance.slug,
+        book__categories=instance,
+    ).delete()
+
+
+@receiver(post_save, sender=Book)
+def update_book_search_index(sender, instance, **kwargs):
+    """
+    Re-index a book in the full-text search index after it is saved.
+    """
+    update_search_index(books=[instance])
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_search_index(sender, instance, **kwargs):
+    """
+    Remove a deleted book from the full-text search index.
+    """
+    remove_from_search_index([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def update_book_authors_search_index(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Re-index books whose author list changed.
+    Handles both book.authors.add(...) and author.books.add(...).
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_search_index(books=[instance])
+        return
+
+    if action == 'pre_clear':
+        instance._search_index_book_ids = list(instance.books.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        update_search_index(book_ids=pk_set)
+    elif action == 'post_clear':
+        update_search_index(book_ids=getattr(instance, '_search_index_book_ids', []))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+def update_related_books_search_index(sender, instance, created, **kwargs):
+    """
+    Re-index the books of an author or publisher whose name may have changed.
+    """
+    if not created:
+        update_search_index(book_ids=instance.books.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Publisher)
+def store_related_books_before_delete(sender, instance, **kwargs):
+    """
+    Remember the books of an author or publisher that is being deleted.
+    The relation is cleared without firing m2m_changed/post_save for the books.
+    """
+    instance._search_index_book_ids = list(instance.books.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Publisher)
+def update_books_after_related_delete(sender, instance, **kwargs):
+    """
+    Re-index the books of a deleted author or publisher.
+    """
+    update_search_index(book_ids=getattr(instance, '_search_index_book_ids', []))
+
+
+@receiver(pre_save, sender=Book)
+def store_previous_publisher(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Remember the publisher a book had before it is saved.
+    """
+    instance._previous_publisher_id = None
+    if update_fields is not None and not {'publisher', 'publisher_id'} & set(update_fields):
+        instance._previous_publisher_id = instance.publisher_id
+    elif instance.pk and not raw:
+        instance._previous_publisher_id = (
+            Book.objects.filter(pk=instance.pk).values_list('publisher_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Book)
+def update_publisher_book_counts(sender, instance, created, raw=False, **kwargs):
+    """
+    Update Publisher.book_count when a book is added or moved to another publisher.
+    """
+    previous_publisher_id = getattr(instance, '_previous_publisher_id', None)
+    if created or raw or previous_publisher_id != instance.publisher_id:
+        refresh_publisher_book_counts([previous_publisher_id, instance.publisher_id])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def update_author_book_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Update Author.book_count when the authors of a book change.
+    Handles both book.authors.add(...) and author.books.add(...).
+    """
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_author_book_counts([instance.pk])
+        return
+
+    if action == 'pre_clear':
+        instance._book_count_author_ids = list(instance.authors.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        refresh_author_book_counts(pk_set)
+    elif action == 'post_clear':
+        refresh_author_book_counts(getattr(instance, '_book_count_author_ids', []))
+
+
+@receiver(pre_delete, sender=Book)
+def store_book_authors_before_delete(sender, instance, **kwargs):
+    """
+    Remember the authors of a book that is being deleted.
+    The through rows are removed by cascade, which does not fire m2m_changed.
+    """
+    instance._book_count_author_ids = list(instance.authors.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Book)
+def update_book_counts_after_delete(sender, instance, **kwargs):
+    """
+    Update the counters of the authors and publisher of a deleted book.
+    """
+    refresh_author_book_counts(getattr(instance, '_book_count_author_ids', []))
+    refresh_publisher_book_counts([instance.publisher_id])
+
+
+@receiver(pre_save, sender=Review)
+def store_previous_review_contribution(sender, instance, raw=False, **kwargs):
+    """
+    Remember what a review contributed to its book's rating summary before it is saved.
+    """
+    instance._previous_rating_contribution = None
+    if instance.pk and not raw:
+        previous = Review.objects.filter(pk=instance.pk).values_list('book_id', 'rating', 'status').first()
+        if previous:
+            instance._previous_rating_contribution = get_review_contribution(*previous)
+
+
+@receiver(post_save, sender=Review)
+def update_book_rating_summary(sender, instance, raw=False, **kwargs):
+    """
+    Update the book rating summary when a review is created, edited or moderated.
+    """
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating_contribution', None)
+    current = get_review_contribution(instance.book_id, instance.rating, instance.status)
+    if previous == current:
+        return
+    apply_rating_changes(
+        removed=[previous] if previous else [],
+        added=[current] if current else [],
+    )
+    refresh_cached_book(instance)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_rating_summary(sender, instance, **kwargs):
+    """
+    Remove a deleted approved review from its book's rating summary.
+    """
+    contribution = get_review_contribution(instance.book_id, instance.rating, instance.status)
+    if contribution:
+        apply_rating_changes(removed=[contribution])
+
+
+# Fields whose uploads get responsive derivatives
+IMAGE_DERIVATIVE_FIELDS = {
+    Book: 'cover',
+    Author: 'photo',
+    Publisher: 'logo',
+    UserProfile: 'profile_picture',
+}
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=UserProfile)
+def generate_image_derivatives(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Generate the responsive derivatives of a newly saved image when
+    settings.IMAGE_DERIVATIVES_EAGER is set, so the first page showing it does
+    not have to. Off by default, since it encodes every width and format inside
+    the request that saved the image; the image_derivative view then creates
+    each variant on its first request.
+    """
+    field = IMAGE_DERIVATIVE_FIELDS[sender]
+    if raw or not getattr(settings, 'IMAGE_DERIVATIVES_EAGER', False):
+        return
+    if update_fields is not None and field not in update_fields:
+        return
+    image = getattr(instance, field)
+    if image and not has_derivatives(image.name):
+        generate_derivatives(image.name)
+
+
+@receiver(post_save, sender=LibrarySettings)
+@receiver(post_delete, sender=LibrarySettings)
+def invalidate_cached_library_settings(sender, instance, **kwargs):
+    """Make every process read the library settings again after they change."""
+    invalidate_library_settings()
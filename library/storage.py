@@ -0,0 +1,116 @@
+"""
+Content-addressed file storage for the library app.
+Uploaded images are stored under the SHA-256 hash of their content, e.g.
+covers/3f/3f9a...e1.jpg, instead of under their upload name. Identical images are
+stored once and names never collide, so files no longer need to be renamed or
+repaired after the fact. Files outside the content-addressed directories (report
+exports, for example) are stored as usual.
+
+A content-addressed file can be shared by several rows, so delete() leaves it in
+place; library.media_store collects the files that are no longer referenced.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_ADDRESSED_DIRECTORIES = ('covers', 'authors', 'publishers', 'profile_pics')
+
+CONTENT_NAME_PATTERN = re.compile(r'^(?P<directory>[\w-]+)/(?P<prefix>[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})(\.\w+)?$')
+
+
+def get_content_addressed_directories():
+    return tuple(getattr(settings, 'MEDIA_STORE_DIRECTORIES', CONTENT_ADDRESSED_DIRECTORIES))
+
+
+def get_content_name(directory, digest, extension):
+    """Return the name of a file with the given hash, e.g. covers/3f/3f9a...e1.jpg."""
+    return posixpath.join(directory, digest[:2], f"{digest}{extension.lower()}")
+
+
+def is_content_name(name):
+    """Check whether a media name is a content-addressed name."""
+    match = CONTENT_NAME_PATTERN.match(name or '')
+    return bool(match) and match.group('prefix') == match.group('digest')[:2]
+
+
+def hash_chunks(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def hash_path(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in blocks."""
+    with open(path, 'rb') as f:
+        return hash_chunks(iter(lambda: f.read(block_size), b''))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that stores files in the content-addressed directories by hash.
+
+    Saving a file whose content is already stored returns the existing name
+    without writing anything.
+    """
+
+    def is_content_addressed(self, name):
+        directory = name.replace('\\', '/').split('/', 1)[0]
+        return directory in get_content_addressed_directories()
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content and is picked in _save
+        if self.is_content_addressed(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if not self.is_content_addressed(name):
+            return super()._save(name, content)
+
+        name = name.replace('\\', '/')
+        directory = name.split('/', 1)[0]
+        digest = hash_chunks(content.chunks())
+        content_name = get_content_name(directory, digest, posixpath.splitext(name)[1])
+        if self.exists(content_name):
+            return content_name
+
+        # Write under a unique temporary name, then move it into place atomically,
+        # so concurrent uploads of the same image both end with one complete file
+        temp_name = posixpath.join(posixpath.dirname(content_name), f".{digest}.{uuid.uuid4().hex}.tmp")
+        temp_name = super()._save(temp_name, content)
+        os.replace(self.path(temp_name), self.path(content_name))
+        return content_name
+
+    def delete(self, name):
+        # Shared by every row with the same image; removed by garbage collection instead
+        if is_content_name(name):
+            return
+        super().delete(name)
+
+    def ingest(self, path, directory):
+        """
+        Move an existing file into the store.
+
+        Args:
+            path (str): Absolute path of the file, which no longer exists afterwards
+            directory (str): Content-addressed directory to store it in
+
+        Returns:
+            str: The content-addressed name of the file
+        """
+        content_name = get_content_name(directory, hash_path(path), os.path.splitext(path)[1])
+        content_path = self.path(content_name)
+        if os.path.abspath(path) == content_path:
+            return content_name
+        if os.path.exists(content_path):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(content_path), exist_ok=True)
+            os.replace(path, content_path)
+        return content_name
@@ -1,4 +1,7 @@
 from django import template
+from django.utils.html import format_html, format_html_join
+
+from library.image_derivatives import FORMAT_OPTIONS, get_formats, get_srcset
 
 register = template.Library()
 
@@ -14,3 +17,60 @@ def subtract(value, arg):
 def addclass(field, css_class):
     """Adds a CSS class to a Django form field."""
     return field.as_widget(attrs={"class": css_class})
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    """Returns the current query string with the given parameters replaced.
+
+    Parameters set to None or an empty string are removed, e.g.
+    ?{% url_replace page=2 cursor='' %}
+    """
+    query = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        if value is None or value == '':
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
+
+
+def _get_display_width(sizes):
+    """Returns the pixel width from a plain sizes value such as "40px", else None."""
+    if sizes and sizes.endswith('px') and sizes[:-2].isdigit():
+        return int(sizes[:-2])
+    return None
+
+@register.simple_tag
+def image_srcset(image, sizes=None, fmt='jpeg'):
+    """Returns the srcset attribute value for an ImageField in one format.
+
+    Usage: <img src="{{ book.cover.url }}" srcset="{% image_srcset book.cover '40px' %}" sizes="40px">
+    """
+    if not image:
+        return ''
+    return get_srcset(image.name, fmt, _get_display_width(sizes))
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', alt='', **attrs):
+    """Renders a <picture> with AVIF/WebP/JPEG srcsets for an ImageField.
+
+    The widths offered stop at twice a pixel `sizes` value; other attributes
+    (class, style, ...) are passed to the <img>, e.g.
+    {% responsive_image book.cover sizes="40px" alt=book.title class="me-3" %}
+    """
+    if not image:
+        return ''
+    display_width = _get_display_width(sizes)
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (FORMAT_OPTIONS[fmt]['mime_type'], get_srcset(image.name, fmt, display_width), sizes)
+            for fmt in get_formats() if fmt != 'jpeg'
+        )
+    )
+    attrs.setdefault('loading', 'lazy')
+    img_attrs = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}"{}></picture>',
+        sources, image.url, get_srcset(image.name, 'jpeg', display_width), sizes, alt, img_attrs
+    )
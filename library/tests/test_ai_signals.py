@@ -7,12 +7,14 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 from django.conf import settings
 from django.db.models.signals import post_save
+from django.core.management import call_command
 from unittest.mock import patch, MagicMock
+from io import StringIO
 import os
 import tempfile
 import shutil
 
-from library.models import Book, Author, Publisher
+from library.models import Book, Author, Publisher, ImageGenerationJob
 from library.ai_signals import (
     generate_book_cover, generate_author_portrait, generate_publisher_logo,
     generate_with_flux
@@ -116,6 +118,9 @@ class BookCoverSignalTests(AISignalsTestCase):
         
         # Create a publisher
         self.publisher = Publisher.objects.create(name="Test Publisher")
+        
+        # Only the jobs queued for books are of interest here
+        ImageGenerationJob.objects.all().delete()
     
     @patch('library.ai_signals.generate_with_flux')
     def test_generate_book_cover_signal(self, mock_generate):
@@ -134,7 +139,8 @@ class BookCoverSignalTests(AISignalsTestCase):
         )
         book.authors.add(self.author)
         
-        # The signal should have been triggered automatically
+        # The signal queues a job, which the worker then runs
+        call_command('process_image_jobs', '--once', stdout=StringIO())
         
         # Check that generate_with_flux was called
         mock_generate.assert_called_once()
@@ -195,7 +201,8 @@ class AuthorPortraitSignalTests(AISignalsTestCase):
             name="New Author"
         )
         
-        # The signal should have been triggered automatically
+        # The signal queues a job, which the worker then runs
+        call_command('process_image_jobs', '--once', stdout=StringIO())
         
         # Check that generate_with_flux was called
         mock_generate.assert_called_once()
@@ -242,7 +249,8 @@ class PublisherLogoSignalTests(AISignalsTestCase):
             name="New Publisher"
         )
         
-        # The signal should have been triggered automatically
+        # The signal queues a job, which the worker then runs
+        call_command('process_image_jobs', '--once', stdout=StringIO())
         
         # Check that generate_with_flux was called
         mock_generate.assert_called_once()
@@ -0,0 +1,67 @@
+"""
+Tests for the bulk catalog import in the library application.
+Tests chunked inserts, author and publisher lookup maps, the through rows and
+the derived data that model signals would otherwise keep up to date.
+"""
+from django.test import TestCase
+
+from library.bulk_import import BookImporter, chunked
+from library.instrumentation import QueryRecorder
+from library.models import Author, Book, BookGenre, ImageGenerationJob, Publisher
+
+
+def make_record(title, authors, publisher='Znak', genres=None):
+    return {
+        'book': {'title': title, 'isbn': '', 'genres': genres or ['Poetry'], 'total_copies': 2, 'available_copies': 1},
+        'authors': authors,
+        'publisher': publisher,
+    }
+
+
+class BookImporterTests(TestCase):
+    """Tests for the BookImporter."""
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_import_creates_books_authors_and_publishers(self):
+        """Test that records are inserted in chunks and reuse existing rows."""
+        existing = Author.objects.create(name="Wisława Szymborska")
+        records = [
+            make_record("Wiersze", ["Wisława Szymborska"]),
+            make_record("Dwukropek", ["Wisława Szymborska", "Czesław Miłosz", "Czesław Miłosz"]),
+            make_record("Zniewolony umysł", ["Czesław Miłosz"], publisher='Wydawnictwo Literackie'),
+        ]
+        importer = BookImporter(
+            chunk_size=2,
+            author_defaults=lambda name, record: {'bio': f"Author of {record['book']['title']}"},
+        )
+        stats = list(importer.import_records(records))
+
+        self.assertEqual([(s.rows, s.books, s.authors, s.publishers) for s in stats], [(2, 2, 1, 1), (1, 1, 0, 1)])
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Author.objects.get(name="Czesław Miłosz").bio, "Author of Dwukropek")
+
+        book = Book.objects.get(title="Dwukropek")
+        self.assertEqual(sorted(book.authors.values_list('name', flat=True)), ["Czesław Miłosz", "Wisława Szymborska"])
+        self.assertEqual(book.publisher.name, 'Znak')
+
+        # Derived data is refreshed although bulk_create sends no signals
+        existing.refresh_from_db()
+        self.assertEqual(existing.book_count, 2)
+        self.assertEqual(Publisher.objects.get(name='Znak').book_count, 2)
+        self.assertEqual(BookGenre.objects.filter(name='Poetry').count(), 3)
+        # Imported rows do not queue AI images, only the author saved above did
+        self.assertEqual(ImageGenerationJob.objects.count(), 1)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Test that a chunk costs the same number of queries regardless of its size."""
+        def count_queries(prefix, rows):
+            importer = BookImporter(chunk_size=rows)
+            records = [make_record(f"{prefix} {i}", [f"{prefix} author {i}"], publisher=f"{prefix} publisher {i}")
+                       for i in range(rows)]
+            with QueryRecorder() as recorder:
+                list(importer.import_records(records))
+            return recorder.count
+
+        self.assertEqual(count_queries('Small', 3), count_queries('Large', 30))
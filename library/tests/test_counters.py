@@ -0,0 +1,78 @@
+"""
+Tests for the denormalized book counters in the library application.
+Tests Author.book_count and Publisher.book_count maintenance and reconciliation.
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from unittest.mock import patch
+from io import StringIO
+
+from library.models import Book, Author, Publisher
+from library.counters import find_book_count_drift
+
+
+class BookCounterTests(TestCase):
+    """Tests for keeping the book counters in sync with the catalog."""
+
+    def setUp(self):
+        """Set up test data."""
+        flux_patcher = patch('library.ai_signals.generate_with_flux', return_value=False)
+        flux_patcher.start()
+        self.addCleanup(flux_patcher.stop)
+
+        self.author = Author.objects.create(name="Olga Tokarczuk")
+        self.other_author = Author.objects.create(name="Stanisław Lem")
+        self.publisher = Publisher.objects.create(name="Wydawnictwo Literackie")
+        self.other_publisher = Publisher.objects.create(name="Znak")
+
+    def assertCounts(self, author, other_author, publisher, other_publisher):
+        self.assertEqual(
+            [
+                Author.objects.get(pk=self.author.pk).book_count,
+                Author.objects.get(pk=self.other_author.pk).book_count,
+                Publisher.objects.get(pk=self.publisher.pk).book_count,
+                Publisher.objects.get(pk=self.other_publisher.pk).book_count,
+            ],
+            [author, other_author, publisher, other_publisher]
+        )
+
+    def test_counts_follow_book_changes(self):
+        """Test that counters follow adding, moving and deleting books."""
+        book = Book.objects.create(title="Bieguni", publisher=self.publisher)
+        book.authors.add(self.author, self.other_author)
+        self.assertCounts(1, 1, 1, 0)
+
+        book.publisher = self.other_publisher
+        book.save()
+        book.authors.remove(self.other_author)
+        self.assertCounts(1, 0, 0, 1)
+
+        self.other_author.books.add(book)
+        self.author.books.clear()
+        self.assertCounts(0, 1, 0, 1)
+
+        book.delete()
+        self.assertCounts(0, 0, 0, 0)
+
+    def test_saving_stale_instance_keeps_count(self):
+        """Test that saving an author loaded before its books were added keeps the counter."""
+        Book.objects.create(title="Solaris").authors.add(self.other_author)
+        self.other_author.bio = "Pisarz science fiction."
+        self.other_author.save()
+        self.assertEqual(Author.objects.get(pk=self.other_author.pk).book_count, 1)
+
+    def test_reconcile_command(self):
+        """Test that the reconcile command repairs counters changed behind the signals' back."""
+        Book.objects.create(title="Cyberiada", publisher=self.publisher)
+        Book.objects.update(publisher=self.other_publisher)
+        self.assertEqual(len(find_book_count_drift(Publisher)), 2)
+
+        out = StringIO()
+        call_command('reconcile_book_counts', '--dry-run', stdout=out)
+        self.assertIn('2 publishers have out-of-date book counts', out.getvalue())
+        self.assertCounts(0, 0, 1, 0)
+
+        call_command('reconcile_book_counts', stdout=out)
+        self.assertIn('Fixed book counts of 2 publishers', out.getvalue())
+        self.assertCounts(0, 0, 0, 1)
+        self.assertEqual(find_book_count_drift(Publisher), [])
@@ -0,0 +1,173 @@
+"""
+Tests for fuzzy duplicate book detection in the library application.
+Tests normalization, blocking and scoring, clustering and the set-based merge.
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+
+from library.dedup import (
+    CandidateBook, find_duplicate_clusters, merge_cluster, normalize_isbn, normalize_text, score_pair
+)
+from library.models import Author, Book, BookLoan, BookReservation, Category, Review
+
+User = get_user_model()
+
+
+class NormalizationTests(TestCase):
+    """Tests for the normalization and scoring helpers."""
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("Pan Tadeusz (Wydanie II)"), "pan tadeusz")
+        self.assertEqual(normalize_text("Ogniem i  Mieczem!"), "ogniem i mieczem")
+        self.assertEqual(normalize_text("Łódź, źródło"), "lodz zrodlo")
+
+    def test_normalize_isbn(self):
+        self.assertEqual(normalize_isbn('0-425-17642-8'), '9780425176429')
+        self.assertEqual(normalize_isbn('978-0425176429'), '9780425176429')
+        self.assertIsNone(normalize_isbn('12345'))
+        self.assertEqual(normalize_isbn('0-8044-2957-X'), '9780804429573')
+        self.assertIsNone(normalize_isbn('12X4567890'))
+        self.assertIsNone(normalize_isbn(None))
+
+    def test_score_pair(self):
+        def book(title, isbn=None, surnames=()):
+            return CandidateBook(0, normalize_text(title), title, isbn, frozenset(surnames))
+
+        self.assertEqual(score_pair(book("Lalka", '1'), book("Inna", '1')), 1.0)
+        # Different ISBNs are different editions
+        self.assertEqual(score_pair(book("Lalka", '1'), book("Lalka", '2')), 0.0)
+        self.assertGreater(score_pair(book("Quo Vadis", surnames={'sienkiewicz'}),
+                                      book("Quo vadis.", surnames={'sienkiewicz'})), 0.99)
+        self.assertLess(score_pair(book("Lalka", surnames={'prus'}), book("Faraon", surnames={'prus'}), 0.9), 0.9)
+
+
+class DuplicateBookTests(TestCase):
+    """Tests for find_duplicate_clusters and merge_cluster."""
+
+    def setUp(self):
+        """Set up a catalog with one cluster of four near-duplicates."""
+        self.author = Author.objects.create(name="Henryk Sienkiewicz")
+        self.translator = Author.objects.create(name="Jan Kowalski")
+        self.category = Category.objects.create(name="Powieść historyczna", slug="powiesc-historyczna")
+
+        self.original = Book.objects.create(title="Quo Vadis", total_copies=2, available_copies=1)
+        self.variant = Book.objects.create(title="Quo vadis.", description="Powieść z czasów Nerona",
+                                           total_copies=1, available_copies=1)
+        self.by_isbn = Book.objects.create(title="Quo Vadis: powieść z czasów Nerona", isbn='9788373271890',
+                                           total_copies=1, available_copies=0)
+        self.isbn10 = Book.objects.create(title="Quo Vadis", isbn='8373271890', total_copies=1, available_copies=1)
+        self.other = Book.objects.create(title="Krzyżacy", total_copies=1, available_copies=1)
+        for book in (self.original, self.variant, self.by_isbn, self.isbn10, self.other):
+            book.authors.add(self.author)
+        self.variant.authors.add(self.translator)
+        self.variant.categories.add(self.category)
+
+        self.users = [User.objects.create_user(email=f'reader{i}@example.com', password='pass') for i in range(3)]
+
+    def test_find_clusters(self):
+        report = find_duplicate_clusters()
+        self.assertEqual(report.books, 5)
+        self.assertEqual(report.clusters, [sorted([self.original.pk, self.variant.pk, self.by_isbn.pk, self.isbn10.pk])])
+        self.assertEqual(report.titles[self.variant.pk], "Quo vadis.")
+
+    def test_oversized_blocks_are_skipped(self):
+        report = find_duplicate_clusters(max_block_size=1)
+        self.assertEqual(report.clusters, [])
+        self.assertGreater(report.skipped_blocks, 0)
+
+    def test_merge_cluster(self):
+        """Test that related rows move to the kept book and one review per user survives."""
+        loan = BookLoan.objects.create(book=self.variant, user=self.users[0],
+                                       due_date=timezone.now().date())
+        Review.objects.create(book=self.original, user=self.users[1], rating=3, content="a", status='approved')
+        best = Review.objects.create(book=self.variant, user=self.users[1], rating=5, content="b", status='approved')
+        moved = Review.objects.create(book=self.by_isbn, user=self.users[2], rating=4, content="c", status='approved')
+
+        cluster = [self.original.pk, self.variant.pk, self.by_isbn.pk, self.isbn10.pk]
+        self.assertEqual(merge_cluster(cluster), self.original.pk)
+
+        self.assertEqual(set(Book.objects.values_list('pk', flat=True)), {self.original.pk, self.other.pk})
+        book = Book.objects.get(pk=self.original.pk)
+        # The kept book keeps its own copies, one of them now taken by the moved loan
+        self.assertEqual((book.total_copies, book.available_copies), (2, 0))
+        self.assertEqual(book.description, "Powieść z czasów Nerona")
+        self.assertEqual(book.isbn, '9788373271890')
+        self.assertEqual(set(book.authors.all()), {self.author, self.translator})
+        self.assertEqual(list(book.categories.all()), [self.category])
+
+        loan.refresh_from_db()
+        self.assertEqual(loan.book_id, book.pk)
+        self.assertEqual(set(Review.objects.values_list('pk', flat=True)), {best.pk, moved.pk})
+        self.assertEqual((book.review_count, book.average_rating), (2, 4.5))
+
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.book_count, 2)
+
+    def test_double_holdings_are_closed(self):
+        """Test that a patron keeps one loan and one hold when copies are added up."""
+        expiry_date = timezone.now().date() + timedelta(days=90)
+        kept_loan = BookLoan.objects.create(book=self.original, user=self.users[0], due_date=expiry_date)
+        extra_loan = BookLoan.objects.create(book=self.variant, user=self.users[0], due_date=expiry_date)
+        # The isbn10 copy is set aside for the reader, the kept book has none left
+        ready = BookReservation.objects.create(book=self.isbn10, user=self.users[1], expiry_date=expiry_date)
+        waiting = BookReservation.objects.create(book=self.original, user=self.users[1], expiry_date=expiry_date)
+        self.assertEqual((ready.status, waiting.status), ('fulfilled', 'pending'))
+
+        cluster = [self.original.pk, self.variant.pk, self.by_isbn.pk, self.isbn10.pk]
+        merge_cluster(cluster, sum_copies=True)
+
+        self.assertEqual(BookLoan.objects.get(pk=kept_loan.pk).status, 'borrowed')
+        self.assertEqual(BookLoan.objects.get(pk=extra_loan.pk).status, 'returned')
+        # The copy set aside is kept rather than the place in the queue
+        self.assertEqual(BookReservation.objects.get(pk=ready.pk).status, 'fulfilled')
+        self.assertEqual(BookReservation.objects.get(pk=waiting.pk).status, 'cancelled')
+        book = Book.objects.get(pk=self.original.pk)
+        # The returned loan frees the variant's copy
+        self.assertEqual((book.total_copies, book.available_copies), (5, 1))
+
+    def test_moved_loans_and_ready_holds_take_kept_copies(self):
+        """Test that availability of the kept book counts the moved loan and ready hold, down to 0."""
+        expiry_date = timezone.now().date() + timedelta(days=90)
+        BookLoan.objects.create(book=self.variant, user=self.users[0], due_date=expiry_date)
+        ready = BookReservation.objects.create(book=self.isbn10, user=self.users[1], expiry_date=expiry_date)
+        self.assertEqual(ready.status, 'fulfilled')
+
+        merge_cluster([self.original.pk, self.variant.pk, self.by_isbn.pk, self.isbn10.pk])
+
+        book = Book.objects.get(pk=self.original.pk)
+        self.assertEqual((book.total_copies, book.available_copies), (2, 0))
+
+    def test_merged_queue_is_renumbered(self):
+        """Test that holds moved from a duplicate get their own places in the kept book's queue."""
+        expiry_date = timezone.now().date() + timedelta(days=90)
+        readers = [User.objects.create_user(email=f'waiting{i}@example.com', password='pass') for i in range(4)]
+        # The first hold on the kept book takes its only copy, the second waits
+        for reader in readers[:2]:
+            BookReservation.objects.create(book=self.original, user=reader, expiry_date=expiry_date)
+        for reader in readers[2:]:
+            BookReservation.objects.create(book=self.by_isbn, user=reader, expiry_date=expiry_date)
+
+        merge_cluster([self.original.pk, self.by_isbn.pk])
+
+        positions = BookReservation.objects.filter(book=self.original, status='pending').values_list(
+            'queue_position', flat=True
+        )
+        self.assertEqual(sorted(positions), [1, 2, 3])
+
+    def test_command_is_idempotent(self):
+        out = StringIO()
+        call_command('remove_duplicate_books', '--dry-run', stdout=out)
+        self.assertIn('Found 1 groups of duplicates', out.getvalue())
+        self.assertEqual(Book.objects.count(), 5)
+
+        out = StringIO()
+        call_command('remove_duplicate_books', stdout=out)
+        self.assertIn('Successfully merged 3 duplicate books', out.getvalue())
+
+        out = StringIO()
+        call_command('remove_duplicate_books', stdout=out)
+        self.assertIn('No duplicate books found', out.getvalue())
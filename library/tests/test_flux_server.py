@@ -0,0 +1,166 @@
+"""
+Tests for the warm Flux AI generation server and its client.
+Tests the mock backend over TCP and Unix sockets, batch requests, the fallback to
+the basic image and the routing of generate_with_flux and the image commands
+through the server.
+"""
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from library.ai_signals import generate_batch_with_flux, generate_with_flux
+from library.ai_utils.flux_client import FluxClient, FluxServerError, generate_image, generate_images, run_generation
+from library.ai_utils.flux_server import MockBackend, create_server, get_server_address
+
+
+class FluxServerTestMixin:
+    """Starts a mock generation server in a background thread."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def start_server(self, **kwargs):
+        backend = MockBackend()
+        backend.load()
+        server = create_server(backend, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, get_server_address(server)
+
+
+class FluxServerTests(FluxServerTestMixin, SimpleTestCase):
+    """Tests for the generation server with the mock backend."""
+
+    def test_generate_over_tcp(self):
+        """Test that the warm server generates images and counts them in its health status."""
+        server, address = self.start_server(port=0)
+        client = FluxClient(address)
+        self.assertEqual(client.health()['backend'], 'mock')
+
+        for i in range(2):
+            output_path = os.path.join(self.temp_dir, 'covers', f'{i}.jpg')
+            result = client.generate("A book cover", output_path, seed=7)
+            self.assertTrue(result['ok'])
+            self.assertEqual(result['seed'], 7)
+            self.assertTrue(os.path.exists(output_path))
+        self.assertEqual(client.health()['generated'], 2)
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not available')
+    def test_generate_over_unix_socket(self):
+        socket_path = os.path.join(self.temp_dir, 'flux.sock')
+        server, address = self.start_server(socket_path=socket_path)
+        self.assertEqual(address, f'unix://{socket_path}')
+
+        output_path = os.path.join(self.temp_dir, 'portrait.jpg')
+        FluxClient(address).generate("A portrait", output_path)
+        self.assertTrue(os.path.exists(output_path))
+
+    def test_backend_error_is_reported(self):
+        """Test that a failing backend returns an error instead of killing the server."""
+        server, address = self.start_server(port=0)
+        client = FluxClient(address)
+        with patch.object(MockBackend, 'generate', side_effect=RuntimeError('CUDA out of memory')):
+            with self.assertRaisesMessage(FluxServerError, 'CUDA out of memory'):
+                client.generate("A logo", os.path.join(self.temp_dir, 'logo.jpg'))
+        self.assertEqual(client.health()['failed'], 1)
+
+    def test_generate_batch(self):
+        """Test that a batch returns one result per item and reports failed items."""
+        server, address = self.start_server(port=0)
+        items = [
+            {'prompt': f"Cover {i}", 'output_path': os.path.join(self.temp_dir, 'covers', f'{i}.jpg'), 'seed': i}
+            for i in range(3)
+        ]
+        response = FluxClient(address).generate_batch(items)
+        self.assertTrue(response['ok'])
+        self.assertEqual([result['seed'] for result in response['results']], [0, 1, 2])
+        self.assertTrue(all(os.path.exists(item['output_path']) for item in items))
+
+        original = MockBackend.generate
+
+        def fail_second(backend, prompt, output_path, seed=None, **params):
+            if prompt == "Cover 1":
+                raise RuntimeError("CUDA out of memory")
+            return original(backend, prompt, output_path, seed)
+
+        with patch.object(MockBackend, 'generate', fail_second):
+            response = FluxClient(address).generate_batch(items)
+        self.assertFalse(response['ok'])
+        self.assertEqual([result['ok'] for result in response['results']], [True, False, True])
+        self.assertEqual(response['results'][1]['error'], 'CUDA out of memory')
+
+    def test_invalid_request(self):
+        server, address = self.start_server(port=0)
+        with self.assertRaisesMessage(FluxServerError, 'Invalid request'):
+            FluxClient(address).request('POST', '/generate', {'prompt': 'No output path'})
+
+
+class FluxClientFallbackTests(FluxServerTestMixin, SimpleTestCase):
+    """Tests for the client fallback when no server is running."""
+
+    def get_unused_address(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    def test_unavailable_server(self):
+        client = FluxClient(self.get_unused_address())
+        self.assertIsNone(client.health())
+        self.assertFalse(client.is_available())
+
+    @patch('library.ai_utils.flux_client.generate_basic_image', return_value=True)
+    def test_falls_back_to_basic_image(self, mock_basic):
+        """Test that generate_image draws the basic image when the server is down."""
+        output_path = os.path.join(self.temp_dir, 'cover.jpg')
+        self.assertTrue(generate_image("A cover", output_path, seed=3, address=self.get_unused_address()))
+        mock_basic.assert_called_once_with("A cover", output_path, 3)
+
+        self.assertFalse(generate_image("A cover", output_path, address=self.get_unused_address(), fallback=False))
+
+    @patch('library.ai_utils.flux_client.generate_basic_image', return_value=True)
+    def test_batch_falls_back_per_item(self, mock_basic):
+        items = [{'prompt': "A cover", 'output_path': os.path.join(self.temp_dir, f'{i}.jpg')} for i in range(2)]
+        self.assertEqual(generate_images(items, address=self.get_unused_address()), [True, True])
+        self.assertEqual(mock_basic.call_count, 2)
+
+    @patch('library.ai_signals.subprocess.run')
+    def test_generate_batch_with_flux_uses_server(self, mock_run):
+        server, address = self.start_server(port=0)
+        items = [{'prompt': f"Logo {i}", 'output_path': os.path.join(self.temp_dir, 'logos', f'{i}.jpg')} for i in range(2)]
+        with override_settings(FLUX_SERVER_URL=address):
+            self.assertEqual(generate_batch_with_flux(items), [True, True])
+        mock_run.assert_not_called()
+        self.assertEqual(FluxClient(address).health()['generated'], 2)
+
+    @patch('library.ai_signals.subprocess.run')
+    def test_generate_with_flux_uses_server(self, mock_run):
+        """Test that generate_with_flux does not start a process when a server is configured."""
+        server, address = self.start_server(port=0)
+        output_path = os.path.join(self.temp_dir, 'covers', 'book.jpg')
+        with override_settings(FLUX_SERVER_URL=address):
+            self.assertTrue(generate_with_flux("A cover", output_path))
+        self.assertTrue(os.path.exists(output_path))
+        mock_run.assert_not_called()
+
+    @patch('library.ai_utils.flux_client.subprocess.run')
+    def test_run_generation_starts_a_process_only_without_a_server(self, mock_run):
+        """Test that the image commands use the warm server and run the generator process only as a fallback."""
+        server, address = self.start_server(port=0)
+        output_path = os.path.join(self.temp_dir, 'cover.jpg')
+        command = ['python', 'flux_wrapper.py', '--prompt', "A cover", '--output', output_path]
+
+        result = run_generation(command, "A cover", output_path, 5, address=address, timeout=120)
+        self.assertEqual(result.returncode, 0)
+        self.assertTrue(os.path.exists(output_path))
+        mock_run.assert_not_called()
+
+        run_generation(command, "A cover", output_path, address=self.get_unused_address(), timeout=120)
+        mock_run.assert_called_once_with(command, timeout=120)
@@ -0,0 +1,114 @@
+"""
+Tests for the indexed genre filtering in the library application.
+Tests the BookGenre index sync, the book_list genre filter and the backfill command.
+"""
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.core.management import call_command
+from io import StringIO
+
+from library.models import Book, BookGenre, Category
+from library.genres import extract_genres, filter_books_by_genre
+
+
+class ExtractGenresTests(TestCase):
+    """Tests for normalizing the Book.genres JSON field."""
+
+    def test_extract_genres_from_list(self):
+        self.assertEqual(extract_genres(["fantasy", " adventure ", ""]), ["fantasy", "adventure"])
+
+    def test_extract_genres_from_string(self):
+        self.assertEqual(extract_genres("fantasy,adventure"), ["fantasy", "adventure"])
+
+    def test_extract_genres_from_dict(self):
+        self.assertEqual(extract_genres({"fantasy": 1, "adventure": 2}), ["fantasy", "adventure"])
+
+    def test_extract_genres_empty(self):
+        self.assertEqual(extract_genres(None), [])
+        self.assertEqual(extract_genres(42), [])
+
+
+class BookGenreIndexTests(TestCase):
+    """Tests for keeping BookGenre in sync with books and categories."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.book = Book.objects.create(title="Fantasy Book", genres=["fantasy", "adventure"])
+        self.category = Category.objects.create(name="Klasyka")
+
+    def get_index(self, book):
+        return set(BookGenre.objects.filter(book=book).values_list('name', 'source'))
+
+    def test_index_created_on_save(self):
+        """Test that genres are indexed when a book is created."""
+        self.assertEqual(self.get_index(self.book), {('fantasy', 'genre'), ('adventure', 'genre')})
+
+    def test_index_updated_on_genre_change(self):
+        """Test that stale genres are removed when Book.genres changes."""
+        self.book.genres = ["horror"]
+        self.book.save()
+        self.assertEqual(self.get_index(self.book), {('horror', 'genre')})
+
+    def test_index_follows_categories(self):
+        """Test that category slugs are indexed from both sides of the relation."""
+        self.book.categories.add(self.category)
+        self.assertIn(('klasyka', 'category'), self.get_index(self.book))
+
+        self.book.categories.remove(self.category)
+        self.assertNotIn(('klasyka', 'category'), self.get_index(self.book))
+
+        self.category.books.add(self.book)
+        self.assertIn(('klasyka', 'category'), self.get_index(self.book))
+
+        self.category.books.clear()
+        self.assertNotIn(('klasyka', 'category'), self.get_index(self.book))
+
+    def test_index_removed_with_category(self):
+        """Test that deleting a category drops its index entries."""
+        self.book.categories.add(self.category)
+        self.category.delete()
+        self.assertEqual(self.get_index(self.book), {('fantasy', 'genre'), ('adventure', 'genre')})
+
+    def test_filter_books_by_genre(self):
+        """Test that the genre filter returns each matching book once."""
+        other = Book.objects.create(title="Science Book", genres=["science"])
+        self.book.categories.add(Category.objects.create(name="fantasy"))
+
+        books = filter_books_by_genre(Book.objects.all(), "fantasy")
+        self.assertEqual(list(books), [self.book])
+        self.assertEqual(list(filter_books_by_genre(Book.objects.all(), "science")), [other])
+
+    def test_backfill_command(self):
+        """Test that the backfill command rebuilds entries written behind the signals' back."""
+        Book.objects.filter(pk=self.book.pk).update(genres=["poetry"])
+        BookGenre.objects.create(book=self.book, name="stale")
+
+        out = StringIO()
+        call_command('backfill_book_genres', stdout=out)
+
+        self.assertEqual(self.get_index(self.book), {('poetry', 'genre')})
+        self.assertIn('Created 1', out.getvalue())
+
+
+class BookListGenreFilterTests(TestCase):
+    """Tests for the genre filter of the book_list view."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.client = Client()
+        for i in range(3):
+            Book.objects.create(title=f"Fantasy Book {i}", genres=["fantasy"], available_copies=i)
+        Book.objects.create(title="Science Book", genres="science,education", available_copies=1)
+
+    def test_book_list_view_with_genre_filter(self):
+        """Test that the book_list view filters by genre."""
+        response = self.client.get(reverse('book_list') + '?genre=fantasy')
+        self.assertEqual(len(response.context['books']), 3)
+
+        response = self.client.get(reverse('book_list') + '?genre=education')
+        self.assertEqual(len(response.context['books']), 1)
+
+    def test_book_list_view_with_genre_and_availability_filter(self):
+        """Test that the genre filter combines with other filters."""
+        response = self.client.get(reverse('book_list') + '?genre=fantasy&availability=available')
+        self.assertEqual(len(response.context['books']), 2)
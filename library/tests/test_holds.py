@@ -0,0 +1,68 @@
+"""
+Tests for the reservation hold queue in the library application.
+Tests queue positions, promotion with a pickup deadline, leaving the queue
+and the positions shown on my_reservations.
+"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+
+from library.holds import get_next_hold, leave_queue, promote_next_hold
+from library.inventory import cancel_hold, return_copy
+from library.models import Book, BookLoan, BookReservation, LibrarySettings
+
+User = get_user_model()
+
+
+class HoldQueueTests(TestCase):
+    """Tests for library.holds and the holds placed by the reservation signal."""
+
+    def setUp(self):
+        """Set up a book whose only copy is on loan and four patrons waiting for it."""
+        self.today = timezone.now().date()
+        self.book = Book.objects.create(title="Lalka", total_copies=1, available_copies=1)
+        self.borrower = User.objects.create_user(email='borrower@example.com', password='pass')
+        self.loan = BookLoan.objects.create(book=self.book, user=self.borrower,
+                                            due_date=self.today + timedelta(days=14))
+        self.users = [User.objects.create_user(email=f'reader{i}@example.com', password='pass') for i in range(4)]
+        self.holds = [
+            BookReservation.objects.create(book=self.book, user=user, expiry_date=self.today + timedelta(days=7))
+            for user in self.users
+        ]
+
+    def positions(self):
+        return list(BookReservation.objects.filter(book=self.book, status='pending')
+                    .order_by('queue_position').values_list('user__email', 'queue_position'))
+
+    def test_holds_are_queued_in_order(self):
+        self.assertEqual(self.positions(), [(f'reader{i}@example.com', i + 1) for i in range(4)])
+        self.assertEqual(get_next_hold(self.book.pk), self.holds[0])
+
+    def test_return_promotes_the_head(self):
+        LibrarySettings.objects.create(pk=1, reservation_expiry_days=2)
+        return_copy(self.loan)
+
+        promoted = BookReservation.objects.get(pk=self.holds[0].pk)
+        self.assertEqual((promoted.status, promoted.queue_position), ('fulfilled', None))
+        self.assertEqual(promoted.expiry_date, self.today + timedelta(days=2))
+        self.assertEqual(self.positions(), [(f'reader{i}@example.com', i) for i in range(1, 4)])
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 0)
+
+    def test_leaving_the_queue_closes_the_gap(self):
+        self.assertTrue(leave_queue(BookReservation.objects.get(pk=self.holds[1].pk), 'cancelled'))
+        self.assertEqual([email for email, _ in self.positions()],
+                         ['reader0@example.com', 'reader2@example.com', 'reader3@example.com'])
+        self.assertEqual([position for _, position in self.positions()], [1, 2, 3])
+
+    def test_cancelled_ready_hold_passes_the_copy_on(self):
+        first = promote_next_hold(self.book.pk)
+        self.assertTrue(cancel_hold(first))
+        self.assertEqual(BookReservation.objects.get(pk=self.holds[1].pk).status, 'fulfilled')
+        self.assertEqual(self.positions()[0], ('reader2@example.com', 1))
+
+    def test_my_reservations_shows_position(self):
+        self.client.login(email='reader2@example.com', password='pass')
+        response = self.client.get(reverse('my_reservations'))
+        self.assertContains(response, 'W kolejce: 3. miejsce')
@@ -0,0 +1,142 @@
+"""
+Tests for the responsive image derivatives in the library application.
+Tests the deterministic derivative names, lazy generation through the
+image_derivative view, eager generation on upload and the template tags.
+"""
+from django.test import TestCase, override_settings
+from django.template import Context, Template
+from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from io import BytesIO
+from PIL import Image
+import os
+import shutil
+import tempfile
+
+from library.models import Book
+from library.image_derivatives import (
+    generate_derivatives, get_candidate_widths, get_derivative, get_derivative_name, has_derivatives
+)
+
+
+def make_image_bytes(size, image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color=(120, 30, 60)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+@override_settings(IMAGE_DERIVATIVE_WIDTHS=(80, 160), IMAGE_DERIVATIVE_FORMATS=('webp', 'jpeg'))
+class ImageDerivativeTests(TestCase):
+    """Tests for image derivative generation."""
+
+    def setUp(self):
+        """Set up a temporary media directory with a book cover."""
+        self.temp_media_dir = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.temp_media_dir)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.temp_media_dir)
+
+        self.cover_name = 'covers/pan-tadeusz.jpg'
+        self.cover_path = os.path.join(self.temp_media_dir, self.cover_name)
+        os.makedirs(os.path.dirname(self.cover_path))
+        with open(self.cover_path, 'wb') as f:
+            f.write(make_image_bytes((300, 450)))
+
+    def test_derivative_name_is_deterministic(self):
+        name = get_derivative_name(self.cover_name, 80, 'webp', 1)
+        self.assertEqual(name, get_derivative_name(self.cover_name, 80, 'webp', 1))
+        self.assertTrue(name.startswith('derivatives/'))
+        self.assertTrue(name.endswith('-80w.webp'))
+        # A replaced source gets new derivatives
+        self.assertNotEqual(name, get_derivative_name(self.cover_name, 80, 'webp', 2))
+
+    def test_resizes_without_upscaling(self):
+        """Test that derivatives are resized to their width but never enlarged."""
+        small = get_derivative(self.cover_name, 80, 'webp')
+        with Image.open(os.path.join(self.temp_media_dir, small)) as img:
+            self.assertEqual((img.format, img.size), ('WEBP', (80, 120)))
+
+        large = get_derivative(self.cover_name, 640, 'jpeg')
+        with Image.open(os.path.join(self.temp_media_dir, large)) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (300, 450)))
+
+    def test_rejects_files_outside_image_directories(self):
+        with self.assertRaises(ValueError):
+            get_derivative('../secret.jpg', 80, 'jpeg')
+        with self.assertRaises(ValueError):
+            get_derivative('reports/export.jpg', 80, 'jpeg')
+
+    def test_generate_derivatives(self):
+        self.assertFalse(has_derivatives(self.cover_name))
+        self.assertEqual(generate_derivatives(self.cover_name), 4)
+        self.assertTrue(has_derivatives(self.cover_name))
+        self.assertEqual(generate_derivatives('covers/missing.jpg'), 0)
+
+    def test_candidate_widths(self):
+        with self.settings(IMAGE_DERIVATIVE_WIDTHS=(80, 160, 320, 640)):
+            self.assertEqual(get_candidate_widths(40), [80])
+            self.assertEqual(get_candidate_widths(100), [80, 160, 320])
+            self.assertEqual(get_candidate_widths(), [80, 160, 320, 640])
+
+    def test_view_generates_and_redirects(self):
+        """Test that the first request generates the derivative and redirects to the file."""
+        url = reverse('image_derivative', kwargs={'width': 80, 'fmt': 'webp', 'name': self.cover_name})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        derivative_name = get_derivative(self.cover_name, 80, 'webp', create=False)
+        self.assertEqual(response['Location'], '/media/' + derivative_name)
+
+    def test_view_rejects_unknown_variants(self):
+        for width, fmt, name in [
+            (81, 'webp', self.cover_name),
+            (80, 'gif', self.cover_name),
+            (80, 'webp', 'covers/missing.jpg'),
+            (80, 'webp', 'reports/export.jpg'),
+        ]:
+            url = reverse('image_derivative', kwargs={'width': width, 'fmt': fmt, 'name': name})
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_no_generation_on_upload_by_default(self):
+        book = Book.objects.create(
+            title="Ferdydurke",
+            cover=SimpleUploadedFile('ferdydurke.png', make_image_bytes((200, 300), 'PNG'), content_type='image/png')
+        )
+        self.assertFalse(has_derivatives(book.cover.name))
+
+    @override_settings(IMAGE_DERIVATIVES_EAGER=True)
+    def test_eager_generation_on_upload(self):
+        book = Book.objects.create(
+            title="Ferdydurke",
+            cover=SimpleUploadedFile('ferdydurke.png', make_image_bytes((200, 300), 'PNG'), content_type='image/png')
+        )
+        self.assertTrue(has_derivatives(book.cover.name))
+
+    def test_responsive_image_tag(self):
+        """Test that the tag renders a picture with a source per modern format and an img."""
+        book = Book(title="Pan Tadeusz", cover=self.cover_name)
+        template = Template(
+            '{% load library_extras %}'
+            '{% responsive_image book.cover sizes="40px" alt=book.title class="me-3" %}'
+        )
+        html = template.render(Context({'book': book}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertNotIn('image/avif', html)
+        self.assertIn('src="/media/covers/pan-tadeusz.jpg"', html)
+        self.assertIn('sizes="40px"', html)
+        self.assertIn('alt="Pan Tadeusz"', html)
+        self.assertIn('class="me-3"', html)
+        self.assertIn('loading="lazy"', html)
+        # Only the 80w variant is needed for a 40px image
+        self.assertIn(' 80w"', html)
+        self.assertNotIn('160w', html)
+
+        self.assertEqual(Template('{% load library_extras %}{% responsive_image book.cover %}').render(
+            Context({'book': Book(title="Bez okładki")})), '')
+
+    def test_image_srcset_tag(self):
+        generate_derivatives(self.cover_name)
+        book = Book(title="Pan Tadeusz", cover=self.cover_name)
+        html = Template('{% load library_extras %}{% image_srcset book.cover %}').render(Context({'book': book}))
+        self.assertIn('/media/derivatives/', html)
+        self.assertIn(' 160w', html)
@@ -0,0 +1,149 @@
+"""
+Tests for the AI image generation job queue in the library application.
+Tests enqueueing from signals, deduplication, claiming, retries and the worker command.
+"""
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from unittest.mock import patch
+from io import StringIO
+import os
+import shutil
+import tempfile
+
+from library.models import Book, Author, Publisher, ImageGenerationJob
+from library.image_jobs import claim_jobs, enqueue_image_job, requeue_stale_jobs, run_job, run_jobs
+from library.storage import is_content_name
+
+
+def fake_generate(prompt, output_path, seed=None):
+    """Stand-in for generate_with_flux that writes a placeholder image."""
+    with open(output_path, 'wb') as f:
+        f.write(b'image')
+    return True
+
+
+class ImageJobQueueTests(TestCase):
+    """Tests for queueing and running image generation jobs."""
+
+    def setUp(self):
+        """Set up a temporary media directory."""
+        self.temp_media_dir = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.temp_media_dir)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.temp_media_dir)
+
+    def test_signals_only_enqueue(self):
+        """Test that saving entities queues one job each without generating anything."""
+        with patch('library.ai_signals.generate_with_flux') as mock_generate:
+            author = Author.objects.create(name="Wisława Szymborska")
+            publisher = Publisher.objects.create(name="a5")
+            book = Book.objects.create(title="Wiersze", publisher=publisher)
+            book.authors.add(author)
+        mock_generate.assert_not_called()
+
+        jobs = ImageGenerationJob.objects.order_by('pk')
+        self.assertEqual(
+            [(job.entity_type, job.kind, job.status) for job in jobs],
+            [('author', 'portrait', 'pending'), ('publisher', 'logo', 'pending'), ('book', 'cover', 'pending')]
+        )
+
+    def test_one_active_job_per_entity_and_kind(self):
+        """Test that repeated saves reuse the pending job."""
+        author = Author.objects.create(name="Czesław Miłosz")
+        author.bio = "Poeta"
+        author.save()
+        self.assertEqual(enqueue_image_job(author), ImageGenerationJob.objects.get())
+
+        ImageGenerationJob.objects.update(status='failed')
+        author.save()
+        self.assertEqual(ImageGenerationJob.objects.filter(status='pending').count(), 1)
+
+    def test_claim_is_exclusive(self):
+        """Test that a claimed job is not handed to a second worker."""
+        Author.objects.create(name="Zbigniew Herbert")
+        first = claim_jobs(5, worker='worker-1')
+        self.assertEqual(len(first), 1)
+        self.assertEqual(first[0].status, 'running')
+        self.assertEqual(first[0].attempts, 1)
+        self.assertEqual(claim_jobs(5, worker='worker-2'), [])
+
+    @patch('library.ai_signals.generate_with_flux', side_effect=fake_generate)
+    def test_worker_generates_and_stores_image(self, mock_generate):
+        """Test that the worker command generates images and updates the entity."""
+        author = Author.objects.create(name="Olga Tokarczuk")
+        out = StringIO()
+        call_command('process_image_jobs', '--once', stdout=out)
+
+        author.refresh_from_db()
+        # The generated file is moved into the content-addressed store
+        self.assertTrue(is_content_name(author.photo.name))
+        self.assertTrue(author.photo.name.startswith('authors/'))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_media_dir, author.photo.name)))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_media_dir, 'authors', f'{author.pk}_Olga_Tokarczuk.jpg')))
+        self.assertEqual(ImageGenerationJob.objects.get().status, 'succeeded')
+        self.assertIn('Processed 1 jobs (1 succeeded)', out.getvalue())
+
+        # The stored image does not queue another job
+        author.save()
+        self.assertEqual(ImageGenerationJob.objects.count(), 1)
+
+    def test_worker_submits_batches(self):
+        """Test that --batch-size sends the claimed jobs to the generator together."""
+        for name in ["Bolesław Prus", "Eliza Orzeszkowa", "Henryk Sienkiewicz"]:
+            Author.objects.create(name=name)
+        batches = []
+
+        def fake_batch(items):
+            batches.append(len(items))
+            return [fake_generate(item['prompt'], item['output_path']) for item in items]
+
+        with patch('library.ai_signals.generate_batch_with_flux', side_effect=fake_batch):
+            out = StringIO()
+            call_command('process_image_jobs', '--once', '--batch-size', '2', stdout=out)
+
+        self.assertEqual(batches, [2])
+        self.assertEqual(ImageGenerationJob.objects.filter(status='succeeded').count(), 3)
+        self.assertFalse(Author.objects.filter(photo='').exists())
+
+    @patch('library.ai_signals.generate_batch_with_flux', return_value=[True, False])
+    def test_batch_failures_are_per_job(self, mock_batch):
+        Author.objects.create(name="Adam Mickiewicz")
+        Author.objects.create(name="Juliusz Słowacki")
+        jobs = claim_jobs(2)
+        os.makedirs(os.path.join(self.temp_media_dir, 'authors'))
+        open(os.path.join(self.temp_media_dir, 'authors', f'{jobs[0].entity_id}_Adam_Mickiewicz.jpg'), 'wb').close()
+        self.assertEqual(run_jobs(jobs), ['succeeded', 'pending'])
+
+    @override_settings(IMAGE_JOB_RETRY_DELAY=10, IMAGE_JOB_MAX_ATTEMPTS=2)
+    @patch('library.ai_signals.generate_with_flux', return_value=False)
+    def test_failures_are_retried_with_backoff(self, mock_generate):
+        """Test that failed jobs are rescheduled and finally marked failed."""
+        Publisher.objects.create(name="Znak")
+        job = claim_jobs(1)[0]
+        self.assertEqual(run_job(job), 'pending')
+        job.refresh_from_db()
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+        self.assertEqual(claim_jobs(1), [])
+
+        ImageGenerationJob.objects.update(run_after=timezone.now())
+        job = claim_jobs(1)[0]
+        self.assertEqual(run_job(job), 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.last_error, 'Image generation failed')
+
+    def test_deleted_entity_is_skipped(self):
+        author = Author.objects.create(name="Anonim")
+        job = claim_jobs(1)[0]
+        author.delete()
+        self.assertEqual(run_job(job), 'skipped')
+
+    def test_stale_running_jobs_are_requeued(self):
+        Author.objects.create(name="Jan Kochanowski")
+        claim_jobs(1)
+        ImageGenerationJob.objects.update(started_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(requeue_stale_jobs(timedelta(hours=1)), 1)
+        self.assertEqual(ImageGenerationJob.objects.get().status, 'pending')
@@ -0,0 +1,108 @@
+"""
+Tests for the parallel image optimizer in the library application.
+Tests resizing, the content-hash manifest that skips unchanged files, dry runs
+and the process pool.
+"""
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from io import StringIO
+from PIL import Image
+import os
+import shutil
+import tempfile
+
+from library.models import Author, Book
+from library.image_optimizer import ImageManifest, optimize_library_images
+from library.storage import get_content_name, hash_chunks, hash_path, is_content_name
+
+
+class ImageOptimizerTests(TestCase):
+    """Tests for optimize_library_images."""
+
+    def setUp(self):
+        """Set up a temporary media directory with a few images."""
+        self.temp_media_dir = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.temp_media_dir)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.temp_media_dir)
+
+        self.book = Book.objects.create(title="Lalka")
+        self.author = Author.objects.create(name="Bolesław Prus")
+        self.cover_path = self.create_image('covers/lalka.jpg', (1024, 1536))
+        self.photo_path = self.create_image('authors/prus.png', (256, 256))
+        # Queryset updates, so no image generation jobs are involved
+        Book.objects.filter(pk=self.book.pk).update(cover='covers/lalka.jpg')
+        Author.objects.filter(pk=self.author.pk).update(photo='authors/prus.png')
+
+    def create_image(self, relative_path, size):
+        path = os.path.join(self.temp_media_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.effect_noise(size, 64).convert('RGB').save(path, quality=100)
+        return path
+
+    def test_resizes_and_skips_unchanged_files(self):
+        """Test that a second run skips files recorded in the manifest."""
+        original_size = os.path.getsize(self.cover_path)
+        report = optimize_library_images(workers=1)
+        self.assertEqual(report.processed, 2)
+        self.assertEqual(report.skipped, 0)
+        with Image.open(self.cover_path) as img:
+            self.assertEqual(img.size, (512, 768))
+        self.assertGreater(report.bytes_saved, 0)
+        self.assertLess(os.path.getsize(self.cover_path), original_size)
+
+        manifest = ImageManifest().load()
+        self.assertEqual(set(manifest.entries), {'covers/lalka.jpg', 'authors/prus.png'})
+
+        report = optimize_library_images(workers=1)
+        self.assertEqual((report.processed, report.skipped), (0, 2))
+
+        # A replaced file is optimized again
+        self.create_image('covers/lalka.jpg', (800, 1600))
+        report = optimize_library_images(workers=1)
+        self.assertEqual((report.processed, report.written, report.skipped), (1, 1, 1))
+
+    def test_dry_run_changes_nothing(self):
+        original_size = os.path.getsize(self.cover_path)
+        report = optimize_library_images(dry_run=True, workers=1)
+        # The oversized cover would be resized
+        self.assertGreaterEqual(report.written, 1)
+        self.assertEqual(os.path.getsize(self.cover_path), original_size)
+        self.assertFalse(os.path.exists(ImageManifest().path))
+
+    def test_process_pool_and_command(self):
+        """Test that the command fans out to worker processes and reports per worker."""
+        out = StringIO()
+        call_command('optimize_library_images', '--optimize', '--resize', '--workers', '2', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Worker ', output)
+        self.assertIn('of 2 images (0 unchanged skipped, 0 failed)', output)
+        with Image.open(self.cover_path) as img:
+            self.assertEqual(img.size, (512, 768))
+
+        out = StringIO()
+        call_command('optimize_library_images', '--optimize', '--resize', '--workers', '2', stdout=out)
+        self.assertIn('of 0 images (2 unchanged skipped', out.getvalue())
+
+    def test_content_addressed_image_gets_a_new_name(self):
+        """Test that a content-addressed cover is stored under its new hash, not rewritten."""
+        with open(self.cover_path, 'rb') as f:
+            digest = hash_chunks([f.read()])
+        old_name = get_content_name('covers', digest, '.jpg')
+        old_path = os.path.join(self.temp_media_dir, old_name)
+        os.makedirs(os.path.dirname(old_path))
+        shutil.copyfile(self.cover_path, old_path)
+        Book.objects.filter(pk=self.book.pk).update(cover=old_name)
+
+        optimize_library_images(entity_types=('book',), workers=1)
+
+        self.assertEqual(hash_path(old_path), digest)
+        new_name = Book.objects.get(pk=self.book.pk).cover.name
+        self.assertNotEqual(new_name, old_name)
+        self.assertTrue(is_content_name(new_name))
+        new_path = os.path.join(self.temp_media_dir, new_name)
+        self.assertEqual(new_name, get_content_name('covers', hash_path(new_path), '.jpg'))
+        with Image.open(new_path) as img:
+            self.assertEqual(img.size, (512, 768))
+        self.assertIn(new_name, ImageManifest().load().entries)
@@ -0,0 +1,124 @@
+"""
+Tests for the copy inventory in the library application.
+Tests the conditional copy updates, borrowing and returning through the
+service and the signals, and the benchmark_inventory command.
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+
+from library.inventory import apply_copy_edit, borrow_copy, checkout_copy, release_copy, return_copy
+from library.models import Author, Book, BookLoan, BookReservation, Publisher
+
+User = get_user_model()
+
+
+class InventoryTests(TestCase):
+    """Tests for library.inventory."""
+
+    def setUp(self):
+        self.book = Book.objects.create(title="Lalka", total_copies=2, available_copies=2)
+        self.users = [User.objects.create_user(email=f'reader{i}@example.com', password='pass') for i in range(3)]
+        self.due_date = timezone.now().date() + timedelta(days=14)
+
+    def available(self):
+        return Book.objects.get(pk=self.book.pk).available_copies
+
+    def test_conditional_updates(self):
+        self.assertTrue(checkout_copy(self.book.pk))
+        self.assertTrue(checkout_copy(self.book.pk))
+        self.assertFalse(checkout_copy(self.book.pk))
+        self.assertEqual(self.available(), 0)
+
+        self.assertTrue(release_copy(self.book.pk))
+        self.assertTrue(release_copy(self.book.pk))
+        self.assertFalse(release_copy(self.book.pk))
+        self.assertEqual(self.available(), 2)
+
+    def test_borrow_takes_one_copy(self):
+        """Test that the view path no longer decrements twice, and the last copy goes once."""
+        self.assertIsNotNone(borrow_copy(self.book, self.users[0], self.due_date))
+        self.assertEqual(self.available(), 1)
+        self.assertIsNotNone(borrow_copy(self.book, self.users[1], self.due_date))
+        self.assertIsNone(borrow_copy(self.book, self.users[2], self.due_date))
+        self.assertEqual(self.available(), 0)
+        self.assertEqual(BookLoan.objects.count(), 2)
+
+    def test_loans_created_elsewhere_take_a_copy(self):
+        BookLoan.objects.create(book=self.book, user=self.users[0], due_date=self.due_date)
+        self.assertEqual(self.available(), 1)
+
+    def test_return_releases_once(self):
+        loan = borrow_copy(self.book, self.users[0], self.due_date)
+
+        self.assertTrue(return_copy(loan))
+        self.assertFalse(return_copy(BookLoan.objects.get(pk=loan.pk)))
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(BookLoan.objects.get(pk=loan.pk).status, 'returned')
+
+    def test_returned_copy_goes_to_the_next_hold(self):
+        for user in self.users[:2]:
+            borrow_copy(self.book, user, self.due_date)
+        reservation = BookReservation.objects.create(book=self.book, user=self.users[2], expiry_date=self.due_date)
+
+        return_copy(BookLoan.objects.filter(user=self.users[0]).get())
+        # The copy is set aside for the reservation instead of going back on the shelf
+        self.assertEqual(self.available(), 0)
+        self.assertEqual(BookReservation.objects.get(pk=reservation.pk).status, 'fulfilled')
+        self.assertIsNone(borrow_copy(self.book, self.users[0], self.due_date))
+        self.assertIsNotNone(borrow_copy(self.book, self.users[2], self.due_date))
+        self.assertEqual(BookReservation.objects.get(pk=reservation.pk).status, 'collected')
+
+    def test_stale_save_keeps_the_count(self):
+        """Test that saving a Book loaded before a checkout does not put the copy back."""
+        stale = Book.objects.get(pk=self.book.pk)
+        borrow_copy(self.book, self.users[0], self.due_date)
+        stale.description = "Powieść"
+        stale.save()
+        self.assertEqual(self.available(), 1)
+
+    def test_copy_edit_is_applied_as_a_delta(self):
+        borrow_copy(self.book, self.users[0], self.due_date)
+        # A librarian adds a copy in a form loaded before the loan (2 total, 2 available)
+        Book.objects.filter(pk=self.book.pk).update(total_copies=3)
+        apply_copy_edit(self.book.pk, 2, 3, 2, 2)
+        self.assertEqual(self.available(), 2)
+
+        apply_copy_edit(self.book.pk, 3, 3, 2, 0)
+        self.assertEqual(self.available(), 0)
+
+    def test_stale_edit_form_keeps_the_loan(self):
+        """Test that posting a form rendered before a loan does not put the copy back."""
+        User.objects.create_user(email='librarian@example.com', password='pass', is_staff=True)
+        self.client.login(email='librarian@example.com', password='pass')
+        url = reverse('book_update', args=[self.book.pk])
+        form = self.client.get(url).context['form']
+        self.assertEqual(
+            (form['rendered_total_copies'].value(), form['rendered_available_copies'].value()), (2, 2)
+        )
+
+        borrow_copy(self.book, self.users[0], self.due_date)
+        # The librarian only changed the title
+        data = {
+            'title': "Lalka (wydanie II)", 'language': 'pl', 'genres': '[]',
+            'authors': [Author.objects.create(name="Bolesław Prus").pk],
+            'publisher': Publisher.objects.create(name="Gebethner i Wolff").pk,
+            'total_copies': 2, 'available_copies': 2,
+            'rendered_total_copies': 2, 'rendered_available_copies': 2,
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, "Lalka (wydanie II)")
+        self.assertEqual(self.available(), 1)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_inventory', '--threads', '1', '--iterations', '5', '--copies', '1', stdout=out)
+        output = out.getvalue()
+        self.assertIn('5 borrowed, 5 returned', output)
+        self.assertIn('All inventory invariants hold', output)
+        self.assertFalse(Book.objects.filter(title='Inventory benchmark').exists())
@@ -0,0 +1,97 @@
+"""
+Tests for the nightly late-fee accrual in the library application.
+Tests the SQL day and amount computation, the bulk upsert, the dry-run diff
+and the accrue_late_fees command.
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from library.instrumentation import QueryRecorder
+from library.late_fees import accrue_late_fees
+from library.models import Book, BookLoan, LateFee, LibrarySettings
+
+User = get_user_model()
+
+
+class LateFeeAccrualTests(TestCase):
+    """Tests for accrue_late_fees."""
+
+    def setUp(self):
+        """Set up new, stale, current, paid and returned loans as of today."""
+        self.today = timezone.now().date()
+        LibrarySettings.objects.create(pk=1, late_fee_daily_rate=Decimal('0.50'))
+        user = User.objects.create_user(email='reader@example.com', password='pass')
+        book = Book.objects.create(title="Lalka", total_copies=10, available_copies=10)
+
+        def loan(days_late, **fields):
+            return BookLoan.objects.create(book=book, user=user, due_date=self.today - timedelta(days=days_late),
+                                           **fields)
+
+        self.new = loan(3)
+        self.stale = loan(5)
+        self.current = loan(2)
+        self.paid = loan(4, late_fee_paid=True)
+        self.returned = loan(6, return_date=self.today - timedelta(days=1), status='returned')
+        self.not_due = loan(-2)
+
+        # As if no nightly run happened since the fees were last saved
+        BookLoan.objects.filter(pk=self.new.pk).update(status='borrowed')
+        LateFee.objects.filter(loan=self.new).delete()
+        LateFee.objects.filter(loan=self.stale).update(days_overdue=1, amount=Decimal('0.50'))
+        self.returned_fee = LateFee.objects.get(loan=self.returned).amount
+
+    def test_accrual(self):
+        with QueryRecorder() as recorder:
+            report = accrue_late_fees(self.today)
+        # Settings, annotated loan query and one upsert, plus the transaction
+        self.assertLessEqual(recorder.count, 5)
+
+        self.assertEqual(report.marked_overdue, 0)
+        self.assertEqual((report.created, report.updated, report.unchanged), (1, 1, 1))
+        # The overdue notification marks the loan once its notice was sent
+        self.assertEqual(BookLoan.objects.get(pk=self.new.pk).status, 'borrowed')
+        self.assertEqual(
+            dict(LateFee.objects.filter(loan__in=[self.new, self.stale, self.current])
+                 .values_list('loan_id', 'amount')),
+            {self.new.pk: Decimal('1.50'), self.stale.pk: Decimal('2.50'), self.current.pk: Decimal('1.00')}
+        )
+        self.assertEqual(LateFee.objects.get(loan=self.stale).days_overdue, 5)
+        self.assertEqual(LateFee.objects.get(loan=self.returned).amount, self.returned_fee)
+        self.assertFalse(LateFee.objects.filter(loan__in=[self.paid, self.not_due]).exists())
+
+        # A second run on the same day changes nothing
+        report = accrue_late_fees(self.today)
+        self.assertEqual((report.marked_overdue, len(report.changes), report.unchanged), (0, 0, 3))
+
+    def test_mark_overdue(self):
+        self.assertEqual(accrue_late_fees(self.today, dry_run=True, mark_overdue=True).marked_overdue, 1)
+        self.assertEqual(BookLoan.objects.get(pk=self.new.pk).status, 'borrowed')
+        self.assertEqual(accrue_late_fees(self.today, loan_ids=[self.new.pk], mark_overdue=True).marked_overdue, 1)
+        self.assertEqual(BookLoan.objects.get(pk=self.new.pk).status, 'overdue')
+
+    def test_dry_run_diff(self):
+        report = accrue_late_fees(self.today, dry_run=True)
+        changes = {change.loan_id: change for change in report.changes}
+        self.assertEqual((changes[self.stale.pk].old_amount, changes[self.stale.pk].new_amount),
+                         (Decimal('0.50'), Decimal('2.50')))
+        self.assertIsNone(changes[self.new.pk].old_amount)
+
+        self.assertEqual(BookLoan.objects.get(pk=self.new.pk).status, 'borrowed')
+        self.assertFalse(LateFee.objects.filter(loan=self.new).exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('accrue_late_fees', '--dry-run', stdout=out)
+        output = out.getvalue()
+        self.assertIn(f'Loan #{self.stale.pk} "Lalka" (reader@example.com): 1 -> 5 days, 0.50 -> 2.50 PLN', output)
+        self.assertIn('DRY RUN: Late fees would be 1 created, 1 updated, 1 unchanged', output)
+
+        out = StringIO()
+        call_command('accrue_late_fees', '--date', str(self.today + timedelta(days=1)), stdout=out)
+        self.assertIn('Late fees: 1 created, 2 updated, 0 unchanged', out.getvalue())
+        self.assertEqual(LateFee.objects.get(loan=self.new).amount, Decimal('2.00'))
@@ -0,0 +1,102 @@
+"""
+Tests for the media integrity scan in the library application.
+Tests the set comparison of files and image paths, the bulk regeneration queue
+and the verify_image_references command.
+"""
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from io import StringIO
+import os
+import shutil
+import tempfile
+
+from library.models import Author, Book, ImageGenerationJob, Publisher
+from library.instrumentation import QueryRecorder
+from library.media_scan import queue_regeneration, scan_media
+
+
+@override_settings(IMAGE_DERIVATIVES_EAGER=False)
+class MediaScanTests(TestCase):
+    """Tests for scan_media and queue_regeneration."""
+
+    def setUp(self):
+        """Set up a temporary media directory with intact, empty and orphaned files."""
+        self.temp_media_dir = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.temp_media_dir)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.temp_media_dir)
+
+        self.write_file('covers/ok.jpg', b'image')
+        self.write_file('covers/ab/empty.jpg', b'')
+        self.write_file('covers/orphan.jpg', b'image')
+        self.write_file('covers/.image_manifest.json', b'{}')
+        self.write_file('authors/ok.jpg', b'image')
+
+        # Queryset updates, so no image generation jobs are queued
+        self.intact = Book.objects.create(title="Lalka")
+        self.empty = Book.objects.create(title="Faraon")
+        self.missing = Book.objects.create(title="Emancypantki")
+        self.author = Author.objects.create(name="Bolesław Prus")
+        self.publisher = Publisher.objects.create(name="Gebethner i Wolff")
+        ImageGenerationJob.objects.all().delete()
+        Book.objects.filter(pk=self.intact.pk).update(cover='covers/ok.jpg')
+        Book.objects.filter(pk=self.empty.pk).update(cover='covers\\ab\\empty.jpg')
+        Book.objects.filter(pk=self.missing.pk).update(cover='covers/missing.jpg')
+        Author.objects.filter(pk=self.author.pk).update(photo='authors/ok.jpg')
+        Publisher.objects.filter(pk=self.publisher.pk).update(logo='publishers/missing.png')
+
+    def write_file(self, name, data):
+        path = os.path.join(self.temp_media_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_scan_media(self):
+        """Test that missing, zero-byte and orphaned files are found in one pass."""
+        with QueryRecorder() as recorder:
+            report = scan_media()
+        # One streamed query per model, none per row
+        self.assertEqual(recorder.count, 3)
+
+        self.assertEqual((report.files, report.references), (4, 5))
+        self.assertEqual(
+            sorted((r.entity_type, r.entity_id) for r in report.missing),
+            [('book', self.missing.pk), ('publisher', self.publisher.pk)]
+        )
+        self.assertEqual([(r.entity_id, r.name) for r in report.empty], [(self.empty.pk, 'covers/ab/empty.jpg')])
+        self.assertEqual(report.orphaned, ['covers/orphan.jpg'])
+
+        report = scan_media(['author'])
+        self.assertEqual((report.files, report.missing, report.empty, report.orphaned), (1, [], [], []))
+
+    def test_queue_regeneration(self):
+        report = scan_media()
+        ImageGenerationJob.objects.create(entity_type='book', entity_id=self.missing.pk, kind='cover')
+
+        self.assertEqual(queue_regeneration(report.broken), 2)
+        self.assertEqual(
+            sorted(ImageGenerationJob.objects.values_list('entity_type', 'entity_id', 'kind')),
+            sorted([('book', self.missing.pk, 'cover'), ('book', self.empty.pk, 'cover'),
+                    ('publisher', self.publisher.pk, 'logo')])
+        )
+        self.assertFalse(Book.objects.filter(pk__in=[self.missing.pk, self.empty.pk]).exclude(cover='').exists())
+        self.assertEqual(Book.objects.get(pk=self.intact.pk).cover.name, 'covers/ok.jpg')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('verify_image_references', '--list-orphans', '--dry-run', stdout=out)
+        output = out.getvalue()
+        self.assertIn('2 missing, 1 zero-byte, 1 orphaned', output)
+        self.assertIn('Orphaned file: covers/orphan.jpg', output)
+        self.assertEqual(ImageGenerationJob.objects.count(), 0)
+
+        out = StringIO()
+        call_command('verify_image_references', '--type', 'books', '--regenerate', stdout=out)
+        self.assertIn('Queued 2 images for regeneration', out.getvalue())
+        self.assertEqual(ImageGenerationJob.objects.count(), 2)
+
+        out = StringIO()
+        call_command('verify_image_references', '--fix', stdout=out)
+        self.assertIn('Fixed 1 broken image references', out.getvalue())
+        self.assertEqual(Publisher.objects.get().logo.name, '')
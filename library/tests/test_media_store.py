@@ -0,0 +1,127 @@
+"""
+Tests for the content-addressed media store in the library application.
+Tests deduplicated uploads, reference counting, garbage collection and the
+migration of an existing media tree.
+"""
+from django.test import TestCase, override_settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from datetime import timedelta
+from io import StringIO
+import os
+import shutil
+import tempfile
+import time
+
+from library.models import Author, Book
+from library.media_store import collect_garbage, count_references, get_store, migrate_media
+from library.storage import is_content_name
+
+
+@override_settings(IMAGE_DERIVATIVES_EAGER=False)
+class MediaStoreTests(TestCase):
+    """Tests for ContentAddressedStorage and library.media_store."""
+
+    def setUp(self):
+        """Set up a temporary media directory."""
+        self.temp_media_dir = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.temp_media_dir)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.temp_media_dir)
+        self.storage = get_store()
+
+    def write_file(self, name, data):
+        path = os.path.join(self.temp_media_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_identical_uploads_are_stored_once(self):
+        first = Book.objects.create(title="Solaris")
+        second = Book.objects.create(title="Eden")
+        first.cover.save('solaris.jpg', ContentFile(b'same cover'))
+        second.cover.save('eden.jpg', ContentFile(b'same cover'))
+
+        self.assertEqual(first.cover.name, second.cover.name)
+        self.assertTrue(is_content_name(first.cover.name))
+        self.assertTrue(first.cover.name.startswith('covers/'))
+        self.assertTrue(first.cover.name.endswith('.jpg'))
+        self.assertEqual(len(os.listdir(os.path.dirname(first.cover.path))), 1)
+
+        third = Book.objects.create(title="Fiasko")
+        third.cover.save('fiasko.jpg', ContentFile(b'other cover'))
+        self.assertNotEqual(third.cover.name, first.cover.name)
+
+    def test_other_directories_keep_their_names(self):
+        name = self.storage.save('reports/raport.csv', ContentFile(b'a,b'))
+        self.assertEqual(name, 'reports/raport.csv')
+
+    def test_delete_keeps_shared_files(self):
+        book = Book.objects.create(title="Solaris")
+        book.cover.save('solaris.jpg', ContentFile(b'cover'))
+        path = book.cover.path
+        book.cover.delete()
+        self.assertTrue(os.path.exists(path))
+
+    def test_count_references(self):
+        name = self.storage.save('covers/a.jpg', ContentFile(b'cover'))
+        Book.objects.create(title="Solaris", cover=name)
+        Book.objects.create(title="Eden", cover=name)
+        Author.objects.create(name="Stanisław Lem", photo='authors/lem.jpg')
+
+        references = count_references()
+        self.assertEqual(references[name], 2)
+        self.assertEqual(references['authors/lem.jpg'], 1)
+
+    def test_collect_garbage(self):
+        """Test that only old unreferenced files are collected."""
+        referenced = self.storage.save('covers/a.jpg', ContentFile(b'referenced'))
+        orphan = self.storage.save('covers/b.jpg', ContentFile(b'orphan'))
+        recent = self.storage.save('covers/c.jpg', ContentFile(b'recent'))
+        Book.objects.create(title="Solaris", cover=referenced)
+        for name in (referenced, orphan):
+            timestamp = time.time() - 7200
+            os.utime(self.storage.path(name), (timestamp, timestamp))
+
+        report = collect_garbage(timedelta(hours=1), dry_run=True)
+        self.assertEqual(report.deleted_names, [orphan])
+        self.assertTrue(self.storage.exists(orphan))
+
+        report = collect_garbage(timedelta(hours=1))
+        self.assertEqual((report.stored, report.referenced, report.recent, report.deleted), (3, 1, 1, 1))
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(referenced))
+        self.assertTrue(self.storage.exists(recent))
+
+    def test_migrate_media(self):
+        """Test that legacy files are deduplicated and the rows updated."""
+        self.write_file('covers/1_Solaris.jpg', b'fallback cover')
+        self.write_file('covers/2_Eden.jpg', b'fallback cover')
+        self.write_file('authors/lem.png', b'portrait')
+        Book.objects.create(title="Solaris", cover='covers/1_Solaris.jpg')
+        Book.objects.create(title="Eden", cover='covers/2_Eden.jpg')
+        Book.objects.create(title="Fiasko", cover='covers/missing.jpg')
+        author = Author.objects.create(name="Stanisław Lem", photo='authors/lem.png')
+
+        report = migrate_media(dry_run=True)
+        self.assertEqual((report.converted, report.duplicates, report.missing), (3, 1, 1))
+        self.assertTrue(Book.objects.filter(cover='covers/1_Solaris.jpg').exists())
+
+        out = StringIO()
+        call_command('migrate_media_store', stdout=out)
+        self.assertIn('Converted 3 files, 1 duplicates, 1 missing', out.getvalue())
+        self.assertIn('Missing file: covers/missing.jpg', out.getvalue())
+
+        covers = set(Book.objects.exclude(title="Fiasko").values_list('cover', flat=True))
+        self.assertEqual(len(covers), 1)
+        cover = covers.pop()
+        self.assertTrue(is_content_name(cover))
+        self.assertTrue(self.storage.exists(cover))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_media_dir, 'covers', '1_Solaris.jpg')))
+        author.refresh_from_db()
+        self.assertTrue(author.photo.name.startswith('authors/') and author.photo.name.endswith('.png'))
+
+        # A second run has nothing left to convert
+        self.assertEqual(migrate_media().converted, 0)
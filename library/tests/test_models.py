@@ -151,9 +151,8 @@ class BookModelTests(TestCase):
         """Test the is_available property."""
         self.assertTrue(self.book.is_available)
         
-        # Set available copies to 0
-        self.book.available_copies = 0
-        self.book.save()
+        # Set available copies to 0; Book.save() does not write the counter
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
         
         # Refresh from database
         self.book.refresh_from_db()
@@ -0,0 +1,186 @@
+"""
+Tests for the scheduled email notifications in the library application.
+Tests batched dispatch over one backend connection, the joined loan query,
+the per-patron daily digest and the send_notifications command.
+"""
+from django.test import TestCase, override_settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from library.instrumentation import QueryRecorder
+from library.late_fees import accrue_late_fees
+from library.models import Author, Book, BookLoan, BookReservation, LateFee
+from library.notifications import (
+    get_digest_items, send_daily_digest, send_due_date_reminder, send_overdue_notification
+)
+
+User = get_user_model()
+
+
+class CountingBackend(EmailBackend):
+    """Locmem backend that counts opened connections and send_messages calls."""
+    opened = 0
+    calls = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        CountingBackend.calls += 1
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='library.tests.test_notifications.CountingBackend')
+class BulkNotificationTests(TestCase):
+    """Tests for send_due_date_reminder and send_overdue_notification."""
+
+    def setUp(self):
+        """Set up five loans due in three days and two overdue loans."""
+        today = timezone.now().date()
+        author = Author.objects.create(name="Olga Tokarczuk")
+        self.loans = {'due': [], 'overdue': []}
+        for i in range(7):
+            user = User.objects.create_user(email=f'reader{i}@example.com', password='pass', first_name=f'Jan{i}')
+            book = Book.objects.create(title=f"Bieguni {i}", total_copies=1, available_copies=1)
+            book.authors.add(author)
+            kind = 'due' if i < 5 else 'overdue'
+            due_date = today + timedelta(days=3) if kind == 'due' else today - timedelta(days=2)
+            self.loans[kind].append(BookLoan.objects.create(book=book, user=user, due_date=due_date))
+        # As if the overdue loans were still borrowed yesterday
+        BookLoan.objects.update(status='borrowed')
+        LateFee.objects.all().delete()
+        mail.outbox = []
+        CountingBackend.opened = CountingBackend.calls = 0
+
+    def test_due_date_reminders_are_batched(self):
+        """Test that reminders share one connection and the query count does not grow per loan."""
+        with QueryRecorder() as recorder:
+            report = send_due_date_reminder(batch_size=2)
+
+        self.assertEqual((report.messages, report.sent, report.failed), (5, 5, 0))
+        self.assertEqual([batch.messages for batch in report.batches], [2, 2, 1])
+        self.assertEqual((CountingBackend.opened, CountingBackend.calls), (1, 3))
+        # The joined loan query and the author prefetch
+        self.assertEqual(recorder.count, 2)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'reader{i}@example.com' for i in range(5)])
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, 'Reminder: Book Due Soon')
+        self.assertIn('Olga Tokarczuk', message.alternatives[0][0])
+        self.assertNotIn('<p>', message.body)
+
+    def test_overdue_notifications_mark_loans(self):
+        report = send_overdue_notification()
+        self.assertEqual((report.messages, len(report.batches)), (2, 1))
+        self.assertEqual(
+            set(BookLoan.objects.filter(status='overdue').values_list('pk', flat=True)),
+            {loan.pk for loan in self.loans['overdue']}
+        )
+        self.assertEqual(
+            sorted(LateFee.objects.values_list('days_overdue', 'amount')),
+            [(2, Decimal('1.00')), (2, Decimal('1.00'))]
+        )
+        # Loans already marked overdue are not notified again
+        self.assertEqual(send_overdue_notification().messages, 0)
+
+    def test_nightly_accrual_does_not_skip_notices(self):
+        """Test that fees accrued before the notification run still leave the loans to notify."""
+        accrue_late_fees()
+        report = send_overdue_notification()
+        self.assertEqual((report.messages, report.sent), (2, 2))
+        self.assertEqual(BookLoan.objects.filter(status='overdue').count(), 2)
+
+    def test_failed_batch_loans_are_not_marked(self):
+        """Test that only the loans of sent batches are marked overdue."""
+        failing = self.loans['overdue'][0].user.email
+        original = CountingBackend.send_messages
+
+        def send_messages(backend, messages):
+            if any(failing in message.to for message in messages):
+                raise ConnectionError('connection reset')
+            return original(backend, messages)
+
+        with patch.object(CountingBackend, 'send_messages', send_messages):
+            report = send_overdue_notification(batch_size=1)
+        self.assertEqual((report.messages, report.sent, report.failed), (2, 1, 1))
+        self.assertEqual(
+            list(BookLoan.objects.filter(status='overdue').values_list('pk', flat=True)),
+            [self.loans['overdue'][1].pk]
+        )
+        # The loan of the failed batch is notified on the next run
+        self.assertEqual(send_overdue_notification().sent, 1)
+
+    def test_dry_run_sends_nothing(self):
+        report = send_overdue_notification(dry_run=True)
+        self.assertEqual((report.messages, report.sent), (2, 0))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(CountingBackend.opened, 0)
+        self.assertFalse(BookLoan.objects.filter(status='overdue').exists())
+
+    def test_command_reports_batches(self):
+        out = StringIO()
+        call_command('send_notifications', '--type', 'due', '--batch-size', '3', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Batch 1: 3/3 sent', output)
+        self.assertIn('Batch 2: 2/2 sent', output)
+        self.assertIn('Successfully sent 5 due date reminders', output)
+
+
+class DailyDigestTests(TestCase):
+    """Tests for send_daily_digest."""
+
+    def setUp(self):
+        """Set up a patron with three loans due soon, an overdue loan and a ready reservation."""
+        today = timezone.now().date()
+        self.reader = User.objects.create_user(email='reader@example.com', password='pass', first_name='Anna')
+        self.other = User.objects.create_user(email='other@example.com', password='pass', first_name='Piotr')
+        User.objects.create_user(email='idle@example.com', password='pass')
+        for i in range(3):
+            book = Book.objects.create(title=f"Lalka {i}", total_copies=1, available_copies=1)
+            BookLoan.objects.create(book=book, user=self.reader, due_date=today + timedelta(days=3))
+        book = Book.objects.create(title="Faraon", total_copies=1, available_copies=1)
+        BookLoan.objects.create(book=book, user=self.reader, due_date=today - timedelta(days=4))
+        book = Book.objects.create(title="Emancypantki", total_copies=1, available_copies=1)
+        BookReservation.objects.create(book=book, user=self.reader, expiry_date=today + timedelta(days=2))
+        book = Book.objects.create(title="Placówka", total_copies=1, available_copies=1)
+        BookLoan.objects.create(book=book, user=self.other, due_date=today - timedelta(days=2))
+        BookLoan.objects.filter(user=self.other).update(status='borrowed')
+        LateFee.objects.filter(loan__user=self.other).delete()
+        mail.outbox = []
+
+    def test_items_are_grouped_in_one_query(self):
+        with QueryRecorder() as recorder:
+            items = list(get_digest_items())
+        self.assertEqual(recorder.count, 1)
+        kinds = sorted(row[3] for row in items if row[0] == self.reader.pk)
+        self.assertEqual(kinds, ['due_soon'] * 3 + ['late_fee', 'overdue', 'reservation_ready'])
+
+    def test_one_email_per_patron(self):
+        report = send_daily_digest(batch_size=1)
+        self.assertEqual((report.messages, report.sent, len(report.batches)), (2, 2, 2))
+
+        messages = {message.to[0]: message for message in mail.outbox}
+        self.assertEqual(set(messages), {'reader@example.com', 'other@example.com'})
+        html = messages['reader@example.com'].alternatives[0][0]
+        for title in ("Lalka 0", "Lalka 2", "Faraon", "Emancypantki"):
+            self.assertIn(title, html)
+        self.assertIn('2,00 zł', html)
+
+        # The newly overdue loan was marked and its late fee is listed
+        self.assertEqual(BookLoan.objects.get(user=self.other).status, 'overdue')
+        self.assertIn('1,00 zł', messages['other@example.com'].alternatives[0][0])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('send_notifications', '--digest', '--dry-run', stdout=out)
+        self.assertIn('DRY RUN: Would send 2 daily digests', out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
@@ -0,0 +1,122 @@
+"""
+Tests for the transactional email outbox in the library application.
+Tests that signals only queue emails, the idempotency keys, delivery with
+retries and backoff, and the deliver_emails command.
+"""
+from django.test import TestCase, override_settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+
+from library.models import Book, BookLoan, BookReservation, EmailOutbox
+from library.outbox import claim_emails, deliver_emails, enqueue_email, requeue_stale_emails
+
+User = get_user_model()
+
+
+class FailingBackend(EmailBackend):
+    """Locmem backend that rejects every message."""
+
+    def send_messages(self, messages):
+        raise ConnectionError("Mail server unavailable")
+
+
+class EmailOutboxTests(TestCase):
+    """Tests for enqueue_email, claim_emails and deliver_emails."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='reader@example.com', password='pass')
+        self.book = Book.objects.create(title="Lalka", total_copies=2, available_copies=2)
+
+    def create_loan(self):
+        return BookLoan.objects.create(book=self.book, user=self.user,
+                                       due_date=timezone.now().date() + timedelta(days=14))
+
+    def test_borrowing_queues_email_without_sending(self):
+        loan = self.create_loan()
+        self.assertEqual(len(mail.outbox), 0)
+        entry = EmailOutbox.objects.get()
+        self.assertEqual((entry.kind, entry.object_id, entry.recipient, entry.status),
+                         ('loan_confirmation', loan.pk, 'reader@example.com', 'pending'))
+
+    def test_email_is_rolled_back_with_the_loan(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.create_loan()
+                raise RuntimeError
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_idempotency_key(self):
+        loan = self.create_loan()
+        self.assertFalse(enqueue_email('loan_confirmation', loan))
+        self.assertEqual(EmailOutbox.objects.filter(idempotency_key=f'loan_confirmation:{loan.pk}').count(), 1)
+
+    def test_delivery(self):
+        loan = self.create_loan()
+        BookReservation.objects.create(book=self.book, user=self.user,
+                                       expiry_date=timezone.now().date() + timedelta(days=7))
+
+        entries = claim_emails(10)
+        self.assertEqual(claim_emails(10), [])
+        self.assertEqual(deliver_emails(entries), ['sent'] * 3)
+
+        self.assertEqual(sorted(message.subject for message in mail.outbox), [
+            'Book Loan Confirmation', 'Book Reservation Confirmation', 'Your Reserved Book is Now Available'
+        ])
+        entry = EmailOutbox.objects.get(kind='loan_confirmation')
+        self.assertEqual((entry.status, entry.attempts), ('sent', 1))
+        self.assertIsNotNone(entry.sent_at)
+        message = next(message for message in mail.outbox if message.subject == 'Book Loan Confirmation')
+        self.assertTrue(message.extra_headers['Message-ID'].startswith(f'<outbox.{entry.pk}@'))
+        self.assertIn(loan.book.title, message.alternatives[0][0])
+
+    @override_settings(EMAIL_BACKEND='library.tests.test_outbox.FailingBackend', EMAIL_OUTBOX_RETRY_DELAY=10)
+    def test_retries_with_backoff(self):
+        self.create_loan()
+        entry = EmailOutbox.objects.get()
+
+        self.assertEqual(deliver_emails(claim_emails(10)), ['pending'])
+        entry.refresh_from_db()
+        self.assertIn('Mail server unavailable', entry.last_error)
+        self.assertAlmostEqual((entry.run_after - timezone.now()).total_seconds(), 10, delta=2)
+
+        # Not due again until the backoff has passed
+        self.assertEqual(claim_emails(10), [])
+        EmailOutbox.objects.update(run_after=timezone.now(), attempts=2)
+        deliver_emails(claim_emails(10))
+        entry.refresh_from_db()
+        self.assertAlmostEqual((entry.run_after - timezone.now()).total_seconds(), 40, delta=2)
+
+        EmailOutbox.objects.update(run_after=timezone.now(), attempts=entry.max_attempts - 1)
+        self.assertEqual(deliver_emails(claim_emails(10)), ['failed'])
+
+    def test_deleted_loan_is_skipped(self):
+        self.create_loan().delete()
+        self.assertEqual(deliver_emails(claim_emails(10)), ['skipped'])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_stale_emails_are_requeued(self):
+        self.create_loan()
+        claim_emails(10)
+        EmailOutbox.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_emails(timedelta(minutes=10)), 1)
+        self.assertEqual(EmailOutbox.objects.get().status, 'pending')
+
+    def test_command(self):
+        for i in range(3):
+            user = User.objects.create_user(email=f'reader{i}@example.com', password='pass')
+            BookLoan.objects.create(book=self.book, user=user, due_date=timezone.now().date() + timedelta(days=14))
+
+        out = StringIO()
+        call_command('deliver_emails', '--once', '--batch-size', '2', stdout=out)
+        self.assertIn('Processed 3 emails (3 sent)', out.getvalue())
+        self.assertEqual(len(mail.outbox), 3)
+
+        out = StringIO()
+        call_command('deliver_emails', '--once', stdout=out)
+        self.assertIn('Processed 0 emails (no emails)', out.getvalue())
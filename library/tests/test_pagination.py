@@ -0,0 +1,131 @@
+"""
+Tests for the listing pagination in the library application.
+Tests offset and keyset (cursor) pagination of books, authors and publishers.
+"""
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from unittest.mock import patch
+
+from library.models import Book, Author, Publisher
+from library.pagination import (
+    CursorPaginator, MAX_OFFSET_PAGES, decode_cursor, encode_cursor
+)
+
+
+class CursorPaginatorTests(TestCase):
+    """Tests for the CursorPaginator."""
+
+    def setUp(self):
+        """Set up test data."""
+        today = timezone.now().date()
+        # Duplicate titles and missing dates exercise the id tie-breaker and NULL handling
+        for i in range(30):
+            Book.objects.create(
+                title=f"Book {i % 7:02d}",
+                publication_date=None if i % 5 == 0 else today - timedelta(days=i % 9),
+            )
+
+    def walk(self, sort_field, per_page=4):
+        """Follow next cursors from the first page and return every row seen."""
+        paginator = CursorPaginator(Book.objects.all(), sort_field, per_page=per_page)
+        page = paginator.get_page()
+        seen = list(page)
+        while page.has_next():
+            page = paginator.get_page(cursor=page.next_cursor)
+            seen.extend(page)
+        return seen
+
+    def test_keyset_walk_matches_full_ordering(self):
+        """Test that walking with cursors visits every row once, in order."""
+        cases = {
+            'title': ['title', 'pk'],
+            '-title': ['-title', '-pk'],
+            'publication_date': ['publication_date', 'pk'],
+            '-publication_date': ['-publication_date', '-pk'],
+            None: ['pk'],
+        }
+        for sort_field, ordering in cases.items():
+            expected = list(Book.objects.order_by(*ordering))
+            if sort_field == '-publication_date':
+                # NULL dates come last in descending order
+                expected = [b for b in expected if b.publication_date] + [b for b in expected if not b.publication_date]
+            self.assertEqual(self.walk(sort_field), expected, sort_field)
+
+    def test_previous_cursor_returns_previous_page(self):
+        """Test that the previous cursor goes back to the same rows."""
+        paginator = CursorPaginator(Book.objects.all(), 'title', per_page=5)
+        first = paginator.get_page()
+        second = paginator.get_page(cursor=first.next_cursor)
+        third = paginator.get_page(cursor=second.next_cursor)
+
+        back = paginator.get_page(cursor=third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.is_keyset)
+
+    def test_offset_pages_are_capped(self):
+        """Test that deep page numbers are clamped to the offset limit."""
+        paginator = CursorPaginator(Book.objects.all(), 'title', per_page=1)
+        page = paginator.get_page(page=MAX_OFFSET_PAGES + 5)
+        self.assertEqual(page.number, MAX_OFFSET_PAGES)
+        self.assertTrue(page.next_uses_cursor)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        paginator = CursorPaginator(Book.objects.all(), 'title', per_page=5)
+        page = paginator.get_page(cursor='not-a-cursor')
+        self.assertEqual(page.number, 1)
+
+    def test_cursor_round_trip(self):
+        today = timezone.now().date()
+        self.assertEqual(decode_cursor(encode_cursor(today, 7, 'next')), (today.isoformat(), 7, 'next'))
+
+
+class ListingViewPaginationTests(TestCase):
+    """Tests for pagination in the listing views."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.client = Client()
+        flux_patcher = patch('library.ai_signals.generate_with_flux', return_value=False)
+        flux_patcher.start()
+        self.addCleanup(flux_patcher.stop)
+
+        for i in range(15):
+            author = Author.objects.create(name=f"Author {chr(65 + i)}")
+            publisher = Publisher.objects.create(name=f"Publisher {chr(65 + i)}")
+            for j in range(i % 4):
+                book = Book.objects.create(title=f"Book {i}-{j}", publisher=publisher)
+                book.authors.add(author)
+
+    def test_book_list_pages(self):
+        """Test that book_list returns one page and a working next cursor."""
+        response = self.client.get(reverse('book_list') + '?sort=title_asc')
+        self.assertEqual(len(response.context['books']), 12)
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 21)
+
+        response = self.client.get(reverse('book_list') + f'?sort=title_asc&cursor={page_obj.next_cursor}')
+        self.assertEqual(len(response.context['books']), 9)
+        self.assertFalse(response.context['page_obj'].has_next())
+
+    def test_author_list_sorted_by_book_count(self):
+        """Test that author_list sorts by number of books in SQL, across pages."""
+        response = self.client.get(reverse('author_list') + '?sort=books_desc')
+        page_obj = response.context['page_obj']
+        response = self.client.get(reverse('author_list') + f'?sort=books_desc&cursor={page_obj.next_cursor}')
+
+        authors = list(page_obj) + list(response.context['authors'])
+        self.assertEqual(len(authors), 15)
+        counts = [author.book_count for author in authors]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+    def test_publisher_list_per_page(self):
+        """Test that publisher_list honours per_page and ignores invalid values."""
+        response = self.client.get(reverse('publisher_list') + '?per_page=24')
+        self.assertEqual(len(response.context['publishers']), 15)
+
+        response = self.client.get(reverse('publisher_list') + '?per_page=abc&page=2')
+        self.assertEqual(len(response.context['publishers']), 3)
+        self.assertEqual(response.context['page_obj'].number, 2)
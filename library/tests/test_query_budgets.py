@@ -0,0 +1,108 @@
+"""
+Tests for the query instrumentation in the library application.
+Tests the query recorder, the middleware headers and the per-URL query budgets
+of the hot listing pages, so that N+1 regressions fail the test suite.
+"""
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from unittest.mock import patch
+
+from library.models import Book, Author, Publisher, BookLoan, BookReservation
+from library.instrumentation import (
+    QueryBudgetTestMixin, QueryRecorder, assert_query_budget, fingerprint_sql
+)
+
+User = get_user_model()
+
+
+class QueryRecorderTests(TestCase):
+    """Tests for the QueryRecorder and its helpers."""
+
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            fingerprint_sql("SELECT * FROM t WHERE id = 1 AND name = 'x' AND pk IN (%s, %s)"),
+            fingerprint_sql("SELECT *  FROM t WHERE id = 22 AND name = 'y' AND pk IN (%s)"),
+        )
+
+    def test_recorder_detects_duplicates(self):
+        """Test that repeated queries are reported as duplicates."""
+        books = [Book.objects.create(title=f"Book {i}") for i in range(3)]
+        with QueryRecorder() as recorder:
+            for book in books:
+                list(book.authors.all())
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.duplicate_count, 2)
+        self.assertEqual(recorder.duplicates[0][1], 3)
+
+    def test_assert_query_budget_fails_when_exceeded(self):
+        with self.assertRaisesMessage(AssertionError, 'Query budget of 1 exceeded'):
+            with assert_query_budget(1):
+                Book.objects.count()
+                Author.objects.count()
+
+    @override_settings(QUERY_INSTRUMENTATION_HEADERS=True)
+    def test_middleware_headers(self):
+        """Test that responses carry the query statistics headers."""
+        with self.assertLogs('library.queries', level='INFO') as logs:
+            response = self.client.get(reverse('author_list'))
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertIn('X-Query-Duplicates', response)
+        self.assertIn('X-Query-Time-Ms', response)
+        self.assertIn('"view": "author_list"', logs.output[0])
+
+    @override_settings(QUERY_INSTRUMENTATION=False, QUERY_INSTRUMENTATION_HEADERS=True)
+    def test_middleware_can_be_switched_off(self):
+        with patch('library.middleware.QueryRecorder') as recorder:
+            response = self.client.get(reverse('author_list'))
+        recorder.assert_not_called()
+        self.assertNotIn('X-Query-Count', response)
+
+
+class ViewQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Tests that the hot pages stay within their query budgets regardless of row count."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.client = Client()
+        flux_patcher = patch('library.ai_signals.generate_with_flux', return_value=False)
+        flux_patcher.start()
+        self.addCleanup(flux_patcher.stop)
+
+        self.user = User.objects.create_user(email='reader@example.com', password='pass')
+        today = timezone.now().date()
+        for i in range(12):
+            publisher = Publisher.objects.create(name=f"Publisher {i}")
+            book = Book.objects.create(
+                title=f"Book {i}", publisher=publisher, available_copies=5, total_copies=5
+            )
+            book.authors.add(Author.objects.create(name=f"Author {i}"), Author.objects.create(name=f"Co-author {i}"))
+            BookLoan.objects.create(
+                book=book, user=self.user, due_date=today + timedelta(days=14),
+                status='borrowed' if i % 2 else 'returned', return_date=None if i % 2 else today
+            )
+            BookReservation.objects.create(
+                book=book, user=self.user, expiry_date=timezone.now() + timedelta(days=3)
+            )
+        self.client.login(email='reader@example.com', password='pass')
+
+    def test_book_list_budget(self):
+        self.assertQueryBudget(reverse('book_list'), max_duplicates=0)
+
+    def test_author_list_budget(self):
+        self.assertQueryBudget(reverse('author_list'), max_duplicates=0)
+
+    def test_publisher_list_budget(self):
+        self.assertQueryBudget(reverse('publisher_list'), max_duplicates=0)
+
+    def test_my_loans_budget(self):
+        # Active and past loans each prefetch their authors once
+        self.assertQueryBudget(reverse('my_loans'), max_duplicates=1)
+
+    def test_my_reservations_budget(self):
+        self.assertQueryBudget(reverse('my_reservations'), max_duplicates=1)
+
+    def test_book_detail_budget(self):
+        self.assertQueryBudget(reverse('book_detail', args=[Book.objects.first().pk]), max_duplicates=0)
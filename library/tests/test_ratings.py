@@ -0,0 +1,83 @@
+"""
+Tests for the materialized book rating summaries in the library application.
+Tests incremental updates from Review changes and the bulk recompute command.
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from io import StringIO
+
+from library.models import Book, Review
+
+User = get_user_model()
+
+
+class RatingSummaryTests(TestCase):
+    """Tests for keeping Book rating summaries in sync with reviews."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.book = Book.objects.create(title="Lalka")
+        self.other_book = Book.objects.create(title="Faraon")
+        self.users = [
+            User.objects.create_user(email=f'reader{i}@example.com', password='pass') for i in range(3)
+        ]
+
+    def summary(self, book):
+        book = Book.objects.get(pk=book.pk)
+        return book.average_rating, book.review_count, book.rating_distribution
+
+    def test_summary_follows_review_lifecycle(self):
+        """Test create, moderation, edit, move and delete of reviews."""
+        first = Review.objects.create(book=self.book, user=self.users[0], rating=5, content="a", status='approved')
+        second = Review.objects.create(book=self.book, user=self.users[1], rating=2, content="b")
+        self.assertEqual(self.summary(self.book), (5.0, 1, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1}))
+
+        second.status = 'approved'
+        second.save()
+        self.assertEqual(self.summary(self.book), (3.5, 2, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}))
+
+        first.rating = 4
+        first.save()
+        self.assertEqual(self.summary(self.book), (3.0, 2, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0}))
+
+        second.book = self.other_book
+        second.save()
+        self.assertEqual(self.summary(self.book), (4.0, 1, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}))
+        self.assertEqual(self.summary(self.other_book), (2.0, 1, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}))
+
+        first.status = 'rejected'
+        first.save()
+        second.delete()
+        self.assertEqual(self.summary(self.book), (0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}))
+        self.assertEqual(self.summary(self.other_book)[1], 0)
+
+    def test_book_save_keeps_summary(self):
+        """Test that saving a book loaded before a review was added keeps the summary."""
+        stale = Book.objects.get(pk=self.book.pk)
+        Review.objects.create(book=self.book, user=self.users[0], rating=4, content="a", status='approved')
+        stale.available_copies = 3
+        stale.save()
+        self.assertEqual(self.summary(self.book)[1], 1)
+
+    def test_reading_ratings_costs_no_queries(self):
+        """Test that ratings of a page of books are rendered from the loaded rows."""
+        for user, rating in zip(self.users, [3, 4, 5]):
+            Review.objects.create(book=self.book, user=user, rating=rating, content="x", status='approved')
+
+        with self.assertNumQueries(1):
+            for book in Book.objects.all():
+                book.average_rating, book.review_count, book.rating_distribution
+
+    def test_recompute_command(self):
+        """Test that the recompute command repairs summaries after bulk status updates."""
+        for user in self.users:
+            Review.objects.create(book=self.book, user=user, rating=3, content="x")
+        Review.objects.update(status='approved')
+        self.assertEqual(self.summary(self.book)[1], 0)
+
+        out = StringIO()
+        call_command('recompute_rating_summaries', stdout=out)
+
+        self.assertEqual(self.summary(self.book), (3.0, 3, {1: 0, 2: 0, 3: 3, 4: 0, 5: 0}))
+        self.assertIn('Updated 1 of 2 books', out.getvalue())
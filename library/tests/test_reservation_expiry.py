@@ -0,0 +1,120 @@
+"""
+Tests for the reservation expiry sweeper in the library application.
+Tests that expired ready reservations pass their copies to the next holds or
+back to the shelf, that expired queued holds close their gaps, and the
+expire_reservations and send_notifications commands.
+"""
+from django.test import TestCase
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+
+from library.holds import get_hold_expiry
+from library.inventory import borrow_copy, return_copy
+from library.models import Book, BookLoan, BookReservation, LibrarySettings
+from library.reservation_expiry import expire_reservations
+
+User = get_user_model()
+
+
+class ReservationExpiryTests(TestCase):
+    """Tests for library.reservation_expiry."""
+
+    def setUp(self):
+        """Set up a book with two copies set aside for ready reservations and three holds in the queue."""
+        self.today = timezone.now().date()
+        self.book = Book.objects.create(title="Lalka", total_copies=2, available_copies=2)
+        self.reservations = {}
+        for name in ['ready1', 'ready2', 'queued1', 'queued2', 'queued3']:
+            user = User.objects.create_user(email=f'{name}@example.com', password='pass')
+            self.reservations[name] = BookReservation.objects.create(
+                book=self.book, user=user, expiry_date=self.today + timedelta(days=7)
+            )
+        self.yesterday = self.today - timedelta(days=1)
+
+    def expire(self, *names):
+        BookReservation.objects.filter(
+            pk__in=[self.reservations[name].pk for name in names]
+        ).update(expiry_date=self.yesterday)
+
+    def status(self, name):
+        reservation = BookReservation.objects.get(pk=self.reservations[name].pk)
+        return reservation.status, reservation.queue_position
+
+    def available(self):
+        return Book.objects.get(pk=self.book.pk).available_copies
+
+    def test_copies_go_to_the_next_holds(self):
+        self.expire('ready1', 'ready2', 'queued2')
+        self.assertEqual(self.available(), 0)
+
+        report = expire_reservations(batch_size=2)
+
+        self.assertEqual((report.expired_ready, report.expired_pending), (2, 1))
+        self.assertEqual((report.promoted, report.released, report.batches), (2, 0, 2))
+        self.assertEqual(self.status('ready1'), ('expired', None))
+        self.assertEqual(self.status('queued2'), ('expired', None))
+        self.assertEqual(self.status('queued1'), ('fulfilled', None))
+        self.assertEqual(self.status('queued3'), ('fulfilled', None))
+        self.assertEqual(self.available(), 0)
+
+    def test_copies_without_holds_go_back_on_the_shelf(self):
+        BookReservation.objects.filter(status='pending').update(status='cancelled', queue_position=None)
+        self.expire('ready1', 'ready2')
+
+        report = expire_reservations()
+
+        self.assertEqual((report.promoted, report.released), (0, 2))
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(expire_reservations().expired, 0)
+
+    def test_expired_holds_close_their_gaps(self):
+        self.expire('queued1')
+        expire_reservations()
+        self.assertEqual(self.status('queued2'), ('pending', 1))
+        self.assertEqual(self.status('queued3'), ('pending', 2))
+
+    def test_dry_run_changes_nothing(self):
+        self.expire('ready1', 'queued1')
+        report = expire_reservations(dry_run=True)
+        self.assertEqual((report.expired, report.promoted, report.released), (2, 1, 0))
+        self.assertEqual(self.status('ready1'), ('fulfilled', None))
+        self.assertEqual(self.status('queued1'), ('pending', 1))
+
+    def test_commands(self):
+        """Test that send_notifications releases the copies of expired ready reservations."""
+        BookReservation.objects.filter(status='pending').update(status='cancelled', queue_position=None)
+        self.expire('ready1')
+        out = StringIO()
+        call_command('expire_reservations', '--dry-run', stdout=out)
+        self.assertIn('Would expire 1 reservations (1 ready, 0 queued)', out.getvalue())
+
+        call_command('send_notifications', '--type', 'due', stdout=out)
+        self.assertIn('Successfully expired 1 reservations', out.getvalue())
+        self.assertEqual(self.status('ready1'), ('expired', None))
+        self.assertEqual(self.available(), 1)
+
+
+class QueuedHoldLifetimeTests(TestCase):
+    """Tests that a hold waiting in the queue is not expired by the pickup window."""
+
+    def test_queued_hold_outlives_the_pickup_window(self):
+        LibrarySettings.objects.create(pk=1, reservation_expiry_days=3, hold_lifetime_days=90)
+        today = timezone.now().date()
+        book = Book.objects.create(title="Lalka", total_copies=1, available_copies=1)
+        borrower = User.objects.create_user(email='borrower@example.com', password='pass')
+        reader = User.objects.create_user(email='reader@example.com', password='pass')
+        loan = borrow_copy(book, borrower, today + timedelta(days=14))
+        reservation = BookReservation.objects.create(book=book, user=reader, expiry_date=get_hold_expiry())
+        self.assertEqual(reservation.expiry_date, today + timedelta(days=90))
+
+        # Still waiting behind the 14-day loan long after the 3-day pickup window
+        self.assertEqual(expire_reservations(today + timedelta(days=10)).expired, 0)
+        self.assertEqual(BookReservation.objects.get(pk=reservation.pk).status, 'pending')
+
+        return_copy(BookLoan.objects.get(pk=loan.pk))
+        reservation.refresh_from_db()
+        self.assertEqual((reservation.status, reservation.expiry_date), ('fulfilled', today + timedelta(days=3)))
+        self.assertEqual(expire_reservations(today + timedelta(days=4)).expired_ready, 1)
@@ -0,0 +1,127 @@
+"""
+Tests for the full-text catalog search in the library application.
+Tests the SQLite FTS5 backend, incremental index updates and the book_list search.
+"""
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.core.management import call_command
+from unittest.mock import patch
+from io import StringIO
+
+from library.models import Book, Author, Publisher
+from library.search import (
+    SQLiteFTSBackend, get_search_backend, search_book_ids, search_books, tokenize_query
+)
+
+
+class SearchIndexTests(TestCase):
+    """Tests for keeping the search index in sync with the catalog."""
+
+    def setUp(self):
+        """Set up test data."""
+        # Keep the AI image signals from running for new authors and publishers
+        flux_patcher = patch('library.ai_signals.generate_with_flux', return_value=False)
+        flux_patcher.start()
+        self.addCleanup(flux_patcher.stop)
+
+        self.author = Author.objects.create(name="Andrzej Sapkowski")
+        self.publisher = Publisher.objects.create(name="SuperNowa")
+        self.book = Book.objects.create(
+            title="Ostatnie życzenie",
+            publisher=self.publisher,
+            description="Opowiadania o wiedźminie Geralcie.",
+            isbn="9788375780635"
+        )
+        self.book.authors.add(self.author)
+        self.other = Book.objects.create(title="Solaris", isbn="9788308049401")
+
+    def test_backend_is_fts5_on_sqlite(self):
+        self.assertIsInstance(get_search_backend(), SQLiteFTSBackend)
+
+    def test_search_by_title_author_publisher_description_isbn(self):
+        """Test that every indexed column is searchable."""
+        for query in ["życzenie", "Sapkowski", "SuperNowa", "wiedźminie", "9788375780635"]:
+            self.assertEqual(search_book_ids(query), [self.book.pk], query)
+
+    def test_search_prefix_and_diacritics(self):
+        """Test that partial words and queries without Polish characters match."""
+        self.assertEqual(search_book_ids("Sapk"), [self.book.pk])
+        self.assertEqual(search_book_ids("zyczenie"), [self.book.pk])
+
+    def test_search_ranks_title_matches_first(self):
+        """Test that a title match ranks above a description match."""
+        Book.objects.create(title="Kroniki", description="Zawiera słowo solaris w opisie.")
+        self.assertEqual(search_book_ids("solaris")[0], self.other.pk)
+
+    def test_index_follows_updates(self):
+        """Test that renames and deletions are reflected in the index."""
+        self.author.name = "Stanisław Lem"
+        self.author.save()
+        self.assertEqual(search_book_ids("Sapkowski"), [])
+        self.assertEqual(search_book_ids("Lem"), [self.book.pk])
+
+        self.other.authors.add(self.author)
+        self.assertEqual(sorted(search_book_ids("Lem")), sorted([self.book.pk, self.other.pk]))
+
+        self.publisher.delete()
+        self.assertEqual(search_book_ids("SuperNowa"), [])
+
+        book_id = self.other.pk
+        self.other.delete()
+        self.assertNotIn(book_id, search_book_ids("Lem"))
+
+    def test_search_syntax_is_not_interpreted(self):
+        """Test that FTS operators in user input are treated as plain words."""
+        self.assertEqual(tokenize_query('"Solaris" OR NEAR(*'), ['Solaris', 'OR', 'NEAR'])
+        self.assertEqual(search_book_ids('Solaris"*'), [self.other.pk])
+
+    def test_rebuild_search_index_command(self):
+        """Test that the rebuild command restores books written behind the signals' back."""
+        Book.objects.filter(pk=self.other.pk).update(title="Cyberiada")
+        self.assertEqual(search_book_ids("Cyberiada"), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+
+        self.assertEqual(search_book_ids("Cyberiada"), [self.other.pk])
+        self.assertIn('Indexed 2 books', out.getvalue())
+
+
+class BookListSearchTests(TestCase):
+    """Tests for the search box of the book_list view."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.client = Client()
+        Book.objects.create(title="Pan Tadeusz", available_copies=1)
+        Book.objects.create(title="Tadeusz i przyjaciele", description="Pan", available_copies=0)
+        Book.objects.create(title="Lalka", available_copies=1)
+
+    def test_book_list_view_search_ranked(self):
+        """Test that results are ordered by relevance."""
+        response = self.client.get(reverse('book_list') + '?q=Pan')
+        titles = [book.title for book in response.context['books']]
+        self.assertEqual(titles, ["Pan Tadeusz", "Tadeusz i przyjaciele"])
+
+    def test_book_list_view_search_with_filter(self):
+        """Test that search combines with other filters."""
+        response = self.client.get(reverse('book_list') + '?q=Tadeusz&availability=available')
+        self.assertEqual([book.title for book in response.context['books']], ["Pan Tadeusz"])
+
+    def test_search_books_is_not_capped(self):
+        """Test that every match is returned and ranked inside the database."""
+        Book.objects.bulk_create([Book(title=f"Tadeusz {i}") for i in range(30)])
+        call_command('rebuild_search_index', stdout=StringIO())
+        books = search_books(Book.objects.all(), "Tadeusz")
+        self.assertEqual(books.count(), 32)
+        self.assertEqual(search_books(Book.objects.all(), "Pan").first().title, "Pan Tadeusz")
+
+    def test_search_books_falls_back_without_index(self):
+        """Test that a missing index falls back to icontains matching."""
+        with patch.object(SQLiteFTSBackend, 'table', 'library_missing_fts'):
+            books = search_books(Book.objects.all(), "Lalka")
+            self.assertEqual([book.title for book in books], ["Lalka"])
+
+    def test_book_list_view_search_no_results(self):
+        response = self.client.get(reverse('book_list') + '?q=Quo+vadis')
+        self.assertEqual(len(response.context['books']), 0)
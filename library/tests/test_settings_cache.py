@@ -0,0 +1,55 @@
+"""
+Tests for the cached library settings in the library application.
+Tests the in-process memo, invalidation on save, uncommitted changes and
+version stamps published by other processes.
+"""
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from decimal import Decimal
+
+from library.instrumentation import QueryRecorder
+from library.models import LibrarySettings
+from library.settings_cache import VERSION_CACHE_KEY, get_library_settings
+
+
+@override_settings(LIBRARY_SETTINGS_VERSION_CHECK_INTERVAL=60)
+class SettingsCacheTests(TestCase):
+    """Tests for get_library_settings."""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            LibrarySettings.objects.create(pk=1, late_fee_daily_rate=Decimal('1.00'), max_books_per_user=1)
+
+    def test_settings_are_read_once(self):
+        self.assertEqual(get_library_settings().late_fee_daily_rate, Decimal('1.00'))
+        with QueryRecorder() as recorder:
+            for _ in range(10):
+                LibrarySettings.get_settings()
+        self.assertEqual(recorder.count, 0)
+
+    def test_save_invalidates(self):
+        get_library_settings()
+        library_settings = LibrarySettings.objects.get(pk=1)
+        library_settings.late_fee_daily_rate = Decimal('2.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            library_settings.save()
+        self.assertEqual(get_library_settings().late_fee_daily_rate, Decimal('2.00'))
+
+    def test_uncommitted_changes_are_not_cached(self):
+        get_library_settings()
+        LibrarySettings.objects.filter(pk=1).update(max_loan_days=30)
+        LibrarySettings.objects.get(pk=1).save()
+        # Read through while the change is uncommitted
+        with QueryRecorder() as recorder:
+            self.assertEqual(get_library_settings().max_loan_days, 30)
+            get_library_settings()
+        self.assertEqual(recorder.count, 2)
+
+    @override_settings(LIBRARY_SETTINGS_VERSION_CHECK_INTERVAL=0)
+    def test_version_stamp_from_another_process(self):
+        get_library_settings()
+        # Another process changed the row and published a new version stamp
+        LibrarySettings.objects.filter(pk=1).update(late_fee_daily_rate=Decimal('3.00'))
+        self.assertEqual(get_library_settings().late_fee_daily_rate, Decimal('1.00'))
+        cache.set(VERSION_CACHE_KEY, 'other-process')
+        self.assertEqual(get_library_settings().late_fee_daily_rate, Decimal('3.00'))
@@ -345,8 +345,9 @@ class AuthorListViewTests(TestCase):
         # Check that authors are in the context
         self.assertIn('authors', response.context)
         
-        # Check that we have all authors (15)
-        self.assertEqual(len(response.context['authors']), 15)
+        # Check that the first page holds 12 of all 15 authors
+        self.assertEqual(len(response.context['authors']), 12)
+        self.assertEqual(response.context['page_obj'].paginator.count, 15)
     
     def test_author_list_view_with_query(self):
         """Test that the author_list view filters by query."""
@@ -32,6 +32,7 @@ urlpatterns = [
     
     # Test images
     path('test-images/', views.test_images, name='test_images'),
+    path('images/<int:width>/<str:fmt>/<path:name>', views.image_derivative, name='image_derivative'),
     path('late-fees/<int:fee_id>/pay/', views.pay_late_fee, name='pay_late_fee'),
     path('late-fees/<int:fee_id>/request-waiver/', views.request_fee_waiver, name='request_fee_waiver'),
     
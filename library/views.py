@@ -3,15 +3,23 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Avg, Sum
+from django.db import transaction
+from django.db.models import F, Q, Avg, Sum
 from django.contrib import messages
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, Http404, HttpResponseRedirect
+from django.conf import settings as django_settings
 from datetime import timedelta
 from decimal import Decimal
 from .models import Book, Author, Publisher, BookLoan, BookReservation, Review, LateFee, LibrarySettings
 from .forms import ReviewForm, BookForm, AuthorForm, PublisherForm
+from .genres import filter_books_by_genre
+from .search import search_books
+from .pagination import CursorPaginator, get_per_page
+from .image_derivatives import get_derivative, get_formats, get_widths
+from .holds import get_hold_expiry
+from .inventory import apply_copy_edit, borrow_copy, cancel_hold, return_copy
 
 def home(request):
     featured_books = Book.objects.all().order_by('-id')[:6]  # Get the latest books
@@ -39,34 +47,17 @@ def book_list(request):
     language = request.GET.get('language', '')
     sort = request.GET.get('sort', '')
     
-    # Start with all books
-    books = Book.objects.all()
+    # Start with all books, loading the publisher and authors shown on each card
+    books = Book.objects.select_related('publisher').prefetch_related('authors')
     
     # Apply filters if provided
     if query:
-        books = books.filter(
-            Q(title__icontains=query) | 
-            Q(authors__name__icontains=query) | 
-            Q(isbn__icontains=query)
-        ).distinct()
+        # Full-text search, ordered by relevance unless another sort is chosen
+        books = search_books(books, query)
     
-    # Handle genre filtering differently since JSONField contains lookup isn't supported in SQLite
+    # Genre filtering goes through the indexed BookGenre table
     if genre:
-        # Filter books that have the genre in their genres field
-        # This is a workaround since we can't use the contains lookup
-        filtered_books = []
-        for book in books:
-            if book.genres:
-                # Check if genres is a list or a string
-                if isinstance(book.genres, list) and genre in book.genres:
-                    filtered_books.append(book.id)
-                # If genres is a string, check if it contains the genre
-                elif isinstance(book.genres, str) and genre in book.genres.split(','):
-                    filtered_books.append(book.id)
-                # If genres is a dict, check if genre is a key
-                elif isinstance(book.genres, dict) and genre in book.genres:
-                    filtered_books.append(book.id)
-        books = books.filter(id__in=filtered_books)
+        books = filter_books_by_genre(books, genre)
     
     if author_id:
         books = books.filter(authors__id=author_id)
@@ -122,20 +113,21 @@ def book_list(request):
     # Create genre choices for the template
     genre_choices = [(key, value) for key, value in genre_translations.items()]
     
-    # Apply sorting
-    if sort == 'title_asc':
-        books = books.order_by('title')
-    elif sort == 'title_desc':
-        books = books.order_by('-title')
-    elif sort == 'date_asc':
-        books = books.order_by('publication_date')
-    elif sort == 'date_desc':
-        books = books.order_by('-publication_date')
-    
-    # Use the translated genre choices created earlier
+    # Apply sorting; without an explicit sort, search results stay ranked by relevance
+    sort_fields = {
+        'title_asc': 'title',
+        'title_desc': '-title',
+        'date_asc': 'publication_date',
+        'date_desc': '-publication_date',
+    }
+    paginator = CursorPaginator(books, sort_fields.get(sort), per_page=get_per_page(request))
+    page_obj = paginator.get_page(request.GET.get('page'), request.GET.get('cursor'))
     
     context = {
-        'books': books,
+        'books': page_obj.object_list,
+        'page_obj': page_obj,
+        'paginator': paginator,
+        'is_paginated': page_obj.has_other_pages(),
         'title': 'Wszystkie książki',
         'query': query,
         'genre': genre,
@@ -180,7 +172,7 @@ def author_list(request):
     query = request.GET.get('q', '')
     letter = request.GET.get('letter', '')
     sort_by = request.GET.get('sort', 'name_asc')
-    per_page = int(request.GET.get('per_page', 12))
+    per_page = get_per_page(request)
     
     # Start with all authors
     authors = Author.objects.all()
@@ -193,17 +185,20 @@ def author_list(request):
         authors = authors.filter(name__istartswith=letter)
     
     # Apply sorting
-    if sort_by == 'name_asc':
-        authors = authors.order_by('name')
-    elif sort_by == 'name_desc':
-        authors = authors.order_by('-name')
-    elif sort_by == 'books_asc':
-        authors = sorted(authors, key=lambda a: a.books.count())
-    elif sort_by == 'books_desc':
-        authors = sorted(authors, key=lambda a: -a.books.count())
+    sort_fields = {
+        'name_asc': 'name',
+        'name_desc': '-name',
+        'books_asc': 'book_count',
+        'books_desc': '-book_count',
+    }
+    paginator = CursorPaginator(authors, sort_fields.get(sort_by, 'name'), per_page=per_page)
+    page_obj = paginator.get_page(request.GET.get('page'), request.GET.get('cursor'))
     
     context = {
-        'authors': authors,
+        'authors': page_obj.object_list,
+        'page_obj': page_obj,
+        'paginator': paginator,
+        'is_paginated': page_obj.has_other_pages(),
         'title': 'All Authors',
         'query': query,
         'current_letter': letter,
@@ -226,7 +221,7 @@ def publisher_list(request):
     query = request.GET.get('q', '')
     letter = request.GET.get('letter', '')
     sort_by = request.GET.get('sort', 'name_asc')
-    per_page = int(request.GET.get('per_page', 12))
+    per_page = get_per_page(request)
     
     # Start with all publishers
     publishers = Publisher.objects.all()
@@ -239,20 +234,23 @@ def publisher_list(request):
         publishers = publishers.filter(name__istartswith=letter)
     
     # Apply sorting
-    if sort_by == 'name_asc':
-        publishers = publishers.order_by('name')
-    elif sort_by == 'name_desc':
-        publishers = publishers.order_by('-name')
-    elif sort_by == 'books_asc':
-        publishers = sorted(publishers, key=lambda p: p.books.count())
-    elif sort_by == 'books_desc':
-        publishers = sorted(publishers, key=lambda p: -p.books.count())
+    sort_fields = {
+        'name_asc': 'name',
+        'name_desc': '-name',
+        'books_asc': 'book_count',
+        'books_desc': '-book_count',
+    }
+    paginator = CursorPaginator(publishers, sort_fields.get(sort_by, 'name'), per_page=per_page)
+    page_obj = paginator.get_page(request.GET.get('page'), request.GET.get('cursor'))
     
     # Add some featured publishers for the bottom section
-    featured_publishers = Publisher.objects.all().order_by('?')[:4] if publishers.exists() else []
+    featured_publishers = Publisher.objects.all().order_by('?')[:4] if page_obj.object_list else []
     
     context = {
-        'publishers': publishers,
+        'publishers': page_obj.object_list,
+        'page_obj': page_obj,
+        'paginator': paginator,
+        'is_paginated': page_obj.has_other_pages(),
         'title': 'All Publishers',
         'query': query,
         'current_letter': letter,
@@ -282,11 +280,13 @@ def publisher_detail(request, pk):
 
 
 @login_required
+@transaction.atomic
 def borrow_book(request, pk):
     book = get_object_or_404(Book, pk=pk)
     
-    # Check if book is available
-    if book.available_copies <= 0:
+    # Check if book is available, or a copy is set aside for the user's reservation
+    has_ready_hold = BookReservation.objects.filter(book=book, user=request.user, status='fulfilled').exists()
+    if book.available_copies <= 0 and not has_ready_hold:
         messages.error(request, f'Przepraszamy, książka "{book.title}" jest obecnie niedostępna.')
         return redirect('library:book_detail', pk=book.pk)
     
@@ -307,29 +307,24 @@ def borrow_book(request, pk):
         status__in=['borrowed', 'overdue']
     ).count()
     
-    # Default limit is 5 books, can be customized based on user role
-    if active_loans_count >= 5:  # This could be user.profile.book_limit if implemented
+    loan_settings = LibrarySettings.get_settings()
+    if active_loans_count >= loan_settings.max_books_per_user:
         messages.error(request, 'Osiągnąłeś limit wypożyczeń. Zwróć niektóre książki, aby wypożyczyć więcej.')
         return redirect('library:book_detail', pk=book.pk)
     
-    # Create new loan
-    due_date = timezone.now().date() + timedelta(days=14)  # 2 weeks loan period
-    loan = BookLoan.objects.create(
-        book=book,
-        user=request.user,
-        due_date=due_date,
-        status='borrowed'
-    )
-    
-    # Update book availability
-    book.available_copies -= 1
-    book.save()
+    # Take a copy and create the loan; another request may have taken the last copy
+    due_date = timezone.now().date() + timedelta(days=loan_settings.max_loan_days)
+    loan = borrow_copy(book, request.user, due_date)
+    if loan is None:
+        messages.error(request, f'Przepraszamy, książka "{book.title}" jest obecnie niedostępna.')
+        return redirect('library:book_detail', pk=book.pk)
     
     messages.success(request, f'Pomyślnie wypożyczono "{book.title}". Termin zwrotu: {due_date}.')
     return redirect('library:my_loans')
 
 
 @login_required
+@transaction.atomic
 def return_book(request, loan_id):
     loan = get_object_or_404(BookLoan, id=loan_id, user=request.user)
     
@@ -337,31 +332,19 @@ def return_book(request, loan_id):
         messages.warning(request, 'Ta książka została już zwrócona lub oznaczona jako zgubiona.')
         return redirect('library:my_loans')
     
-    # Update loan status
-    loan.status = 'returned'
-    loan.return_date = timezone.now().date()
-    loan.save()
-    
-    # Update book availability
-    book = loan.book
-    book.available_copies += 1
-    book.save()
-    
-    messages.success(request, f'Pomyślnie zwrócono "{book.title}".')
-    
-    # Check if there are pending reservations for this book
-    pending_reservation = BookReservation.objects.filter(
-        book=book,
-        status='pending'
-    ).order_by('reservation_date').first()
+    # Update loan status and book availability; a concurrent return wins only once
+    if not return_copy(loan):
+        messages.warning(request, 'Ta książka została już zwrócona lub oznaczona jako zgubiona.')
+        return redirect('library:my_loans')
     
-    if pending_reservation:
-        messages.info(request, f'Książka ma oczekującą rezerwację od {pending_reservation.user.username}.')
+    # return_copy has already handed the copy to the next hold in the queue, if any
+    messages.success(request, f'Pomyślnie zwrócono "{loan.book.title}".')
     
     return redirect('library:my_loans')
 
 
 @login_required
+@transaction.atomic
 def reserve_book(request, pk):
     book = get_object_or_404(Book, pk=pk)
     
@@ -387,16 +370,16 @@ def reserve_book(request, pk):
         messages.warning(request, f'Już wypożyczyłeś tę książkę. Termin zwrotu: {existing_loan.due_date}.')
         return redirect('library:book_detail', pk=book.pk)
     
-    # Create new reservation (valid for 7 days)
-    expiry_date = timezone.now().date() + timedelta(days=7)
+    # Create new reservation; it waits in the queue for up to hold_lifetime_days, and the
+    # pickup deadline of reservation_expiry_days starts once a copy is set aside for it
     reservation = BookReservation.objects.create(
         book=book,
         user=request.user,
-        expiry_date=expiry_date,
+        expiry_date=get_hold_expiry(),
         status='pending'
     )
     
-    messages.success(request, f'Pomyślnie zarezerwowano "{book.title}". Rezerwacja ważna do: {expiry_date}.')
+    messages.success(request, f'Pomyślnie zarezerwowano "{book.title}". Rezerwacja ważna do: {reservation.expiry_date}.')
     return redirect('library:my_reservations')
 
 
@@ -404,14 +387,11 @@ def reserve_book(request, pk):
 def cancel_reservation(request, reservation_id):
     reservation = get_object_or_404(BookReservation, id=reservation_id, user=request.user)
     
-    if reservation.status != 'pending':
+    # A ready reservation's copy goes to the next patron in line
+    if not cancel_hold(reservation):
         messages.warning(request, 'Ta rezerwacja została już zrealizowana, anulowana lub wygasła.')
         return redirect('library:my_reservations')
     
-    # Update reservation status
-    reservation.status = 'cancelled'
-    reservation.save()
-    
     messages.success(request, f'Pomyślnie anulowano rezerwację książki "{reservation.book.title}".')
     return redirect('library:my_reservations')
 
@@ -419,14 +399,13 @@ def cancel_reservation(request, reservation_id):
 @login_required
 def my_loans(request):
     # Get active loans
-    active_loans = BookLoan.objects.filter(
-        user=request.user,
+    loans = BookLoan.objects.filter(user=request.user).select_related('book').prefetch_related('book__authors')
+    active_loans = loans.filter(
         status__in=['borrowed', 'overdue']
     ).order_by('due_date')
     
     # Get past loans
-    past_loans = BookLoan.objects.filter(
-        user=request.user,
+    past_loans = loans.filter(
         status='returned'
     ).order_by('-return_date')
     
@@ -441,7 +420,9 @@ def my_loans(request):
 @login_required
 def my_reservations(request):
     # Get all reservations for the current user
-    reservations = BookReservation.objects.filter(user=request.user)
+    reservations = BookReservation.objects.filter(user=request.user).select_related('book').prefetch_related(
+        'book__authors'
+    )
     
     # Filter by status if requested
     status_filter = request.GET.get('status', '')
@@ -453,6 +434,10 @@ def my_reservations(request):
     fulfilled_reservations = reservations.filter(status='fulfilled')
     cancelled_reservations = reservations.filter(status='cancelled')
     expired_reservations = reservations.filter(status='expired')
+    # Ready for pickup first, then the holds by queue position stored on each row
+    active_reservations = reservations.filter(status__in=['fulfilled', 'pending']).order_by(
+        F('queue_position').asc(nulls_first=True), 'expiry_date'
+    )
     
     context = {
         'reservations': reservations,
@@ -460,6 +445,9 @@ def my_reservations(request):
         'fulfilled_reservations': fulfilled_reservations,
         'cancelled_reservations': cancelled_reservations,
         'expired_reservations': expired_reservations,
+        # Tabs rendered by my_reservations.html
+        'active_reservations': active_reservations,
+        'past_reservations': reservations.exclude(status__in=['pending', 'fulfilled']),
         'status_filter': status_filter,
     }
     return render(request, 'books/my_reservations.html', context)
@@ -671,7 +659,8 @@ def process_waiver_request(request, fee_id):
 @user_passes_test(is_staff)
 def library_settings(request):
     """Admin view to manage library settings."""
-    settings = LibrarySettings.get_settings()
+    # A fresh instance, as get_settings() returns the shared cached one
+    settings, created = LibrarySettings.objects.get_or_create(pk=1)
     
     if request.method == 'POST':
         # Update settings
@@ -681,6 +670,7 @@ def library_settings(request):
             settings.max_renewals = int(request.POST.get('max_renewals', '2'))
             settings.max_books_per_user = int(request.POST.get('max_books_per_user', '5'))
             settings.reservation_expiry_days = int(request.POST.get('reservation_expiry_days', '3'))
+            settings.hold_lifetime_days = int(request.POST.get('hold_lifetime_days', '90'))
             settings.save()
             
             messages.success(request, _('Library settings updated successfully.'))
@@ -695,6 +685,22 @@ def test_images(request):
     return render(request, 'books/test_images.html')
 
 
+def image_derivative(request, width, fmt, name):
+    """
+    Generate a resized image variant on its first request and redirect to the cached file.
+    Later page renders link the cached file directly.
+    """
+    if width not in get_widths() or fmt not in get_formats():
+        raise Http404("Nieobsługiwany wariant obrazu")
+    try:
+        derivative_name = get_derivative(name, width, fmt)
+    except (ValueError, OSError):
+        raise Http404("Nie znaleziono obrazu")
+    if derivative_name is None:
+        raise Http404("Nie znaleziono obrazu")
+    return HttpResponseRedirect(django_settings.MEDIA_URL + derivative_name)
+
+
 # Library Information Pages
 
 def about(request):
@@ -890,7 +896,11 @@ def book_update(request, pk):
     if request.method == 'POST':
         form = BookForm(request.POST, request.FILES, instance=book)
         if form.is_valid():
+            initial_total, initial_available = form.get_rendered_counts()
             book = form.save()
+            apply_copy_edit(
+                book.pk, initial_total, book.total_copies, initial_available, form.cleaned_data['available_copies']
+            )
             messages.success(request, f'Książka "{book.title}" została zaktualizowana pomyślnie.')
             return redirect('book_detail', pk=book.pk)
     else:
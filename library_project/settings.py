@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -60,6 +61,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'library.middleware.QueryCountMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',  # Re-enabled CSRF middleware
@@ -139,6 +141,15 @@ LOGOUT_REDIRECT_URL = '/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Images are stored by content hash (library/storage.py), so identical files are kept once.
+# Convert an existing media tree with `manage.py migrate_media_store` and remove
+# unreferenced files with `manage.py collect_media_garbage`.
+STORAGES = {
+    'default': {'BACKEND': 'library.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+MEDIA_STORE_DIRECTORIES = ('covers', 'authors', 'publishers', 'profile_pics')
+
 
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -148,6 +159,77 @@ EMAIL_USE_TLS = False
 EMAIL_HOST_USER = ''
 EMAIL_HOST_PASSWORD = ''
 DEFAULT_FROM_EMAIL = 'biblioteka@example.com'
+NOTIFICATION_BATCH_SIZE = 100  # emails handed to one backend connection at a time
+
+# Loan and reservation emails are queued in the outbox and sent by deliver_emails
+EMAIL_OUTBOX_CONCURRENCY = 1
+EMAIL_OUTBOX_BATCH_SIZE = 50  # emails sent over one connection by each worker thread
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30  # seconds, doubled after each failed attempt
+
+# LibrarySettings are cached per process. Changes publish a version stamp in the
+# default cache; use a shared backend (Redis, Memcached) for instant invalidation
+# across worker processes, otherwise they reload after the timeout.
+LIBRARY_SETTINGS_CACHE_TIMEOUT = 300  # seconds
+LIBRARY_SETTINGS_VERSION_CHECK_INTERVAL = 1.0  # seconds between version stamp checks
+
+
+# Catalog search
+# Dotted path to a library.search backend class. When None, the backend is picked
+# from the database engine (SQLite FTS5 or PostgreSQL tsvector).
+LIBRARY_SEARCH_BACKEND = None
+
+# AI image generation queue
+# Model signals queue ImageGenerationJob rows; run `manage.py process_image_jobs` to generate them.
+IMAGE_JOB_CONCURRENCY = 1
+IMAGE_JOB_BATCH_SIZE = 1  # jobs sent to the Flux server as one batch
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_RETRY_DELAY = 60  # seconds, doubled after each failed attempt
+# Warm Flux server (library/ai_utils/flux_server.py), e.g. "unix:///tmp/flux.sock" or
+# "http://127.0.0.1:8765". When unset, every image starts its own flux_wrapper.py process.
+FLUX_SERVER_URL = os.environ.get('FLUX_SERVER_URL') or None
+FLUX_SERVER_TIMEOUT = 300  # seconds to wait for one image
+
+# Responsive image derivatives (library/image_derivatives.py)
+# Resized AVIF/WebP/JPEG variants of uploaded images, cached under MEDIA_ROOT/derivatives.
+IMAGE_DERIVATIVE_WIDTHS = (80, 160, 320, 640)
+IMAGE_DERIVATIVE_FORMATS = ('avif', 'webp', 'jpeg')  # formats missing from Pillow are skipped
+IMAGE_DERIVATIVES_EAGER = False  # True generates on upload; by default the first request does
+
+# Query instrumentation
+# QueryCountMiddleware records query count, duplicate queries and DB time per request.
+# Budgets are keyed by URL name; exceeding one logs a warning and fails the budget tests.
+# Off unless DEBUG; set QUERY_INSTRUMENTATION = True to record in production too.
+QUERY_INSTRUMENTATION = DEBUG
+QUERY_INSTRUMENTATION_HEADERS = DEBUG
+QUERY_BUDGETS = {
+    'book_list': 8,
+    'author_list': 9,
+    'publisher_list': 8,
+    'my_loans': 9,
+    'my_reservations': 10,
+    'book_detail': 8,
+}
+
+# Logging
+# The per-request query statistics go to the console, every request under DEBUG
+# and only the requests over budget otherwise.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'library.queries': {
+            'handlers': ['console'],
+            'level': 'INFO' if DEBUG else 'WARNING',
+            'propagate': False,
+        },
+    },
+}
 
 
 # Internationalization
@@ -0,0 +1,226 @@
+"""
+Streaming exports of reports.
+Exports are not built from report.results in memory. The loan history and
+overdue books reports export the rows stored by their last run, so the file
+shows the same loans as the report page; a report that was not run yet reads
+its rows with a server-side .iterator() over the current loans instead. Other
+reports export the stored results as key/value rows.
+CSV and NDJSON are streamed to the client with StreamingHttpResponse while the
+same bytes are written to a temporary file, and XLSX is written with
+xlsxwriter's constant_memory mode, so memory use does not grow with the size of
+the report. The finished file is saved to ReportExport.file for re-download.
+"""
+import csv
+import io
+import json
+import tempfile
+from collections import namedtuple
+from decimal import Decimal
+
+import xlsxwriter
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from library.models import BookLoan, LibrarySettings
+
+from .models import ReportExport
+
+# Rows fetched per round trip of the database cursor
+EXPORT_CHUNK_SIZE = 2000
+# Bytes of CSV or NDJSON collected before a chunk is sent to the client
+STREAM_BUFFER_SIZE = 64 * 1024
+
+ExportFormat = namedtuple('ExportFormat', ['extension', 'content_type'])
+
+EXPORT_FORMATS = {
+    'csv': ExportFormat('csv', 'text/csv'),
+    'excel': ExportFormat('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'json': ExportFormat('ndjson', 'application/x-ndjson'),
+}
+
+LOAN_HISTORY_COLUMNS = [
+    ('id', 'ID'), ('book_title', 'Book Title'), ('user_email', 'User Email'), ('loan_date', 'Loan Date'),
+    ('due_date', 'Due Date'), ('return_date', 'Return Date'), ('status', 'Status'),
+]
+OVERDUE_BOOKS_COLUMNS = [
+    ('id', 'ID'), ('book_title', 'Book Title'), ('user_email', 'User Email'), ('due_date', 'Due Date'),
+    ('days_overdue', 'Days Overdue'), ('late_fee', 'Late Fee'),
+]
+RESULT_COLUMNS = [('key', 'Key'), ('value', 'Value')]
+
+
+# Keys of the loan rows stored by Report.generate_loan_history_report
+LOAN_HISTORY_FIELDS = ['id', 'book__title', 'user__email', 'loan_date', 'due_date', 'return_date', 'status']
+
+
+def get_loan_history_rows(report):
+    """
+    Yield the loans stored by the report's last run, as of that run.
+    A report without stored rows exports the loans its parameters select now.
+    """
+    stored = report.get_result_rows()
+    if stored is not None:
+        for row in stored:
+            yield tuple(row.get(field) for field in LOAN_HISTORY_FIELDS)
+        return
+
+    yield from report.get_loan_history_queryset().order_by('pk').values_list(
+        *LOAN_HISTORY_FIELDS
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def get_overdue_books_rows(report):
+    """
+    Yield the overdue loans stored by the report's last run, as of that run.
+    A report without stored rows exports the current overdue loans, with their
+    days overdue and late fee computed like BookLoan.calculated_late_fee.
+    """
+    stored = report.get_result_rows()
+    if stored is not None:
+        fields = [field for field, header in OVERDUE_BOOKS_COLUMNS]
+        for row in stored:
+            yield tuple(row.get(field) for field in fields)
+        return
+
+    today = timezone.now().date()
+    daily_rate = LibrarySettings.get_settings().late_fee_daily_rate
+    loans = BookLoan.objects.filter(status='overdue').order_by('pk').values_list(
+        'id', 'book__title', 'user__email', 'due_date', 'return_date'
+    )
+    for loan_id, title, email, due_date, return_date in loans.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        days_overdue = max(((return_date or today) - due_date).days, 0)
+        yield loan_id, title, email, due_date, days_overdue, Decimal(days_overdue) * daily_rate
+
+
+def get_result_rows(report):
+    for key, value in report.results.items():
+        yield key, value
+
+
+EXPORT_TABLES = {
+    'loan_history': (LOAN_HISTORY_COLUMNS, get_loan_history_rows),
+    'overdue_books': (OVERDUE_BOOKS_COLUMNS, get_overdue_books_rows),
+}
+
+
+def get_export_table(report):
+    """
+    Return the columns of a report export and a generator of its rows.
+
+    Returns:
+        tuple: A list of (field, header) pairs and an iterator of row tuples
+    """
+    columns, get_rows = EXPORT_TABLES.get(report.report_type, (RESULT_COLUMNS, get_result_rows))
+    return columns, get_rows(report)
+
+
+def cell_value(value):
+    """Return a value CSV and XLSX cells can hold; nested results are written as JSON."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def iter_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for field, header in columns])
+    for row in rows:
+        writer.writerow([cell_value(value) for value in row])
+        if buffer.tell() >= STREAM_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(columns, rows):
+    fields = [field for field, header in columns]
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(lines)
+            lines, size = [], 0
+    yield ''.join(lines)
+
+
+STREAM_WRITERS = {
+    'csv': iter_csv,
+    'json': iter_ndjson,
+}
+
+
+def save_export(report, export_format, user, filename, content):
+    """Save an export file to a new ReportExport of the report."""
+    export = ReportExport(report=report, format=export_format, created_by=user)
+    export.file.save(f"{filename}.{EXPORT_FORMATS[export_format].extension}", File(content), save=True)
+    return export
+
+
+def stream_export(report, export_format, user, filename):
+    """
+    Yield a CSV or NDJSON export in chunks, and save it as a ReportExport once
+    the last chunk was sent. An export the client stopped downloading is not saved.
+    """
+    columns, rows = get_export_table(report)
+    with tempfile.TemporaryFile() as copy:
+        for chunk in STREAM_WRITERS[export_format](columns, rows):
+            data = chunk.encode('utf-8')
+            copy.write(data)
+            yield data
+        copy.seek(0)
+        save_export(report, export_format, user, filename, copy)
+
+
+def write_excel(columns, rows, output):
+    """Write an XLSX workbook row by row; constant_memory flushes every row to disk."""
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, [header for field, header in columns])
+    for row_num, row in enumerate(rows, 1):
+        worksheet.write_row(row_num, 0, [cell_value(value) for value in row])
+    workbook.close()
+
+
+def export_report_response(report, export_format, user, filename):
+    """
+    Export a report and return the response that downloads it.
+
+    Args:
+        report (Report): The report to export
+        export_format (str): Key of EXPORT_FORMATS
+        user: The user who requested the export
+        filename (str): File name without the extension
+
+    Returns:
+        HttpResponse: A StreamingHttpResponse for CSV and NDJSON, a FileResponse of the saved file for XLSX
+    """
+    export_type = EXPORT_FORMATS[export_format]
+    if export_format == 'excel':
+        # The ZIP container of an XLSX file can only be finished once all rows are written
+        with tempfile.TemporaryFile() as output:
+            columns, rows = get_export_table(report)
+            write_excel(columns, rows, output)
+            output.seek(0)
+            export = save_export(report, export_format, user, filename, output)
+        return download_export_response(export)
+
+    response = StreamingHttpResponse(
+        stream_export(report, export_format, user, filename), content_type=export_type.content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_type.extension}"'
+    return response
+
+
+def download_export_response(export):
+    """Return a response that downloads the saved file of a ReportExport."""
+    return FileResponse(
+        export.file.open('rb'), as_attachment=True, filename=export.file.name.rsplit('/', 1)[-1],
+        content_type=EXPORT_FORMATS[export.format].content_type,
+    )
@@ -0,0 +1,99 @@
+# Generated by Django 4.2.30 on 2026-10-17 13:10
+
+import json
+import uuid
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Report.ROW_SECTIONS and reports.result_store.CHUNK_SIZE when this migration was written
+ROW_SECTIONS = {"loan_history": "loans", "overdue_books": "overdue_loans"}
+CHUNK_SIZE = 500
+
+
+def move_rows_to_chunks(apps, schema_editor):
+    """Move the row sections of existing results into compressed chunks."""
+    Report = apps.get_model("reports", "Report")
+    ReportResultChunk = apps.get_model("reports", "ReportResultChunk")
+    for report in Report.objects.filter(report_type__in=ROW_SECTIONS).iterator():
+        section = ROW_SECTIONS[report.report_type]
+        if not isinstance(report.results, dict) or section not in report.results:
+            continue
+        rows = report.results.pop(section) or []
+        report.run_id = uuid.uuid4()
+        ReportResultChunk.objects.bulk_create(
+            [
+                ReportResultChunk(
+                    report=report,
+                    run_id=report.run_id,
+                    section=section,
+                    first_row=first_row,
+                    row_count=len(rows[first_row : first_row + CHUNK_SIZE]),
+                    data=zlib.compress(
+                        json.dumps(
+                            rows[first_row : first_row + CHUNK_SIZE],
+                            separators=(",", ":"),
+                        ).encode("utf-8")
+                    ),
+                )
+                for first_row in range(0, len(rows), CHUNK_SIZE)
+            ]
+        )
+        report.results["row_counts"] = {section: len(rows)}
+        report.save(update_fields=["results", "run_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reports", "0002_report_results_encoder"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="report",
+            name="run_id",
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name="ReportResultChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("run_id", models.UUIDField()),
+                ("section", models.CharField(max_length=50)),
+                ("first_row", models.PositiveIntegerField()),
+                ("row_count", models.PositiveIntegerField()),
+                ("data", models.BinaryField()),
+                (
+                    "report",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="result_chunks",
+                        to="reports.report",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Report Result Chunk",
+                "verbose_name_plural": "Report Result Chunks",
+                "ordering": ["report", "section", "first_row"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="reportresultchunk",
+            constraint=models.UniqueConstraint(
+                fields=("report", "run_id", "section", "first_row"),
+                name="reports_result_chunk_unique",
+            ),
+        ),
+        migrations.RunPython(move_rows_to_chunks, migrations.RunPython.noop),
+    ]
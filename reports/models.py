@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
@@ -22,13 +23,22 @@ class Report(models.Model):
     report_type = models.CharField(max_length=20, choices=REPORT_TYPES)
     description = models.TextField(blank=True)
     parameters = models.JSONField(default=dict, blank=True)
-    results = models.JSONField(default=dict, blank=True)
+    results = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='reports')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_scheduled = models.BooleanField(default=False)
     schedule_frequency = models.CharField(max_length=20, blank=True, null=True)
     last_run = models.DateTimeField(null=True, blank=True)
+    # Run whose rows are stored in ReportResultChunk
+    run_id = models.UUIDField(null=True, blank=True, editable=False)
+    
+    # Result sections that grow with the data. Their rows are stored in compressed
+    # chunks (see reports.result_store) and results only keeps the summary.
+    ROW_SECTIONS = {
+        'loan_history': 'loans',
+        'overdue_books': 'overdue_loans',
+    }
     
     class Meta:
         ordering = ['-created_at']
@@ -40,27 +50,39 @@ class Report(models.Model):
     
     def run_report(self):
         """Execute the report based on its type and parameters."""
+        from .result_store import save_report_results
+        
+        results = {}
         if self.report_type == 'loan_history':
-            self.results = self.generate_loan_history_report()
+            results = self.generate_loan_history_report()
         elif self.report_type == 'popular_books':
-            self.results = self.generate_popular_books_report()
+            results = self.generate_popular_books_report()
         elif self.report_type == 'user_activity':
-            self.results = self.generate_user_activity_report()
+            results = self.generate_user_activity_report()
         elif self.report_type == 'overdue_books':
-            self.results = self.generate_overdue_books_report()
+            results = self.generate_overdue_books_report()
         elif self.report_type == 'revenue':
-            self.results = self.generate_revenue_report()
+            results = self.generate_revenue_report()
         elif self.report_type == 'inventory':
-            self.results = self.generate_inventory_report()
+            results = self.generate_inventory_report()
         elif self.report_type == 'custom':
-            self.results = self.generate_custom_report()
+            results = self.generate_custom_report()
         
         self.last_run = timezone.now()
-        self.save()
+        save_report_results(self, results)
         return self.results
     
-    def generate_loan_history_report(self):
-        """Generate a report on loan history."""
+    def get_result_rows(self):
+        """Return the stored rows of the last run as a lazy sequence, or None if the report has no row section."""
+        from .result_store import StoredRows
+        
+        section = self.ROW_SECTIONS.get(self.report_type)
+        if section is None or self.run_id is None:
+            return None
+        return StoredRows(self, section)
+    
+    def get_loan_history_queryset(self):
+        """Return the loans selected by the loan history parameters."""
         start_date = self.parameters.get('start_date')
         end_date = self.parameters.get('end_date')
         user_id = self.parameters.get('user_id')
@@ -74,14 +96,18 @@ class Report(models.Model):
         if user_id:
             loans_query = loans_query.filter(user_id=user_id)
         
-        loans = loans_query.values(
+        return loans_query
+    
+    def generate_loan_history_report(self):
+        """Generate a report on loan history."""
+        loans = self.get_loan_history_queryset().values(
             'id', 'book__title', 'user__email', 'loan_date', 'due_date', 
             'return_date', 'status'
         )
         
         return {
             'total_loans': loans.count(),
-            'loans': list(loans),
+            'loans': loans.order_by('pk').iterator(chunk_size=2000),
             'parameters': self.parameters,
         }
     
@@ -158,32 +184,33 @@ class Report(models.Model):
             'Over 30 days': 0
         }
         
-        loans_data = []
-        for loan in overdue_loans:
-            days_overdue = loan.days_overdue
-            
-            if days_overdue <= 7:
-                days_overdue_groups['1-7 days'] += 1
-            elif days_overdue <= 14:
-                days_overdue_groups['8-14 days'] += 1
-            elif days_overdue <= 30:
-                days_overdue_groups['15-30 days'] += 1
-            else:
-                days_overdue_groups['Over 30 days'] += 1
-            
-            loans_data.append({
-                'id': loan.id,
-                'book_title': loan.book.title,
-                'user_email': loan.user.email,
-                'due_date': loan.due_date.isoformat(),
-                'days_overdue': days_overdue,
-                'late_fee': str(loan.calculated_late_fee) if hasattr(loan, 'calculated_late_fee') else '0.00'
-            })
+        def generate_loans_data():
+            # Fills days_overdue_groups while the rows are being stored
+            for loan in overdue_loans.order_by('pk').iterator(chunk_size=2000):
+                days_overdue = loan.days_overdue
+                
+                if days_overdue <= 7:
+                    days_overdue_groups['1-7 days'] += 1
+                elif days_overdue <= 14:
+                    days_overdue_groups['8-14 days'] += 1
+                elif days_overdue <= 30:
+                    days_overdue_groups['15-30 days'] += 1
+                else:
+                    days_overdue_groups['Over 30 days'] += 1
+                
+                yield {
+                    'id': loan.id,
+                    'book_title': loan.book.title,
+                    'user_email': loan.user.email,
+                    'due_date': loan.due_date.isoformat(),
+                    'days_overdue': days_overdue,
+                    'late_fee': str(loan.calculated_late_fee) if hasattr(loan, 'calculated_late_fee') else '0.00'
+                }
         
         return {
             'total_overdue': overdue_loans.count(),
             'days_overdue_groups': days_overdue_groups,
-            'overdue_loans': loans_data,
+            'overdue_loans': generate_loans_data(),
             'parameters': self.parameters,
         }
     
@@ -270,6 +297,29 @@ class Report(models.Model):
         }
 
 
+class ReportResultChunk(models.Model):
+    """Compressed JSON rows of one section of a report run."""
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name='result_chunks')
+    run_id = models.UUIDField()
+    section = models.CharField(max_length=50)
+    first_row = models.PositiveIntegerField()
+    row_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    
+    class Meta:
+        ordering = ['report', 'section', 'first_row']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['report', 'run_id', 'section', 'first_row'], name='reports_result_chunk_unique'
+            ),
+        ]
+        verbose_name = _('Report Result Chunk')
+        verbose_name_plural = _('Report Result Chunks')
+    
+    def __str__(self):
+        return f"{self.report} - {self.section} - {self.first_row}"
+
+
 class ReportExport(models.Model):
     """Model for storing exported reports."""
     EXPORT_FORMATS = [
@@ -0,0 +1,125 @@
+"""
+Chunked storage of report rows.
+The row sections of a report (Report.ROW_SECTIONS, e.g. every loan of a loan
+history) are not kept in Report.results. They are written in chunks of
+CHUNK_SIZE rows, as zlib-compressed JSON, to ReportResultChunk rows keyed by the
+report run, while the rows are read from the database cursor. Report.results
+only keeps the summary metrics, so listing reports never loads the rows, and
+report_detail decompresses only the chunks of the page it shows.
+"""
+import json
+import uuid
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Sum
+
+from library.bulk_import import chunked
+
+from .models import ReportResultChunk
+
+CHUNK_SIZE = 500
+# Chunks inserted per statement
+INSERT_BATCH_SIZE = 20
+
+
+def compress_rows(rows):
+    return zlib.compress(json.dumps(rows, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8'))
+
+
+def decompress_rows(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def iter_chunks(report, run_id, section, rows, chunk_size):
+    first_row = 0
+    for chunk in chunked(rows, chunk_size):
+        yield ReportResultChunk(
+            report=report, run_id=run_id, section=section,
+            first_row=first_row, row_count=len(chunk), data=compress_rows(chunk),
+        )
+        first_row += len(chunk)
+
+
+def write_rows(report, run_id, section, rows, chunk_size=CHUNK_SIZE):
+    """
+    Store the rows of one section of a report run in compressed chunks.
+
+    Args:
+        report (Report): The report that was run
+        run_id (UUID): The run the rows belong to
+        section (str): Name of the section, e.g. 'loans'
+        rows: Iterable of JSON-serializable rows, consumed once
+        chunk_size (int): Rows per chunk
+
+    Returns:
+        int: The number of rows stored
+    """
+    count = 0
+    for batch in chunked(iter_chunks(report, run_id, section, rows, chunk_size), INSERT_BATCH_SIZE):
+        ReportResultChunk.objects.bulk_create(batch)
+        count += sum(chunk.row_count for chunk in batch)
+    return count
+
+
+@transaction.atomic
+def save_report_results(report, results):
+    """
+    Save the results of a new run of a report: rows of its row section go to
+    ReportResultChunk, the summary to Report.results. The chunks of earlier
+    runs are deleted once the new run is saved.
+    """
+    run_id = uuid.uuid4()
+    section = report.ROW_SECTIONS.get(report.report_type)
+    summary = dict(results)
+    if section in summary:
+        row_count = write_rows(report, run_id, section, summary.pop(section))
+        summary['row_counts'] = {section: row_count}
+    report.results = summary
+    report.run_id = run_id
+    report.save()
+    ReportResultChunk.objects.filter(report=report).exclude(run_id=run_id).delete()
+
+
+class StoredRows:
+    """
+    The stored rows of one section of a report's last run, as a sequence that
+    Paginator can count and slice. Slicing decompresses only the chunks that
+    overlap the slice.
+    """
+
+    def __init__(self, report, section):
+        self.chunks = ReportResultChunk.objects.filter(report=report, run_id=report.run_id, section=section)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.chunks.aggregate(rows=Sum('row_count'))['rows'] or 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        for data in self.chunks.order_by('first_row').values_list('data', flat=True).iterator(chunk_size=10):
+            yield from decompress_rows(data)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            rows = self[index:index + 1]
+            if not rows:
+                raise IndexError(index)
+            return rows[0]
+        start, stop, step = index.indices(self.count())
+        if start >= stop:
+            return []
+        # The chunk holding the first row of the slice, then every chunk up to its end
+        first = self.chunks.filter(first_row__lte=start).order_by('-first_row').values_list(
+            'first_row', flat=True
+        ).first()
+        rows = []
+        overlapping = self.chunks.filter(first_row__gte=first, first_row__lt=stop).order_by('first_row')
+        for first_row, data in overlapping.values_list('first_row', 'data'):
+            rows.extend(decompress_rows(data)[max(start - first_row, 0):stop - first_row])
+        return rows[::step]
@@ -1,3 +1,157 @@
-from django.test import TestCase
+"""
+Tests for the reports application.
+Tests the streaming CSV, NDJSON and XLSX exports, downloading a saved export
+again, and the chunked storage of report rows.
+"""
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from library.models import Book, BookLoan
+from .models import Report, ReportExport, ReportResultChunk
+from .result_store import StoredRows, write_rows
+
+User = get_user_model()
+
+
+class ReportExportTests(TestCase):
+    """Tests for reports.exports and the export_report view."""
+
+    def setUp(self):
+        """Set up a temporary media directory, a staff user and a loan history report."""
+        self.temp_media_dir = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.temp_media_dir)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.temp_media_dir)
+
+        self.staff = User.objects.create_user(email='staff@example.com', password='pass', is_staff=True)
+        self.client.login(email='staff@example.com', password='pass')
+        book = Book.objects.create(title="Lalka", total_copies=5, available_copies=5)
+        due_date = timezone.now().date() + timedelta(days=14)
+        self.loans = [BookLoan.objects.create(book=book, user=self.staff, due_date=due_date) for _ in range(3)]
+        self.report = Report.objects.create(title='Loan history', report_type='loan_history', created_by=self.staff)
+        self.report.run_report()
+
+    def export(self, export_format):
+        return self.client.get(reverse('export_report', args=[self.report.pk]), {'format': export_format})
+
+    def test_csv_is_streamed_and_saved(self):
+        response = self.export('csv')
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'ID,Book Title,User Email,Loan Date,Due Date,Return Date,Status')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(f'{self.loans[0].pk},Lalka,staff@example.com,'))
+
+        export = ReportExport.objects.get(report=self.report)
+        self.assertEqual(export.format, 'csv')
+        with export.file.open('rb') as saved:
+            self.assertEqual(saved.read().decode('utf-8'), content)
+
+    def test_json_is_ndjson(self):
+        response = self.export('json')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [loan.pk for loan in self.loans])
+        self.assertEqual(rows[0]['status'], 'borrowed')
+
+    def test_excel_and_download(self):
+        response = self.export('excel')
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        sheet = workbook.active
+        self.assertEqual(sheet.max_row, 4)
+        self.assertEqual(sheet.cell(row=2, column=2).value, 'Lalka')
+
+        export = ReportExport.objects.get(report=self.report)
+        response = self.client.get(reverse('download_export', args=[export.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.xlsx', response['Content-Disposition'])
+
+    def test_loan_history_export_matches_the_stored_run(self):
+        """Test that loans returned or made after the run do not change the export."""
+        BookLoan.objects.filter(pk=self.loans[0].pk).update(status='returned', return_date=timezone.now().date())
+        BookLoan.objects.create(book=self.loans[0].book, user=self.staff, due_date=self.loans[0].due_date)
+        rows = b''.join(self.export('csv').streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[1].startswith(f'{self.loans[0].pk},Lalka,staff@example.com,'))
+        self.assertTrue(rows[1].endswith(',,borrowed'))
+
+    def test_overdue_export_matches_the_stored_run(self):
+        """Test that the overdue export lists the loans of the report's run, not today's."""
+        BookLoan.objects.filter(pk=self.loans[0].pk).update(
+            status='overdue', due_date=timezone.now().date() - timedelta(days=3)
+        )
+        report = Report.objects.create(title='Overdue', report_type='overdue_books', created_by=self.staff)
+        report.run_report()
+        BookLoan.objects.filter(pk=self.loans[0].pk).update(status='returned', return_date=timezone.now().date())
+        self.report = report
+        rows = b''.join(self.export('csv').streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(rows[0], 'ID,Book Title,User Email,Due Date,Days Overdue,Late Fee')
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith(f'{self.loans[0].pk},Lalka,staff@example.com,'))
+        self.assertEqual(rows[1].split(',')[4], '3')
+
+    def test_other_reports_export_their_results(self):
+        report = Report.objects.create(title='Revenue', report_type='revenue', created_by=self.staff)
+        report.run_report()
+        self.report = report
+        rows = b''.join(self.export('csv').streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(rows[0], 'Key,Value')
+        self.assertIn('total_paid,0.0', rows)
+        self.assertIn('monthly_breakdown,[]', rows)
+
+
+class ReportResultStoreTests(TestCase):
+    """Tests for reports.result_store."""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(email='staff@example.com', password='pass', is_staff=True)
+        self.book = Book.objects.create(title="Lalka", total_copies=5, available_copies=5)
+        self.due_date = timezone.now().date() + timedelta(days=14)
+        for _ in range(3):
+            BookLoan.objects.create(book=self.book, user=self.staff, due_date=self.due_date)
+        self.report = Report.objects.create(title='Loan history', report_type='loan_history', created_by=self.staff)
+
+    def test_results_keep_only_the_summary(self):
+        self.report.run_report()
+        report = Report.objects.get(pk=self.report.pk)
+        self.assertNotIn('loans', report.results)
+        self.assertEqual(report.results['total_loans'], 3)
+        self.assertEqual(report.results['row_counts'], {'loans': 3})
+        rows = report.get_result_rows()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['book__title'], 'Lalka')
+
+        first_run = report.run_id
+        report.run_report()
+        self.assertNotEqual(report.run_id, first_run)
+        self.assertFalse(ReportResultChunk.objects.filter(run_id=first_run).exists())
+
+    def test_slices_read_only_overlapping_chunks(self):
+        self.report.run_report()
+        write_rows(self.report, self.report.run_id, 'numbers', ({'n': n} for n in range(7)), chunk_size=3)
+        rows = StoredRows(self.report, 'numbers')
+
+        self.assertEqual(rows.count(), 7)
+        self.assertEqual(ReportResultChunk.objects.filter(section='numbers').count(), 3)
+        with self.assertNumQueries(2):
+            self.assertEqual([row['n'] for row in rows[2:5]], [2, 3, 4])
+        self.assertEqual([row['n'] for row in rows[5:50]], [5, 6])
+        self.assertEqual(rows[6], {'n': 6})
+        self.assertEqual([row['n'] for row in rows], list(range(7)))
+
+    def test_report_detail_pages_through_rows(self):
+        self.report.run_report()
+        self.client.login(email='staff@example.com', password='pass')
+        response = self.client.get(reverse('report_detail', args=[self.report.pk]))
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+        self.assertContains(response, 'staff@example.com')
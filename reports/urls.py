@@ -16,4 +16,5 @@ urlpatterns = [
     path('reports/create/', views.create_report, name='create_report'),
     path('reports/<int:pk>/parameters/', views.report_parameters, name='report_parameters'),
     path('reports/<int:pk>/export/', views.export_report, name='export_report'),
+    path('exports/<int:pk>/download/', views.download_export, name='download_export'),
 ]
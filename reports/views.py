@@ -1,6 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, JsonResponse
 from django.urls import reverse
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
@@ -10,12 +10,9 @@ from django.db.models import Count, Sum, Avg, F, Q
 from django.core.paginator import Paginator
 from django.conf import settings
 
-import csv
-import json
 import datetime
-import io
-import xlsxwriter
 
+from .exports import EXPORT_FORMATS, download_export_response, export_report_response
 from .models import Report, ReportExport, Dashboard, DashboardWidget
 from library.models import Book, Author, Publisher, BookLoan, BookReservation, Review, LateFee
 
@@ -32,7 +29,7 @@ def reports_dashboard(request):
     dashboard = Dashboard.objects.filter(is_default=True).first() or Dashboard.objects.first()
     
     # Get recent reports
-    recent_reports = Report.objects.all()[:5]
+    recent_reports = Report.objects.select_related('created_by').defer('results')[:5]
     
     # Get quick stats
     total_books = Book.objects.count()
@@ -56,7 +53,7 @@ def reports_dashboard(request):
 @user_passes_test(is_staff)
 def report_list(request):
     """List all available reports."""
-    reports = Report.objects.all()
+    reports = Report.objects.select_related('created_by').defer('results')
     
     # Filter by type if provided
     report_type = request.GET.get('type')
@@ -92,9 +89,17 @@ def report_detail(request, pk):
     # Get exports
     exports = report.exports.all().order_by('-created_at')
     
+    # Page through the stored rows; only the chunks of the current page are read
+    page_obj = None
+    rows = report.get_result_rows()
+    if rows is not None:
+        paginator = Paginator(rows, 50)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    
     context = {
         'report': report,
         'exports': exports,
+        'page_obj': page_obj,
     }
     
     return render(request, 'reports/report_detail.html', context)
@@ -196,129 +201,33 @@ def export_report(request, pk):
         return redirect('report_detail', pk=report.pk)
     
     export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        messages.error(request, _('Invalid export format selected.'))
+        return redirect('report_detail', pk=report.pk)
     
     # Generate filename
     timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
     filename = f"{report.title.replace(' ', '_')}_{timestamp}"
     
-    # Export based on format
-    if export_format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
-        
-        # Create CSV writer
-        writer = csv.writer(response)
-        
-        # Write headers and data based on report type
-        if report.report_type == 'loan_history':
-            writer.writerow(['ID', 'Book Title', 'User Email', 'Loan Date', 'Due Date', 'Return Date', 'Status'])
-            for loan in report.results.get('loans', []):
-                writer.writerow([
-                    loan.get('id'),
-                    loan.get('book__title'),
-                    loan.get('user__email'),
-                    loan.get('loan_date'),
-                    loan.get('due_date'),
-                    loan.get('return_date'),
-                    loan.get('status'),
-                ])
-        
-        elif report.report_type == 'overdue_books':
-            writer.writerow(['ID', 'Book Title', 'User Email', 'Due Date', 'Days Overdue', 'Late Fee'])
-            for loan in report.results.get('overdue_loans', []):
-                writer.writerow([
-                    loan.get('id'),
-                    loan.get('book_title'),
-                    loan.get('user_email'),
-                    loan.get('due_date'),
-                    loan.get('days_overdue'),
-                    loan.get('late_fee'),
-                ])
-        
-        # Save the export record
-        export = ReportExport.objects.create(
-            report=report,
-            format='csv',
-            created_by=request.user,
-        )
-        
-        return response
-    
-    elif export_format == 'excel':
-        # Create an in-memory output file for the Excel workbook
-        output = io.BytesIO()
-        
-        # Create Excel file
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet()
-        
-        # Add headers and data based on report type
-        if report.report_type == 'loan_history':
-            headers = ['ID', 'Book Title', 'User Email', 'Loan Date', 'Due Date', 'Return Date', 'Status']
-            for col_num, header in enumerate(headers):
-                worksheet.write(0, col_num, header)
-            
-            for row_num, loan in enumerate(report.results.get('loans', []), 1):
-                worksheet.write(row_num, 0, loan.get('id'))
-                worksheet.write(row_num, 1, loan.get('book__title'))
-                worksheet.write(row_num, 2, loan.get('user__email'))
-                worksheet.write(row_num, 3, str(loan.get('loan_date')))
-                worksheet.write(row_num, 4, str(loan.get('due_date')))
-                worksheet.write(row_num, 5, str(loan.get('return_date')) if loan.get('return_date') else '')
-                worksheet.write(row_num, 6, loan.get('status'))
-        
-        elif report.report_type == 'overdue_books':
-            headers = ['ID', 'Book Title', 'User Email', 'Due Date', 'Days Overdue', 'Late Fee']
-            for col_num, header in enumerate(headers):
-                worksheet.write(0, col_num, header)
-            
-            for row_num, loan in enumerate(report.results.get('overdue_loans', []), 1):
-                worksheet.write(row_num, 0, loan.get('id'))
-                worksheet.write(row_num, 1, loan.get('book_title'))
-                worksheet.write(row_num, 2, loan.get('user_email'))
-                worksheet.write(row_num, 3, loan.get('due_date'))
-                worksheet.write(row_num, 4, loan.get('days_overdue'))
-                worksheet.write(row_num, 5, loan.get('late_fee'))
-        
-        workbook.close()
-        
-        # Prepare response
-        output.seek(0)
-        response = HttpResponse(output.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
-        
-        # Save the export record
-        export = ReportExport.objects.create(
-            report=report,
-            format='excel',
-            created_by=request.user,
-        )
-        
-        return response
-    
-    elif export_format == 'json':
-        response = HttpResponse(json.dumps(report.results, indent=4), content_type='application/json')
-        response['Content-Disposition'] = f'attachment; filename="{filename}.json"'
-        
-        # Save the export record
-        export = ReportExport.objects.create(
-            report=report,
-            format='json',
-            created_by=request.user,
-        )
-        
-        return response
-    
-    # Default fallback
-    messages.error(request, _('Invalid export format selected.'))
-    return redirect('report_detail', pk=report.pk)
+    # Rows are streamed from the report's query and the file is saved as a ReportExport
+    return export_report_response(report, export_format, request.user, filename)
+
+
+@login_required
+@user_passes_test(is_staff)
+def download_export(request, pk):
+    """Download a previously exported report file again."""
+    export = get_object_or_404(ReportExport, pk=pk)
+    if not export.file or export.format not in EXPORT_FORMATS or not export.file.storage.exists(export.file.name):
+        raise Http404(_('The export file is not available.'))
+    return download_export_response(export)
 
 
 @login_required
 @user_passes_test(is_staff)
 def dashboard_list(request):
     """List all available dashboards."""
-    dashboards = Dashboard.objects.all()
+    dashboards = Dashboard.objects.select_related('created_by')
     
     context = {
         'dashboards': dashboards,
@@ -426,7 +335,7 @@ def widget_data(request, widget_pk):
     data = {}
     
     if widget.data_source == 'recent_loans':
-        loans = BookLoan.objects.all().order_by('-loan_date')[:10]
+        loans = BookLoan.objects.select_related('book', 'user').order_by('-loan_date')[:10]
         data = {
             'loans': [
                 {